@@ -3,6 +3,8 @@ Default configuration management for Zenow backend
 """
 from pathlib import Path
 
+from spacemit_llm.comon.sqlite.sqlite_base import DEFAULT_PRAGMAS
+
 # Base directories
 BASE_DIR = Path.home() / ".cache" / "zenow"
 DATA_DIR = BASE_DIR / "data"
@@ -26,6 +28,74 @@ RERANK_MODELS_DIR.mkdir(exist_ok=True)
 # Database configuration
 DB_CONFIG_PATH = DB_DIR / "config.db"
 DB_SESSION_PATH = DB_DIR / "sessions.db"  # 会话历史数据库
+DB_KB_PATH = DB_DIR / "knowledge_base.db"  # 知识库数据库
+DB_EMBED_CACHE_PATH = DB_DIR / "embed_cache.db"  # 嵌入向量缓存（按模型 + 内容哈希）
+
+# SQLite storage profile (applied to config.db, sessions.db and knowledge_base.db)
+# 取值定义在 sqlite_base.DEFAULT_PRAGMAS（WAL、busy_timeout、页缓存、mmap 等），部署时可在此覆盖单项
+SQLITE_PRAGMAS = dict(DEFAULT_PRAGMAS)
+KB_DB_POOL_SIZE = 4  # 知识库数据库连接池 / 工作线程数
+
+# Session write-behind configuration
+# sync: 每条消息立即提交; group: 批量提交后返回; async: 入队即返回（可能丢失一个刷新周期的数据）
+SESSION_WRITE_DURABILITY = "group"
+SESSION_WRITE_FLUSH_INTERVAL = 0.05  # 刷新周期（秒）
+SESSION_WRITE_MAX_BATCH = 256  # 单个事务最多写入的消息数
+
+# Session search configuration
+# trigram: 子串匹配，适合中日韩文本（关键词至少 3 个字符）; unicode61: 按词切分，适合英文
+SESSION_SEARCH_TOKENIZER = "trigram"
+
+# Session storage compression: 超过该字节数的消息以 zlib 压缩存储（0 表示不压缩）
+SESSION_COMPRESS_THRESHOLD = 4096
+
+# Session archiving: 超过 IDLE_DAYS 天未更新的会话消息移入归档文件（<= 0 表示不归档）
+SESSION_ARCHIVE_DIR = DATA_DIR / "archive" / "sessions"
+SESSION_ARCHIVE_IDLE_DAYS = 30
+SESSION_ARCHIVE_INTERVAL = 3600  # 检查周期（秒）
+SESSION_ARCHIVE_BATCH = 50  # 每次最多归档的会话数
+
+# Session history cache configuration
+SESSION_CACHE_MAX_SESSIONS = 256  # 最多缓存的会话数
+SESSION_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 缓存消息的内存上限（字节）
+SESSION_CACHE_MAX_MESSAGES = 500  # 每个会话最多缓存的尾部消息数
+
+# Knowledge-base ingestion configuration
+VECTOR_DIR = DATA_DIR / "vectors"  # 每个知识库一个内存映射的向量矩阵
+KB_PARSER_WORKERS = 2  # PDF 解析进程数
+KB_INGEST_CONCURRENCY = 1  # 处理队列的 worker 数（同时处理的上传文件数）
+KB_INGEST_MAX_ATTEMPTS = 3  # 任务被崩溃 / 重启中断的次数上限，达到后标记为失败
+KB_INGEST_CHECKPOINT_INTERVAL = 1.0  # 处理进度写回任务表的最小间隔（秒）
+KB_CHUNK_TOKENS = 512  # 每个 chunk 的 token 上限
+KB_CHUNK_OVERLAP = 64  # 相邻 chunk 的重叠 token 数
+KB_VECTOR_COMPACT_RATIO = 0.3  # 已删除向量比例超过该值时压缩向量文件
+KB_VECTOR_EXACT_THRESHOLD = 20000  # 向量数低于该值时精确检索；ivf 索引在达到该值时训练
+KB_IVF_NPROBE = 16  # ivf 查询默认扫描的聚类列表数（越大召回越高、越慢）
+
+# Knowledge-base retrieval configuration（向量 + BM25，倒数排名融合）
+KB_RETRIEVE_VECTOR_CANDIDATES = 32  # 向量检索候选数（词法检索补充精确词，候选池可以较小）
+KB_RETRIEVE_LEXICAL_CANDIDATES = 32  # BM25 检索候选数
+KB_RRF_K = 60  # RRF 平滑常数
+
+# Knowledge-base rerank configuration（cross-encoder 重排序融合后的候选）
+KB_RERANK_CANDIDATES = 24  # 交给 rerank 的融合结果数
+KB_RERANK_REQUEST_TOKENS = 8192  # 单个 rerank 子请求的 token 上限（不超过 rerank server 上下文）
+KB_RERANK_PAIR_TOKENS = 512  # 单个 (query, 文档) 对的 token 上限（rerank server batch 大小），超出时截断文档
+KB_RERANK_MAX_BATCH = 16  # 单个 rerank 子请求的文档数上限
+KB_RERANK_CONCURRENCY = 2  # 同时在途的 rerank 子请求数
+KB_RERANK_CACHE_SIZE = 4096  # (query, chunk 内容哈希) → 分数 LRU 缓存条目数
+
+# Retrieval-augmented chat configuration
+KB_RAG_TOP_K = 8  # 每轮对话最多检索的 chunk 数
+KB_RAG_CONTEXT_RATIO = 0.2  # 参考资料占 context_size 的比例（从历史记录的一半中划出）
+
+# Knowledge-base embedding configuration
+KB_EMBED_BATCH_TOKENS = 8192  # 单个嵌入请求的 token 上限（不超过 embed server 上下文）
+KB_EMBED_MAX_BATCH = 64  # 单个嵌入请求的条数上限
+KB_EMBED_CONCURRENCY = 2  # 同时在途的嵌入请求数
+KB_EMBED_TARGET_LATENCY = 2.0  # 目标请求延迟（秒），超过时减小批大小
+KB_EMBED_TIMEOUT = 60.0  # 单个嵌入请求超时（秒）
+KB_EMBED_CACHE_MEMORY_ENTRIES = 8192  # 嵌入缓存内存层的向量数（768 维约 3KB/条）
 
 # LLM Server default configuration
 LLM_SERVER_HOST = "127.0.0.1"
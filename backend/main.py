@@ -4,6 +4,7 @@ Zenow Backend Main Application
 使用 APIRouter 重构后的主应用文件
 """
 
+import asyncio
 import logging
 
 from fastapi import FastAPI
@@ -24,12 +25,24 @@ from spacemit_llm.model.server_manager import ModelServerManager
 from spacemit_llm.model.download import ModelDownloader
 from spacemit_llm.comon.sqlite.sqlite_config import SQLiteConfig
 from spacemit_llm.comon.sqlite.sqlite_session import SQLiteSession
+from spacemit_llm.comon.sqlite.sqlite_cache import SessionHistoryCache
+from spacemit_llm.comon.sqlite.sqlite_writer import SessionWriteBehind
+from spacemit_llm.comon.sqlite.sqlite_archiver import SessionArchiver
 from spacemit_llm.comon.sqlite.sqlit_kb import SQLiteKnowledgeBase
 from spacemit_llm.comon.minio import MinioServer, MinioClient
+from spacemit_llm.rag.parser import DocumentParser
+from spacemit_llm.rag.splitter import TextSplitter
+from spacemit_llm.rag.embedder import BatchEmbedder
+from spacemit_llm.rag.embed_cache import EmbeddingCache, model_identity
+from spacemit_llm.rag.vector_store import VectorStore
+from spacemit_llm.rag.retriever import Retriever
+from spacemit_llm.rag.reranker import Reranker
 from spacemit_llm.pipeline.model_select import ModelSelectionPipeline
 from spacemit_llm.pipeline.backend_start import BackendStartupHandler
 from spacemit_llm.pipeline.model_param_change import ModelParameterChangePipeline
 from spacemit_llm.pipeline.chat import ChatPipeline
+from spacemit_llm.pipeline.kb_ingest import KnowledgeBaseIngestPipeline
+from spacemit_llm.pipeline.kb_jobs import KnowledgeBaseIngestQueue
 from utils.port import write_port_file, cleanup_port_file
 import config
 
@@ -42,9 +55,48 @@ logger = logging.getLogger(__name__)
 # ============================================================================
 
 # 数据库
-db_config = SQLiteConfig(config.DB_CONFIG_PATH)
-db_session = SQLiteSession(config.DB_SESSION_PATH)
-db_kb = SQLiteKnowledgeBase()
+db_config = SQLiteConfig(config.DB_CONFIG_PATH, pragmas=config.SQLITE_PRAGMAS)
+session_cache = SessionHistoryCache(
+    max_sessions=config.SESSION_CACHE_MAX_SESSIONS,
+    max_bytes=config.SESSION_CACHE_MAX_BYTES,
+    max_messages_per_session=config.SESSION_CACHE_MAX_MESSAGES
+)
+db_session = SQLiteSession(
+    config.DB_SESSION_PATH,
+    cache=session_cache,
+    pragmas=config.SQLITE_PRAGMAS,
+    search_tokenizer=config.SESSION_SEARCH_TOKENIZER,
+    compress_threshold=config.SESSION_COMPRESS_THRESHOLD,
+    archive_dir=config.SESSION_ARCHIVE_DIR
+)
+vector_store = VectorStore(
+    config.VECTOR_DIR,
+    compact_ratio=config.KB_VECTOR_COMPACT_RATIO,
+    exact_threshold=config.KB_VECTOR_EXACT_THRESHOLD,
+    nprobe=config.KB_IVF_NPROBE
+)
+db_kb = SQLiteKnowledgeBase(
+    config.DB_KB_PATH,
+    pragmas=config.SQLITE_PRAGMAS,
+    pool_size=config.KB_DB_POOL_SIZE,
+    vector_store=vector_store
+)
+
+# 会话消息后台批量写入
+session_writer = SessionWriteBehind(
+    db_session,
+    flush_interval=config.SESSION_WRITE_FLUSH_INTERVAL,
+    max_batch=config.SESSION_WRITE_MAX_BATCH,
+    durability=config.SESSION_WRITE_DURABILITY
+)
+
+# 空闲会话定期归档
+session_archiver = SessionArchiver(
+    db_session,
+    idle_days=config.SESSION_ARCHIVE_IDLE_DAYS,
+    interval=config.SESSION_ARCHIVE_INTERVAL,
+    batch_size=config.SESSION_ARCHIVE_BATCH
+)
 
 # MinIO 服务
 minio_server = MinioServer()
@@ -74,13 +126,76 @@ param_change_pipeline = ModelParameterChangePipeline(
     db_config
 )
 
-# Initialize chat pipeline
+# LLM 客户端订阅参数变更（temperature / repeat_penalty / max_tokens）
+db_config.subscribe(server_manager.get_client("llm").on_config_change)
+
+# 嵌入向量缓存：按（当前嵌入模型, normalize, 内容哈希）复用向量，切换嵌入模型时清除
+embed_cache = EmbeddingCache(
+    config.DB_EMBED_CACHE_PATH,
+    model_key=lambda: model_identity(server_manager.get_server("embed").current_model_path),
+    max_memory_entries=config.KB_EMBED_CACHE_MEMORY_ENTRIES,
+    pragmas=config.SQLITE_PRAGMAS
+)
+model_selection_pipeline.subscribe(embed_cache.on_model_change)
+
+# 知识库文件后台处理：解析 → 切分 → 嵌入 → 向量存储
+document_parser = DocumentParser(max_workers=config.KB_PARSER_WORKERS)
+kb_ingest_pipeline = KnowledgeBaseIngestPipeline(
+    db_kb,
+    document_parser,
+    TextSplitter(chunk_tokens=config.KB_CHUNK_TOKENS, overlap_tokens=config.KB_CHUNK_OVERLAP),
+    BatchEmbedder(
+        server_manager.get_client("embed"),
+        max_batch_tokens=config.KB_EMBED_BATCH_TOKENS,
+        max_batch_size=config.KB_EMBED_MAX_BATCH,
+        concurrency=config.KB_EMBED_CONCURRENCY,
+        target_latency=config.KB_EMBED_TARGET_LATENCY,
+        timeout=config.KB_EMBED_TIMEOUT,
+        cache=embed_cache
+    ),
+    concurrency=config.KB_INGEST_CONCURRENCY
+)
+# 持久化处理队列：上传只写入任务表，重启后继续未完成的任务（MinIO 就绪后启动）
+kb_ingest_queue = KnowledgeBaseIngestQueue(
+    db_kb,
+    kb_ingest_pipeline,
+    concurrency=config.KB_INGEST_CONCURRENCY,
+    max_attempts=config.KB_INGEST_MAX_ATTEMPTS,
+    checkpoint_interval=config.KB_INGEST_CHECKPOINT_INTERVAL
+)
+
+# 知识库混合检索 + 重排序
+reranker = Reranker(
+    server_manager.get_client("rerank"),
+    max_request_tokens=config.KB_RERANK_REQUEST_TOKENS,
+    max_pair_tokens=config.KB_RERANK_PAIR_TOKENS,
+    max_batch_size=config.KB_RERANK_MAX_BATCH,
+    concurrency=config.KB_RERANK_CONCURRENCY,
+    cache_size=config.KB_RERANK_CACHE_SIZE,
+    model_key=lambda: server_manager.get_server("rerank").current_model_path
+)
+retriever = Retriever(
+    db_kb,
+    server_manager.get_client("embed"),
+    vector_candidates=config.KB_RETRIEVE_VECTOR_CANDIDATES,
+    lexical_candidates=config.KB_RETRIEVE_LEXICAL_CANDIDATES,
+    rrf_k=config.KB_RRF_K,
+    reranker=reranker,
+    rerank_candidates=config.KB_RERANK_CANDIDATES,
+    embed_cache=embed_cache
+)
+
+# Initialize chat pipeline（指定 kb_ids 时检索增强）
 chat_pipeline = ChatPipeline(
     server_manager,
     db_config,
     db_session,
     default_system_prompt=config.DEFAULT_SYSTEM_PROMPT,
-    default_context_size=config.LLM_SERVER_CONTEXT_SIZE
+    default_context_size=config.LLM_SERVER_CONTEXT_SIZE,
+    session_writer=session_writer,
+    retriever=retriever,
+    rag_top_k=config.KB_RAG_TOP_K,
+    rag_context_ratio=config.KB_RAG_CONTEXT_RATIO
 )
 
 # ============================================================================
@@ -96,6 +211,7 @@ models_router.param_change_pipeline = param_change_pipeline
 
 # 设置 sessions router 的全局变量
 sessions_router.db_session = db_session
+sessions_router.session_archiver = session_archiver
 
 # 设置 chat router 的全局变量
 chat_router.chat_pipeline = chat_pipeline
@@ -132,6 +248,16 @@ app.include_router(kb_router)        # 知识库管理路由
 # 应用生命周期事件
 # ============================================================================
 
+async def _compress_existing_messages():
+    """压缩旧版本写入的大消息"""
+    try:
+        count = await asyncio.to_thread(db_session.compress_existing_messages)
+        if count:
+            logger.info(f"✓ Compressed {count} existing messages")
+    except Exception as e:
+        logger.warning(f"Message compression migration failed: {e}")
+
+
 @app.on_event("startup")
 async def startup_event():
     """应用启动时的初始化"""
@@ -146,8 +272,9 @@ async def startup_event():
             try:
                 minio_client = MinioClient()
                 # 更新知识库路由的依赖
-                set_kb_dependencies(db_kb, minio_client)
+                set_kb_dependencies(db_kb, minio_client, kb_ingest_queue, retriever)
                 logger.info("✅ MinIO client initialized")
+                await kb_ingest_queue.start(minio_client.open_object)
             except Exception as e:
                 logger.warning(f"⚠️ MinIO client initialization failed: {e}, continuing without file storage")
         else:
@@ -155,6 +282,15 @@ async def startup_event():
     except Exception as e:
         logger.warning(f"⚠️ MinIO startup error: {e}, continuing without file storage")
 
+    # 启动会话消息后台写入
+    session_writer.start()
+
+    # 后台压缩已有的大消息（不阻塞启动）
+    asyncio.create_task(_compress_existing_messages())
+
+    # 启动空闲会话归档
+    session_archiver.start()
+
     # 写入端口文件
     write_port_file(config.API_SERVER_PORT)
 
@@ -168,6 +304,34 @@ async def shutdown_event():
     """应用关闭时的清理"""
     logger.info("🛑 Shutting down Zenow Backend...")
 
+    # 停止空闲会话归档
+    try:
+        session_archiver.close()
+    except Exception as e:
+        logger.warning(f"Session archiver shutdown error: {e}")
+
+    # 刷新并停止会话消息后台写入
+    try:
+        session_writer.close()
+        logger.info("✓ Session write-behind flushed")
+    except Exception as e:
+        logger.warning(f"Session write-behind shutdown error: {e}")
+
+    # 停止知识库处理队列（未完成的任务下次启动时继续）并关闭解析进程池
+    try:
+        await kb_ingest_queue.close()
+        await kb_ingest_pipeline.close()
+        document_parser.close()
+    except Exception as e:
+        logger.warning(f"Knowledge base ingest shutdown error: {e}")
+
+    # 关闭知识库数据库连接池
+    try:
+        embed_cache.close()
+        db_kb.close()
+    except Exception as e:
+        logger.warning(f"Knowledge base database shutdown error: {e}")
+
     # 停止所有 llama-server 进程
     try:
         await server_manager.stop_all()
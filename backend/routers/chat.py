@@ -5,7 +5,7 @@ Chat API Router
 
 from fastapi import APIRouter
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 router = APIRouter(prefix="/api", tags=["chat"])
 
@@ -23,6 +23,7 @@ class ChatRequest(BaseModel):
     max_tokens: Optional[int] = None
     mode: Optional[str] = "llm"  # Added mode parameter
     session_id: Optional[int] = None  # Optional session ID for history management
+    kb_ids: Optional[List[int]] = None  # Knowledge bases to retrieve context from (RAG)
 
 # ==================== Dependency Injection ====================
 
@@ -35,9 +36,10 @@ async def chat(request: ChatRequest):
     """
     聊天接口（流式响应）
 
-    必须提供 session_id，所有聊天都会保存到数据库
+    必须提供 session_id，所有聊天都会保存到数据库。
+    提供 kb_ids 时先检索知识库，引用信息在第一个 token 之前以 {"citations": [...], "timings": {...}} 事件发送
 
     Args:
-        request: 包含 message, mode (可选), temperature (可选), session_id (必需) 等
+        request: 包含 message, mode (可选), temperature (可选), session_id (必需), kb_ids (可选) 等
     """
     return await router.chat_pipeline.process_chat(request)
\ No newline at end of file
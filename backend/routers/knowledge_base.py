@@ -6,19 +6,42 @@ Endpoints for managing knowledge bases and files:
 - POST /api/knowledge-bases - Create new knowledge base
 - GET /api/knowledge-bases/{kb_id} - Get KB details
 - PUT /api/knowledge-bases/{kb_id} - Update KB info
+- GET /api/knowledge-bases/{kb_id}/index - Vector index memory use (and recall@k)
+- POST /api/knowledge-bases/search - Hybrid (vector + BM25) search across knowledge bases
 - DELETE /api/knowledge-bases/{kb_id} - Delete KB
 - POST /api/knowledge-bases/{kb_id}/files - Upload file
+- POST /api/knowledge-bases/{kb_id}/files/by-hash - Add a file whose content is already stored
 - GET /api/knowledge-bases/{kb_id}/files - List KB files
 - DELETE /api/knowledge-bases/{kb_id}/files/{file_id} - Delete file
+- POST /api/knowledge-bases/{kb_id}/files/batch - Upload several files
+- POST /api/knowledge-bases/{kb_id}/files/batch-delete - Delete several files
+- GET /api/knowledge-bases/{kb_id}/jobs - Ingestion jobs of the KB with per-file progress
+- GET /api/knowledge-bases/{kb_id}/jobs/events - SSE stream of job progress until all jobs finish
+
+File content is stored once per sha256 under blobs/ in MinIO and shared by every
+file record with the same content; a blob is removed when its last file is deleted.
+
+Uploads return as soon as the file is stored: ingestion (parse → split → embed →
+index) runs in the persistent job queue and continues after a backend restart.
 """
 
+import asyncio
+import hashlib
+import json
 import logging
+import weakref
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, status
 from fastapi.responses import StreamingResponse
-from typing import List, Optional
+from pydantic import BaseModel
+from typing import List, Optional, Tuple
 from datetime import datetime
 import io
 
+from spacemit_llm.comon.sqlite.sqlit_kb import BLOB_PREFIX
+from spacemit_llm.pipeline.kb_jobs import ACTIVE_JOB_STATUSES
+from spacemit_llm.rag.retriever import RETRIEVAL_MODES
+from spacemit_llm.rag.vector_store import INDEX_TYPES, QUANTIZATION_TYPES
+
 logger = logging.getLogger(__name__)
 
 # Create router
@@ -27,13 +50,153 @@ kb_router = APIRouter(prefix="/api/knowledge-bases", tags=["Knowledge Bases"])
 # These will be injected from main.py
 db_kb = None
 minio_client = None
+ingest_queue = None
+retriever = None
+
+# Seconds between SSE keep-alive comments while no job changes
+JOB_EVENTS_HEARTBEAT = 15.0
+
+# Per-content locks: storing a blob and deleting an orphaned blob of the same
+# content never interleave (entries disappear once no task holds the lock)
+_blob_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+ALLOWED_FILE_TYPES = {".md", ".txt", ".pdf"}
+
 
+class BatchDeleteFilesRequest(BaseModel):
+    file_ids: List[int]
 
-def set_dependencies(db_knowledge_base, minio_client_instance):
+
+class AddFileByHashRequest(BaseModel):
+    filename: str
+    content_hash: str
+
+
+class SearchRequest(BaseModel):
+    query: str
+    kb_ids: List[int]
+    top_k: int = 8
+    mode: str = "hybrid"
+    rerank: bool = True
+
+
+def _validate_file_ext(filename: str) -> str:
+    """Return the lower-cased extension of filename, raising 400 if not allowed."""
+    file_ext = "." + filename.split(".")[-1].lower() if "." in filename else ""
+    if file_ext not in ALLOWED_FILE_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"File type '{file_ext}' not allowed. Allowed: {', '.join(ALLOWED_FILE_TYPES)}"
+        )
+    return file_ext
+
+
+def _validate_vector_settings(index_type: Optional[str], quantization: Optional[str]):
+    """Raise 400 if index_type / quantization is not supported by the vector store."""
+    if index_type is not None and index_type not in INDEX_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Index type '{index_type}' not supported. Supported: {', '.join(INDEX_TYPES)}"
+        )
+    if quantization is not None and quantization not in QUANTIZATION_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Quantization '{quantization}' not supported. Supported: {', '.join(QUANTIZATION_TYPES)}"
+        )
+
+
+def set_dependencies(
+    db_knowledge_base,
+    minio_client_instance,
+    ingest_queue_instance=None,
+    retriever_instance=None
+):
     """Set dependencies for this router."""
-    global db_kb, minio_client
+    global db_kb, minio_client, ingest_queue, retriever
     db_kb = db_knowledge_base
     minio_client = minio_client_instance
+    ingest_queue = ingest_queue_instance
+    retriever = retriever_instance
+
+
+async def _enqueue_ingest(file_ids: List[int]) -> List[int]:
+    """Queue uploaded files for parsing, chunking and embedding; returns job IDs."""
+    if not ingest_queue:
+        return []
+    return await ingest_queue.enqueue(file_ids)
+
+
+def _blob_lock(content_hash: str) -> asyncio.Lock:
+    """Lock serializing uploads and orphan deletes of one blob."""
+    lock = _blob_locks.get(content_hash)
+    if lock is None:
+        lock = _blob_locks[content_hash] = asyncio.Lock()
+    return lock
+
+
+async def _store_blob(content: bytes) -> Tuple[str, str, bool]:
+    """Take a reference to the content's blob, uploading it unless it is already stored.
+
+    A newly created blob record is always uploaded: an object left in MinIO by
+    a claimed orphan is deleted by _free_orphan_blobs.
+
+    Returns:
+        (content_hash, object_name, uploaded)
+    """
+    content_hash = hashlib.sha256(content).hexdigest()
+    async with _blob_lock(content_hash):
+        object_name, created = await db_kb.acquire_blob(content_hash, len(content))
+        try:
+            if not created and await minio_client.file_exists(object_name):
+                logger.info(f"✅ Deduplicated upload: {object_name} already stored")
+                return content_hash, object_name, False
+            await minio_client.upload_file(object_name, content)
+            return content_hash, object_name, True
+        except Exception:
+            await db_kb.release_blobs([content_hash])
+            raise
+
+
+async def _free_orphan_blobs():
+    """Delete blobs that no file references any more from MinIO."""
+    try:
+        object_names = await db_kb.claim_orphan_blobs()
+    except Exception as e:
+        logger.warning(f"Failed to collect unreferenced blobs: {e}")
+        return
+    for object_name in object_names:
+        content_hash = object_name.rsplit("/", 1)[-1]
+        async with _blob_lock(content_hash):
+            try:
+                # Uploaded again since the claim: the object belongs to the new record
+                if await db_kb.get_blob(content_hash):
+                    continue
+                await minio_client.delete_file(object_name)
+            except Exception as e:
+                logger.warning(f"Failed to delete blob {object_name} from MinIO: {e}")
+
+
+async def _delete_legacy_objects(file_infos: List[dict]):
+    """Delete objects of files stored before content addressing (one object per file)."""
+    for file_info in file_infos:
+        if file_info.get("content_hash"):
+            continue
+        try:
+            await minio_client.delete_file(file_info["file_path"])
+        except Exception as e:
+            logger.warning(f"Failed to delete file from MinIO: {e}")
+
+
+async def _delete_legacy_folder(kb_name: str):
+    """Delete the per-KB folder used before content addressing."""
+    if kb_name.split("/")[0] == BLOB_PREFIX:
+        # A KB named like the blob folder must not take the shared blobs with it
+        return
+    try:
+        await minio_client.delete_folder(f"{kb_name}/")
+    except Exception as e:
+        logger.warning(f"Failed to delete files from MinIO: {e}")
 
 
 # ============================================================================
@@ -73,7 +236,9 @@ async def list_knowledge_bases():
 async def create_knowledge_base(
     name: str = Form(...),
     description: str = Form(""),
-    avatar: Optional[UploadFile] = File(None)
+    avatar: Optional[UploadFile] = File(None),
+    index_type: str = Form("flat"),
+    quantization: str = Form("none")
 ):
     """Create a new knowledge base with optional avatar image."""
     try:
@@ -82,6 +247,7 @@ async def create_knowledge_base(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Knowledge base name is required"
             )
+        _validate_vector_settings(index_type, quantization)
 
         avatar_path = None
 
@@ -114,7 +280,9 @@ async def create_knowledge_base(
         kb_id = await db_kb.create_knowledge_base(
             name=name.strip(),
             description=description.strip(),
-            avatar_url=avatar_path
+            avatar_url=avatar_path,
+            index_type=index_type,
+            quantization=quantization
         )
 
         kb = await db_kb.get_knowledge_base(kb_id)
@@ -150,6 +318,38 @@ async def create_knowledge_base(
         )
 
 
+@kb_router.post("/search")
+async def search_knowledge_bases(request: SearchRequest):
+    """Search chunks of the given knowledge bases (vector + BM25, fused by reciprocal rank, then reranked)."""
+    if request.mode not in RETRIEVAL_MODES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid mode '{request.mode}'. Allowed: {', '.join(RETRIEVAL_MODES)}"
+        )
+    if not retriever:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Knowledge base search not available"
+        )
+
+    try:
+        results = await retriever.retrieve(
+            request.query, request.kb_ids, top_k=max(1, request.top_k), mode=request.mode,
+            rerank=request.rerank
+        )
+        return {
+            "success": True,
+            "results": results,
+            "count": len(results)
+        }
+    except Exception as e:
+        logger.error(f"Failed to search knowledge bases: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
 @kb_router.get("/{kb_id}")
 async def get_knowledge_base(kb_id: int):
     """Get knowledge base details."""
@@ -190,10 +390,14 @@ async def update_knowledge_base(
     kb_id: int,
     name: Optional[str] = Form(None),
     description: Optional[str] = Form(None),
-    avatar_url: Optional[str] = Form(None)
+    avatar_url: Optional[str] = Form(None),
+    index_type: Optional[str] = Form(None),
+    quantization: Optional[str] = Form(None)
 ):
-    """Update knowledge base information."""
+    """Update knowledge base information (changing index_type / quantization rebuilds the vector index)."""
     try:
+        _validate_vector_settings(index_type, quantization)
+
         # Check if KB exists
         kb = await db_kb.get_knowledge_base(kb_id)
         if not kb:
@@ -207,7 +411,9 @@ async def update_knowledge_base(
             kb_id=kb_id,
             name=name.strip() if name else None,
             description=description.strip() if description else None,
-            avatar_url=avatar_url
+            avatar_url=avatar_url,
+            index_type=index_type,
+            quantization=quantization
         )
 
         if not success:
@@ -233,6 +439,38 @@ async def update_knowledge_base(
         )
 
 
+@kb_router.get("/{kb_id}/index")
+async def get_vector_index(kb_id: int, evaluate: bool = False, sample_size: int = 20, top_k: int = 10):
+    """Get vector index statistics; with evaluate=true also measure recall@k against exact search."""
+    try:
+        kb = await db_kb.get_knowledge_base(kb_id)
+        if not kb:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Knowledge base {kb_id} not found"
+            )
+
+        stats = await db_kb.get_vector_stats(kb_id, evaluate=evaluate, sample_size=sample_size, top_k=top_k)
+        if stats is None:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Vector store not available"
+            )
+        return {
+            "success": True,
+            "index": stats
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to get vector index stats: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
 @kb_router.delete("/{kb_id}")
 async def delete_knowledge_base(kb_id: int):
     """Delete knowledge base by ID (cascades to files)."""
@@ -247,13 +485,9 @@ async def delete_knowledge_base(kb_id: int):
 
         kb_name = kb["name"]
 
-        # Delete all files from MinIO
+        # Delete files stored before content addressing from MinIO
         if minio_client:
-            try:
-                prefix = f"{kb_name}/"
-                await minio_client.delete_folder(prefix)
-            except Exception as e:
-                logger.warning(f"Failed to delete files from MinIO: {e}")
+            await _delete_legacy_folder(kb_name)
 
         # Delete KB from database (cascades to files)
         success = await db_kb.delete_knowledge_base(kb_id)
@@ -263,6 +497,10 @@ async def delete_knowledge_base(kb_id: int):
                 detail="Failed to delete knowledge base"
             )
 
+        # Delete blobs no other knowledge base references
+        if minio_client:
+            await _free_orphan_blobs()
+
         return {
             "success": True,
             "message": f"Knowledge base '{kb_name}' deleted successfully"
@@ -292,13 +530,9 @@ async def delete_knowledge_base_by_name(kb_name: str):
 
         kb_id = kb["id"]
 
-        # Delete all files from MinIO
+        # Delete files stored before content addressing from MinIO
         if minio_client:
-            try:
-                prefix = f"{kb_name}/"
-                await minio_client.delete_folder(prefix)
-            except Exception as e:
-                logger.warning(f"Failed to delete files from MinIO: {e}")
+            await _delete_legacy_folder(kb_name)
 
         # Delete KB from database (cascades to files)
         success = await db_kb.delete_knowledge_base(kb_id)
@@ -308,6 +542,10 @@ async def delete_knowledge_base_by_name(kb_name: str):
                 detail="Failed to delete knowledge base"
             )
 
+        # Delete blobs no other knowledge base references
+        if minio_client:
+            await _free_orphan_blobs()
+
         return {
             "success": True,
             "message": f"Knowledge base '{kb_name}' deleted successfully"
@@ -342,17 +580,8 @@ async def upload_file(
                 detail=f"Knowledge base {kb_id} not found"
             )
 
-        kb_name = kb["name"]
-
         # Validate file type
-        allowed_types = {".md", ".txt", ".pdf"}
-        file_ext = "." + file.filename.split(".")[-1].lower() if "." in file.filename else ""
-
-        if file_ext not in allowed_types:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"File type '{file_ext}' not allowed. Allowed: {', '.join(allowed_types)}"
-            )
+        file_ext = _validate_file_ext(file.filename)
 
         # Read file content
         content = await file.read()
@@ -365,24 +594,32 @@ async def upload_file(
                 detail="MinIO client not available"
             )
 
-        file_path = f"{kb_name}/{file.filename}"
-        await minio_client.upload_file(file_path, content)
+        content_hash, file_path, uploaded = await _store_blob(content)
 
-        # Add file to database
+        # Add file to database (keeps the blob reference; an overwritten version releases its own)
         file_type = file_ext.lstrip(".")
-        file_id = await db_kb.add_file(
-            kb_id=kb_id,
-            filename=file.filename,
-            file_path=file_path,
-            file_size=file_size,
-            file_type=file_type
-        )
+        try:
+            file_id = await db_kb.add_file(
+                kb_id=kb_id,
+                filename=file.filename,
+                file_path=file_path,
+                file_size=file_size,
+                file_type=file_type,
+                content_hash=content_hash
+            )
+        except Exception:
+            await db_kb.release_blobs([content_hash])
+            raise
+        await _free_orphan_blobs()
+        job_ids = await _enqueue_ingest([file_id])
 
         file_info = await db_kb.get_file(file_id)
         return {
             "success": True,
             "message": f"File '{file.filename}' uploaded successfully",
             "file_id": file_id,
+            "job_id": job_ids[0] if job_ids else None,
+            "deduplicated": not uploaded,
             "file": file_info
         }
 
@@ -396,6 +633,175 @@ async def upload_file(
         )
 
 
+@kb_router.post("/{kb_id}/files/by-hash")
+async def add_file_by_hash(kb_id: int, request: AddFileByHashRequest):
+    """Add a file whose content is already stored (skips the upload); 404 if the content is unknown."""
+    try:
+        kb = await db_kb.get_knowledge_base(kb_id)
+        if not kb:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Knowledge base {kb_id} not found"
+            )
+
+        file_ext = _validate_file_ext(request.filename)
+        if not minio_client:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="MinIO client not available"
+            )
+
+        content_hash = request.content_hash.lower()
+        blob = await db_kb.get_blob(content_hash)
+        if not blob:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Content {content_hash} not stored, upload the file instead"
+            )
+
+        async with _blob_lock(content_hash):
+            file_path, created = await db_kb.acquire_blob(content_hash, blob["size"])
+            try:
+                # A created record means the blob was freed since get_blob
+                if created or not await minio_client.file_exists(file_path):
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail=f"Content {content_hash} not stored, upload the file instead"
+                    )
+            except Exception:
+                await db_kb.release_blobs([content_hash])
+                raise
+        try:
+            file_id = await db_kb.add_file(
+                kb_id=kb_id,
+                filename=request.filename,
+                file_path=file_path,
+                file_size=blob["size"],
+                file_type=file_ext.lstrip("."),
+                content_hash=content_hash
+            )
+        except Exception:
+            await db_kb.release_blobs([content_hash])
+            raise
+        await _free_orphan_blobs()
+        job_ids = await _enqueue_ingest([file_id])
+
+        return {
+            "success": True,
+            "message": f"File '{request.filename}' added successfully",
+            "file_id": file_id,
+            "job_id": job_ids[0] if job_ids else None,
+            "deduplicated": True,
+            "file": await db_kb.get_file(file_id)
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to add file by hash: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@kb_router.post("/{kb_id}/files/batch")
+async def upload_files(
+    kb_id: int,
+    files: List[UploadFile] = File(...)
+):
+    """Upload several files to knowledge base, recording them in one transaction."""
+    try:
+        # Check if KB exists
+        kb = await db_kb.get_knowledge_base(kb_id)
+        if not kb:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Knowledge base {kb_id} not found"
+            )
+
+        # Validate all file types before uploading anything
+        file_exts = [_validate_file_ext(file.filename) for file in files]
+
+        if not minio_client:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="MinIO client not available"
+            )
+
+        records = []
+        try:
+            for file, file_ext in zip(files, file_exts):
+                content = await file.read()
+                content_hash, file_path, _ = await _store_blob(content)
+                records.append({
+                    "filename": file.filename,
+                    "file_path": file_path,
+                    "file_size": len(content),
+                    "file_type": file_ext.lstrip("."),
+                    "content_hash": content_hash
+                })
+            file_ids = await db_kb.add_files(kb_id, records)
+        except Exception:
+            await db_kb.release_blobs([record["content_hash"] for record in records])
+            raise
+        await _free_orphan_blobs()
+        job_ids = await _enqueue_ingest(file_ids)
+        return {
+            "success": True,
+            "message": f"{len(file_ids)} files uploaded successfully",
+            "file_ids": file_ids,
+            "job_ids": job_ids,
+            "files": await db_kb.get_files(file_ids)
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to upload files: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@kb_router.post("/{kb_id}/files/batch-delete")
+async def delete_files(kb_id: int, request: BatchDeleteFilesRequest):
+    """Delete several files from knowledge base in one transaction."""
+    try:
+        # Check if KB exists
+        kb = await db_kb.get_knowledge_base(kb_id)
+        if not kb:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Knowledge base {kb_id} not found"
+            )
+
+        # Only files that belong to this KB
+        file_infos = [f for f in await db_kb.get_files(request.file_ids) if f["kb_id"] == kb_id]
+
+        # Delete from database, then the blobs (and pre-dedup objects) nothing references any more
+        deleted = await db_kb.delete_files([f["id"] for f in file_infos])
+        if minio_client:
+            await _delete_legacy_objects(file_infos)
+            await _free_orphan_blobs()
+
+        return {
+            "success": True,
+            "message": f"{deleted} files deleted successfully",
+            "deleted": deleted
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to delete files: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
 @kb_router.get("/{kb_id}/files")
 async def list_kb_files(kb_id: int):
     """List all files in knowledge base."""
@@ -445,13 +851,6 @@ async def delete_file(kb_id: int, file_id: int):
                 detail=f"File {file_id} not found in KB {kb_id}"
             )
 
-        # Delete from MinIO
-        if minio_client:
-            try:
-                await minio_client.delete_file(file_info["file_path"])
-            except Exception as e:
-                logger.warning(f"Failed to delete file from MinIO: {e}")
-
         # Delete from database
         success = await db_kb.delete_file(file_id)
         if not success:
@@ -460,6 +859,11 @@ async def delete_file(kb_id: int, file_id: int):
                 detail="Failed to delete file"
             )
 
+        # Delete the blob if no other file references it
+        if minio_client:
+            await _delete_legacy_objects([file_info])
+            await _free_orphan_blobs()
+
         return {
             "success": True,
             "message": f"File '{file_info['filename']}' deleted successfully"
@@ -475,6 +879,92 @@ async def delete_file(kb_id: int, file_id: int):
         )
 
 
+# ============================================================================
+# Ingestion Job Endpoints
+# ============================================================================
+
+@kb_router.get("/{kb_id}/jobs")
+async def list_ingest_jobs(kb_id: int, active: bool = False):
+    """List ingestion jobs of a knowledge base (only queued / running ones if active)."""
+    try:
+        kb = await db_kb.get_knowledge_base(kb_id)
+        if not kb:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Knowledge base {kb_id} not found"
+            )
+        if not ingest_queue:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Ingest queue not available"
+            )
+
+        jobs = await ingest_queue.get_jobs(kb_id, ACTIVE_JOB_STATUSES if active else None)
+        return {
+            "success": True,
+            "jobs": jobs,
+            "counts": await db_kb.get_ingest_job_counts(kb_id),
+            "queue": ingest_queue.get_stats()
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to list ingest jobs: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=str(e)
+        )
+
+
+@kb_router.get("/{kb_id}/jobs/events")
+async def stream_ingest_jobs(kb_id: int):
+    """Stream job snapshots as SSE whenever a job of the KB changes.
+
+    Each event is {"jobs": [...], "counts": {...}}: the KB's queued and running
+    jobs with their stage and chunk progress, and the number of jobs per status.
+    The stream ends after the event in which no job is left queued or running.
+    """
+    kb = await db_kb.get_knowledge_base(kb_id)
+    if not kb:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Knowledge base {kb_id} not found"
+        )
+    if not ingest_queue:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Ingest queue not available"
+        )
+
+    async def events():
+        last = None
+        while True:
+            version = ingest_queue.version
+            jobs = await ingest_queue.get_jobs(kb_id, ACTIVE_JOB_STATUSES)
+            counts = await db_kb.get_ingest_job_counts(kb_id)
+            snapshot = json.dumps({"jobs": jobs, "counts": counts}, ensure_ascii=False, default=str)
+            if snapshot != last:
+                last = snapshot
+                yield f"data: {snapshot}\n\n"
+            if not jobs:
+                return
+            if not await ingest_queue.wait_for_change(version, JOB_EVENTS_HEARTBEAT):
+                yield ": keep-alive\n\n"
+            # Coalesce bursts of progress updates
+            await asyncio.sleep(0.2)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
 # ============================================================================
 # Avatar Proxy Endpoint
 # ============================================================================
@@ -3,13 +3,17 @@ Sessions API Router
 处理会话相关的所有接口
 """
 
+import asyncio
+import base64
+import json
 import logging
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List
+from typing import Any, Dict, Iterable, Iterator, List, Optional
 
 # 导入必要的依赖
-from spacemit_llm.comon.sqlite.sqlite_session import SQLiteSession
+from spacemit_llm.comon.sqlite.sqlite_session import SQLiteSession, SessionImport
 from spacemit_llm.utils.token_estimator import estimate_message_tokens
 
 logger = logging.getLogger(__name__)
@@ -27,6 +31,8 @@ class SessionInfo(BaseModel):
 class SessionListResponse(BaseModel):
     sessions: List[SessionInfo]
     total: int
+    next_cursor: Optional[str] = None  # 更旧的一页
+    prev_cursor: Optional[str] = None  # 更新的一页
 
 class CreateSessionRequest(BaseModel):
     first_message: str
@@ -50,6 +56,8 @@ class MessagesResponse(BaseModel):
     messages: List[MessageInfo]
     session_id: int
     total_tokens: int
+    prev_cursor: Optional[str] = None  # 更早的消息
+    next_cursor: Optional[str] = None  # 更晚的消息
 
 class AddMessageRequest(BaseModel):
     role: str
@@ -59,12 +67,105 @@ class AddMessageResponse(BaseModel):
     message_id: int
     session_id: int
 
+class SearchResult(BaseModel):
+    message_id: int
+    session_id: int
+    session_name: str
+    role: str
+    snippet: str
+    created_at: str
+    score: float
+
+class SearchResponse(BaseModel):
+    results: List[SearchResult]
+    next_cursor: Optional[str] = None
+
+# ==================== Cursor Helpers ====================
+
+def _encode_cursor(values: list) -> str:
+    """把翻页位置编码为不透明的游标字符串"""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, *fields) -> list:
+    """
+    解析游标字符串，格式或字段类型错误时返回 400
+
+    Args:
+        cursor: 游标字符串
+        fields: 可选，每个位置的类型（str / int / float）或允许取值的元组
+
+    Returns:
+        游标中的值（给出 fields 时已按类型转换）
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list):
+            raise ValueError("cursor must encode a list")
+        if fields and len(values) != len(fields):
+            raise ValueError("cursor has the wrong number of values")
+        return [_cursor_value(value, field) for value, field in zip(values, fields)] if fields else values
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _cursor_value(value: Any, field: Any) -> Any:
+    """按字段定义校验并转换游标中的一个值，失败时抛出 ValueError"""
+    if isinstance(field, tuple):
+        if value not in field:
+            raise ValueError(f"unexpected cursor value: {value!r}")
+        return value
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError(f"unexpected cursor value: {value!r}")
+    if field is str and not isinstance(value, str):
+        raise ValueError(f"unexpected cursor value: {value!r}")
+    return field(value)
+
+
+# NDJSON 导出时每个响应块包含的行数
+EXPORT_CHUNK_LINES = 256
+# NDJSON 导入时每个事务写入的记录数
+IMPORT_BATCH_SIZE = 2000
+
+
+def _ndjson_chunks(records: Iterable[Dict[str, Any]], chunk_lines: int = EXPORT_CHUNK_LINES) -> Iterator[bytes]:
+    """把记录编码为 NDJSON，按块产出以减少响应分片数"""
+    lines = []
+    for record in records:
+        lines.append(json.dumps(record, ensure_ascii=False))
+        if len(lines) >= chunk_lines:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _parse_import_line(line: bytes, line_no: int) -> Optional[Dict[str, Any]]:
+    """解析一行导入数据，空行返回 None；缺少 token 数的消息按内容估算"""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        raise ValueError(f"Line {line_no}: invalid JSON ({e})")
+    if not isinstance(record, dict):
+        raise ValueError(f"Line {line_no}: expected a JSON object")
+    if record.get("type") == "message" and record.get("token_count") is None:
+        record["token_count"] = estimate_message_tokens(
+            str(record.get("role", "")), str(record.get("content", ""))
+        )
+    return record
+
 # ==================== Router Definition ====================
 
 router = APIRouter(prefix="/api/sessions", tags=["sessions"])
 
 # 依赖注入 - 这些需要在 main.py 中配置
 db_session = None
+session_archiver = None
 
 # ==================== Session Endpoints ====================
 
@@ -103,20 +204,42 @@ async def create_session(request: CreateSessionRequest, ):
 async def list_sessions(
     limit: int = 50,
     offset: int = 0,
-    
+    cursor: Optional[str] = None
 ):
     """
     获取会话列表
 
     Args:
         limit: 返回的会话数量限制
-        offset: 偏移量
+        offset: 偏移量（未提供 cursor 时使用）
+        cursor: 上一次返回的 next_cursor 或 prev_cursor（键集分页）
 
     Returns:
-        会话列表和总数
+        会话列表、总数和前后页游标
     """
+    limit = max(1, limit)
+    after = before = None
+    if cursor:
+        direction, updated_at, session_id = _decode_cursor(cursor, ("n", "p"), str, int)
+        if direction == "n":
+            after = (updated_at, session_id)
+        else:
+            before = (updated_at, session_id)
+
     try:
-        sessions_data = router.db_session.get_all_sessions(limit=limit, offset=offset)
+        # 多取一条判断翻页方向上是否还有数据
+        sessions_data = router.db_session.get_all_sessions(
+            limit=limit + 1, offset=offset, after=after, before=before
+        )
+        if before is not None:
+            has_newer = len(sessions_data) > limit
+            sessions_data = sessions_data[-limit:] if has_newer else sessions_data
+            has_older = True
+        else:
+            has_older = len(sessions_data) > limit
+            sessions_data = sessions_data[:limit]
+            has_newer = after is not None or offset > 0
+
         sessions = [
             SessionInfo(
                 id=session["id"],
@@ -129,15 +252,208 @@ async def list_sessions(
             for session in sessions_data
         ]
 
+        next_cursor = prev_cursor = None
+        if sessions_data:
+            first, last = sessions_data[0], sessions_data[-1]
+            if has_older:
+                next_cursor = _encode_cursor(["n", last["updated_at"], last["id"]])
+            if has_newer:
+                prev_cursor = _encode_cursor(["p", first["updated_at"], first["id"]])
+
         return SessionListResponse(
             sessions=sessions,
-            total=len(sessions_data)
+            total=len(sessions_data),
+            next_cursor=next_cursor,
+            prev_cursor=prev_cursor
         )
     except Exception as e:
         logger.error(f"Failed to list sessions: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/search", response_model=SearchResponse)
+async def search_messages(
+    q: str,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    session_id: Optional[int] = None
+):
+    """
+    全文检索历史消息
+
+    Args:
+        q: 搜索关键词（空白分隔，全部命中）
+        limit: 每页结果数
+        cursor: 上一页返回的 next_cursor
+        session_id: 可选，只搜索指定会话
+
+    Returns:
+        按相关度排序的结果（含高亮摘要）和下一页游标
+    """
+    limit = max(1, min(limit, 100))
+    after = None
+    if cursor:
+        after = tuple(_decode_cursor(cursor, float, int))
+
+    try:
+        # 多取一条判断是否还有下一页
+        rows = await asyncio.to_thread(
+            router.db_session.search_messages, q, limit + 1, after, session_id
+        )
+    except Exception as e:
+        logger.error(f"Failed to search messages: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_cursor([last["score"], last["message_id"]])
+
+    return SearchResponse(
+        results=[SearchResult(**row) for row in rows],
+        next_cursor=next_cursor
+    )
+
+
+@router.get("/export")
+async def export_sessions(session_ids: Optional[List[int]] = Query(None)):
+    """
+    以 NDJSON 流式导出会话和消息（包括已归档会话）
+
+    每个会话输出一行 {"type": "session", ...}，随后是其消息行 {"type": "message", ...}。
+
+    Args:
+        session_ids: 可选，只导出指定会话（可重复传入）
+
+    Returns:
+        application/x-ndjson 流
+    """
+    records = router.db_session.iter_export(session_ids)
+    return StreamingResponse(
+        _ndjson_chunks(records),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="sessions.ndjson"'}
+    )
+
+
+@router.post("/import")
+async def import_sessions(request: Request):
+    """
+    从 NDJSON 请求体流式导入会话和消息（格式与导出一致，总是创建新会话）
+
+    记录按批在大事务中写入，会话统计信息在导入结束时一次性写入。
+
+    Returns:
+        导入的会话数和消息数
+    """
+    state = SessionImport()
+    batch: List[Dict[str, Any]] = []
+    buffer = b""
+    line_no = 0
+
+    async def flush():
+        nonlocal batch
+        if batch:
+            records, batch = batch, []
+            await asyncio.to_thread(router.db_session.import_records, records, state)
+
+    try:
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                line_no += 1
+                record = _parse_import_line(line, line_no)
+                if record is not None:
+                    batch.append(record)
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    await flush()
+
+        record = _parse_import_line(buffer, line_no + 1)
+        if record is not None:
+            batch.append(record)
+        await flush()
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{e} (imported {state.session_count} sessions, {state.message_count} messages before the error)"
+        )
+    except Exception as e:
+        logger.error(f"Failed to import sessions: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await asyncio.to_thread(router.db_session.finish_import, state)
+
+    logger.info(f"Imported {state.session_count} sessions, {state.message_count} messages")
+    return {
+        "success": True,
+        "sessions": state.session_count,
+        "messages": state.message_count
+    }
+
+
+@router.post("/maintenance/rebuild-stats")
+async def rebuild_session_stats(session_id: Optional[int] = None):
+    """
+    重建会话统计信息（消息数量、总 token 数）
+
+    Args:
+        session_id: 可选，只修复指定会话；默认修复所有会话
+
+    Returns:
+        被修正的会话数量
+    """
+    try:
+        repaired = await asyncio.to_thread(router.db_session.rebuild_session_stats, session_id)
+        logger.info(f"Rebuilt session stats, repaired {repaired} sessions")
+        return {"success": True, "repaired": repaired}
+    except Exception as e:
+        logger.error(f"Failed to rebuild session stats: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/maintenance/archive")
+async def archive_idle_sessions(idle_days: Optional[float] = None):
+    """
+    立即归档空闲会话
+
+    Args:
+        idle_days: 可选，空闲天数阈值；默认使用归档器的配置
+
+    Returns:
+        被归档的会话数量
+    """
+    archiver = getattr(router, "session_archiver", None)
+    if idle_days is None:
+        if not archiver:
+            raise HTTPException(status_code=400, detail="idle_days is required")
+        idle_days = archiver.idle_days
+    limit = archiver.batch_size if archiver else 50
+
+    try:
+        archived = await asyncio.to_thread(router.db_session.archive_idle_sessions, idle_days, limit)
+        logger.info(f"Archived {archived} sessions idle for more than {idle_days} days")
+        return {"success": True, "archived": archived}
+    except Exception as e:
+        logger.error(f"Failed to archive sessions: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/maintenance/cache-stats")
+async def get_cache_stats():
+    """
+    获取会话历史缓存统计信息（命中率、内存占用等）
+
+    Returns:
+        缓存统计信息，未启用缓存时 enabled 为 False
+    """
+    cache = router.db_session.cache
+    if not cache:
+        return {"enabled": False}
+    return {"enabled": True, **cache.get_stats()}
+
+
 @router.get("/{session_id}")
 async def get_session(session_id: int, ):
     """
@@ -242,26 +558,47 @@ async def delete_session(session_id: int, ):
 async def get_session_messages(
     session_id: int,
     limit: int = 100,
-    
+    cursor: Optional[str] = None
 ):
     """
-    获取会话消息
+    获取会话消息（默认返回最新的 limit 条）
 
     Args:
         session_id: 会话ID
         limit: 消息数量限制
+        cursor: 上一次返回的 prev_cursor（更早）或 next_cursor（更晚）
 
     Returns:
-        消息列表和统计信息
+        消息列表、统计信息和前后页游标
     """
+    limit = max(1, limit)
+    before_id = after_id = None
+    if cursor:
+        direction, message_id = _decode_cursor(cursor, ("b", "a"), int)
+        if direction == "b":
+            before_id = message_id
+        else:
+            after_id = message_id
+
     try:
         # 检查会话是否存在
         session = router.db_session.get_session(session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
 
-        # 获取消息列表
-        messages_data = router.db_session.get_messages(session_id, limit=limit)
+        # 获取消息列表（多取一条判断翻页方向上是否还有数据）
+        messages_data = router.db_session.get_messages(
+            session_id, limit=limit + 1, before_id=before_id, after_id=after_id
+        )
+        if after_id is not None:
+            has_later = len(messages_data) > limit
+            messages_data = messages_data[:limit]
+            has_earlier = True
+        else:
+            has_earlier = len(messages_data) > limit
+            messages_data = messages_data[-limit:] if has_earlier else messages_data
+            has_later = before_id is not None
+
         messages = [
             MessageInfo(
                 id=msg["id"],
@@ -277,10 +614,19 @@ async def get_session_messages(
         # 计算总token数
         total_tokens = sum(msg.token_count for msg in messages)
 
+        prev_cursor = next_cursor = None
+        if messages_data:
+            if has_earlier:
+                prev_cursor = _encode_cursor(["b", messages_data[0]["id"]])
+            if has_later:
+                next_cursor = _encode_cursor(["a", messages_data[-1]["id"]])
+
         return MessagesResponse(
             messages=messages,
             session_id=session_id,
-            total_tokens=total_tokens
+            total_tokens=total_tokens,
+            prev_cursor=prev_cursor,
+            next_cursor=next_cursor
         )
     except HTTPException:
         raise
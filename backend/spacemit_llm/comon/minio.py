@@ -25,8 +25,9 @@ import subprocess
 import time
 import requests
 import asyncio
+from contextlib import contextmanager
 from io import BytesIO
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator
 from datetime import timedelta
 
 from minio import Minio
@@ -360,6 +361,27 @@ class MinioClient:
             response.release_conn()
         return content
 
+    @contextmanager
+    def open_object(self, object_name: str) -> Iterator[Any]:
+        """Open a streaming reader for an object (blocking).
+
+        The yielded response supports read(size), so large files can be
+        consumed in chunks without loading them into memory. Use from a
+        worker thread, not the event loop.
+
+        Args:
+            object_name: Object path (e.g., "my-kb/doc-123/report.pdf")
+
+        Yields:
+            File-like response object
+        """
+        response = self.client.get_object(self.bucket_name, object_name)
+        try:
+            yield response
+        finally:
+            response.close()
+            response.release_conn()
+
     async def delete_file(self, object_name: str) -> bool:
         """Delete single file from MinIO.
 
@@ -5,7 +5,23 @@ Manages knowledge base metadata and file information using SQLite.
 
 Tables:
 - knowledge_bases: Store KB metadata (name, description, created_at, updated_at)
+  and the vector settings selected in the KB settings: index type ('flat' or 'ivf')
+  and quantization ('none', 'int8' or 'binary')
 - kb_files: Store file information (filename, file_path, file_size, file_type, uploaded_at)
+  and ingestion status (pending / processing / ready / error); content_hash points at
+  the file's blob
+- kb_blobs: Content-addressed file blobs in MinIO (sha256 → object name) with the
+  number of kb_files rows referencing them; identical uploads share one blob
+- kb_chunks: Store text chunks produced by ingestion; their embeddings live in the
+  optional VectorStore and are removed together with the chunks
+- kb_chunks_fts: Contentless FTS5 index over CJK-aware pre-tokenized chunk text
+  (see rag.lexical), scored with bm25()
+- kb_ingest_jobs: Durable ingestion queue, one job per file (queued / running /
+  done / failed) with its stage, attempts and progress checkpoint
+- kb_meta: Internal key/value settings (lexical tokenizer version)
+
+Queries run on a small worker executor with pooled connections, so the
+async methods never block the event loop on disk I/O.
 
 Usage:
     db = SQLiteKnowledgeBase()
@@ -16,54 +32,128 @@ Usage:
     # Add file
     file_id = await db.add_file(kb_id, "document.pdf", "kb/doc.pdf", 1024, "pdf")
 
+    # Add several files in one transaction
+    file_ids = await db.add_files(kb_id, [{"filename": ..., "file_path": ..., "file_size": ..., "file_type": ...}])
+
+    # Content-addressed upload: take a blob reference, then record the file (which keeps it)
+    object_name, created = await db.acquire_blob(sha256, size)   # upload when created
+    file_id = await db.add_file(kb_id, "document.pdf", object_name, size, "pdf", content_hash=sha256)
+
+    # After deletes / overwrites: blobs nobody references any more, to remove from MinIO
+    object_names = await db.claim_orphan_blobs()
+
     # Get KB files
     files = await db.get_kb_files(kb_id)
 
-    # Delete KB (cascades to files)
+    # Store chunks of an ingested file together with their embeddings
+    chunk_ids = await db.add_chunks(kb_id, file_id, chunks, vectors)
+
+    # Queue files for background ingestion; workers claim jobs one at a time
+    job_ids = await db.enqueue_ingest_jobs(file_ids)
+    job = await db.claim_ingest_job()
+
+    # Delete KB (cascades to files, chunks and vectors)
     await db.delete_knowledge_base(kb_id)
 """
 
+import asyncio
+import functools
 import sqlite3
 import logging
-from datetime import datetime
-from typing import List, Dict, Optional, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Any, Callable, Sequence, Set, Tuple
 from pathlib import Path
 
+from .sqlite_base import ConnectionPool, write_transaction
+from ...rag.lexical import TOKENIZER_VERSION, index_text, match_query
+from ...rag.vector_store import INDEX_TYPES, QUANTIZATION_TYPES
+
 logger = logging.getLogger(__name__)
 
 
+# MinIO folder holding content-addressed file blobs
+BLOB_PREFIX = "blobs"
+
+
+def blob_object_name(content_hash: str) -> str:
+    """MinIO object name of a content-addressed file blob."""
+    return f"{BLOB_PREFIX}/{content_hash[:2]}/{content_hash}"
+
+
+def _validate_vector_settings(index_type: str = None, quantization: str = None):
+    """Raise ValueError if index_type / quantization is not supported by the vector store."""
+    if index_type is not None and index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}'. Supported: {', '.join(INDEX_TYPES)}")
+    if quantization is not None and quantization not in QUANTIZATION_TYPES:
+        raise ValueError(f"Unknown quantization '{quantization}'. Supported: {', '.join(QUANTIZATION_TYPES)}")
+
+
 class SQLiteKnowledgeBase:
     """SQLite Knowledge Base Management."""
 
-    def __init__(self, db_path: str = None):
+    def __init__(
+        self,
+        db_path: str = None,
+        pragmas: Optional[Dict[str, Any]] = None,
+        pool_size: int = 4,
+        vector_store: Any = None
+    ):
         """Initialize SQLite Knowledge Base manager.
 
         Args:
             db_path: Path to SQLite database file
                     (default: ~/.cache/zenow/data/db/knowledge_base.db)
+            pragmas: Optional PRAGMA profile (default: sqlite_base.DEFAULT_PRAGMAS)
+            pool_size: Number of pooled connections / worker threads
+            vector_store: Optional VectorStore holding chunk embeddings
         """
         if db_path is None:
             db_path = Path.home() / ".cache" / "zenow" / "data" / "db" / "knowledge_base.db"
 
         self.db_path = str(db_path)
+        self.pragmas = pragmas
+        self.vector_store = vector_store
+        # Set by _init_lexical_index (False when SQLite lacks FTS5)
+        self.lexical_enabled = False
         Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
 
+        # One connection per worker, so a worker never waits for the pool
+        self._pool = ConnectionPool(self.db_path, size=pool_size, pragmas=pragmas)
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="kb-sqlite")
+
         # Initialize database
         self._init_db()
         logger.info(f"✅ SQLite Knowledge Base initialized: {self.db_path}")
 
-    def _get_connection(self) -> sqlite3.Connection:
-        """Get database connection."""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+    async def _run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run func(conn, *args, **kwargs) on the worker executor with a pooled connection."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            functools.partial(self._call, func, *args, **kwargs)
+        )
+
+    def _call(self, func: Callable, *args, **kwargs) -> Any:
+        """Borrow a connection from the pool and call func with it."""
+        with self._pool.connection() as conn:
+            return func(conn, *args, **kwargs)
+
+    def close(self):
+        """Stop the worker executor and close pooled connections."""
+        self._executor.shutdown(wait=True)
+        self._pool.close()
 
     def _init_db(self):
         """Initialize database tables."""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
         try:
+            self._call(self._init_db_sync)
+            logger.debug("✅ Database tables initialized")
+        except Exception as e:
+            logger.error(f"❌ Failed to initialize database: {e}")
+            raise
+
+    def _init_db_sync(self, conn: sqlite3.Connection):
+        with write_transaction(conn) as cursor:
             # Create knowledge_bases table
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS knowledge_bases (
@@ -78,6 +168,15 @@ class SQLiteKnowledgeBase:
                 )
             """)
 
+            # Vector settings (added after the first release)
+            # Index type: 'flat' (exact) or 'ivf'
+            columns = {row[1] for row in cursor.execute("PRAGMA table_info(knowledge_bases)").fetchall()}
+            if "index_type" not in columns:
+                cursor.execute("ALTER TABLE knowledge_bases ADD COLUMN index_type TEXT NOT NULL DEFAULT 'flat'")
+            # Vector quantization: 'none', 'int8' or 'binary'
+            if "quantization" not in columns:
+                cursor.execute("ALTER TABLE knowledge_bases ADD COLUMN quantization TEXT NOT NULL DEFAULT 'none'")
+
             # Create kb_files table
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS kb_files (
@@ -94,20 +193,175 @@ class SQLiteKnowledgeBase:
                 )
             """)
 
-            conn.commit()
-            logger.debug("✅ Database tables initialized")
+            # Ingestion status columns (added after the first release)
+            columns = {row[1] for row in cursor.execute("PRAGMA table_info(kb_files)").fetchall()}
+            for column, definition in (
+                ("status", "TEXT NOT NULL DEFAULT 'pending'"),
+                ("chunk_count", "INTEGER NOT NULL DEFAULT 0"),
+                ("error", "TEXT"),
+                ("content_hash", "TEXT"),
+            ):
+                if column not in columns:
+                    cursor.execute(f"ALTER TABLE kb_files ADD COLUMN {column} {definition}")
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_kb_files_hash
+                ON kb_files(content_hash)
+            """)
 
-        except Exception as e:
-            logger.error(f"❌ Failed to initialize database: {e}")
-            raise
-        finally:
-            conn.close()
+            # Content-addressed blobs; ref_count = number of kb_files rows (plus in-flight
+            # uploads) using the blob. Rows at 0 are claimed by claim_orphan_blobs.
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS kb_blobs (
+                    content_hash TEXT PRIMARY KEY,
+                    object_name TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    ref_count INTEGER NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Create kb_chunks table
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS kb_chunks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kb_id INTEGER NOT NULL,
+                    file_id INTEGER NOT NULL,
+                    chunk_index INTEGER NOT NULL,
+                    content TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    token_count INTEGER NOT NULL,
+                    start_offset INTEGER,
+                    end_offset INTEGER,
+                    page INTEGER,
+                    heading TEXT,
+                    FOREIGN KEY (kb_id) REFERENCES knowledge_bases(id) ON DELETE CASCADE,
+                    FOREIGN KEY (file_id) REFERENCES kb_files(id) ON DELETE CASCADE
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_kb_chunks_file
+                ON kb_chunks(file_id, chunk_index)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_kb_chunks_kb
+                ON kb_chunks(kb_id)
+            """)
+
+            # Ingestion jobs; generation grows each time the file is queued again,
+            # so a superseded run cannot overwrite the state of the new job
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS kb_ingest_jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    file_id INTEGER NOT NULL UNIQUE,
+                    kb_id INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    stage TEXT,
+                    generation INTEGER NOT NULL DEFAULT 1,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    chunks_done INTEGER NOT NULL DEFAULT 0,
+                    chunks_reused INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    started_at TIMESTAMP,
+                    finished_at TIMESTAMP,
+                    FOREIGN KEY (kb_id) REFERENCES knowledge_bases(id) ON DELETE CASCADE,
+                    FOREIGN KEY (file_id) REFERENCES kb_files(id) ON DELETE CASCADE
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_kb_ingest_jobs_status
+                ON kb_ingest_jobs(status, updated_at)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_kb_ingest_jobs_kb
+                ON kb_ingest_jobs(kb_id)
+            """)
+
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS kb_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            """)
+            self._init_lexical_index(cursor)
+
+    def _init_lexical_index(self, cursor: sqlite3.Cursor):
+        """Create the BM25 index over chunks, rebuilding it when the tokenizer changed.
+
+        The index is contentless (only the inverted lists are stored), so
+        removing a chunk re-tokenizes its content; a tokenizer change makes
+        old entries undeletable, hence the rebuild. Without FTS5 lexical
+        search is disabled and returns no results.
+        """
+        row = cursor.execute("SELECT value FROM kb_meta WHERE key = 'lexical_tokenizer'").fetchone()
+        exists = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'kb_chunks_fts'"
+        ).fetchone()
+        if exists and row and row[0] == str(TOKENIZER_VERSION):
+            self.lexical_enabled = True
+            return
+
+        try:
+            if exists:
+                cursor.execute("DROP TABLE kb_chunks_fts")
+            cursor.execute("""
+                CREATE VIRTUAL TABLE kb_chunks_fts USING fts5(
+                    tokens,
+                    content='',
+                    tokenize="unicode61 tokenchars '_.-'"
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"⚠️ FTS5 unavailable ({e}), knowledge base lexical search disabled")
+            self.lexical_enabled = False
+            return
+
+        last_id = 0
+        while True:
+            rows = cursor.execute(
+                "SELECT id, content FROM kb_chunks WHERE id > ? ORDER BY id LIMIT 1000", (last_id,)
+            ).fetchall()
+            if not rows:
+                break
+            cursor.executemany(
+                "INSERT INTO kb_chunks_fts (rowid, tokens) VALUES (?, ?)",
+                [(chunk_id, index_text(content)) for chunk_id, content in rows]
+            )
+            last_id = rows[-1][0]
+        cursor.execute(
+            "INSERT OR REPLACE INTO kb_meta (key, value) VALUES ('lexical_tokenizer', ?)",
+            (str(TOKENIZER_VERSION),)
+        )
+        self.lexical_enabled = True
+
+    @staticmethod
+    def _fetchone(conn: sqlite3.Connection, query: str, params: tuple = ()) -> Optional[Dict[str, Any]]:
+        row = conn.execute(query, params).fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def _fetchall(conn: sqlite3.Connection, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        return [dict(row) for row in conn.execute(query, params).fetchall()]
+
+    @staticmethod
+    def _refresh_kb_stats(cursor: sqlite3.Cursor, kb_id: int):
+        """Recount doc_count / total_size of a knowledge base inside the current transaction."""
+        cursor.execute("""
+            UPDATE knowledge_bases
+            SET doc_count = (SELECT COUNT(*) FROM kb_files WHERE kb_id = ?),
+                total_size = (SELECT COALESCE(SUM(file_size), 0) FROM kb_files WHERE kb_id = ?),
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (kb_id, kb_id, kb_id))
 
     async def create_knowledge_base(
         self,
         name: str,
         description: str = "",
-        avatar_url: str = None
+        avatar_url: str = None,
+        index_type: str = "flat",
+        quantization: str = "none"
     ) -> int:
         """Create a new knowledge base.
 
@@ -115,25 +369,28 @@ class SQLiteKnowledgeBase:
             name: Knowledge base name (must be unique)
             description: Knowledge base description
             avatar_url: Avatar URL
+            index_type: Vector index type ('flat' or 'ivf')
+            quantization: Vector quantization ('none', 'int8' or 'binary')
 
         Returns:
             Knowledge base ID
 
         Raises:
+            ValueError: If index_type or quantization is unknown
             Exception: If KB with same name already exists
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        _validate_vector_settings(index_type, quantization)
 
-        try:
-            cursor.execute("""
-                INSERT INTO knowledge_bases (name, description, avatar_url)
-                VALUES (?, ?, ?)
-            """, (name, description, avatar_url))
-
-            conn.commit()
-            kb_id = cursor.lastrowid
+        def _create(conn):
+            with write_transaction(conn) as cursor:
+                cursor.execute("""
+                    INSERT INTO knowledge_bases (name, description, avatar_url, index_type, quantization)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (name, description, avatar_url, index_type, quantization))
+                return cursor.lastrowid
 
+        try:
+            kb_id = await self._run(_create)
             logger.info(f"✅ Created knowledge base: {name} (ID: {kb_id})")
             return kb_id
 
@@ -143,8 +400,6 @@ class SQLiteKnowledgeBase:
         except Exception as e:
             logger.error(f"❌ Failed to create knowledge base: {e}")
             raise
-        finally:
-            conn.close()
 
     async def get_knowledge_base(self, kb_id: int) -> Optional[Dict[str, Any]]:
         """Get knowledge base by ID.
@@ -155,21 +410,9 @@ class SQLiteKnowledgeBase:
         Returns:
             Knowledge base info dict or None if not found
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute("""
-                SELECT * FROM knowledge_bases WHERE id = ?
-            """, (kb_id,))
-
-            row = cursor.fetchone()
-            if row:
-                return dict(row)
-            return None
-
-        finally:
-            conn.close()
+        return await self._run(
+            self._fetchone, "SELECT * FROM knowledge_bases WHERE id = ?", (kb_id,)
+        )
 
     async def get_knowledge_base_by_name(self, name: str) -> Optional[Dict[str, Any]]:
         """Get knowledge base by name.
@@ -180,21 +423,9 @@ class SQLiteKnowledgeBase:
         Returns:
             Knowledge base info dict or None if not found
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute("""
-                SELECT * FROM knowledge_bases WHERE name = ?
-            """, (name,))
-
-            row = cursor.fetchone()
-            if row:
-                return dict(row)
-            return None
-
-        finally:
-            conn.close()
+        return await self._run(
+            self._fetchone, "SELECT * FROM knowledge_bases WHERE name = ?", (name,)
+        )
 
     async def list_knowledge_bases(self) -> List[Dict[str, Any]]:
         """List all knowledge bases.
@@ -202,73 +433,97 @@ class SQLiteKnowledgeBase:
         Returns:
             List of knowledge base info dicts
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute("""
-                SELECT * FROM knowledge_bases ORDER BY updated_at DESC
-            """)
-
-            rows = cursor.fetchall()
-            return [dict(row) for row in rows]
-
-        finally:
-            conn.close()
+        return await self._run(
+            self._fetchall, "SELECT * FROM knowledge_bases ORDER BY updated_at DESC"
+        )
 
     async def update_knowledge_base(
         self,
         kb_id: int,
         name: str = None,
         description: str = None,
-        avatar_url: str = None
+        avatar_url: str = None,
+        index_type: str = None,
+        quantization: str = None
     ) -> bool:
         """Update knowledge base information.
 
+        Changing index_type or quantization rewrites the knowledge base's vector
+        files (training an IVF index can take a while on large knowledge bases).
+        The vector files are switched first; if that fails nothing is committed,
+        and if the row update fails the previous settings are restored.
+
         Args:
             kb_id: Knowledge base ID
             name: New name (optional)
             description: New description (optional)
             avatar_url: New avatar URL (optional)
+            index_type: New vector index type (optional)
+            quantization: New vector quantization (optional)
 
         Returns:
             True if successful, False otherwise
-        """
-        conn = self._get_connection()
-        cursor = conn.cursor()
 
-        try:
-            updates = []
-            params = []
-
-            if name is not None:
-                updates.append("name = ?")
-                params.append(name)
-            if description is not None:
-                updates.append("description = ?")
-                params.append(description)
-            if avatar_url is not None:
-                updates.append("avatar_url = ?")
-                params.append(avatar_url)
-
-            if not updates:
-                return True
-
-            updates.append("updated_at = CURRENT_TIMESTAMP")
-            params.append(kb_id)
+        Raises:
+            ValueError: If index_type or quantization is unknown
+        """
+        _validate_vector_settings(index_type, quantization)
+
+        updates = []
+        params = []
+
+        if name is not None:
+            updates.append("name = ?")
+            params.append(name)
+        if description is not None:
+            updates.append("description = ?")
+            params.append(description)
+        if avatar_url is not None:
+            updates.append("avatar_url = ?")
+            params.append(avatar_url)
+        if index_type is not None:
+            updates.append("index_type = ?")
+            params.append(index_type)
+        if quantization is not None:
+            updates.append("quantization = ?")
+            params.append(quantization)
+
+        if not updates:
+            return True
 
-            query = f"UPDATE knowledge_bases SET {', '.join(updates)} WHERE id = ?"
-            cursor.execute(query, params)
-            conn.commit()
+        updates.append("updated_at = CURRENT_TIMESTAMP")
+        params.append(kb_id)
+        query = f"UPDATE knowledge_bases SET {', '.join(updates)} WHERE id = ?"
+
+        reindex = (index_type or quantization) and self.vector_store is not None
+
+        def _update(conn):
+            previous = None
+            if reindex:
+                # Switch the vector files before committing so a failed rebuild leaves the row unchanged
+                previous = conn.execute(
+                    "SELECT index_type, quantization FROM knowledge_bases WHERE id = ?", (kb_id,)
+                ).fetchone()
+                if previous is not None:
+                    self.vector_store.configure(kb_id, index_type=index_type, quantization=quantization)
+            try:
+                with write_transaction(conn) as cursor:
+                    cursor.execute(query, params)
+            except Exception:
+                if previous is not None:
+                    self.vector_store.configure(
+                        kb_id, index_type=previous["index_type"], quantization=previous["quantization"]
+                    )
+                raise
 
+        try:
+            await self._run(_update)
             logger.info(f"✅ Updated knowledge base: ID {kb_id}")
             return True
 
         except Exception as e:
             logger.error(f"❌ Failed to update knowledge base: {e}")
             return False
-        finally:
-            conn.close()
 
     async def delete_knowledge_base(self, kb_id: int) -> bool:
         """Delete knowledge base (cascades to files).
@@ -279,21 +534,22 @@ class SQLiteKnowledgeBase:
         Returns:
             True if successful, False otherwise
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        def _delete(conn):
+            with write_transaction(conn) as cursor:
+                self._unindex_chunks(cursor, "kb_id = ?", (kb_id,))
+                self._release_file_blobs(cursor, "kb_id = ?", (kb_id,))
+                cursor.execute("DELETE FROM knowledge_bases WHERE id = ?", (kb_id,))
+            if self.vector_store is not None:
+                self.vector_store.drop(kb_id)
 
         try:
-            cursor.execute("DELETE FROM knowledge_bases WHERE id = ?", (kb_id,))
-            conn.commit()
-
+            await self._run(_delete)
             logger.info(f"✅ Deleted knowledge base: ID {kb_id}")
             return True
 
         except Exception as e:
             logger.error(f"❌ Failed to delete knowledge base: {e}")
             return False
-        finally:
-            conn.close()
 
     async def add_file(
         self,
@@ -301,16 +557,19 @@ class SQLiteKnowledgeBase:
         filename: str,
         file_path: str,
         file_size: int,
-        file_type: str
+        file_type: str,
+        content_hash: Optional[str] = None
     ) -> int:
         """Add file to knowledge base (or update if exists).
 
         Args:
             kb_id: Knowledge base ID
             filename: Original filename
-            file_path: Path in MinIO (e.g., "kb-name/filename")
+            file_path: Path in MinIO (e.g., "blobs/ab/ab12...")
             file_size: File size in bytes
             file_type: File type (md, txt, pdf)
+            content_hash: sha256 of the content; the file takes over a blob
+                reference the caller got from acquire_blob
 
         Returns:
             File ID
@@ -318,46 +577,35 @@ class SQLiteKnowledgeBase:
         Raises:
             Exception: If KB doesn't exist
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
-        try:
-            # Check if file already exists
-            cursor.execute("""
-                SELECT id FROM kb_files WHERE kb_id = ? AND filename = ?
-            """, (kb_id, filename))
+        file_ids = await self.add_files(kb_id, [{
+            "filename": filename,
+            "file_path": file_path,
+            "file_size": file_size,
+            "file_type": file_type,
+            "content_hash": content_hash
+        }])
+        return file_ids[0]
+
+    async def add_files(self, kb_id: int, files: List[Dict[str, Any]]) -> List[int]:
+        """Add (or update) several files in one transaction.
 
-            existing = cursor.fetchone()
+        Args:
+            kb_id: Knowledge base ID
+            files: List of dicts with filename, file_path, file_size, file_type and
+                optional content_hash (a blob reference from acquire_blob, kept by the file;
+                the blob of an overwritten file loses its reference)
 
-            if existing:
-                # Update existing file
-                file_id = existing[0]
-                cursor.execute("""
-                    UPDATE kb_files
-                    SET file_path = ?, file_size = ?, file_type = ?, updated_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                """, (file_path, file_size, file_type, file_id))
-                logger.info(f"✅ Updated file: {filename} (ID: {file_id})")
-            else:
-                # Insert new file
-                cursor.execute("""
-                    INSERT INTO kb_files (kb_id, filename, file_path, file_size, file_type)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (kb_id, filename, file_path, file_size, file_type))
-                file_id = cursor.lastrowid
-                logger.info(f"✅ Added file: {filename} (ID: {file_id})")
+        Returns:
+            File IDs in input order
 
-            # Update KB stats
-            cursor.execute("""
-                UPDATE knowledge_bases
-                SET doc_count = (SELECT COUNT(*) FROM kb_files WHERE kb_id = ?),
-                    total_size = (SELECT SUM(file_size) FROM kb_files WHERE kb_id = ?),
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            """, (kb_id, kb_id, kb_id))
+        Raises:
+            Exception: If KB doesn't exist
+        """
+        if not files:
+            return []
 
-            conn.commit()
-            return file_id
+        try:
+            return await self._run(self._add_files_sync, kb_id, files)
 
         except sqlite3.IntegrityError as e:
             logger.error(f"❌ KB doesn't exist: {e}")
@@ -365,8 +613,48 @@ class SQLiteKnowledgeBase:
         except Exception as e:
             logger.error(f"❌ Failed to add file: {e}")
             raise
-        finally:
-            conn.close()
+
+    def _add_files_sync(self, conn: sqlite3.Connection, kb_id: int, files: List[Dict[str, Any]]) -> List[int]:
+        file_ids = []
+        with write_transaction(conn) as cursor:
+            for file in files:
+                content_hash = file.get("content_hash")
+
+                # Check if file already exists
+                cursor.execute("""
+                    SELECT id, content_hash FROM kb_files WHERE kb_id = ? AND filename = ?
+                """, (kb_id, file["filename"]))
+
+                existing = cursor.fetchone()
+
+                if existing:
+                    # Update existing file; its previous blob loses this file's reference
+                    file_id = existing[0]
+                    if existing[1]:
+                        self._release_blob_refs(cursor, [existing[1]])
+                    cursor.execute("""
+                        UPDATE kb_files
+                        SET file_path = ?, file_size = ?, file_type = ?, content_hash = ?,
+                            updated_at = CURRENT_TIMESTAMP, status = 'pending', error = NULL
+                        WHERE id = ?
+                    """, (file["file_path"], file["file_size"], file["file_type"], content_hash, file_id))
+                    logger.info(f"✅ Updated file: {file['filename']} (ID: {file_id})")
+                else:
+                    # Insert new file
+                    cursor.execute("""
+                        INSERT INTO kb_files (kb_id, filename, file_path, file_size, file_type, content_hash)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    """, (kb_id, file["filename"], file["file_path"], file["file_size"], file["file_type"],
+                          content_hash))
+                    file_id = cursor.lastrowid
+                    logger.info(f"✅ Added file: {file['filename']} (ID: {file_id})")
+
+                file_ids.append(file_id)
+
+            # Update KB stats once for the whole batch
+            self._refresh_kb_stats(cursor, kb_id)
+
+        return file_ids
 
     async def get_kb_files(self, kb_id: int) -> List[Dict[str, Any]]:
         """Get all files in knowledge base.
@@ -377,19 +665,11 @@ class SQLiteKnowledgeBase:
         Returns:
             List of file info dicts
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute("""
-                SELECT * FROM kb_files WHERE kb_id = ? ORDER BY uploaded_at DESC
-            """, (kb_id,))
-
-            rows = cursor.fetchall()
-            return [dict(row) for row in rows]
-
-        finally:
-            conn.close()
+        return await self._run(
+            self._fetchall,
+            "SELECT * FROM kb_files WHERE kb_id = ? ORDER BY uploaded_at DESC",
+            (kb_id,)
+        )
 
     async def get_file(self, file_id: int) -> Optional[Dict[str, Any]]:
         """Get file by ID.
@@ -400,18 +680,27 @@ class SQLiteKnowledgeBase:
         Returns:
             File info dict or None if not found
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        return await self._run(
+            self._fetchone, "SELECT * FROM kb_files WHERE id = ?", (file_id,)
+        )
 
-        try:
-            cursor.execute("SELECT * FROM kb_files WHERE id = ?", (file_id,))
-            row = cursor.fetchone()
-            if row:
-                return dict(row)
-            return None
+    async def get_files(self, file_ids: List[int]) -> List[Dict[str, Any]]:
+        """Get several files by ID.
 
-        finally:
-            conn.close()
+        Args:
+            file_ids: File IDs
+
+        Returns:
+            File info dicts of the files that exist
+        """
+        if not file_ids:
+            return []
+        placeholders = ",".join("?" * len(file_ids))
+        return await self._run(
+            self._fetchall,
+            f"SELECT * FROM kb_files WHERE id IN ({placeholders})",
+            tuple(file_ids)
+        )
 
     async def delete_file(self, file_id: int) -> bool:
         """Delete file from knowledge base.
@@ -422,71 +711,751 @@ class SQLiteKnowledgeBase:
         Returns:
             True if successful, False otherwise
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
         try:
-            # Get KB ID before deleting
-            cursor.execute("SELECT kb_id FROM kb_files WHERE id = ?", (file_id,))
-            row = cursor.fetchone()
-            if not row:
+            deleted = await self._run(self._delete_files_sync, [file_id])
+            if not deleted:
                 return False
-
-            kb_id = row[0]
-
-            # Delete file
-            cursor.execute("DELETE FROM kb_files WHERE id = ?", (file_id,))
-
-            # Update KB stats
-            cursor.execute("""
-                UPDATE knowledge_bases
-                SET doc_count = (SELECT COUNT(*) FROM kb_files WHERE kb_id = ?),
-                    total_size = (SELECT SUM(file_size) FROM kb_files WHERE kb_id = ?),
-                    updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            """, (kb_id, kb_id, kb_id))
-
-            conn.commit()
             logger.info(f"✅ Deleted file: ID {file_id}")
             return True
 
         except Exception as e:
             logger.error(f"❌ Failed to delete file: {e}")
             return False
-        finally:
-            conn.close()
 
-    async def delete_kb_files(self, kb_id: int) -> int:
-        """Delete all files in knowledge base.
+    async def delete_files(self, file_ids: List[int]) -> int:
+        """Delete several files in one transaction.
 
         Args:
-            kb_id: Knowledge base ID
+            file_ids: File IDs (may span knowledge bases)
 
         Returns:
             Number of files deleted
         """
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        if not file_ids:
+            return 0
 
         try:
-            cursor.execute("SELECT COUNT(*) FROM kb_files WHERE kb_id = ?", (kb_id,))
-            count = cursor.fetchone()[0]
+            deleted = await self._run(self._delete_files_sync, file_ids)
+            logger.info(f"✅ Deleted {deleted} files")
+            return deleted
+
+        except Exception as e:
+            logger.error(f"❌ Failed to delete files: {e}")
+            return 0
 
-            cursor.execute("DELETE FROM kb_files WHERE kb_id = ?", (kb_id,))
+    def _delete_files_sync(self, conn: sqlite3.Connection, file_ids: List[int]) -> int:
+        placeholders = ",".join("?" * len(file_ids))
+        with write_transaction(conn) as cursor:
+            # Get KB IDs before deleting
+            cursor.execute(
+                f"SELECT DISTINCT kb_id FROM kb_files WHERE id IN ({placeholders})",
+                tuple(file_ids)
+            )
+            kb_ids = [row[0] for row in cursor.fetchall()]
+            if not kb_ids:
+                return 0
+
+            # Chunks cascade with their files; unindex them and remember them to drop their vectors
+            chunk_ids = self._unindex_chunks(
+                cursor, f"file_id IN ({placeholders})", tuple(file_ids)
+            )
+            self._release_file_blobs(cursor, f"id IN ({placeholders})", tuple(file_ids))
+
+            cursor.execute(f"DELETE FROM kb_files WHERE id IN ({placeholders})", tuple(file_ids))
+            deleted = cursor.rowcount
 
             # Update KB stats
-            cursor.execute("""
-                UPDATE knowledge_bases
-                SET doc_count = 0, total_size = 0, updated_at = CURRENT_TIMESTAMP
-                WHERE id = ?
-            """, (kb_id,))
+            for kb_id in kb_ids:
+                self._refresh_kb_stats(cursor, kb_id)
+
+        self._delete_vectors(chunk_ids)
+        return deleted
+
+    def _unindex_chunks(self, cursor: sqlite3.Cursor, where: str, params: tuple) -> Dict[int, List[int]]:
+        """Remove chunks matching where from the lexical index (before deleting them).
+
+        Returns:
+            The chunk IDs, grouped by KB ID
+        """
+        chunk_ids: Dict[int, List[int]] = {}
+        rows = cursor.execute(f"SELECT kb_id, id, content FROM kb_chunks WHERE {where}", params).fetchall()
+        for kb_id, chunk_id, _ in rows:
+            chunk_ids.setdefault(kb_id, []).append(chunk_id)
+        if self.lexical_enabled and rows:
+            cursor.executemany(
+                "INSERT INTO kb_chunks_fts (kb_chunks_fts, rowid, tokens) VALUES ('delete', ?, ?)",
+                [(chunk_id, index_text(content)) for _, chunk_id, content in rows]
+            )
+        return chunk_ids
+
+    def _delete_vectors(self, chunk_ids: Dict[int, List[int]]):
+        """Tombstone the vectors of deleted chunks (after the rows are committed)."""
+        if self.vector_store is None:
+            return
+        for kb_id, ids in chunk_ids.items():
+            self.vector_store.delete(kb_id, ids)
+
+    async def delete_kb_files(self, kb_id: int) -> int:
+        """Delete all files in knowledge base.
+
+        Args:
+            kb_id: Knowledge base ID
 
-            conn.commit()
+        Returns:
+            Number of files deleted
+        """
+        def _delete(conn):
+            with write_transaction(conn) as cursor:
+                self._unindex_chunks(cursor, "kb_id = ?", (kb_id,))
+                self._release_file_blobs(cursor, "kb_id = ?", (kb_id,))
+                cursor.execute("DELETE FROM kb_files WHERE kb_id = ?", (kb_id,))
+                count = cursor.rowcount
+
+                # Update KB stats
+                cursor.execute("""
+                    UPDATE knowledge_bases
+                    SET doc_count = 0, total_size = 0, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                """, (kb_id,))
+            if self.vector_store is not None:
+                self.vector_store.drop(kb_id)
+            return count
+
+        try:
+            count = await self._run(_delete)
             logger.info(f"✅ Deleted {count} files from KB: ID {kb_id}")
             return count
 
         except Exception as e:
             logger.error(f"❌ Failed to delete KB files: {e}")
             return 0
-        finally:
-            conn.close()
+
+    # ========================================================================
+    # Content-addressed blobs
+    # ========================================================================
+
+    async def acquire_blob(self, content_hash: str, size: int) -> Tuple[str, bool]:
+        """Take a reference to the blob of content_hash (creating its record).
+
+        Call before uploading, so a concurrent delete cannot free the blob
+        between the upload and add_files. The reference is handed over to the
+        file passed to add_files with this content_hash; if the upload fails,
+        give it back with release_blobs.
+
+        When the record is created, the object must be uploaded even if MinIO
+        still has it: it may belong to a claimed orphan that is about to be
+        deleted.
+
+        Args:
+            content_hash: sha256 (hex) of the file content
+            size: Content size in bytes
+
+        Returns:
+            (MinIO object name of the blob, whether the record was created)
+        """
+        object_name = blob_object_name(content_hash)
+
+        def _acquire(conn):
+            with write_transaction(conn) as cursor:
+                cursor.execute("""
+                    INSERT OR IGNORE INTO kb_blobs (content_hash, object_name, size, ref_count)
+                    VALUES (?, ?, ?, 1)
+                """, (content_hash, object_name, size))
+                if cursor.rowcount:
+                    return True
+                cursor.execute(
+                    "UPDATE kb_blobs SET ref_count = ref_count + 1 WHERE content_hash = ?",
+                    (content_hash,)
+                )
+                return False
+
+        created = await self._run(_acquire)
+        return object_name, created
+
+    async def release_blobs(self, content_hashes: List[str]) -> None:
+        """Give back references taken by acquire_blob that no file kept.
+
+        Args:
+            content_hashes: One entry per reference
+        """
+        if not content_hashes:
+            return
+
+        def _release(conn):
+            with write_transaction(conn) as cursor:
+                self._release_blob_refs(cursor, content_hashes)
+
+        await self._run(_release)
+
+    async def claim_orphan_blobs(self) -> List[str]:
+        """Remove blob records without references.
+
+        The records are deleted first, so a blob acquired afterwards gets a
+        new record (acquire_blob reports it as created). The caller must
+        serialize the MinIO delete with uploads of the same content and skip
+        the delete if get_blob finds such a new record.
+
+        Returns:
+            MinIO object names to delete
+        """
+        def _claim(conn):
+            with write_transaction(conn) as cursor:
+                rows = cursor.execute(
+                    "DELETE FROM kb_blobs WHERE ref_count <= 0 RETURNING object_name"
+                ).fetchall()
+            return [row[0] for row in rows]
+
+        return await self._run(_claim)
+
+    async def get_blob(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Get the blob record of content_hash, or None."""
+        return await self._run(
+            self._fetchone, "SELECT * FROM kb_blobs WHERE content_hash = ?", (content_hash,)
+        )
+
+    async def find_duplicate_file(self, file_id: int) -> Optional[Dict[str, Any]]:
+        """Find an ingested file with the same content as file_id (in any knowledge base).
+
+        Args:
+            file_id: File ID
+
+        Returns:
+            File info dict of a ready file with chunks, or None
+        """
+        return await self._run(
+            self._fetchone,
+            """
+            SELECT other.* FROM kb_files f
+            JOIN kb_files other ON other.content_hash = f.content_hash AND other.id != f.id
+            WHERE f.id = ? AND other.status = 'ready' AND other.chunk_count > 0
+            ORDER BY other.updated_at DESC
+            LIMIT 1
+            """,
+            (file_id,)
+        )
+
+    def _release_file_blobs(self, cursor: sqlite3.Cursor, where: str, params: tuple):
+        """Drop the blob references of the files matching where (before deleting them)."""
+        rows = cursor.execute(
+            f"SELECT content_hash FROM kb_files WHERE {where} AND content_hash IS NOT NULL", params
+        ).fetchall()
+        self._release_blob_refs(cursor, [row[0] for row in rows])
+
+    @staticmethod
+    def _release_blob_refs(cursor: sqlite3.Cursor, content_hashes: List[str]):
+        """Decrement ref_count once per entry of content_hashes."""
+        counts: Dict[str, int] = {}
+        for content_hash in content_hashes:
+            counts[content_hash] = counts.get(content_hash, 0) + 1
+        cursor.executemany(
+            "UPDATE kb_blobs SET ref_count = ref_count - ? WHERE content_hash = ?",
+            [(count, content_hash) for content_hash, count in counts.items()]
+        )
+
+    # ========================================================================
+    # Ingestion status and chunks
+    # ========================================================================
+
+    async def update_file_status(
+        self,
+        file_id: int,
+        status: str,
+        chunk_count: int = None,
+        error: str = None
+    ) -> bool:
+        """Update the ingestion status of a file.
+
+        Args:
+            file_id: File ID
+            status: pending / processing / ready / error
+            chunk_count: Number of chunks (optional)
+            error: Error message (cleared unless given)
+
+        Returns:
+            True if the file exists
+        """
+        updates = ["status = ?", "error = ?"]
+        params: List[Any] = [status, error]
+        if chunk_count is not None:
+            updates.append("chunk_count = ?")
+            params.append(chunk_count)
+        params.append(file_id)
+        query = f"UPDATE kb_files SET {', '.join(updates)} WHERE id = ?"
+
+        def _update(conn):
+            with write_transaction(conn) as cursor:
+                cursor.execute(query, params)
+                return cursor.rowcount > 0
+
+        return await self._run(_update)
+
+    async def add_chunks(
+        self,
+        kb_id: int,
+        file_id: int,
+        chunks: Sequence[Any],
+        vectors: Any = None
+    ) -> List[int]:
+        """Add chunks of a file in one transaction, then append their vectors.
+
+        Args:
+            kb_id: Knowledge base ID
+            file_id: File ID
+            chunks: splitter.Chunk objects
+            vectors: Optional embeddings in the same order as chunks
+
+        Returns:
+            Chunk IDs in input order
+
+        Raises:
+            ValueError: If the knowledge base or the file no longer exists
+        """
+        if not chunks:
+            return []
+        return await self._run(self._add_chunks_sync, kb_id, file_id, chunks, vectors)
+
+    def _add_chunks_sync(
+        self,
+        conn: sqlite3.Connection,
+        kb_id: int,
+        file_id: int,
+        chunks: Sequence[Any],
+        vectors: Any
+    ) -> List[int]:
+        chunk_ids = []
+        with write_transaction(conn) as cursor:
+            row = cursor.execute(
+                "SELECT index_type, quantization FROM knowledge_bases WHERE id = ?", (kb_id,)
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Knowledge base {kb_id} not found")
+            if cursor.execute(
+                "SELECT 1 FROM kb_files WHERE id = ? AND kb_id = ?", (file_id, kb_id)
+            ).fetchone() is None:
+                raise ValueError(f"File {file_id} not found in knowledge base {kb_id}")
+            for chunk in chunks:
+                cursor.execute("""
+                    INSERT INTO kb_chunks (
+                        kb_id, file_id, chunk_index, content, content_hash, token_count,
+                        start_offset, end_offset, page, heading
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    kb_id, file_id, chunk.index, chunk.text, chunk.content_hash, chunk.token_count,
+                    chunk.start, chunk.end, chunk.page, chunk.heading
+                ))
+                chunk_ids.append(cursor.lastrowid)
+            if self.lexical_enabled:
+                cursor.executemany(
+                    "INSERT INTO kb_chunks_fts (rowid, tokens) VALUES (?, ?)",
+                    [(chunk_id, index_text(chunk.text)) for chunk_id, chunk in zip(chunk_ids, chunks)]
+                )
+
+        # Vectors are appended only after the rows are committed; a crash in
+        # between leaves the file in "processing" and it is ingested again
+        if vectors is not None and self.vector_store is not None:
+            self.vector_store.add(kb_id, chunk_ids, vectors, index_type=row[0], quantization=row[1])
+        return chunk_ids
+
+    async def update_file_chunks(
+        self,
+        file_id: int,
+        kept: Sequence[Tuple[int, Any]],
+        removed: List[int]
+    ) -> int:
+        """Finish an incremental re-ingest of a file in one transaction.
+
+        Chunks whose content did not change keep their row, lexical entry and
+        vector; only their position is updated. Chunks that are no longer in
+        the file are deleted and their vectors tombstoned.
+
+        Args:
+            file_id: File ID
+            kept: (existing chunk ID, splitter.Chunk at its new position) pairs
+            removed: IDs of the file's chunks to delete
+
+        Returns:
+            Number of chunks deleted
+        """
+        def _update(conn):
+            chunk_ids: Dict[int, List[int]] = {}
+            with write_transaction(conn) as cursor:
+                cursor.executemany("""
+                    UPDATE kb_chunks
+                    SET chunk_index = ?, start_offset = ?, end_offset = ?, page = ?, heading = ?
+                    WHERE id = ? AND file_id = ?
+                """, [
+                    (chunk.index, chunk.start, chunk.end, chunk.page, chunk.heading, chunk_id, file_id)
+                    for chunk_id, chunk in kept
+                ])
+                for start in range(0, len(removed), 500):
+                    part = tuple(removed[start:start + 500])
+                    where = f"file_id = ? AND id IN ({','.join('?' * len(part))})"
+                    for kb_id, ids in self._unindex_chunks(cursor, where, (file_id, *part)).items():
+                        chunk_ids.setdefault(kb_id, []).extend(ids)
+                    cursor.execute(f"DELETE FROM kb_chunks WHERE {where}", (file_id, *part))
+            self._delete_vectors(chunk_ids)
+            return sum(len(ids) for ids in chunk_ids.values())
+
+        return await self._run(_update)
+
+    async def get_indexed_chunk_ids(self, kb_id: int, chunk_ids: List[int]) -> Set[int]:
+        """Return the chunks that have a vector (all of them without a vector store).
+
+        Chunk rows are committed before their vectors are appended, so after a
+        crash the last batch of a file may have rows but no vectors.
+
+        Args:
+            kb_id: Knowledge base ID
+            chunk_ids: Chunk IDs to check
+
+        Returns:
+            The IDs in chunk_ids whose vector is stored
+        """
+        if self.vector_store is None:
+            return set(chunk_ids)
+        return await self._run(lambda conn: self.vector_store.contains(kb_id, chunk_ids))
+
+    async def get_chunks(self, chunk_ids: List[int]) -> List[Dict[str, Any]]:
+        """Get chunks by ID, with their filename.
+
+        Args:
+            chunk_ids: Chunk IDs
+
+        Returns:
+            Chunk dicts in input order (missing chunks are skipped)
+        """
+        if not chunk_ids:
+            return []
+        placeholders = ",".join("?" * len(chunk_ids))
+        rows = await self._run(
+            self._fetchall,
+            f"""
+            SELECT c.*, f.filename
+            FROM kb_chunks c JOIN kb_files f ON f.id = c.file_id
+            WHERE c.id IN ({placeholders})
+            """,
+            tuple(chunk_ids)
+        )
+        by_id = {row["id"]: row for row in rows}
+        return [by_id[chunk_id] for chunk_id in chunk_ids if chunk_id in by_id]
+
+    async def get_file_chunks(self, file_id: int) -> List[Dict[str, Any]]:
+        """Get all chunks of a file in document order.
+
+        Args:
+            file_id: File ID
+
+        Returns:
+            List of chunk dicts
+        """
+        return await self._run(
+            self._fetchall,
+            "SELECT * FROM kb_chunks WHERE file_id = ? ORDER BY chunk_index",
+            (file_id,)
+        )
+
+    async def search_chunks_lexical(
+        self,
+        kb_ids: List[int],
+        query: str,
+        limit: int = 50
+    ) -> List[Tuple[int, float]]:
+        """BM25 search over the chunks of the given knowledge bases.
+
+        Args:
+            kb_ids: Knowledge base IDs to search
+            query: Free-text query (tokenized like the chunks, terms OR-ed)
+            limit: Maximum number of results
+
+        Returns:
+            [(chunk ID, BM25 score)] ordered by score, higher is better
+        """
+        expression = match_query(query)
+        if not self.lexical_enabled or not kb_ids or expression is None:
+            return []
+        placeholders = ",".join("?" * len(kb_ids))
+
+        def _search(conn):
+            rows = conn.execute(
+                f"""
+                SELECT c.id, bm25(kb_chunks_fts) AS score
+                FROM kb_chunks_fts JOIN kb_chunks c ON c.id = kb_chunks_fts.rowid
+                WHERE kb_chunks_fts MATCH ? AND c.kb_id IN ({placeholders})
+                ORDER BY score
+                LIMIT ?
+                """,
+                (expression, *kb_ids, limit)
+            ).fetchall()
+            # bm25() is lower-is-better; flip it so every retriever score sorts descending
+            return [(row[0], -row[1]) for row in rows]
+
+        return await self._run(_search)
+
+    async def get_vector_stats(
+        self,
+        kb_id: int,
+        evaluate: bool = False,
+        sample_size: int = 20,
+        top_k: int = 10
+    ) -> Optional[Dict[str, Any]]:
+        """Get vector storage statistics of a knowledge base.
+
+        Args:
+            kb_id: Knowledge base ID
+            evaluate: Also measure recall@k of the configured index / quantization
+                against exact search (runs sample_size queries)
+            sample_size: Number of stored vectors used as evaluation queries
+            top_k: k for recall@k
+
+        Returns:
+            Stats dict (rows, bytes, scan_bytes, index, quantization, ...), or None
+            if no vector store is configured
+        """
+        if self.vector_store is None:
+            return None
+
+        def _stats(conn):
+            if evaluate:
+                return self.vector_store.evaluate(kb_id, sample_size=sample_size, top_k=top_k)
+            return self.vector_store.get_stats(kb_id)
+
+        return await self._run(_stats)
+
+    async def delete_file_chunks(self, file_id: int) -> int:
+        """Delete all chunks of a file and their vectors (before re-ingesting it).
+
+        Args:
+            file_id: File ID
+
+        Returns:
+            Number of chunks deleted
+        """
+        def _delete(conn):
+            with write_transaction(conn) as cursor:
+                chunk_ids = self._unindex_chunks(cursor, "file_id = ?", (file_id,))
+                cursor.execute("DELETE FROM kb_chunks WHERE file_id = ?", (file_id,))
+                cursor.execute("UPDATE kb_files SET chunk_count = 0 WHERE id = ?", (file_id,))
+            self._delete_vectors(chunk_ids)
+            return sum(len(ids) for ids in chunk_ids.values())
+
+        return await self._run(_delete)
+
+    # ========================================================================
+    # Ingest jobs
+    # ========================================================================
+
+    async def enqueue_ingest_jobs(self, file_ids: List[int]) -> List[int]:
+        """Queue files for ingestion (a file that already has a job is queued again).
+
+        Args:
+            file_ids: File IDs
+
+        Returns:
+            Job IDs in input order (missing files are skipped)
+        """
+        def _enqueue(conn):
+            job_ids = []
+            with write_transaction(conn) as cursor:
+                for file_id in file_ids:
+                    # WHERE true: lets SQLite parse ON CONFLICT after INSERT ... SELECT
+                    row = cursor.execute("""
+                        INSERT INTO kb_ingest_jobs (file_id, kb_id)
+                        SELECT id, kb_id FROM kb_files WHERE id = ? AND true
+                        ON CONFLICT(file_id) DO UPDATE SET
+                            status = 'queued', stage = NULL, generation = generation + 1,
+                            attempts = 0, chunks_done = 0, chunks_reused = 0, error = NULL,
+                            updated_at = CURRENT_TIMESTAMP, started_at = NULL, finished_at = NULL
+                        RETURNING id
+                    """, (file_id,)).fetchone()
+                    if row is not None:
+                        job_ids.append(row[0])
+            return job_ids
+
+        if not file_ids:
+            return []
+        return await self._run(_enqueue)
+
+    async def claim_ingest_job(self, exclude_file_ids: Sequence[int] = ()) -> Optional[Dict[str, Any]]:
+        """Mark the oldest queued job as running and return it.
+
+        Args:
+            exclude_file_ids: Files not to claim (still being processed by a superseded run)
+
+        Returns:
+            Job dict with the file's filename and file_path, or None if no job is queued
+        """
+        exclude = tuple(exclude_file_ids)
+        placeholders = ",".join("?" * len(exclude))
+
+        def _claim(conn):
+            with write_transaction(conn) as cursor:
+                row = cursor.execute(f"""
+                    UPDATE kb_ingest_jobs
+                    SET status = 'running', stage = NULL, attempts = attempts + 1,
+                        started_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = (
+                        SELECT id FROM kb_ingest_jobs
+                        WHERE status = 'queued' AND file_id NOT IN ({placeholders})
+                        ORDER BY updated_at, id
+                        LIMIT 1
+                    )
+                    RETURNING *
+                """, exclude).fetchone()
+                if row is None:
+                    return None
+                job = dict(row)
+                file_row = cursor.execute(
+                    "SELECT filename, file_path FROM kb_files WHERE id = ?", (job["file_id"],)
+                ).fetchone()
+                job["filename"], job["file_path"] = file_row
+                return job
+
+        return await self._run(_claim)
+
+    async def update_ingest_job(
+        self,
+        job_id: int,
+        generation: int,
+        status: str = None,
+        stage: str = None,
+        chunks_done: int = None,
+        chunks_reused: int = None,
+        error: str = None,
+        refund_attempt: bool = False
+    ) -> bool:
+        """Update a job, unless it has been queued again since it was claimed.
+
+        Args:
+            job_id: Job ID
+            generation: Generation of the claimed job
+            status: queued / running / done / failed (done and failed set finished_at)
+            stage: Current stage (prepare / embed / finalize / done)
+            chunks_done: Chunks of the file processed so far
+            chunks_reused: Chunks kept from the previous version or an interrupted run
+            error: Error message
+            refund_attempt: Do not count the current attempt (interrupted by shutdown)
+
+        Returns:
+            True if the job was updated
+        """
+        updates = ["updated_at = CURRENT_TIMESTAMP"]
+        params: List[Any] = []
+        for column, value in (
+            ("status", status),
+            ("stage", stage),
+            ("chunks_done", chunks_done),
+            ("chunks_reused", chunks_reused),
+            ("error", error),
+        ):
+            if value is not None:
+                updates.append(f"{column} = ?")
+                params.append(value)
+        if status in ("done", "failed"):
+            updates.append("finished_at = CURRENT_TIMESTAMP")
+        if refund_attempt:
+            updates.append("attempts = MAX(attempts - 1, 0)")
+        params.extend([job_id, generation])
+        query = f"UPDATE kb_ingest_jobs SET {', '.join(updates)} WHERE id = ? AND generation = ?"
+
+        def _update(conn):
+            with write_transaction(conn) as cursor:
+                cursor.execute(query, params)
+                return cursor.rowcount > 0
+
+        return await self._run(_update)
+
+    async def get_ingest_jobs(
+        self,
+        kb_id: int = None,
+        statuses: Sequence[str] = None
+    ) -> List[Dict[str, Any]]:
+        """List jobs with their file's filename, status and chunk_count.
+
+        Args:
+            kb_id: Only jobs of this knowledge base (optional)
+            statuses: Only jobs in these states (optional)
+
+        Returns:
+            Job dicts, oldest first
+        """
+        conditions = []
+        params: List[Any] = []
+        if kb_id is not None:
+            conditions.append("j.kb_id = ?")
+            params.append(kb_id)
+        if statuses:
+            conditions.append(f"j.status IN ({','.join('?' * len(statuses))})")
+            params.extend(statuses)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return await self._run(
+            self._fetchall,
+            f"""
+            SELECT j.*, f.filename, f.status AS file_status, f.chunk_count
+            FROM kb_ingest_jobs j JOIN kb_files f ON f.id = j.file_id
+            {where}
+            ORDER BY j.id
+            """,
+            tuple(params)
+        )
+
+    async def get_ingest_job_counts(self, kb_id: int) -> Dict[str, int]:
+        """Number of jobs per status (queued / running / done / failed) of a knowledge base."""
+        rows = await self._run(
+            self._fetchall,
+            "SELECT status, COUNT(*) AS count FROM kb_ingest_jobs WHERE kb_id = ? GROUP BY status",
+            (kb_id,)
+        )
+        counts = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+        counts.update({row["status"]: row["count"] for row in rows})
+        return counts
+
+    async def recover_ingest_jobs(self, max_attempts: int) -> Dict[str, int]:
+        """Restore the queue after a restart.
+
+        Jobs left running by the previous process are queued again, unless they
+        already used max_attempts (a file that keeps crashing the backend is
+        marked failed). Files waiting for ingestion without a job (uploaded
+        before the queue existed, or a crash between upload and enqueue) get one.
+
+        Args:
+            max_attempts: Attempts after which an interrupted job fails
+
+        Returns:
+            {"requeued": n, "failed": n, "enqueued": n}
+        """
+        def _recover(conn):
+            with write_transaction(conn) as cursor:
+                failed = cursor.execute("""
+                    UPDATE kb_ingest_jobs
+                    SET status = 'failed', error = 'Interrupted ' || attempts || ' times',
+                        updated_at = CURRENT_TIMESTAMP, finished_at = CURRENT_TIMESTAMP
+                    WHERE status = 'running' AND attempts >= ?
+                    RETURNING file_id, error
+                """, (max_attempts,)).fetchall()
+                cursor.executemany(
+                    "UPDATE kb_files SET status = 'error', error = ? WHERE id = ?",
+                    [(error, file_id) for file_id, error in failed]
+                )
+                cursor.execute("""
+                    UPDATE kb_ingest_jobs SET status = 'queued', updated_at = CURRENT_TIMESTAMP
+                    WHERE status = 'running'
+                """)
+                requeued = cursor.rowcount
+                cursor.execute("""
+                    INSERT INTO kb_ingest_jobs (file_id, kb_id)
+                    SELECT f.id, f.kb_id FROM kb_files f
+                    WHERE f.status IN ('pending', 'processing')
+                    AND NOT EXISTS (
+                        SELECT 1 FROM kb_ingest_jobs j
+                        WHERE j.file_id = f.id AND j.status = 'queued'
+                    )
+                    ON CONFLICT(file_id) DO UPDATE SET
+                        status = 'queued', stage = NULL, generation = generation + 1,
+                        attempts = 0, chunks_done = 0, chunks_reused = 0, error = NULL,
+                        updated_at = CURRENT_TIMESTAMP, started_at = NULL, finished_at = NULL
+                """)
+                enqueued = cursor.rowcount
+            return {"requeued": requeued, "failed": len(failed), "enqueued": enqueued}
+
+        return await self._run(_recover)
@@ -0,0 +1,108 @@
+"""
+Periodic cold-storage archiving of inactive sessions
+
+后台线程定期把长时间未更新的会话消息移入归档文件（见 SQLiteSession.archive_session），
+保持 sessions.db 及其索引的体积。归档会话在被访问时自动恢复。
+"""
+import logging
+import threading
+from typing import Optional, Dict, Any
+
+from .sqlite_session import SQLiteSession
+
+logger = logging.getLogger(__name__)
+
+
+class SessionArchiver:
+    """空闲会话定期归档"""
+
+    def __init__(
+        self,
+        db_session: SQLiteSession,
+        idle_days: float = 30,
+        interval: float = 3600,
+        batch_size: int = 50
+    ):
+        """
+        初始化归档器
+
+        Args:
+            db_session: SQLiteSession 实例
+            idle_days: 超过该天数未更新的会话被归档，<= 0 表示不归档
+            interval: 检查周期（秒）
+            batch_size: 每个周期最多归档的会话数
+        """
+        self.db_session = db_session
+        self.idle_days = idle_days
+        self.interval = interval
+        self.batch_size = batch_size
+
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+        # 统计信息
+        self.archived_count = 0
+        self.run_count = 0
+
+    @property
+    def is_running(self) -> bool:
+        """后台线程是否在运行"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """启动后台归档线程"""
+        if self.idle_days <= 0 or self.is_running:
+            return
+
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="session-archiver",
+            daemon=True
+        )
+        self._thread.start()
+        logger.info(
+            f"Session archiver started (idle_days={self.idle_days}, interval={self.interval}s)"
+        )
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        """停止后台线程（当前批次完成后退出）"""
+        if not self.is_running:
+            return
+
+        self._stopping.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"Session archiver did not stop within {timeout}s")
+        self._thread = None
+
+    def run_once(self) -> int:
+        """执行一次归档，返回被归档的会话数量"""
+        archived = self.db_session.archive_idle_sessions(self.idle_days, self.batch_size)
+        self.run_count += 1
+        self.archived_count += archived
+        if archived:
+            logger.info(f"Archived {archived} idle sessions")
+        return archived
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取归档统计信息"""
+        return {
+            "is_running": self.is_running,
+            "idle_days": self.idle_days,
+            "run_count": self.run_count,
+            "archived_count": self.archived_count
+        }
+
+    def _run(self) -> None:
+        """后台线程主循环"""
+        while not self._stopping.is_set():
+            try:
+                # 一批归档满时立即继续，直到没有可归档的会话
+                while self.run_once() >= self.batch_size and not self._stopping.is_set():
+                    pass
+            except Exception as e:
+                logger.error(f"Session archiving failed: {e}", exc_info=True)
+            self._stopping.wait(self.interval)
+
+        self.db_session.close()
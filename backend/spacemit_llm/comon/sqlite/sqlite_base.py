@@ -1,23 +1,156 @@
 """
 SQLite 数据库基类，用于 Zenow 后端
 """
+import queue
 import sqlite3
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, Any, List, Dict
+from typing import Optional, Any, List, Dict, Iterator
 import threading
 
+# 默认存储配置：WAL 模式下读写互不阻塞，synchronous=NORMAL 只在 checkpoint 时 fsync
+DEFAULT_PRAGMAS: Dict[str, Any] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,            # 毫秒，锁被占用时等待而不是立即报错
+    "cache_size": -16000,            # 负数表示 KiB，约 16MB 页缓存
+    "mmap_size": 256 * 1024 * 1024,  # 内存映射读取
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",            # SQLite 默认不启用外键约束
+}
+
+# 每个连接缓存的预编译语句数量
+DEFAULT_CACHED_STATEMENTS = 256
+
+
+def connect(
+    db_path,
+    pragmas: Optional[Dict[str, Any]] = None,
+    cached_statements: int = DEFAULT_CACHED_STATEMENTS
+) -> sqlite3.Connection:
+    """
+    打开 SQLite 连接并应用存储配置
+
+    Args:
+        db_path: 数据库文件路径
+        pragmas: PRAGMA 配置，默认使用 DEFAULT_PRAGMAS
+        cached_statements: 预编译语句缓存大小
+
+    Returns:
+        row_factory 为 sqlite3.Row 的连接
+    """
+    conn = sqlite3.connect(
+        str(db_path),
+        check_same_thread=False,
+        cached_statements=cached_statements
+    )
+    conn.row_factory = sqlite3.Row
+    for name, value in (DEFAULT_PRAGMAS if pragmas is None else pragmas).items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+@contextmanager
+def write_transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Cursor]:
+    """
+    在连接上执行一个写事务（BEGIN IMMEDIATE），正常退出时提交，出错时回滚
+
+    Args:
+        conn: 数据库连接
+
+    Yields:
+        当前事务的游标
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn.cursor()
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+class ConnectionPool:
+    """SQLite 连接池：按需创建连接，最多 size 个，用完归还复用"""
+
+    def __init__(
+        self,
+        db_path,
+        size: int = 4,
+        pragmas: Optional[Dict[str, Any]] = None
+    ):
+        """
+        初始化连接池
+
+        Args:
+            db_path: 数据库文件路径
+            size: 最大连接数
+            pragmas: 可选的 PRAGMA 配置
+        """
+        self.db_path = db_path
+        self.size = size
+        self.pragmas = pragmas
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """借出一个连接，连接数已满时等待其他调用方归还"""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                # 调用方未完成的事务不能带给下一个使用者
+                conn.rollback()
+            self._idle.put(conn)
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return connect(self.db_path, self.pragmas)
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get()
+
+    def close(self) -> None:
+        """关闭所有空闲连接"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
 
 class SQLiteBase:
     """SQLite 数据库操作基类"""
 
-    def __init__(self, db_path: Path):
+    def __init__(self, db_path: Path, pragmas: Optional[Dict[str, Any]] = None):
         """
         初始化 SQLite 数据库连接
 
         Args:
             db_path: SQLite 数据库文件路径
+            pragmas: 可选的 PRAGMA 配置，默认使用 DEFAULT_PRAGMAS
         """
         self.db_path = db_path
+        self.pragmas = pragmas
         self._local = threading.local()
         self._init_db()
 
@@ -25,12 +158,37 @@ class SQLiteBase:
     def conn(self) -> sqlite3.Connection:
         """获取线程本地数据库连接"""
         if not hasattr(self._local, 'conn') or self._local.conn is None:
-            self._local.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
-            self._local.conn.row_factory = sqlite3.Row
-            # 启用外键约束（SQLite 默认不启用）
-            self._local.conn.execute("PRAGMA foreign_keys = ON")
+            self._local.conn = connect(self.db_path, self.pragmas)
+            self._local.depth = 0
         return self._local.conn
 
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Cursor]:
+        """
+        在一个事务中执行多条语句，退出时只提交一次，出错时回滚
+
+        可以嵌套使用，只有最外层提交；事务内调用 execute() 不会单独提交。
+        最外层使用 BEGIN IMMEDIATE 预先获取写锁，避免 WAL 下读锁升级失败。
+
+        Yields:
+            当前事务的游标
+        """
+        conn = self.conn
+        depth = self._local.depth
+        if depth == 0 and not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        self._local.depth = depth + 1
+        try:
+            yield conn.cursor()
+        except BaseException:
+            self._local.depth = depth
+            if depth == 0:
+                conn.rollback()
+            raise
+        self._local.depth = depth
+        if depth == 0:
+            conn.commit()
+
     def _init_db(self):
         """初始化数据库模式 - 由子类实现"""
         pass
@@ -48,7 +206,8 @@ class SQLiteBase:
         """
         cursor = self.conn.cursor()
         cursor.execute(query, params)
-        self.conn.commit()
+        if self._local.depth == 0:
+            self.conn.commit()
         return cursor
 
     def fetchone(self, query: str, params: tuple = ()) -> Optional[Dict[str, Any]]:
@@ -0,0 +1,273 @@
+"""
+In-memory LRU cache of hot session histories
+
+缓存最近活跃会话的元数据和尾部消息窗口，由 SQLiteSession 的写操作直写更新，
+活跃会话的读路径（get_session / get_messages_within_token_limit）无需访问磁盘。
+"""
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List
+
+# 每条消息除内容外的估算内存开销（字节）
+_MESSAGE_OVERHEAD_BYTES = 200
+
+
+class _CachedSession:
+    """单个会话的缓存条目"""
+
+    __slots__ = ("session", "messages", "covered_from", "nbytes")
+
+    def __init__(self):
+        # 会话元数据（sessions 表的一行）
+        self.session: Optional[Dict[str, Any]] = None
+        # 尾部消息窗口（按 id 正序，包含 token_offset），None 表示未加载
+        self.messages: Optional[List[Dict[str, Any]]] = None
+        # 窗口包含所有 token_offset >= covered_from 的消息；<= 0 表示包含整个会话
+        self.covered_from: int = 0
+        self.nbytes: int = 0
+
+
+def _message_size(message: Dict[str, Any]) -> int:
+    """估算单条消息占用的内存"""
+    return len(message["content"]) + _MESSAGE_OVERHEAD_BYTES
+
+
+def _public_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """返回去掉内部字段的消息副本"""
+    return {key: value for key, value in message.items() if key != "token_offset"}
+
+
+class SessionHistoryCache:
+    """会话历史 LRU 缓存（线程安全）"""
+
+    def __init__(
+        self,
+        max_sessions: int = 256,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_messages_per_session: int = 500
+    ):
+        """
+        初始化缓存
+
+        Args:
+            max_sessions: 最多缓存的会话数
+            max_bytes: 所有缓存消息的估算内存上限（字节）
+            max_messages_per_session: 每个会话最多缓存的尾部消息数
+        """
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.max_messages_per_session = max_messages_per_session
+
+        self._entries: "OrderedDict[int, _CachedSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        # 每次写操作递增，用于丢弃与写入并发的数据库读取结果
+        self._write_seq = 0
+
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ==================== Read Path ====================
+
+    def get_session(self, session_id: int) -> Optional[Dict[str, Any]]:
+        """获取缓存的会话元数据，未命中返回 None"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or entry.session is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return dict(entry.session)
+
+    def get_window(self, session_id: int, available_tokens: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        从缓存中选取 token 数不超过 available_tokens 的尾部消息
+
+        Returns:
+            消息列表（按时间正序）；缓存无法完整回答时返回 None
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or entry.messages is None:
+                self.misses += 1
+                return None
+
+            messages = entry.messages
+            if messages:
+                last = messages[-1]
+                threshold = last["token_offset"] + last["token_count"] - available_tokens
+            else:
+                threshold = 0
+
+            if entry.covered_from > 0 and threshold < entry.covered_from:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return [_public_message(m) for m in messages if m["token_offset"] >= threshold]
+
+    # ==================== Fill / Write-through ====================
+
+    def fill_token(self) -> int:
+        """在从数据库读取前获取填充令牌，读取期间若发生写入则该次填充被丢弃"""
+        with self._lock:
+            return self._write_seq
+
+    def put_session(
+        self,
+        session_id: int,
+        session: Optional[Dict[str, Any]],
+        token: Optional[int] = None
+    ) -> None:
+        """缓存会话元数据（None 表示会话不存在，移除条目）"""
+        with self._lock:
+            if token is not None and token != self._write_seq:
+                return
+            if session is None:
+                self._remove(session_id)
+                return
+            entry = self._get_or_create(session_id)
+            entry.session = dict(session)
+            self._evict()
+
+    def put_window(
+        self,
+        session_id: int,
+        messages: List[Dict[str, Any]],
+        covered_from: int,
+        token: Optional[int] = None
+    ) -> None:
+        """
+        缓存从数据库读取的尾部消息窗口
+
+        Args:
+            session_id: 会话 ID
+            messages: 消息列表（按 id 正序，包含 token_offset）
+            covered_from: 窗口包含所有 token_offset >= covered_from 的消息
+            token: 读取前获取的填充令牌
+        """
+        with self._lock:
+            if token is not None and token != self._write_seq:
+                return
+            entry = self._get_or_create(session_id)
+            self._set_messages(entry, [dict(m) for m in messages], max(covered_from, 0))
+            self._evict()
+
+    def append_messages(
+        self,
+        session_id: int,
+        messages: List[Dict[str, Any]],
+        session: Optional[Dict[str, Any]] = None
+    ) -> None:
+        """
+        写入新消息后直写更新缓存（仅更新已缓存的会话）
+
+        Args:
+            session_id: 会话 ID
+            messages: 新消息（按 id 正序，包含 token_offset）
+            session: 写入后的会话元数据
+        """
+        with self._lock:
+            self._write_seq += 1
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return
+            if session is not None:
+                entry.session = dict(session)
+            if entry.messages is not None:
+                # 跳过并发填充时已经读到的消息
+                last_id = entry.messages[-1]["id"] if entry.messages else 0
+                new_messages = [dict(m) for m in messages if m["id"] > last_id]
+                self._set_messages(entry, entry.messages + new_messages, entry.covered_from)
+            self._evict()
+
+    def mark_write(self) -> None:
+        """记录一次未缓存会话的写入，使并发进行的填充失效"""
+        with self._lock:
+            self._write_seq += 1
+
+    def reset_messages(self, session_id: int, session: Optional[Dict[str, Any]] = None) -> None:
+        """会话消息被清空后更新缓存"""
+        with self._lock:
+            self._write_seq += 1
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return
+            if session is not None:
+                entry.session = dict(session)
+            self._set_messages(entry, [], 0)
+
+    def contains(self, session_id: int) -> bool:
+        """会话是否在缓存中"""
+        with self._lock:
+            return session_id in self._entries
+
+    def invalidate(self, session_id: int) -> None:
+        """移除会话的缓存条目"""
+        with self._lock:
+            self._write_seq += 1
+            self._remove(session_id)
+
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._write_seq += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "sessions": len(self._entries),
+                "bytes": self._bytes,
+                "max_sessions": self.max_sessions,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions
+            }
+
+    # ==================== Internal (caller holds lock) ====================
+
+    def _get_or_create(self, session_id: int) -> _CachedSession:
+        entry = self._entries.get(session_id)
+        if entry is None:
+            entry = _CachedSession()
+            self._entries[session_id] = entry
+        self._entries.move_to_end(session_id)
+        return entry
+
+    def _set_messages(self, entry: _CachedSession, messages: List[Dict[str, Any]], covered_from: int) -> None:
+        """设置消息窗口，超过单会话上限时丢弃最旧的消息"""
+        overflow = len(messages) - self.max_messages_per_session
+        if overflow > 0:
+            # 被丢弃的消息 token_offset 均 <= 最后一条被丢弃消息的 token_offset
+            covered_from = max(covered_from, messages[overflow - 1]["token_offset"] + 1)
+            messages = messages[overflow:]
+
+        nbytes = sum(_message_size(m) for m in messages)
+        self._bytes += nbytes - entry.nbytes
+        entry.messages = messages
+        entry.covered_from = covered_from
+        entry.nbytes = nbytes
+
+    def _remove(self, session_id: int) -> None:
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+
+    def _evict(self) -> None:
+        """按 LRU 顺序淘汰条目直到满足内存限制（至少保留最近使用的一个）"""
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_sessions or self._bytes > self.max_bytes
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.nbytes
+            self.evictions += 1
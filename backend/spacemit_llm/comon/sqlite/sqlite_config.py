@@ -1,18 +1,56 @@
 """
 SQLite configuration management for Zenow backend
+
+参数和当前模型在进程内维护一份类型化快照：首次读取时从数据库加载一次，
+之后由 set_parameter / set_current_model 等写操作以整体替换的方式原子更新。
+组件可以通过 subscribe() 订阅变更，而不必反复查询数据库。
 """
 import json
+import logging
+import threading
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from types import MappingProxyType
+from typing import Optional, Dict, Any, List, Callable, Mapping
 from .sqlite_base import SQLiteBase
 
+logger = logging.getLogger(__name__)
+
+# 当前模型变更通知使用的名称前缀，例如 "current_model.llm"
+CURRENT_MODEL_PREFIX = "current_model."
+
+# 变更回调：callback(name, value)
+ConfigListener = Callable[[str, Any], None]
+
+# 缓存中表示“该模式没有当前模型”的标记
+_NO_MODEL = object()
+
+
+def _convert_parameter(value_str: str, param_type: str) -> Any:
+    """按参数类型转换数据库中的字符串值"""
+    if param_type == "int":
+        return int(value_str)
+    elif param_type == "float":
+        return float(value_str)
+    elif param_type == "bool":
+        return value_str.lower() == "true"
+    elif param_type in ["dict", "list"]:
+        return json.loads(value_str)
+    else:
+        return value_str
+
 
 class SQLiteConfig(SQLiteBase):
     """SQLite database class for configuration persistence"""
 
-    def __init__(self, db_path: Path):
+    def __init__(self, db_path: Path, pragmas: Optional[Dict[str, Any]] = None):
         """Initialize configuration database"""
-        super().__init__(db_path)
+        # 参数快照（只整体替换，不原地修改），None 表示尚未加载
+        self._params: Optional[Dict[str, Any]] = None
+        # 各模式的当前模型缓存
+        self._current_models: Dict[str, Any] = {}
+        self._snapshot_lock = threading.RLock()
+        self._listeners: List[ConfigListener] = []
+        super().__init__(db_path, pragmas)
 
     def _init_db(self):
         """初始化配置表"""
@@ -182,11 +220,25 @@ class SQLiteConfig(SQLiteBase):
 
     def get_current_model(self, mode: str = "llm") -> Optional[Dict[str, Any]]:
         """
-        获取当前活动模型
+        获取当前活动模型（读取进程内缓存）
 
         Args:
             mode: 模型模式 ('llm', 'embed', 'rerank')
         """
+        with self._snapshot_lock:
+            cached = self._current_models.get(mode)
+        if cached is _NO_MODEL:
+            return None
+        if cached is not None:
+            return dict(cached)
+
+        model = self._load_current_model(mode)
+        with self._snapshot_lock:
+            self._current_models[mode] = model if model is not None else _NO_MODEL
+        return dict(model) if model is not None else None
+
+    def _load_current_model(self, mode: str) -> Optional[Dict[str, Any]]:
+        """从数据库读取当前活动模型"""
         query = """
             SELECT
                 id,
@@ -235,13 +287,19 @@ class SQLiteConfig(SQLiteBase):
                 f"Model mode mismatch: expected '{mode}', got '{model.get('mode')}'"
             )
 
-        # First, unset all current models for this mode
-        self.execute("UPDATE model_info SET is_current = 0 WHERE mode = ?", (mode,))
-        # Then set the specified model as current
-        self.execute(
-            "UPDATE model_info SET is_current = 1, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
-            (model_id,)
-        )
+        with self.transaction() as cursor:
+            # First, unset all current models for this mode
+            cursor.execute("UPDATE model_info SET is_current = 0 WHERE mode = ?", (mode,))
+            # Then set the specified model as current
+            cursor.execute(
+                "UPDATE model_info SET is_current = 1, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (model_id,)
+            )
+
+        current = self._load_current_model(mode)
+        with self._snapshot_lock:
+            self._current_models[mode] = current if current is not None else _NO_MODEL
+        self._notify(CURRENT_MODEL_PREFIX + mode, dict(current) if current else None)
         return True
 
     def update_model_download_status(self, model_id: int, is_downloaded: bool) -> bool:
@@ -259,6 +317,7 @@ class SQLiteConfig(SQLiteBase):
             "UPDATE model_info SET is_downloaded = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
             (is_downloaded, model_id)
         )
+        self._invalidate_current_model(model_id)
         return True
 
     def check_and_update_download_status(self, model_id: int) -> bool:
@@ -286,11 +345,19 @@ class SQLiteConfig(SQLiteBase):
     def delete_model(self, model_id: int) -> bool:
         """Delete a model from configuration"""
         self.execute("DELETE FROM model_info WHERE id = ?", (model_id,))
+        self._invalidate_current_model(model_id)
         return True
 
+    def _invalidate_current_model(self, model_id: int) -> None:
+        """模型行被修改后，丢弃引用该模型的当前模型缓存"""
+        with self._snapshot_lock:
+            for mode, cached in list(self._current_models.items()):
+                if cached is not _NO_MODEL and cached["id"] == model_id:
+                    del self._current_models[mode]
+
     # LLM parameters methods
     def set_parameter(self, name: str, value: Any, param_type: str = "string") -> None:
-        """Set a parameter value"""
+        """Set a parameter value and publish it to the in-process snapshot"""
         value_str = json.dumps(value) if param_type in ["dict", "list"] else str(value)
         self.execute("""
             INSERT INTO llm_parameters (parameter_name, parameter_value, parameter_type)
@@ -301,48 +368,115 @@ class SQLiteConfig(SQLiteBase):
                 updated_at = CURRENT_TIMESTAMP
         """, (name, value_str, param_type))
 
+        # 与从数据库读取时的类型保持一致
+        typed_value = _convert_parameter(value_str, param_type)
+        with self._snapshot_lock:
+            if self._params is not None:
+                # copy-on-write：读者持有的旧快照不会被修改
+                params = dict(self._params)
+                params[name] = typed_value
+                self._params = params
+        self._notify(name, typed_value)
+
     def get_parameter(self, name: str, default: Any = None) -> Any:
-        """Get a parameter value"""
-        result = self.fetchone(
-            "SELECT parameter_value, parameter_type FROM llm_parameters WHERE parameter_name = ?",
-            (name,)
-        )
-        if not result:
-            return default
-
-        value_str = result['parameter_value']
-        param_type = result['parameter_type']
-
-        # Convert based on type
-        if param_type == "int":
-            return int(value_str)
-        elif param_type == "float":
-            return float(value_str)
-        elif param_type == "bool":
-            return value_str.lower() == "true"
-        elif param_type in ["dict", "list"]:
-            return json.loads(value_str)
-        else:
-            return value_str
+        """Get a parameter value from the snapshot"""
+        return self._parameters().get(name, default)
 
     def get_all_parameters(self) -> Dict[str, Any]:
         """Get all parameters"""
-        results = self.fetchall("SELECT parameter_name, parameter_value, parameter_type FROM llm_parameters")
-        params = {}
-        for row in results:
-            name = row['parameter_name']
-            value_str = row['parameter_value']
-            param_type = row['parameter_type']
-
-            if param_type == "int":
-                params[name] = int(value_str)
-            elif param_type == "float":
-                params[name] = float(value_str)
-            elif param_type == "bool":
-                params[name] = value_str.lower() == "true"
-            elif param_type in ["dict", "list"]:
-                params[name] = json.loads(value_str)
-            else:
-                params[name] = value_str
-
-        return params
+        return dict(self._parameters())
+
+    def get_snapshot(self) -> Mapping[str, Any]:
+        """
+        获取参数快照的只读视图
+
+        快照只会被整体替换，因此返回的视图在之后的写入中保持不变。
+        """
+        return MappingProxyType(self._parameters())
+
+    def reload(self) -> None:
+        """
+        从数据库重新加载参数和当前模型快照（数据库被外部修改时使用）
+
+        与旧快照比较，对发生变化的参数和当前模型通知订阅者；被删除的参数以 None 通知。
+        """
+        params = self._load_parameters()
+        with self._snapshot_lock:
+            old_params = self._params
+            old_models = dict(self._current_models)
+        # 只重新加载已缓存的模式，其余模式在下次读取时加载
+        models = {mode: self._load_current_model(mode) for mode in old_models}
+        with self._snapshot_lock:
+            self._params = params
+            self._current_models.clear()
+            for mode, model in models.items():
+                self._current_models[mode] = model if model is not None else _NO_MODEL
+
+        # 旧快照尚未加载时没有订阅者读到过参数，无需通知
+        if old_params is not None:
+            for name in old_params.keys() - params.keys():
+                self._notify(name, None)
+            for name, value in params.items():
+                if name not in old_params or old_params[name] != value:
+                    self._notify(name, value)
+        for mode, model in models.items():
+            old = old_models[mode]
+            old = None if old is _NO_MODEL else old
+            if old != model:
+                self._notify(CURRENT_MODEL_PREFIX + mode, dict(model) if model else None)
+
+    def _load_parameters(self) -> Dict[str, Any]:
+        """从数据库读取全部参数并转换类型"""
+        results = self.fetchall(
+            "SELECT parameter_name, parameter_value, parameter_type FROM llm_parameters"
+        )
+        return {
+            row['parameter_name']: _convert_parameter(row['parameter_value'], row['parameter_type'])
+            for row in results
+        }
+
+    def _parameters(self) -> Dict[str, Any]:
+        """返回当前参数快照，首次调用时从数据库加载"""
+        params = self._params
+        if params is not None:
+            return params
+
+        with self._snapshot_lock:
+            if self._params is None:
+                self._params = self._load_parameters()
+            return self._params
+
+    # Change notification methods
+    def subscribe(self, listener: ConfigListener) -> Callable[[], None]:
+        """
+        订阅配置变更
+
+        参数变更时以 (参数名, 新值) 调用；当前模型变更时以
+        ("current_model.<mode>", 模型信息) 调用。回调在写入方线程中同步执行，
+        应保持轻量。
+
+        Args:
+            listener: 回调函数 callback(name, value)
+
+        Returns:
+            取消订阅的函数
+        """
+        with self._snapshot_lock:
+            self._listeners.append(listener)
+
+        def unsubscribe():
+            with self._snapshot_lock:
+                if listener in self._listeners:
+                    self._listeners.remove(listener)
+
+        return unsubscribe
+
+    def _notify(self, name: str, value: Any) -> None:
+        """通知所有订阅者（单个回调出错不影响其他订阅者）"""
+        with self._snapshot_lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(name, value)
+            except Exception as e:
+                logger.error(f"Config listener failed for '{name}': {e}", exc_info=True)
@@ -1,19 +1,119 @@
 """
 SQLite session management for chat history
 """
+import gzip
 import json
+import logging
+import os
+import sqlite3
+import zlib
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple, Iterator
 from datetime import datetime
-from .sqlite_base import SQLiteBase
+from .sqlite_base import SQLiteBase, connect
+from .sqlite_cache import SessionHistoryCache
+
+logger = logging.getLogger(__name__)
+
+# 全文检索支持的分词器：trigram 适合中日韩文本（子串匹配），unicode61 按词切分
+SEARCH_TOKENIZERS = ("trigram", "unicode61")
+
+# 搜索结果摘要中关键词的标记
+SNIPPET_START = "<mark>"
+SNIPPET_END = "</mark>"
+
+
+# 消息内容编码：plain 为原文 TEXT，zlib 为压缩后的 UTF-8 BLOB
+CODEC_PLAIN = "plain"
+CODEC_ZLIB = "zlib"
+
+
+def _encode_content(content: str, threshold: Optional[int]) -> Tuple[Any, str]:
+    """
+    超过阈值（字节）且压缩后更小的消息内容使用 zlib 压缩
+
+    Returns:
+        (存储值, 编码)
+    """
+    if threshold:
+        raw = content.encode("utf-8")
+        if len(raw) >= threshold:
+            compressed = zlib.compress(raw, 6)
+            if len(compressed) < len(raw):
+                return compressed, CODEC_ZLIB
+    return content, CODEC_PLAIN
+
+
+def _decode_content(value: Any, codec: Optional[str]) -> str:
+    """还原消息内容"""
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(value).decode("utf-8")
+    return value
+
+
+def _decode_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """就地解码查询结果中的 content 并移除 codec 字段"""
+    for row in rows:
+        row['content'] = _decode_content(row['content'], row.pop('codec'))
+    return rows
+
+
+# 插入消息，token_offset 为同一会话中之前所有消息的 token 累计和
+_INSERT_MESSAGE_SQL = """
+    INSERT INTO messages (session_id, role, content, codec, token_count, token_offset)
+    VALUES (?, ?, ?, ?, ?, COALESCE((
+        SELECT token_offset + token_count FROM messages
+        WHERE session_id = ?
+        ORDER BY token_offset DESC, id DESC
+        LIMIT 1
+    ), 0))
+"""
+
+
+class SessionImport:
+    """一次导入的进度状态：原会话 ID 到新会话 ID 的映射，以及各会话的累计统计"""
+
+    def __init__(self):
+        self.session_ids: Dict[Any, int] = {}
+        # 新会话 ID -> [消息数, token 总数]（token 总数同时是下一条消息的 token_offset）
+        self.stats: Dict[int, List[int]] = {}
+        self.session_count = 0
+        self.message_count = 0
 
 
 class SQLiteSession(SQLiteBase):
     """SQLite database class for chat session management"""
 
-    def __init__(self, db_path: Path):
-        """Initialize session database"""
-        super().__init__(db_path)
+    def __init__(
+        self,
+        db_path: Path,
+        cache: Optional[SessionHistoryCache] = None,
+        pragmas: Optional[Dict[str, Any]] = None,
+        search_tokenizer: str = "trigram",
+        compress_threshold: Optional[int] = 4096,
+        archive_dir: Optional[Path] = None
+    ):
+        """
+        Initialize session database
+
+        Args:
+            db_path: SQLite 数据库文件路径
+            cache: 可选的会话历史缓存，由写操作直写更新
+            pragmas: 可选的 PRAGMA 配置
+            search_tokenizer: 全文检索分词器 ('trigram' 或 'unicode61')
+            compress_threshold: 超过该字节数的消息压缩存储，None 或 0 表示不压缩
+            archive_dir: 归档文件目录，默认为数据库同级的 archive/sessions
+        """
+        if search_tokenizer not in SEARCH_TOKENIZERS:
+            raise ValueError(
+                f"Invalid search tokenizer: {search_tokenizer}. Must be 'trigram' or 'unicode61'"
+            )
+        self.cache = cache
+        self.search_tokenizer = search_tokenizer
+        self.search_enabled = False
+        self.compress_threshold = compress_threshold
+        self.archive_dir = Path(archive_dir) if archive_dir else Path(db_path).parent / "archive" / "sessions"
+        super().__init__(db_path, pragmas)
 
     def _init_db(self):
         """初始化会话表"""
@@ -25,10 +125,22 @@ class SQLiteSession(SQLiteBase):
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 message_count INTEGER DEFAULT 0,
-                total_tokens INTEGER DEFAULT 0
+                total_tokens INTEGER DEFAULT 0,
+                archived_at TIMESTAMP DEFAULT NULL,
+                archive_path TEXT DEFAULT NULL
             )
         """)
 
+        # 为已存在的表添加归档字段（如果不存在）
+        for column in ("archived_at TIMESTAMP", "archive_path TEXT"):
+            name = column.split()[0]
+            result = self.fetchone(
+                "SELECT COUNT(*) as count FROM pragma_table_info('sessions') WHERE name = ?",
+                (name,)
+            )
+            if result and result['count'] == 0:
+                self.execute(f"ALTER TABLE sessions ADD COLUMN {column} DEFAULT NULL")
+
         # 消息表
         self.execute("""
             CREATE TABLE IF NOT EXISTS messages (
@@ -36,23 +148,174 @@ class SQLiteSession(SQLiteBase):
                 session_id INTEGER NOT NULL,
                 role TEXT NOT NULL,
                 content TEXT NOT NULL,
+                codec TEXT NOT NULL DEFAULT 'plain',
                 token_count INTEGER DEFAULT 0,
+                token_offset INTEGER DEFAULT 0,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (session_id) REFERENCES sessions(id) ON DELETE CASCADE
             )
         """)
 
-        # 创建索引以提高查询性能
+        # 为已存在的表添加 token_offset 字段（如果不存在）
+        self._add_token_offset_column_if_not_exists()
+
+        # 为已存在的表添加 codec 字段（如果不存在），旧数据均为原文
+        result = self.fetchone("""
+            SELECT COUNT(*) as count
+            FROM pragma_table_info('messages')
+            WHERE name='codec'
+        """)
+        if result and result['count'] == 0:
+            self.execute("ALTER TABLE messages ADD COLUMN codec TEXT NOT NULL DEFAULT 'plain'")
+
+        # 创建索引以提高查询性能（键集分页按 (updated_at, id) 和 (session_id, id) 定位）
+        self.execute("DROP INDEX IF EXISTS idx_sessions_updated_at")
+        self.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sessions_updated_keyset
+            ON sessions(updated_at DESC, id DESC)
+        """)
+
+        self.execute("DROP INDEX IF EXISTS idx_messages_session_id")
         self.execute("""
-            CREATE INDEX IF NOT EXISTS idx_sessions_updated_at
-            ON sessions(updated_at DESC)
+            CREATE INDEX IF NOT EXISTS idx_messages_session_keyset
+            ON messages(session_id, id)
         """)
 
+        # 按累计 token 选取历史窗口
         self.execute("""
-            CREATE INDEX IF NOT EXISTS idx_messages_session_id
-            ON messages(session_id, created_at ASC)
+            CREATE INDEX IF NOT EXISTS idx_messages_session_offset
+            ON messages(session_id, token_offset)
         """)
 
+        # 消息全文检索索引
+        self._init_search_index()
+
+    def _init_search_index(self):
+        """
+        创建 FTS5 全文检索表 messages_fts（rowid 即消息 ID）
+
+        表不存在或分词器与配置不同时重建并回填；当前 SQLite 不支持 trigram
+        时退回 unicode61，不支持 FTS5 时禁用索引，搜索退回 LIKE 扫描。
+        """
+        existing = self.fetchone(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        )
+        if existing and f"tokenize='{self.search_tokenizer}'" in existing['sql']:
+            self.search_enabled = True
+            return
+
+        try:
+            with self.transaction():
+                if existing:
+                    self.execute("DROP TABLE messages_fts")
+                self.execute(f"""
+                    CREATE VIRTUAL TABLE messages_fts USING fts5(
+                        content,
+                        session_id UNINDEXED,
+                        tokenize='{self.search_tokenizer}'
+                    )
+                """)
+                self.search_enabled = True
+                self._backfill_search_index()
+        except sqlite3.OperationalError as e:
+            self.search_enabled = False
+            if self.search_tokenizer != "unicode61":
+                logger.warning(f"FTS5 tokenizer '{self.search_tokenizer}' unavailable ({e}), using unicode61")
+                self.search_tokenizer = "unicode61"
+                self._init_search_index()
+            else:
+                logger.warning(f"FTS5 unavailable ({e}), message search falls back to LIKE scans")
+                self.search_enabled = False
+
+    def _backfill_search_index(self, batch_size: int = 1000) -> None:
+        """把已有消息（解码后的原文）分批写入全文检索索引"""
+        last_id = 0
+        while True:
+            rows = self.fetchall(
+                """
+                SELECT id, session_id, content, codec FROM messages
+                WHERE id > ? ORDER BY id LIMIT ?
+                """,
+                (last_id, batch_size)
+            )
+            if not rows:
+                break
+            _decode_rows(rows)
+            self._index_messages(
+                self.conn.cursor(),
+                [(row['id'], row['content'], row['session_id']) for row in rows]
+            )
+            last_id = rows[-1]['id']
+
+    def _index_messages(self, cursor, rows: List[Tuple[int, str, int]]) -> None:
+        """
+        在当前事务中把消息加入全文检索索引
+
+        Args:
+            cursor: 当前事务的游标
+            rows: (消息 ID, 内容, 会话 ID) 列表
+        """
+        if self.search_enabled and rows:
+            cursor.executemany(
+                "INSERT INTO messages_fts (rowid, content, session_id) VALUES (?, ?, ?)",
+                rows
+            )
+
+    def _unindex_session(self, cursor, session_id: int) -> None:
+        """在当前事务中移除会话所有消息的索引（需在删除消息之前调用）"""
+        if self.search_enabled:
+            cursor.execute(
+                """
+                DELETE FROM messages_fts
+                WHERE rowid IN (SELECT id FROM messages WHERE session_id = ?)
+                """,
+                (session_id,)
+            )
+
+    def _add_token_offset_column_if_not_exists(self):
+        """为已存在的 messages 表添加 token_offset 字段并回填"""
+        result = self.fetchone("""
+            SELECT COUNT(*) as count
+            FROM pragma_table_info('messages')
+            WHERE name='token_offset'
+        """)
+
+        if result and result['count'] == 0:
+            with self.transaction():
+                self.execute("ALTER TABLE messages ADD COLUMN token_offset INTEGER DEFAULT 0")
+                self._rebuild_token_offsets()
+
+    def _rebuild_token_offsets(self, session_id: Optional[int] = None) -> int:
+        """
+        用窗口函数重建消息的 token 累计偏移
+
+        Args:
+            session_id: 可选，只重建指定会话
+
+        Returns:
+            被修正的消息数量
+        """
+        where = "WHERE session_id = ?" if session_id is not None else ""
+        params = (session_id,) if session_id is not None else ()
+        cursor = self.execute(
+            f"""
+            UPDATE messages
+            SET token_offset = w.token_offset
+            FROM (
+                SELECT
+                    id,
+                    SUM(token_count) OVER (
+                        PARTITION BY session_id ORDER BY id
+                    ) - token_count AS token_offset
+                FROM messages
+                {where}
+            ) AS w
+            WHERE messages.id = w.id AND messages.token_offset IS NOT w.token_offset
+            """,
+            params
+        )
+        return cursor.rowcount
+
     # ==================== Session Management ====================
 
     def create_session(self, first_user_message: str, max_name_length: int = 12) -> int:
@@ -79,33 +342,75 @@ class SQLiteSession(SQLiteBase):
 
     def get_session(self, session_id: int) -> Optional[Dict[str, Any]]:
         """获取会话信息"""
-        return self.fetchone(
+        token = None
+        if self.cache:
+            session = self.cache.get_session(session_id)
+            if session is not None:
+                return session
+            token = self.cache.fill_token()
+
+        session = self.fetchone(
             "SELECT * FROM sessions WHERE id = ?",
             (session_id,)
         )
+        if self.cache and session is not None:
+            self.cache.put_session(session_id, session, token)
+        return session
 
-    def get_all_sessions(self, limit: int = 100, offset: int = 0) -> List[Dict[str, Any]]:
+    def get_all_sessions(
+        self,
+        limit: int = 100,
+        offset: int = 0,
+        after: Optional[Tuple[str, int]] = None,
+        before: Optional[Tuple[str, int]] = None
+    ) -> List[Dict[str, Any]]:
         """
         获取所有会话，按更新时间倒序排列
 
+        传入 after / before 时使用键集分页（不扫描跳过的行），忽略 offset。
+
         Args:
             limit: 返回的最大会话数
-            offset: 偏移量（用于分页）
+            offset: 偏移量（兼容旧的分页方式）
+            after: 可选的 (updated_at, id)，返回排在其后（更旧）的会话
+            before: 可选的 (updated_at, id)，返回排在其前（更新）的会话
 
         Returns:
             会话列表
         """
+        columns = """
+            id,
+            session_name,
+            created_at,
+            updated_at,
+            message_count,
+            total_tokens
+        """
+        if after is not None:
+            return self.fetchall(
+                f"""
+                SELECT {columns} FROM sessions
+                WHERE (updated_at, id) < (?, ?)
+                ORDER BY updated_at DESC, id DESC
+                LIMIT ?
+                """,
+                (after[0], after[1], limit)
+            )
+        if before is not None:
+            rows = self.fetchall(
+                f"""
+                SELECT {columns} FROM sessions
+                WHERE (updated_at, id) > (?, ?)
+                ORDER BY updated_at ASC, id ASC
+                LIMIT ?
+                """,
+                (before[0], before[1], limit)
+            )
+            return rows[::-1]
         return self.fetchall(
-            """
-            SELECT
-                id,
-                session_name,
-                created_at,
-                updated_at,
-                message_count,
-                total_tokens
-            FROM sessions
-            ORDER BY updated_at DESC
+            f"""
+            SELECT {columns} FROM sessions
+            ORDER BY updated_at DESC, id DESC
             LIMIT ? OFFSET ?
             """,
             (limit, offset)
@@ -130,6 +435,8 @@ class SQLiteSession(SQLiteBase):
             """,
             (new_name, session_id)
         )
+        if self.cache:
+            self.cache.invalidate(session_id)
         return True
 
     def delete_session(self, session_id: int) -> bool:
@@ -142,12 +449,23 @@ class SQLiteSession(SQLiteBase):
         Returns:
             是否成功
         """
-        self.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        with self.transaction() as cursor:
+            row = cursor.execute(
+                "SELECT archive_path FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            self._unindex_session(cursor, session_id)
+            cursor.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+        if self.cache:
+            self.cache.invalidate(session_id)
+        if row and row['archive_path']:
+            self._remove_archive_file(row['archive_path'])
         return True
 
     def update_session_stats(self, session_id: int) -> bool:
         """
-        更新会话统计信息（消息数量、总 token 数、更新时间）
+        按消息表全量重算单个会话的统计信息（消息数量、总 token 数、更新时间）
+
+        正常写入路径使用增量更新，此方法仅用于修复
 
         Args:
             session_id: 会话 ID
@@ -155,22 +473,151 @@ class SQLiteSession(SQLiteBase):
         Returns:
             是否成功
         """
-        self.execute(
+        with self.transaction() as cursor:
+            restored = self._restore_in_transaction(cursor, session_id)
+            cursor.execute(
+                """
+                UPDATE sessions
+                SET
+                    message_count = (
+                        SELECT COUNT(*) FROM messages WHERE session_id = ?
+                    ),
+                    total_tokens = (
+                        SELECT COALESCE(SUM(token_count), 0) FROM messages WHERE session_id = ?
+                    ),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+                """,
+                (session_id, session_id, session_id)
+            )
+        self._finish_restore(session_id, restored)
+        if self.cache:
+            self.cache.invalidate(session_id)
+        return True
+
+    def rebuild_session_stats(self, session_id: Optional[int] = None) -> int:
+        """
+        批量重建会话统计信息和消息 token 累计偏移（修复命令），不修改更新时间
+
+        已归档会话的消息不在消息表中，保留其统计信息
+
+        Args:
+            session_id: 可选，只修复指定会话；默认修复所有会话
+
+        Returns:
+            统计信息被修正的会话数量
+        """
+        where = "WHERE s.archived_at IS NULL"
+        params = ()
+        if session_id is not None:
+            where += " AND s.id = ?"
+            params = (session_id,)
+        with self.transaction():
+            cursor = self.execute(
+                f"""
+                UPDATE sessions
+                SET message_count = agg.cnt, total_tokens = agg.tokens
+                FROM (
+                    SELECT
+                        s.id AS sid,
+                        COUNT(m.id) AS cnt,
+                        COALESCE(SUM(m.token_count), 0) AS tokens
+                    FROM sessions s
+                    LEFT JOIN messages m ON m.session_id = s.id
+                    {where}
+                    GROUP BY s.id
+                ) AS agg
+                WHERE sessions.id = agg.sid
+                  AND (sessions.message_count != agg.cnt OR sessions.total_tokens != agg.tokens)
+                """,
+                params
+            )
+            repaired = cursor.rowcount
+
+            self._rebuild_token_offsets(session_id)
+
+        if self.cache:
+            if session_id is None:
+                self.cache.clear()
+            else:
+                self.cache.invalidate(session_id)
+
+        return repaired
+
+    def compress_existing_messages(self, batch_size: int = 500) -> int:
+        """
+        压缩已有的超过阈值的原文消息（后台迁移，每批一个短事务）
+
+        内容不变，缓存和全文检索索引无需更新。
+
+        Args:
+            batch_size: 每批处理的消息数
+
+        Returns:
+            被压缩的消息数量
+        """
+        if not self.compress_threshold:
+            return 0
+
+        compressed = 0
+        last_id = 0
+        while True:
+            rows = self.fetchall(
+                """
+                SELECT id, content FROM messages
+                WHERE id > ? AND codec = 'plain' AND length(CAST(content AS BLOB)) >= ?
+                ORDER BY id
+                LIMIT ?
+                """,
+                (last_id, self.compress_threshold, batch_size)
+            )
+            if not rows:
+                break
+
+            updates = []
+            for row in rows:
+                stored, codec = _encode_content(row['content'], self.compress_threshold)
+                if codec != CODEC_PLAIN:
+                    updates.append((stored, codec, row['id']))
+            if updates:
+                with self.transaction() as cursor:
+                    # codec 条件避免覆盖期间被并发修改的行
+                    cursor.executemany(
+                        "UPDATE messages SET content = ?, codec = ? WHERE id = ? AND codec = 'plain'",
+                        updates
+                    )
+                compressed += len(updates)
+            last_id = rows[-1]['id']
+
+        return compressed
+
+    def _apply_stats_delta(
+        self,
+        cursor,
+        session_id: int,
+        count_delta: int,
+        token_delta: int
+    ) -> None:
+        """
+        增量更新会话统计信息（O(1)，不扫描消息表），不提交事务
+
+        Args:
+            cursor: 当前事务的游标
+            session_id: 会话 ID
+            count_delta: 消息数量变化
+            token_delta: token 数变化
+        """
+        cursor.execute(
             """
             UPDATE sessions
             SET
-                message_count = (
-                    SELECT COUNT(*) FROM messages WHERE session_id = ?
-                ),
-                total_tokens = (
-                    SELECT COALESCE(SUM(token_count), 0) FROM messages WHERE session_id = ?
-                ),
+                message_count = message_count + ?,
+                total_tokens = total_tokens + ?,
                 updated_at = CURRENT_TIMESTAMP
             WHERE id = ?
             """,
-            (session_id, session_id, session_id)
+            (count_delta, token_delta, session_id)
         )
-        return True
 
     # ==================== Message Management ====================
 
@@ -197,72 +644,206 @@ class SQLiteSession(SQLiteBase):
             ValueError: 如果 role 不是 'user' 或 'assistant'
         """
         # 验证角色
-        if role not in ['user', 'assistant']:
-            raise ValueError(f"Invalid role: {role}. Only 'user' and 'assistant' are allowed.")
+        self.validate_role(role)
+
+        with self.transaction() as cursor:
+            # 向已归档的会话追加消息前先恢复，保证 token 偏移连续
+            restored = self._restore_in_transaction(cursor, session_id)
+            stored, codec = _encode_content(content, self.compress_threshold)
+            cursor.execute(
+                _INSERT_MESSAGE_SQL,
+                (session_id, role, stored, codec, token_count, session_id)
+            )
+            message_id = cursor.lastrowid
 
-        cursor = self.execute(
-            """
-            INSERT INTO messages (session_id, role, content, token_count)
-            VALUES (?, ?, ?, ?)
+            self._index_messages(cursor, [(message_id, content, session_id)])
+
+            # 增量更新会话统计信息
+            self._apply_stats_delta(cursor, session_id, 1, token_count)
+
+        self._finish_restore(session_id, restored)
+        self._cache_after_insert([message_id], [session_id])
+
+        return message_id
+
+    def add_messages(self, messages: List[Dict[str, Any]]) -> List[int]:
+        """
+        批量添加消息（可跨多个会话），所有插入和统计更新在同一个事务中提交
+
+        Args:
+            messages: 消息列表，每条包含 session_id, role, content, token_count
+
+        Returns:
+            新消息的 ID 列表（与输入顺序一致）
+
+        Raises:
+            ValueError: 如果任意一条消息的 role 不是 'user' 或 'assistant'
+        """
+        for msg in messages:
+            self.validate_role(msg['role'])
+
+        if not messages:
+            return []
+
+        message_ids = []
+        with self.transaction() as cursor:
+            restored = {
+                session_id: self._restore_in_transaction(cursor, session_id)
+                for session_id in dict.fromkeys(msg['session_id'] for msg in messages)
+            }
+            for msg in messages:
+                stored, codec = _encode_content(msg['content'], self.compress_threshold)
+                cursor.execute(
+                    _INSERT_MESSAGE_SQL,
+                    (msg['session_id'], msg['role'], stored, codec, msg['token_count'], msg['session_id'])
+                )
+                message_ids.append(cursor.lastrowid)
+
+            self._index_messages(cursor, [
+                (message_id, msg['content'], msg['session_id'])
+                for message_id, msg in zip(message_ids, messages)
+            ])
+
+            # 每个会话只做一次增量统计更新
+            deltas: Dict[int, List[int]] = {}
+            for msg in messages:
+                delta = deltas.setdefault(msg['session_id'], [0, 0])
+                delta[0] += 1
+                delta[1] += msg['token_count']
+            for session_id, (count_delta, token_delta) in deltas.items():
+                self._apply_stats_delta(cursor, session_id, count_delta, token_delta)
+
+        for session_id, result in restored.items():
+            self._finish_restore(session_id, result)
+        self._cache_after_insert(message_ids, [msg['session_id'] for msg in messages])
+
+        return message_ids
+
+    def _cache_after_insert(self, message_ids: List[int], session_ids: List[int]) -> None:
+        """写入新消息后直写更新已缓存的会话"""
+        if not self.cache or not message_ids:
+            return
+
+        # 未缓存的会话只需使并发填充失效，不读取消息
+        cached_ids = [
+            message_id
+            for message_id, session_id in zip(message_ids, session_ids)
+            if self.cache.contains(session_id)
+        ]
+        if len(cached_ids) < len(message_ids):
+            self.cache.mark_write()
+        if not cached_ids:
+            return
+
+        placeholders = ", ".join("?" for _ in cached_ids)
+        rows = self.fetchall(
+            f"""
+            SELECT
+                id,
+                session_id,
+                role,
+                content,
+                codec,
+                token_count,
+                created_at,
+                token_offset
+            FROM messages
+            WHERE id IN ({placeholders})
+            ORDER BY id ASC
             """,
-            (session_id, role, content, token_count)
+            tuple(cached_ids)
         )
+        _decode_rows(rows)
 
-        message_id = cursor.lastrowid
+        by_session: Dict[int, List[Dict[str, Any]]] = {}
+        for row in rows:
+            by_session.setdefault(row['session_id'], []).append(row)
 
-        # 更新会话统计信息
-        self.update_session_stats(session_id)
+        for session_id, messages in by_session.items():
+            session = self.fetchone("SELECT * FROM sessions WHERE id = ?", (session_id,))
+            self.cache.append_messages(session_id, messages, session)
 
-        return message_id
+    @staticmethod
+    def validate_role(role: str) -> None:
+        """
+        验证消息角色（仅支持 user 和 assistant）
+
+        Raises:
+            ValueError: 如果 role 不是 'user' 或 'assistant'
+        """
+        if role not in ['user', 'assistant']:
+            raise ValueError(f"Invalid role: {role}. Only 'user' and 'assistant' are allowed.")
 
     def get_messages(
         self,
         session_id: int,
-        limit: Optional[int] = None
+        limit: Optional[int] = None,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None
     ) -> List[Dict[str, Any]]:
         """
-        获取会话的所有消息，按时间正序排列
+        获取会话的消息，按时间正序排列
 
         Args:
             session_id: 会话 ID
-            limit: 可选，限制返回的消息数量（最新的 N 条）
+            limit: 可选，限制返回的消息数量（默认返回最新的 N 条）
+            before_id: 可选，只返回 ID 小于它的消息中最新的 N 条（向前翻页）
+            after_id: 可选，只返回 ID 大于它的消息中最早的 N 条（向后翻页）
 
         Returns:
             消息列表
         """
+        self._ensure_restored(session_id)
+
+        columns = """
+            id,
+            session_id,
+            role,
+            content,
+            codec,
+            token_count,
+            created_at
+        """
+        if after_id is not None:
+            query = f"""
+                SELECT {columns} FROM messages
+                WHERE session_id = ? AND id > ?
+                ORDER BY id ASC
+            """
+            params: Tuple = (session_id, after_id)
+            if limit:
+                query += " LIMIT ?"
+                params += (limit,)
+            return _decode_rows(self.fetchall(query, params))
+
+        conditions = "session_id = ?"
+        params = (session_id,)
+        if before_id is not None:
+            conditions += " AND id < ?"
+            params += (before_id,)
+
         if limit:
             # 获取最新的 N 条消息
-            query = """
-                SELECT * FROM (
-                    SELECT
-                        id,
-                        session_id,
-                        role,
-                        content,
-                        token_count,
-                        created_at
-                    FROM messages
-                    WHERE session_id = ?
-                    ORDER BY created_at DESC
-                    LIMIT ?
-                ) ORDER BY created_at ASC
-            """
-            return self.fetchall(query, (session_id, limit))
-        else:
-            # 获取所有消息
-            query = """
-                SELECT
-                    id,
-                    session_id,
-                    role,
-                    content,
-                    token_count,
-                    created_at
-                FROM messages
-                WHERE session_id = ?
-                ORDER BY created_at ASC
-            """
-            return self.fetchall(query, (session_id,))
+            rows = self.fetchall(
+                f"""
+                SELECT {columns} FROM messages
+                WHERE {conditions}
+                ORDER BY id DESC
+                LIMIT ?
+                """,
+                params + (limit,)
+            )
+            return _decode_rows(rows[::-1])
+
+        # 获取所有消息
+        return _decode_rows(self.fetchall(
+            f"""
+            SELECT {columns} FROM messages
+            WHERE {conditions}
+            ORDER BY id ASC
+            """,
+            params
+        ))
 
     def get_messages_within_token_limit(
         self,
@@ -282,91 +863,677 @@ class SQLiteSession(SQLiteBase):
         Returns:
             消息列表（按时间正序）
         """
-        # 获取所有消息（倒序）
-        all_messages = self.fetchall(
+        # 计算可用的 token 数（减去系统提示词）
+        available_tokens = max_tokens - system_prompt_tokens
+
+        token = None
+        if self.cache:
+            cached = self.cache.get_window(session_id, available_tokens)
+            if cached is not None:
+                return cached
+            token = self.cache.fill_token()
+
+        self._ensure_restored(session_id)
+
+        # 会话的 token 总数 = 最后一条消息的偏移 + 其 token 数（索引查找）
+        last = self.fetchone(
+            """
+            SELECT token_offset + token_count AS total
+            FROM messages
+            WHERE session_id = ?
+            ORDER BY token_offset DESC, id DESC
+            LIMIT 1
+            """,
+            (session_id,)
+        )
+
+        if not last:
+            if self.cache:
+                self.cache.put_window(session_id, [], 0, token)
+            return []
+
+        # 从最新消息往前累计不超过 available_tokens 的消息，
+        # 等价于 token_offset >= total - available_tokens，只读取窗口内的行
+        threshold = last['total'] - available_tokens
+        messages = self.fetchall(
             """
             SELECT
                 id,
                 session_id,
                 role,
                 content,
+                codec,
                 token_count,
-                created_at
+                created_at,
+                token_offset
             FROM messages
-            WHERE session_id = ?
-            ORDER BY created_at DESC
+            WHERE session_id = ? AND token_offset >= ?
+            ORDER BY token_offset ASC, id ASC
             """,
-            (session_id,)
+            (session_id, threshold)
         )
+        _decode_rows(messages)
 
-        if not all_messages:
-            return []
-
-        # 计算可用的 token 数（减去系统提示词）
-        available_tokens = max_tokens - system_prompt_tokens
+        if self.cache:
+            self.cache.put_window(session_id, messages, threshold, token)
 
-        selected_messages = []
-        current_tokens = 0
+        for msg in messages:
+            del msg['token_offset']
+        return messages
 
-        # 从最新的消息开始往前取
-        for msg in all_messages:
-            msg_tokens = msg['token_count']
+    def delete_message(self, message_id: int, session_id: Optional[int] = None) -> bool:
+        """
+        删除消息（消息所在会话已归档时先恢复）
 
-            # 检查是否超过限制
-            if current_tokens + msg_tokens > available_tokens:
-                break
+        Args:
+            message_id: 消息 ID
+            session_id: 可选，消息所属的会话 ID；省略且消息不在消息表中时查找归档文件
 
-            selected_messages.append(msg)
-            current_tokens += msg_tokens
+        Returns:
+            是否成功（消息不存在或不属于 session_id 时返回 False）
+        """
+        if session_id is None:
+            row = self.fetchone("SELECT session_id FROM messages WHERE id = ?", (message_id,))
+            session_id = row['session_id'] if row else self._find_archived_session(message_id)
+            if session_id is None:
+                return False
+
+        with self.transaction() as cursor:
+            # 在同一写事务中恢复，避免归档在检查和删除之间发生
+            restored = self._restore_in_transaction(cursor, session_id)
+            message = cursor.execute(
+                "SELECT token_count FROM messages WHERE id = ? AND session_id = ?",
+                (message_id, session_id)
+            ).fetchone()
+
+            if message:
+                # 删除消息
+                cursor.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+                if self.search_enabled:
+                    cursor.execute("DELETE FROM messages_fts WHERE rowid = ?", (message_id,))
+
+                # 之后消息的 token 累计偏移减去被删除消息的 token 数
+                cursor.execute(
+                    """
+                    UPDATE messages
+                    SET token_offset = token_offset - ?
+                    WHERE session_id = ? AND id > ?
+                    """,
+                    (message['token_count'], session_id, message_id)
+                )
+
+                # 增量更新会话统计信息
+                self._apply_stats_delta(cursor, session_id, -1, -message['token_count'])
+
+        self._finish_restore(session_id, restored)
+        if not message:
+            return False
 
-        # 反转列表，使其按时间正序
-        selected_messages.reverse()
+        if self.cache:
+            self.cache.invalidate(session_id)
 
-        return selected_messages
+        return True
 
-    def delete_message(self, message_id: int) -> bool:
+    def clear_session_messages(self, session_id: int) -> bool:
         """
-        删除消息
+        清空会话的所有消息
 
         Args:
-            message_id: 消息 ID
+            session_id: 会话 ID
 
         Returns:
             是否成功
         """
-        # 先获取 session_id
-        message = self.fetchone(
-            "SELECT session_id FROM messages WHERE id = ?",
-            (message_id,)
-        )
+        with self.transaction() as cursor:
+            row = cursor.execute(
+                "SELECT archive_path FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            self._unindex_session(cursor, session_id)
+            cursor.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            cursor.execute(
+                """
+                UPDATE sessions
+                SET message_count = 0, total_tokens = 0, updated_at = CURRENT_TIMESTAMP,
+                    archived_at = NULL, archive_path = NULL
+                WHERE id = ?
+                """,
+                (session_id,)
+            )
 
-        if not message:
-            return False
+        if row and row['archive_path']:
+            self._remove_archive_file(row['archive_path'])
 
-        session_id = message['session_id']
+        if self.cache:
+            self.cache.reset_messages(
+                session_id,
+                self.fetchone("SELECT * FROM sessions WHERE id = ?", (session_id,))
+            )
+        return True
 
-        # 删除消息
-        self.execute("DELETE FROM messages WHERE id = ?", (message_id,))
+    # ==================== Archive ====================
+
+    def archive_session(self, session_id: int) -> bool:
+        """
+        把会话的消息移到 gzip 压缩的 JSONL 归档文件中，只保留会话行（含统计信息）
 
-        # 更新会话统计信息
-        self.update_session_stats(session_id)
+        归档文件写入并 fsync 后才删除数据库中的消息；归档会话的消息不参与全文检索，
+        读取或追加消息时自动恢复。
 
+        Args:
+            session_id: 会话 ID
+
+        Returns:
+            是否归档（会话不存在、已归档或没有消息时返回 False）
+        """
+        path = self.archive_dir / f"session_{session_id}.jsonl.gz"
+        with self.transaction() as cursor:
+            # 在写事务中读取，保证归档内容与删除的行一致
+            session = cursor.execute(
+                "SELECT archived_at FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if not session or session['archived_at']:
+                return False
+
+            rows = [dict(row) for row in cursor.execute(
+                """
+                SELECT id, role, content, codec, token_count, token_offset, created_at
+                FROM messages WHERE session_id = ?
+                ORDER BY id
+                """,
+                (session_id,)
+            ).fetchall()]
+            if not rows:
+                return False
+
+            self._write_archive_file(path, session_id, _decode_rows(rows))
+
+            self._unindex_session(cursor, session_id)
+            cursor.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            cursor.execute(
+                """
+                UPDATE sessions SET archived_at = CURRENT_TIMESTAMP, archive_path = ?
+                WHERE id = ?
+                """,
+                (str(path), session_id)
+            )
+
+        if self.cache:
+            self.cache.invalidate(session_id)
         return True
 
-    def clear_session_messages(self, session_id: int) -> bool:
+    def restore_session(self, session_id: int) -> bool:
         """
-        清空会话的所有消息
+        从归档文件恢复会话的消息（保留原消息 ID 和 token 偏移）
 
         Args:
             session_id: 会话 ID
 
         Returns:
-            是否成功
+            是否恢复（会话未归档时返回 False）
+
+        Raises:
+            FileNotFoundError: 归档文件丢失
         """
-        self.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
-        self.update_session_stats(session_id)
+        with self.transaction() as cursor:
+            restored = self._restore_in_transaction(cursor, session_id)
+        if not restored:
+            return False
+        self._finish_restore(session_id, restored)
         return True
 
+    def _restore_in_transaction(self, cursor: sqlite3.Cursor, session_id: int) -> Optional[Tuple[str, int]]:
+        """
+        在调用方的写事务中恢复归档会话的消息
+
+        写事务持有写锁，归档不会与调用方随后的写入交错；提交后须调用 _finish_restore。
+
+        Returns:
+            (归档文件路径, 恢复的消息数)；会话未归档时返回 None
+
+        Raises:
+            FileNotFoundError: 归档文件丢失
+        """
+        session = cursor.execute(
+            "SELECT archive_path FROM sessions WHERE id = ? AND archived_at IS NOT NULL",
+            (session_id,)
+        ).fetchone()
+        if not session:
+            return None
+
+        path = session['archive_path']
+        messages = self._read_archive_file(path)
+
+        encoded = []
+        for msg in messages:
+            stored, codec = _encode_content(msg['content'], self.compress_threshold)
+            encoded.append((
+                msg['id'], session_id, msg['role'], stored, codec,
+                msg['token_count'], msg['token_offset'], msg['created_at']
+            ))
+        cursor.executemany(
+            """
+            INSERT INTO messages
+                (id, session_id, role, content, codec, token_count, token_offset, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            encoded
+        )
+        self._index_messages(cursor, [(msg['id'], msg['content'], session_id) for msg in messages])
+        cursor.execute(
+            "UPDATE sessions SET archived_at = NULL, archive_path = NULL WHERE id = ?",
+            (session_id,)
+        )
+        return path, len(messages)
+
+    def _finish_restore(self, session_id: int, restored: Optional[Tuple[str, int]]) -> None:
+        """恢复的事务提交后删除归档文件并使缓存失效"""
+        if not restored:
+            return
+        path, count = restored
+        if self.cache:
+            self.cache.invalidate(session_id)
+        self._remove_archive_file(path)
+        logger.info(f"Restored archived session {session_id} ({count} messages)")
+
+    def archive_idle_sessions(self, idle_days: float, limit: int = 50) -> int:
+        """
+        归档超过 idle_days 天未更新的会话
+
+        Args:
+            idle_days: 空闲天数阈值
+            limit: 本次最多归档的会话数
+
+        Returns:
+            被归档的会话数量
+        """
+        rows = self.fetchall(
+            """
+            SELECT id FROM sessions
+            WHERE archived_at IS NULL
+              AND message_count > 0
+              AND updated_at < datetime('now', ?)
+            ORDER BY updated_at ASC
+            LIMIT ?
+            """,
+            (f"-{idle_days} days", limit)
+        )
+
+        archived = 0
+        for row in rows:
+            try:
+                if self.archive_session(row['id']):
+                    archived += 1
+            except Exception as e:
+                logger.error(f"Failed to archive session {row['id']}: {e}", exc_info=True)
+        return archived
+
+    def _ensure_restored(self, session_id: int) -> None:
+        """会话已归档时恢复其消息（会话信息通常来自缓存，未归档时开销很小）"""
+        session = self.get_session(session_id)
+        if session and session.get('archived_at'):
+            self.restore_session(session_id)
+
+    def _find_archived_session(self, message_id: int) -> Optional[int]:
+        """在归档文件中查找消息所属的会话（慢路径，仅在消息不在消息表中时使用）"""
+        rows = self.fetchall(
+            "SELECT id, archive_path FROM sessions WHERE archived_at IS NOT NULL ORDER BY id"
+        )
+        for row in rows:
+            try:
+                if any(msg['id'] == message_id for msg in self._iter_archive_file(row['archive_path'])):
+                    return row['id']
+            except OSError as e:
+                logger.warning(f"Failed to read archive of session {row['id']}: {e}")
+        return None
+
+    def _write_archive_file(self, path: Path, session_id: int, messages: List[Dict[str, Any]]) -> None:
+        """写入归档文件：先写临时文件并 fsync，再原子替换"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                f.write((json.dumps({"version": 1, "session_id": session_id}) + "\n").encode("utf-8"))
+                for msg in messages:
+                    f.write((json.dumps(msg, ensure_ascii=False) + "\n").encode("utf-8"))
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _iter_archive_file(path: str) -> Iterator[Dict[str, Any]]:
+        """逐行读取归档文件中的消息（跳过首行的文件头）"""
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            next(f, None)
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def _read_archive_file(self, path: str) -> List[Dict[str, Any]]:
+        """读取归档文件中的全部消息"""
+        return list(self._iter_archive_file(path))
+
+    @staticmethod
+    def _remove_archive_file(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove archive file {path}: {e}")
+
+    # ==================== Export / Import ====================
+
+    def iter_export(self, session_ids: Optional[List[int]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        按会话顺序逐条产出会话和消息记录（用于 NDJSON 导出）
+
+        使用独立连接和惰性游标，内存占用与数据量无关；已归档会话直接从归档文件读取，
+        不会被恢复。生成器可以在不同线程中被迭代。
+
+        Args:
+            session_ids: 可选，只导出指定会话
+
+        Yields:
+            {"type": "session", ...} 记录，随后是该会话的 {"type": "message", ...} 记录
+        """
+        where = ""
+        params: Tuple = ()
+        if session_ids:
+            where = f"WHERE id IN ({','.join('?' * len(session_ids))})"
+            params = tuple(session_ids)
+
+        conn = connect(self.db_path, self.pragmas)
+        try:
+            sessions = conn.execute(
+                f"""
+                SELECT id, session_name, created_at, updated_at, archive_path
+                FROM sessions {where}
+                ORDER BY id
+                """,
+                params
+            )
+            for session in sessions:
+                session_id = session['id']
+                yield {
+                    "type": "session",
+                    "id": session_id,
+                    "session_name": session['session_name'],
+                    "created_at": session['created_at'],
+                    "updated_at": session['updated_at']
+                }
+
+                if session['archive_path']:
+                    try:
+                        messages = self._iter_archive_file(session['archive_path'])
+                        for msg in messages:
+                            yield {
+                                "type": "message",
+                                "session_id": session_id,
+                                "role": msg['role'],
+                                "content": msg['content'],
+                                "token_count": msg['token_count'],
+                                "created_at": msg['created_at']
+                            }
+                    except FileNotFoundError:
+                        # 导出期间会话被恢复，消息已不在归档文件中
+                        logger.warning(f"Archive of session {session_id} disappeared during export")
+                    continue
+
+                rows = conn.execute(
+                    """
+                    SELECT role, content, codec, token_count, created_at
+                    FROM messages WHERE session_id = ?
+                    ORDER BY id
+                    """,
+                    (session_id,)
+                )
+                for row in rows:
+                    yield {
+                        "type": "message",
+                        "session_id": session_id,
+                        "role": row['role'],
+                        "content": _decode_content(row['content'], row['codec']),
+                        "token_count": row['token_count'],
+                        "created_at": row['created_at']
+                    }
+        finally:
+            conn.close()
+
+    def import_records(self, records: List[Dict[str, Any]], state: SessionImport) -> None:
+        """
+        在一个事务中导入一批会话和消息记录（总是创建新会话，不覆盖已有数据）
+
+        token 偏移在内存中累计，会话统计信息由 finish_import 一次性写入。
+
+        Args:
+            records: iter_export 格式的记录，消息记录必须在其会话记录之后
+            state: 本次导入的进度状态，跨批次共享
+
+        Raises:
+            ValueError: 记录类型未知、角色无效或消息引用了未知会话（整批不写入）
+        """
+        # 先校验整批，保证失败时状态和数据库都不变
+        batch_sessions = set()
+        for record in records:
+            kind = record.get("type")
+            if kind == "session":
+                batch_sessions.add(record.get("id"))
+            elif kind == "message":
+                if record.get("session_id") not in state.session_ids and \
+                        record.get("session_id") not in batch_sessions:
+                    raise ValueError(f"Message references unknown session {record.get('session_id')}")
+                self.validate_role(record.get("role"))
+                if not isinstance(record.get("content"), str):
+                    raise ValueError("Message content must be a string")
+            else:
+                raise ValueError(f"Unknown record type: {kind}")
+
+        index_rows = []
+        touched = set()
+        with self.transaction() as cursor:
+            for record in records:
+                if record["type"] == "session":
+                    cursor.execute(
+                        """
+                        INSERT INTO sessions (session_name, created_at, updated_at)
+                        VALUES (?, COALESCE(?, CURRENT_TIMESTAMP), COALESCE(?, CURRENT_TIMESTAMP))
+                        """,
+                        (record.get("session_name") or "Imported", record.get("created_at"), record.get("updated_at"))
+                    )
+                    state.session_ids[record.get("id")] = cursor.lastrowid
+                    touched.add(cursor.lastrowid)
+                    state.stats[cursor.lastrowid] = [0, 0]
+                    state.session_count += 1
+                    continue
+
+                session_id = state.session_ids[record["session_id"]]
+                touched.add(session_id)
+                stats = state.stats[session_id]
+                token_count = int(record.get("token_count") or 0)
+                stored, codec = _encode_content(record["content"], self.compress_threshold)
+                cursor.execute(
+                    """
+                    INSERT INTO messages
+                        (session_id, role, content, codec, token_count, token_offset, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP))
+                    """,
+                    (session_id, record["role"], stored, codec, token_count, stats[1], record.get("created_at"))
+                )
+                index_rows.append((cursor.lastrowid, record["content"], session_id))
+                stats[0] += 1
+                stats[1] += token_count
+                state.message_count += 1
+
+            self._index_messages(cursor, index_rows)
+
+        if self.cache:
+            # 导入前（或批次之间）对这些会话的读取可能已缓存了空窗口
+            for session_id in touched:
+                self.cache.invalidate(session_id)
+
+    def finish_import(self, state: SessionImport) -> None:
+        """一次性写入导入会话的统计信息（不修改更新时间）"""
+        if not state.stats:
+            return
+        with self.transaction() as cursor:
+            cursor.executemany(
+                "UPDATE sessions SET message_count = ?, total_tokens = ? WHERE id = ?",
+                [(count, tokens, session_id) for session_id, (count, tokens) in state.stats.items()]
+            )
+
+        if self.cache:
+            for session_id in state.stats:
+                self.cache.invalidate(session_id)
+
+    # ==================== Search ====================
+
+    def search_messages(
+        self,
+        query: str,
+        limit: int = 20,
+        after: Optional[Tuple[float, int]] = None,
+        session_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        全文检索消息，按相关度（bm25，越小越相关）和消息 ID 排序
+
+        查询按空白切分为多个关键词，全部命中才匹配。trigram 分词器无法匹配少于
+        3 个字符的关键词，此时退回对索引内容的 LIKE 扫描（score 均为 0）。
+
+        Args:
+            query: 搜索关键词
+            limit: 返回的最大结果数
+            after: 可选的翻页游标 (score, message_id)，只返回排在其后的结果
+            session_id: 可选，只搜索指定会话
+
+        Returns:
+            结果列表，每条包含 message_id, session_id, session_name, role,
+            snippet, created_at, score
+        """
+        terms = query.split()
+        if not terms or limit <= 0:
+            return []
+
+        use_match = self.search_enabled and not (
+            self.search_tokenizer == "trigram" and any(len(term) < 3 for term in terms)
+        )
+
+        if use_match:
+            # 每个关键词作为短语查询，避免用户输入被解析为 FTS5 语法
+            match = " ".join('"' + term.replace('"', '""') + '"' for term in terms)
+            inner = """
+                SELECT rowid AS message_id, session_id, bm25(messages_fts) AS score
+                FROM messages_fts
+                WHERE messages_fts MATCH ?
+            """
+            params: List[Any] = [match]
+        else:
+            # content || '' 绕过 trigram 索引，对短关键词做逐行匹配
+            # （无 FTS5 时直接扫描消息表，压缩存储的消息无法匹配）
+            source = "messages_fts" if self.search_enabled else "messages"
+            condition = " AND ".join(["(content || '') LIKE ? ESCAPE '\\'"] * len(terms))
+            inner = f"""
+                SELECT rowid AS message_id, session_id, 0.0 AS score
+                FROM {source}
+                WHERE {condition}
+            """
+            params = [f"%{self._escape_like(term)}%" for term in terms]
+
+        if session_id is not None:
+            inner += " AND session_id = ?"
+            params.append(session_id)
+
+        where = ""
+        if after is not None:
+            where = "WHERE score > ? OR (score = ? AND message_id > ?)"
+            params.extend([after[0], after[0], after[1]])
+
+        page = self.fetchall(
+            f"""
+            SELECT message_id, session_id, score FROM ({inner})
+            {where}
+            ORDER BY score, message_id
+            LIMIT ?
+            """,
+            tuple(params) + (limit,)
+        )
+        if not page:
+            return []
+
+        # 只为当前页生成摘要并补充消息和会话信息
+        ids = [row['message_id'] for row in page]
+        placeholders = ",".join("?" * len(ids))
+        details = {
+            row['id']: row
+            for row in self.fetchall(
+                f"""
+                SELECT m.id, m.role, m.content, m.codec, m.created_at, s.session_name
+                FROM messages m
+                JOIN sessions s ON s.id = m.session_id
+                WHERE m.id IN ({placeholders})
+                """,
+                tuple(ids)
+            )
+        }
+        _decode_rows(list(details.values()))
+        snippets = {}
+        if use_match:
+            snippets = {
+                row['rowid']: row['snippet']
+                for row in self.fetchall(
+                    f"""
+                    SELECT rowid, snippet(messages_fts, 0, ?, ?, '…', 16) AS snippet
+                    FROM messages_fts
+                    WHERE messages_fts MATCH ? AND rowid IN ({placeholders})
+                    """,
+                    (SNIPPET_START, SNIPPET_END, match) + tuple(ids)
+                )
+            }
+
+        results = []
+        for row in page:
+            detail = details.get(row['message_id'])
+            if detail is None:
+                continue
+            snippet = snippets.get(row['message_id'])
+            if snippet is None:
+                snippet = self._make_snippet(detail['content'], terms)
+            results.append({
+                "message_id": row['message_id'],
+                "session_id": row['session_id'],
+                "session_name": detail['session_name'],
+                "role": detail['role'],
+                "snippet": snippet,
+                "created_at": detail['created_at'],
+                "score": row['score']
+            })
+        return results
+
+    @staticmethod
+    def _escape_like(term: str) -> str:
+        """转义 LIKE 模式中的通配符"""
+        return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+    @staticmethod
+    def _make_snippet(content: str, terms: List[str], context: int = 32) -> str:
+        """围绕第一个命中的关键词截取摘要（LIKE 检索时使用）"""
+        lowered = content.lower()
+        positions = [(lowered.find(term.lower()), term) for term in terms]
+        positions = [(pos, term) for pos, term in positions if pos >= 0]
+        if not positions:
+            return content[:context * 2]
+
+        pos, term = min(positions)
+        start = max(0, pos - context)
+        end = min(len(content), pos + len(term) + context)
+        return (
+            ("…" if start > 0 else "")
+            + content[start:pos]
+            + SNIPPET_START + content[pos:pos + len(term)] + SNIPPET_END
+            + content[pos + len(term):end]
+            + ("…" if end < len(content) else "")
+        )
+
     # ==================== Statistics ====================
 
     def get_session_token_count(self, session_id: int) -> int:
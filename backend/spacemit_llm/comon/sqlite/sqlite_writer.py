@@ -0,0 +1,310 @@
+"""
+Write-behind batched persistence for chat messages
+
+后台写入线程把来自多个会话的消息插入和统计更新合并到同一个事务中，
+每个刷新周期只提交（fsync）一次。
+
+Durability 模式：
+- sync:  不使用队列，每条消息立即写入并提交（与直接调用 add_message 相同）
+- group: 消息入队，调用方等待所在批次提交后返回（组提交，返回即已落盘）
+- async: 消息入队后立即返回，最多丢失一个刷新周期内的消息
+"""
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Optional, Dict, Any, List
+
+from .sqlite_session import SQLiteSession
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_SYNC = "sync"
+DURABILITY_GROUP = "group"
+DURABILITY_ASYNC = "async"
+
+_DURABILITY_MODES = (DURABILITY_SYNC, DURABILITY_GROUP, DURABILITY_ASYNC)
+
+# 队列中的刷新屏障标记
+_FLUSH_MARKER = object()
+
+
+class SessionWriteBehind:
+    """会话消息后台批量写入队列"""
+
+    def __init__(
+        self,
+        db_session: SQLiteSession,
+        flush_interval: float = 0.05,
+        max_batch: int = 256,
+        durability: str = DURABILITY_GROUP
+    ):
+        """
+        初始化后台写入队列
+
+        Args:
+            db_session: SQLiteSession 实例
+            flush_interval: 刷新周期（秒），同一周期内的写入合并为一个事务
+            max_batch: 单个事务最多包含的消息数
+            durability: 持久化模式 ('sync', 'group', 'async')
+        """
+        if durability not in _DURABILITY_MODES:
+            raise ValueError(f"Invalid durability: {durability}. Must be 'sync', 'group', or 'async'")
+
+        self.db_session = db_session
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.durability = durability
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._pending: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+        # 统计信息
+        self.flush_count = 0
+        self.message_count = 0
+
+    @property
+    def is_running(self) -> bool:
+        """后台写入线程是否在运行"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """启动后台写入线程（sync 模式下不启动）"""
+        if self.durability == DURABILITY_SYNC or self.is_running:
+            return
+
+        with self._lock:
+            self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run,
+            name="session-write-behind",
+            daemon=True
+        )
+        self._thread.start()
+        logger.info(
+            f"Session write-behind started (durability={self.durability}, "
+            f"interval={self.flush_interval}s, max_batch={self.max_batch})"
+        )
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        """刷新队列中剩余的消息并停止后台线程（用于关闭时）"""
+        if not self.is_running:
+            return
+
+        # 与 submit/flush 的入队互斥：置位之后不会再有新条目进入队列
+        with self._lock:
+            self._stopping.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"Session write-behind did not stop within {timeout}s")
+            return
+
+        # 线程退出后队列中仍有条目时在当前线程写入，避免 Future 永远不完成
+        remaining = self._drain()
+        if remaining:
+            self._write_batch(remaining)
+        logger.info(
+            f"Session write-behind stopped ({self.message_count} messages in {self.flush_count} flushes)"
+        )
+        self._thread = None
+
+    # ==================== Producer API ====================
+
+    def submit(
+        self,
+        session_id: int,
+        role: str,
+        content: str,
+        token_count: int
+    ) -> Future:
+        """
+        提交一条消息
+
+        Returns:
+            Future，批次提交后结果为新消息的 ID
+
+        Raises:
+            ValueError: 如果 role 不是 'user' 或 'assistant'
+        """
+        # 尽早校验，让调用方同步得到错误
+        self.db_session.validate_role(role)
+
+        future: Future = Future()
+        message = {
+            "session_id": session_id,
+            "role": role,
+            "content": content,
+            "token_count": token_count
+        }
+
+        # 检查与入队在同一把锁内完成，close() 之后的条目不会滞留在队列中
+        with self._lock:
+            queued = self._accepting()
+            if queued:
+                self._pending[session_id] = self._pending.get(session_id, 0) + 1
+                self._queue.put((message, future))
+        if queued:
+            return future
+
+        # sync 模式（或线程未启动/正在关闭）直接写入
+        try:
+            future.set_result(self.db_session.add_message(session_id, role, content, token_count))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    async def add_message(
+        self,
+        session_id: int,
+        role: str,
+        content: str,
+        token_count: int
+    ) -> Optional[int]:
+        """
+        异步添加消息
+
+        Returns:
+            新消息的 ID；async 模式下立即返回 None
+        """
+        future = self.submit(session_id, role, content, token_count)
+        if self.durability == DURABILITY_ASYNC and not future.done():
+            return None
+        return await asyncio.wrap_future(future)
+
+    def has_pending(self, session_id: int) -> bool:
+        """会话是否还有未提交的消息"""
+        with self._lock:
+            return self._pending.get(session_id, 0) > 0
+
+    def flush_sync(self, timeout: Optional[float] = None) -> None:
+        """阻塞直到当前队列中的所有消息都已提交"""
+        future = self._put_flush_marker()
+        if future is not None:
+            future.result(timeout)
+
+    async def flush(self) -> None:
+        """等待当前队列中的所有消息都已提交"""
+        future = self._put_flush_marker()
+        if future is not None:
+            await asyncio.wrap_future(future)
+
+    def _put_flush_marker(self) -> Optional[Future]:
+        """放入刷新屏障；队列不再接收条目时返回 None（close() 会处理剩余条目）"""
+        with self._lock:
+            if not self._accepting():
+                return None
+            future: Future = Future()
+            self._queue.put((_FLUSH_MARKER, future))
+            return future
+
+    def _accepting(self) -> bool:
+        """后台线程是否仍接收新条目（调用方需持有 _lock）"""
+        return self.is_running and not self._stopping.is_set()
+
+    def _drain(self) -> List[tuple]:
+        """取出队列中剩余的全部条目"""
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取写入统计信息"""
+        return {
+            "durability": self.durability,
+            "is_running": self.is_running,
+            "queued": self._queue.qsize(),
+            "flush_count": self.flush_count,
+            "message_count": self.message_count
+        }
+
+    # ==================== Writer Thread ====================
+
+    def _run(self) -> None:
+        """后台线程主循环：收集一个刷新周期内的写入并一次性提交"""
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    break
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0 and not self._stopping.is_set():
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            self._write_batch(batch)
+
+        # 关闭时确保连接被释放
+        self.db_session.close()
+
+    def _write_batch(self, batch: List[tuple]) -> None:
+        """在一个事务中写入一批消息，并完成对应的 Future"""
+        entries = [(item, future) for item, future in batch if item is not _FLUSH_MARKER]
+        markers = [future for item, future in batch if item is _FLUSH_MARKER]
+
+        if entries:
+            messages = [item for item, _ in entries]
+            try:
+                message_ids = self.db_session.add_messages(messages)
+            except Exception as e:
+                # 一个会话的错误（如会话已被删除）不应让同批次其他会话的消息丢失：
+                # 按会话拆分重试，只让失败会话的 Future 失败
+                logger.warning(f"Batch of {len(messages)} messages failed ({e}), retrying per session")
+                self._write_per_session(entries)
+            else:
+                for (_, future), message_id in zip(entries, message_ids):
+                    future.set_result(message_id)
+                self.flush_count += 1
+                self.message_count += len(messages)
+            finally:
+                with self._lock:
+                    for message in messages:
+                        session_id = message["session_id"]
+                        remaining = self._pending.get(session_id, 0) - 1
+                        if remaining > 0:
+                            self._pending[session_id] = remaining
+                        else:
+                            self._pending.pop(session_id, None)
+
+        for future in markers:
+            future.set_result(None)
+
+    def _write_per_session(self, entries: List[tuple]) -> None:
+        """逐个会话写入一批消息（每个会话一个事务，保持会话内顺序）"""
+        by_session: Dict[int, List[tuple]] = {}
+        for message, future in entries:
+            by_session.setdefault(message["session_id"], []).append((message, future))
+
+        for session_id, session_entries in by_session.items():
+            messages = [message for message, _ in session_entries]
+            try:
+                message_ids = self.db_session.add_messages(messages)
+            except Exception as e:
+                logger.error(
+                    f"Failed to write {len(messages)} messages for session {session_id}: {e}",
+                    exc_info=True
+                )
+                for _, future in session_entries:
+                    future.set_exception(e)
+            else:
+                for (_, future), message_id in zip(session_entries, message_ids):
+                    future.set_result(message_id)
+                self.flush_count += 1
+                self.message_count += len(messages)
@@ -309,7 +309,8 @@ class EmbedClient:
         self,
         base_url: str,
         normalize: bool = True,  # 是否归一化嵌入向量
-        truncate: bool = True    # 是否截断过长文本
+        truncate: bool = True,   # 是否截断过长文本
+        timeout: float = 60.0    # 请求超时（秒）
     ):
         """
         初始化 Embed Client
@@ -318,16 +319,19 @@ class EmbedClient:
             base_url: Embed server 的基础 URL
             normalize: 是否归一化嵌入向量
             truncate: 是否截断过长文本
+            timeout: 请求超时（秒）
         """
         self.base_url = base_url
         self.normalize = normalize
         self.truncate = truncate
+        self.timeout = timeout
 
     async def get_embeddings(
         self,
         texts: List[str],
         normalize: Optional[bool] = None,
-        truncate: Optional[bool] = None
+        truncate: Optional[bool] = None,
+        timeout: Optional[float] = None
     ) -> List[List[float]]:
         """
         获取文本的嵌入向量
@@ -336,9 +340,10 @@ class EmbedClient:
             texts: 文本列表
             normalize: 是否归一化（覆盖默认值）
             truncate: 是否截断（覆盖默认值）
+            timeout: 请求超时（覆盖默认值）
 
         Returns:
-            嵌入向量列表
+            嵌入向量列表（与 texts 顺序一致）
         """
         norm = normalize if normalize is not None else self.normalize
         trunc = truncate if truncate is not None else self.truncate
@@ -351,13 +356,15 @@ class EmbedClient:
 
         url = f"{self.base_url}/embeddings"
 
-        async with httpx.AsyncClient(timeout=60.0, trust_env=False) as client:
+        request_timeout = timeout if timeout is not None else self.timeout
+        async with httpx.AsyncClient(timeout=request_timeout, trust_env=False) as client:
             response = await client.post(url, json=payload)
             response.raise_for_status()
             data = response.json()
 
-            # 提取嵌入向量
-            embeddings = [item["embedding"] for item in data.get("data", [])]
+            # 提取嵌入向量（按 index 排序，保证与输入顺序一致）
+            items = sorted(data.get("data", []), key=lambda item: item.get("index", 0))
+            embeddings = [item["embedding"] for item in items]
             return embeddings
 
     async def get_embedding(
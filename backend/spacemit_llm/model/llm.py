@@ -379,6 +379,17 @@ class LLMClient:
         if max_tokens is not None:
             self.max_tokens = max_tokens
 
+    def on_config_change(self, name: str, value: Any) -> None:
+        """
+        配置变更回调（通过 SQLiteConfig.subscribe 注册）
+
+        Args:
+            name: 参数名
+            value: 新的参数值
+        """
+        if name in ("temperature", "repeat_penalty", "max_tokens"):
+            self.update_parameters(**{name: value})
+
     async def chat_stream(
         self,
         messages: List[Dict[str, str]],
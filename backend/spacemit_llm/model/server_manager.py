@@ -93,7 +93,7 @@ class ModelServerManager:
         self.clients["rerank"] = RerankClient(
             base_url=f"http://{host}:{rerank_port}/v1",
             top_n=10,
-            return_documents=True
+            return_documents=False  # 检索只需要 index 和分数，不回传文档内容
         )
 
         logger.info(f"ModelServerManager initialized with ports: LLM={llm_port}, Embed={embed_port}, Rerank={rerank_port}")
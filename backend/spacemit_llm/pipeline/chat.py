@@ -1,10 +1,16 @@
 """
 Chat Pipeline
+
+指定 kb_ids 时为检索增强对话：检索（嵌入 → 检索 → 重排序）与历史消息加载并发执行，
+检索到的 chunk 在从 context_size 中划出的预算内拼接到本轮用户消息前，
+引用信息在第一个 token 之前以 SSE 事件发送。
 """
 
+import asyncio
 import json
 import logging
-from typing import AsyncIterator, Optional
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 from fastapi import HTTPException
 from fastapi.responses import StreamingResponse
@@ -12,10 +18,23 @@ from fastapi.responses import StreamingResponse
 from ..model.server_manager import ModelServerManager
 from ..comon.sqlite.sqlite_config import SQLiteConfig
 from ..comon.sqlite.sqlite_session import SQLiteSession
-from ..utils.token_estimator import estimate_message_tokens
+from ..comon.sqlite.sqlite_writer import SessionWriteBehind
+from ..rag.retriever import Retriever
+from ..utils.token_estimator import estimate_message_tokens, estimate_tokens
 
 logger = logging.getLogger(__name__)
 
+# 检索增强时发送给模型的用户消息（数据库中只保存原始问题）
+RAG_PROMPT_TEMPLATE = """请参考以下资料回答问题。引用资料时标注对应的编号，例如 [1]；资料中没有相关内容时请如实说明。
+
+{context}
+
+问题：{question}"""
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
 
 class ChatPipeline:
     """Chat pipeline manager"""
@@ -26,13 +45,112 @@ class ChatPipeline:
         db_config: SQLiteConfig,
         db_session: SQLiteSession,
         default_system_prompt: str = "You are a helpful assistant.",
-        default_context_size: int = 15360
+        default_context_size: int = 15360,
+        session_writer: Optional[SessionWriteBehind] = None,
+        retriever: Optional[Retriever] = None,
+        rag_top_k: int = 8,
+        rag_context_ratio: float = 0.2
     ):
         self.server_manager = server_manager
         self.db_config = db_config
         self.db_session = db_session
         self.default_system_prompt = default_system_prompt
         self.default_context_size = default_context_size
+        self.session_writer = session_writer
+
+        # 知识库检索（未配置时不支持 kb_ids）；参考资料预算按 context_size 的比例从历史记录预算中划出
+        self.retriever = retriever
+        self.rag_top_k = rag_top_k
+        self.rag_context_ratio = rag_context_ratio
+
+        # 系统提示词和上下文大小由配置变更通知更新，请求时无需查询数据库
+        self.system_prompt = db_config.get_parameter("system_prompt") or default_system_prompt
+        self.context_size = db_config.get_parameter("context_size") or default_context_size
+        db_config.subscribe(self._on_config_change)
+
+    def _on_config_change(self, name: str, value: Any) -> None:
+        """配置变更回调"""
+        if name == "system_prompt":
+            self.system_prompt = value or self.default_system_prompt
+        elif name == "context_size":
+            self.context_size = value or self.default_context_size
+
+    async def _save_message(self, session_id: int, role: str, content: str, token_count: int) -> None:
+        """保存消息（有后台写入队列时批量提交）"""
+        if self.session_writer:
+            await self.session_writer.add_message(session_id, role, content, token_count)
+        else:
+            self.db_session.add_message(
+                session_id=session_id,
+                role=role,
+                content=content,
+                token_count=token_count
+            )
+
+    async def _load_history(
+        self,
+        session_id: int,
+        max_tokens: int,
+        system_prompt_tokens: int,
+        timings: Dict[str, float]
+    ) -> List[Dict[str, Any]]:
+        """在线程中加载历史消息（与检索并发）"""
+        started = time.perf_counter()
+        try:
+            return await asyncio.to_thread(
+                self.db_session.get_messages_within_token_limit,
+                session_id=session_id,
+                max_tokens=max_tokens,
+                system_prompt_tokens=system_prompt_tokens
+            )
+        finally:
+            timings["history"] = _elapsed_ms(started)
+
+    async def _retrieve(self, query: str, kb_ids: List[int], timings: Dict[str, float]) -> List[Dict[str, Any]]:
+        """检索知识库；失败时记录警告并在没有参考资料的情况下继续对话"""
+        started = time.perf_counter()
+        try:
+            return await self.retriever.retrieve(query, kb_ids, top_k=self.rag_top_k, timings=timings)
+        except Exception as e:
+            logger.warning(f"⚠️ Knowledge base retrieval failed, answering without context: {e}")
+            return []
+        finally:
+            timings["retrieval"] = _elapsed_ms(started)
+
+    @staticmethod
+    def _pack_context(chunks: List[Dict[str, Any]], max_tokens: int) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        按相关度顺序把 chunk 放入 token 预算，放不下的跳过
+
+        Returns:
+            (参考资料文本, 引用列表)；引用的 index 与资料中的编号一致
+        """
+        sections = []
+        citations = []
+        used = 0
+        for chunk in chunks:
+            index = len(citations) + 1
+            source = chunk["filename"]
+            if chunk.get("page"):
+                source += f"（第 {chunk['page']} 页）"
+            section = f"[{index}] {source}\n{chunk['content']}"
+            tokens = estimate_tokens(section)
+            if used + tokens > max_tokens:
+                continue
+            used += tokens
+            sections.append(section)
+            citations.append({
+                "index": index,
+                "chunk_id": chunk["id"],
+                "kb_id": chunk["kb_id"],
+                "file_id": chunk["file_id"],
+                "filename": chunk["filename"],
+                "page": chunk.get("page"),
+                "heading": chunk.get("heading"),
+                "score": chunk["rerank_score"] if chunk.get("rerank_score") is not None else chunk["score"],
+                "content": chunk["content"]
+            })
+        return "\n\n".join(sections), citations
 
     async def process_chat(self, request) -> StreamingResponse:
         """
@@ -72,25 +190,49 @@ class ChatPipeline:
                 raise HTTPException(status_code=404, detail="Session not found")
 
             # 获取系统提示词
-            system_prompt_param = self.db_config.get_parameter("system_prompt")
-            system_prompt = system_prompt_param if system_prompt_param else self.default_system_prompt
+            system_prompt = self.system_prompt
 
             # 估算系统提示词的 token 数
             system_prompt_tokens = estimate_message_tokens("system", system_prompt)
 
             # 获取 context_size 参数
-            context_size_param = self.db_config.get_parameter("context_size")
-            context_size = context_size_param if context_size_param else self.default_context_size
+            context_size = self.context_size
 
             # 计算历史记录的最大 token 数（context_size 的一半）
             max_history_tokens = context_size // 2
 
-            # 从数据库加载历史消息（在 token 限制内）
-            history_messages = self.db_session.get_messages_within_token_limit(
-                session_id=request.session_id,
-                max_tokens=max_history_tokens,
-                system_prompt_tokens=system_prompt_tokens
+            # 检索增强：参考资料预算从历史记录预算中划出
+            kb_ids = getattr(request, "kb_ids", None) or []
+            question = request.message.content if request.message else ""
+            use_rag = bool(kb_ids) and bool(question.strip())
+            if use_rag and self.retriever is None:
+                raise HTTPException(status_code=503, detail="Knowledge base retrieval not available")
+            max_context_tokens = int(context_size * self.rag_context_ratio) if use_rag else 0
+            max_history_tokens -= max_context_tokens
+
+            request_started = time.perf_counter()
+            timings: Dict[str, float] = {}
+
+            # 确保该会话尚未提交的消息已写入，避免读到不完整的历史
+            if self.session_writer and self.session_writer.has_pending(request.session_id):
+                await self.session_writer.flush()
+
+            # 从数据库加载历史消息（在 token 限制内），同时检索知识库
+            history_load = self._load_history(
+                request.session_id, max_history_tokens, system_prompt_tokens, timings
             )
+            if use_rag:
+                history_messages, retrieved = await asyncio.gather(
+                    history_load, self._retrieve(question, kb_ids, timings)
+                )
+            else:
+                history_messages, retrieved = await history_load, []
+
+            citations: List[Dict[str, Any]] = []
+            if use_rag:
+                started = time.perf_counter()
+                context, citations = self._pack_context(retrieved, max_context_tokens)
+                timings["pack"] = _elapsed_ms(started)
 
             # 构建消息列表：[system] + [history] + [new_user_message]
             messages_to_send = []
@@ -100,24 +242,33 @@ class ChatPipeline:
             for msg in history_messages:
                 messages_to_send.append({"role": msg["role"], "content": msg["content"]})
 
-            # 添加新的用户消息
+            # 添加新的用户消息（有参考资料时拼接在问题之前）
             if request.message:
                 new_user_message = request.message
-                messages_to_send.append({"role": new_user_message.role, "content": new_user_message.content})
+                content = new_user_message.content
+                if citations:
+                    content = RAG_PROMPT_TEMPLATE.format(context=context, question=content)
+                messages_to_send.append({"role": new_user_message.role, "content": content})
 
                 # 保存用户消息到数据库
                 user_token_count = estimate_message_tokens(new_user_message.role, new_user_message.content)
-                self.db_session.add_message(
-                    session_id=request.session_id,
-                    role=new_user_message.role,
-                    content=new_user_message.content,
-                    token_count=user_token_count
+                await self._save_message(
+                    request.session_id,
+                    new_user_message.role,
+                    new_user_message.content,
+                    user_token_count
                 )
 
             # 流式响应生成器
             async def generate():
                 assistant_response = ""  # 收集完整的助手响应
+                first_token_at = None
                 try:
+                    # 引用信息在第一个 token 之前发送（没有 data 字段，旧客户端会忽略）
+                    if use_rag:
+                        timings["prompt_ready"] = _elapsed_ms(request_started)
+                        yield f"data: {json.dumps({'citations': citations, 'timings': timings}, ensure_ascii=False)}\n\n"
+
                     stream_gen = client.chat_stream(
                         messages=messages_to_send,
                         temperature=request.temperature,
@@ -130,6 +281,8 @@ class ChatPipeline:
                         done_flag = chunk.get("done_flag", False)
 
                         if content:
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()
                             assistant_response += content
 
                         # 直接发送结构化数据给前端
@@ -141,14 +294,24 @@ class ChatPipeline:
                     # 保存助手响应到数据库
                     if assistant_response:
                         assistant_token_count = estimate_message_tokens("assistant", assistant_response)
-                        self.db_session.add_message(
-                            session_id=request.session_id,
-                            role="assistant",
-                            content=assistant_response,
-                            token_count=assistant_token_count
+                        await self._save_message(
+                            request.session_id,
+                            "assistant",
+                            assistant_response,
+                            assistant_token_count
                         )
                         logger.info(f"Saved assistant message to session {request.session_id}, tokens: {assistant_token_count}")
 
+                    if use_rag:
+                        if first_token_at is not None:
+                            timings["first_token"] = round((first_token_at - request_started) * 1000, 1)
+                        timings["total"] = _elapsed_ms(request_started)
+                        stages = ", ".join(f"{stage}={ms}ms" for stage, ms in timings.items())
+                        logger.info(
+                            f"🧭 RAG chat session={request.session_id} kbs={kb_ids} "
+                            f"chunks={len(citations)}/{len(retrieved)}: {stages}"
+                        )
+
                 except Exception as e:
                     logger.error(f"Error in chat stream: {e}", exc_info=True)
                     error_data = {"error": str(e)}
@@ -0,0 +1,247 @@
+"""
+Knowledge Base Ingest Pipeline
+
+上传的文件在后台依次经过：解析（DocumentParser）→ 切分（TextSplitter）→
+批量嵌入（BatchEmbedder）→ 写入 kb_chunks 和向量存储。全程流式处理，
+文件状态记录在 kb_files.status（pending / processing / ready / error）。
+
+内容相同的文件（kb_files.content_hash 相同）已在任一知识库中处理过时，
+直接复制其 chunk，不再解析和切分；向量由嵌入缓存提供。
+
+重新处理（覆盖同名文件）是增量的：新版本中内容哈希与旧 chunk 相同的 chunk
+保留原有的行和向量（只更新位置），只嵌入新增的 chunk，处理完成后再删除
+旧版本中不再出现的 chunk（向量存储中写入墓碑）。处理期间检索仍能命中旧内容。
+
+已提交的 chunk 就是处理进度的检查点：中断（崩溃、重启）后重新处理同一文件时，
+已有向量的 chunk 同样被复用，只有未完成的部分需要嵌入。
+"""
+
+import asyncio
+import logging
+import time
+from typing import (
+    Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+)
+
+from ..comon.sqlite.sqlit_kb import SQLiteKnowledgeBase
+from ..rag.embedder import BatchEmbedder
+from ..rag.parser import DocumentParser, StreamOpener
+from ..rag.splitter import Chunk, TextSplitter
+
+logger = logging.getLogger(__name__)
+
+# 进度回调：(阶段, 已处理 chunk 数, 其中复用的 chunk 数)
+ProgressCallback = Callable[[str, int, int], Awaitable[None]]
+
+
+class KnowledgeBaseIngestPipeline:
+    """Knowledge base ingest pipeline"""
+
+    def __init__(
+        self,
+        db_kb: SQLiteKnowledgeBase,
+        parser: DocumentParser,
+        splitter: TextSplitter,
+        embedder: BatchEmbedder,
+        concurrency: int = 1
+    ):
+        """
+        Args:
+            db_kb: 知识库数据库（需配置 vector_store）
+            parser: 文档解析器
+            splitter: 文本切分器
+            embedder: 批量嵌入器
+            concurrency: 同时处理的文件数
+        """
+        self.db_kb = db_kb
+        self.parser = parser
+        self.splitter = splitter
+        self.embedder = embedder
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._tasks: Set[asyncio.Task] = set()
+
+    def submit(self, kb_id: int, file_id: int, open_stream: StreamOpener, filename: str) -> asyncio.Task:
+        """
+        在后台处理文件（立即返回）
+
+        Args:
+            kb_id: 知识库 ID
+            file_id: 文件 ID
+            open_stream: 打开源文件流的工厂函数（如 partial(minio_client.open_object, path)）
+            filename: 文件名
+
+        Returns:
+            后台任务
+        """
+        task = asyncio.create_task(self.ingest_file(kb_id, file_id, open_stream, filename))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def ingest_file(
+        self,
+        kb_id: int,
+        file_id: int,
+        open_stream: StreamOpener,
+        filename: str,
+        progress: Optional[ProgressCallback] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        解析、切分、嵌入并保存一个文件（增量替换该文件已有的 chunk）
+
+        阶段：prepare（比对已有 chunk）→ embed（解析、切分、嵌入、写入，流式进行）
+        → finalize（删除不再出现的 chunk，标记 ready）
+
+        Args:
+            kb_id: 知识库 ID
+            file_id: 文件 ID
+            open_stream: 打开源文件流的工厂函数
+            filename: 文件名
+            progress: 可选的进度回调，每个阶段开始和每批 chunk 写入后调用
+
+        Returns:
+            处理统计（chunks、reused、tokens、elapsed、chunks_per_sec），失败时返回 None
+        """
+        async with self._semaphore:
+            started = time.monotonic()
+            chunk_count = 0
+            token_count = 0
+            kept: List[Tuple[int, Chunk]] = []
+            try:
+                if progress:
+                    await progress("prepare", 0, 0)
+                previous = await self._previous_chunks(kb_id, file_id)
+                # chunk_count 在完成时才写回（处理期间不作为其他文件的复用来源）
+                await self.db_kb.update_file_status(file_id, "processing", chunk_count=0)
+
+                chunks = await self._reuse_chunks(file_id, filename)
+                if chunks is None:
+                    chunks = self.splitter.asplit(self.parser.iter_blocks(open_stream, filename))
+                fresh = self._skip_unchanged(chunks, previous, kept)
+                async for batch, vectors in self.embedder.embed_stream(fresh):
+                    await self.db_kb.add_chunks(kb_id, file_id, batch, vectors)
+                    chunk_count += len(batch)
+                    token_count += sum(chunk.token_count for chunk in batch)
+                    if progress:
+                        await progress("embed", chunk_count + len(kept), len(kept))
+
+                if progress:
+                    await progress("finalize", chunk_count + len(kept), len(kept))
+                removed = [chunk_id for ids in previous.values() for chunk_id in ids]
+                await self.db_kb.update_file_chunks(file_id, kept, removed)
+                chunk_count += len(kept)
+                token_count += sum(chunk.token_count for _, chunk in kept)
+                await self.db_kb.update_file_status(file_id, "ready", chunk_count=chunk_count)
+            except asyncio.CancelledError:
+                await self._set_status_quietly(file_id, "pending")
+                raise
+            except Exception as e:
+                logger.error(f"❌ Failed to ingest {filename} (file {file_id}): {e}", exc_info=True)
+                await self._set_status_quietly(file_id, "error", error=str(e))
+                return None
+
+            elapsed = time.monotonic() - started
+            stats = {
+                "chunks": chunk_count,
+                "reused": len(kept),
+                "tokens": token_count,
+                "elapsed": elapsed,
+                "chunks_per_sec": chunk_count / elapsed if elapsed > 0 else 0.0
+            }
+            logger.info(
+                f"✅ Ingested {filename}: {chunk_count} chunks ({len(kept)} unchanged), {token_count} tokens "
+                f"in {elapsed:.1f}s ({stats['chunks_per_sec']:.1f} chunks/s)"
+            )
+            return stats
+
+    async def _previous_chunks(self, kb_id: int, file_id: int) -> Dict[str, List[int]]:
+        """
+        取得文件已有的可复用 chunk（内容哈希 → chunk ID 列表，按文档顺序）
+
+        包括上一版本的 chunk 和中断的处理已提交的 chunk。chunk 行先于向量提交，
+        崩溃时最后一批可能只有行没有向量，这些 chunk 被删除后重新嵌入。
+        """
+        rows = await self.db_kb.get_file_chunks(file_id)
+        if not rows:
+            return {}
+        indexed = await self.db_kb.get_indexed_chunk_ids(kb_id, [row["id"] for row in rows])
+        stale = [row["id"] for row in rows if row["id"] not in indexed]
+        if stale:
+            await self.db_kb.update_file_chunks(file_id, [], stale)
+        previous: Dict[str, List[int]] = {}
+        for row in rows:
+            if row["id"] in indexed:
+                previous.setdefault(row["content_hash"], []).append(row["id"])
+        return previous
+
+    @staticmethod
+    async def _skip_unchanged(
+        chunks: Union[Iterable[Chunk], AsyncIterable[Chunk]],
+        previous: Dict[str, List[int]],
+        kept: List[Tuple[int, Chunk]]
+    ) -> AsyncIterator[Chunk]:
+        """
+        只产出需要嵌入的 chunk
+
+        与旧 chunk 内容相同的 chunk 认领一个旧 chunk ID（从 previous 中移除），
+        以 (chunk ID, 新 chunk) 记入 kept；previous 中剩下的就是被删除的 chunk。
+        """
+        async def iterate():
+            if hasattr(chunks, "__aiter__"):
+                async for chunk in chunks:
+                    yield chunk
+            else:
+                for chunk in chunks:
+                    yield chunk
+
+        async for chunk in iterate():
+            ids = previous.get(chunk.content_hash)
+            if ids:
+                kept.append((ids.pop(0), chunk))
+                continue
+            yield chunk
+
+    async def _reuse_chunks(self, file_id: int, filename: str) -> Optional[List[Chunk]]:
+        """
+        取得内容相同且已处理完成的文件的 chunk
+
+        Args:
+            file_id: 文件 ID
+            filename: 文件名（用于日志）
+
+        Returns:
+            Chunk 列表；没有可复用的文件（或它刚被删除）时返回 None
+        """
+        duplicate = await self.db_kb.find_duplicate_file(file_id)
+        if duplicate is None:
+            return None
+        rows = await self.db_kb.get_file_chunks(duplicate["id"])
+        if not rows:
+            return None
+        logger.info(
+            f"♻️ {filename} has the same content as {duplicate['filename']} "
+            f"(file {duplicate['id']}), reusing {len(rows)} chunks"
+        )
+        return [
+            Chunk(
+                row["chunk_index"], row["content"], row["token_count"],
+                row["start_offset"], row["end_offset"], row["page"], row["heading"]
+            )
+            for row in rows
+        ]
+
+    async def _set_status_quietly(self, file_id: int, status: str, error: str = None) -> None:
+        """更新文件状态，失败时只记录日志（文件可能已被删除）"""
+        try:
+            await self.db_kb.update_file_status(file_id, status, error=error)
+        except Exception as e:
+            logger.warning(f"Failed to update status of file {file_id}: {e}")
+
+    async def close(self) -> None:
+        """取消未完成的后台任务（被取消的文件状态恢复为 pending）"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
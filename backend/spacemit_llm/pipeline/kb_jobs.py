@@ -0,0 +1,281 @@
+"""
+Persistent Knowledge Base Ingest Queue
+
+上传接口只把文件写入 kb_ingest_jobs 表（每个文件一个任务）后立即返回，
+固定数量的 worker 依次领取任务并交给 KnowledgeBaseIngestPipeline 处理：
+- 任务状态（queued / running / done / failed）、阶段和进度保存在 SQLite 中，
+  后端重启后未完成的任务重新排队；同一文件反复导致崩溃时（attempts 用尽）标记为失败
+- 已提交的 chunk 是文件内的检查点：中断的文件重新处理时只嵌入未完成的部分
+- 处理中的文件被再次上传时，旧的处理被取消，新任务在它退出后才被领取
+- 进度变化时通知订阅者（状态 / SSE 接口），进度写回数据库的频率受 checkpoint_interval 限制
+
+Usage:
+    queue = KnowledgeBaseIngestQueue(db_kb, pipeline, concurrency=2)
+    await queue.start(minio_client.open_object)
+    job_ids = await queue.enqueue(file_ids)
+    jobs = await queue.get_jobs(kb_id)
+    await queue.close()
+"""
+
+import asyncio
+import functools
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from ..comon.sqlite.sqlit_kb import SQLiteKnowledgeBase
+from .kb_ingest import KnowledgeBaseIngestPipeline
+
+logger = logging.getLogger(__name__)
+
+# 未完成的任务状态
+ACTIVE_JOB_STATUSES = ("queued", "running")
+
+
+class KnowledgeBaseIngestQueue:
+    """持久化的知识库文件处理队列"""
+
+    def __init__(
+        self,
+        db_kb: SQLiteKnowledgeBase,
+        pipeline: KnowledgeBaseIngestPipeline,
+        concurrency: int = 1,
+        max_attempts: int = 3,
+        checkpoint_interval: float = 1.0
+    ):
+        """
+        Args:
+            db_kb: 知识库数据库
+            pipeline: 文件处理流水线
+            concurrency: worker 数（同时处理的文件数）
+            max_attempts: 任务被中断（后端崩溃或重启）的次数上限，达到后标记为失败
+            checkpoint_interval: 进度写回数据库的最小间隔（秒），阶段变化时总是写回
+        """
+        self.db_kb = db_kb
+        self.pipeline = pipeline
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.checkpoint_interval = checkpoint_interval
+
+        self.open_object: Optional[Callable[[str], Any]] = None
+        self._workers: List[asyncio.Task] = []
+        # 正在处理的文件 → 处理任务；被重新上传而取消的文件
+        self._active: Dict[int, asyncio.Task] = {}
+        self._superseded: Set[int] = set()
+        # 领取任务与重新排队互斥，避免同一文件被两个 worker 同时处理
+        self._claim_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._changed = asyncio.Event()
+        self.version = 0
+        # 正在处理的文件的实时进度（数据库中的进度按 checkpoint_interval 写回）
+        self._progress: Dict[int, Dict[str, Any]] = {}
+
+        # 统计信息
+        self.completed_count = 0
+        self.failed_count = 0
+
+    @property
+    def is_running(self) -> bool:
+        """worker 是否在运行"""
+        return bool(self._workers)
+
+    async def start(self, open_object: Callable[[str], Any]) -> Dict[str, int]:
+        """
+        恢复上次未完成的任务并启动 worker
+
+        Args:
+            open_object: 按对象名打开源文件流的函数（如 minio_client.open_object）
+
+        Returns:
+            恢复统计（requeued、failed、enqueued）
+        """
+        self.open_object = open_object
+        if self.is_running:
+            return {"requeued": 0, "failed": 0, "enqueued": 0}
+
+        recovered = await self.db_kb.recover_ingest_jobs(self.max_attempts)
+        if any(recovered.values()):
+            logger.info(
+                f"🧭 Ingest queue recovered: {recovered['requeued']} interrupted jobs requeued, "
+                f"{recovered['failed']} failed, {recovered['enqueued']} pending files queued"
+            )
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"kb-ingest-{i}")
+            for i in range(self.concurrency)
+        ]
+        self._wakeup.set()
+        logger.info(f"✅ Ingest queue started ({self.concurrency} workers)")
+        return recovered
+
+    async def enqueue(self, file_ids: List[int]) -> List[int]:
+        """
+        把文件加入队列（立即返回）；正在处理的文件取消当前处理后重新排队
+
+        Args:
+            file_ids: 文件 ID
+
+        Returns:
+            任务 ID
+        """
+        async with self._claim_lock:
+            job_ids = await self.db_kb.enqueue_ingest_jobs(file_ids)
+            for file_id in file_ids:
+                task = self._active.get(file_id)
+                if task is not None:
+                    self._superseded.add(file_id)
+                    task.cancel()
+        self._wakeup.set()
+        self._notify()
+        return job_ids
+
+    async def get_jobs(self, kb_id: int = None, statuses: List[str] = None) -> List[Dict[str, Any]]:
+        """
+        列出任务（正在处理的任务带有实时进度）
+
+        Args:
+            kb_id: 只列出该知识库的任务（可选）
+            statuses: 只列出这些状态的任务（可选）
+
+        Returns:
+            任务字典列表
+        """
+        jobs = await self.db_kb.get_ingest_jobs(kb_id, statuses)
+        for job in jobs:
+            live = self._progress.get(job["file_id"])
+            if job["status"] == "running" and live is not None and live["generation"] == job["generation"]:
+                job.update(stage=live["stage"], chunks_done=live["chunks_done"], chunks_reused=live["chunks_reused"])
+        return jobs
+
+    async def wait_for_change(self, version: int, timeout: float) -> bool:
+        """
+        等待任务状态或进度变化
+
+        Args:
+            version: 调用方上次读取时的 self.version（读取之后的变化立即返回）
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            是否发生了变化（超时返回 False）
+        """
+        if self.version != version:
+            return True
+        changed = self._changed
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取队列统计信息"""
+        return {
+            "is_running": self.is_running,
+            "workers": self.concurrency,
+            "active_files": list(self._active),
+            "completed_count": self.completed_count,
+            "failed_count": self.failed_count
+        }
+
+    async def close(self) -> None:
+        """停止 worker；被中断的任务保持排队，下次启动时继续（不计入尝试次数）"""
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        if workers:
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    # ==================== Workers ====================
+
+    def _notify(self) -> None:
+        """唤醒等待变化的订阅者"""
+        self.version += 1
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _worker(self) -> None:
+        """领取并处理任务，队列为空时等待新任务"""
+        while True:
+            self._wakeup.clear()
+            try:
+                async with self._claim_lock:
+                    job = await self.db_kb.claim_ingest_job(list(self._active))
+                    if job is not None:
+                        task = asyncio.create_task(self._ingest(job))
+                        self._active[job["file_id"]] = task
+            except Exception as e:
+                logger.error(f"❌ Failed to claim ingest job: {e}", exc_info=True)
+                await asyncio.sleep(self.checkpoint_interval)
+                continue
+
+            if job is None:
+                await self._wakeup.wait()
+                continue
+            self._notify()
+            await self._finish(job, task)
+
+    async def _finish(self, job: Dict[str, Any], task: asyncio.Task) -> None:
+        """等待文件处理结束并记录任务结果"""
+        file_id = job["file_id"]
+        try:
+            stats = await task
+        except asyncio.CancelledError:
+            if file_id in self._superseded:
+                # 文件被重新上传：新任务已排队，旧任务的状态不再更新
+                logger.info(f"🧭 Ingest of {job['filename']} superseded by a new upload")
+                return
+            # 关闭：任务回到队列，下次启动时继续
+            task.cancel()
+            await self._update_quietly(job, status="queued", refund_attempt=True)
+            raise
+        except Exception as e:
+            stats = None
+            logger.error(f"❌ Ingest job {job['id']} failed: {e}", exc_info=True)
+        finally:
+            self._active.pop(file_id, None)
+            self._superseded.discard(file_id)
+            self._progress.pop(file_id, None)
+            self._wakeup.set()
+            self._notify()
+
+        if stats is None:
+            self.failed_count += 1
+            file_info = await self.db_kb.get_file(file_id)
+            error = file_info["error"] if file_info else "File deleted during ingestion"
+            await self._update_quietly(job, status="failed", error=error or "Ingestion failed")
+        else:
+            self.completed_count += 1
+            await self._update_quietly(
+                job, status="done", stage="done",
+                chunks_done=stats["chunks"], chunks_reused=stats["reused"]
+            )
+        self._notify()
+
+    async def _ingest(self, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """交给流水线处理，进度写入内存并按间隔写回数据库"""
+        file_id = job["file_id"]
+        last = {"stage": None, "time": 0.0}
+
+        async def progress(stage: str, chunks_done: int, chunks_reused: int) -> None:
+            self._progress[file_id] = {
+                "generation": job["generation"],
+                "stage": stage,
+                "chunks_done": chunks_done,
+                "chunks_reused": chunks_reused
+            }
+            self._notify()
+            now = time.monotonic()
+            if stage != last["stage"] or now - last["time"] >= self.checkpoint_interval:
+                last.update(stage=stage, time=now)
+                await self._update_quietly(job, stage=stage, chunks_done=chunks_done, chunks_reused=chunks_reused)
+
+        return await self.pipeline.ingest_file(
+            job["kb_id"], file_id, functools.partial(self.open_object, job["file_path"]),
+            job["filename"], progress=progress
+        )
+
+    async def _update_quietly(self, job: Dict[str, Any], **fields) -> None:
+        """更新任务状态，失败时只记录日志（文件可能已被删除）"""
+        try:
+            await self.db_kb.update_ingest_job(job["id"], job["generation"], **fields)
+        except Exception as e:
+            logger.warning(f"Failed to update ingest job {job['id']}: {e}")
@@ -5,7 +5,7 @@ Model Selection Pipeline
 import logging
 import asyncio
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable, List
 
 from ..model.download import ModelDownloader
 from ..model.llm import LLMServer
@@ -29,6 +29,25 @@ class ModelSelectionPipeline:
         self.server_manager = server_manager
         self.db_config = db_config
         self.models_dir.mkdir(parents=True, exist_ok=True)
+        # 模型切换成功后的回调：callback(mode, model_name, model_path)
+        self._listeners: List[Callable[[str, str, str], None]] = []
+
+    def subscribe(self, callback: Callable[[str, str, str], None]) -> None:
+        """
+        订阅模型切换通知（如嵌入模型切换后清除嵌入缓存）
+
+        Args:
+            callback: 回调函数，参数为 (mode, model_name, model_path)
+        """
+        self._listeners.append(callback)
+
+    def _notify(self, mode: str, model_name: str, model_path: str) -> None:
+        """通知订阅者；单个回调失败不影响模型切换结果"""
+        for callback in self._listeners:
+            try:
+                callback(mode, model_name, model_path)
+            except Exception as e:
+                logger.warning(f"Model change listener failed: {e}")
 
     async def select_model(
         self,
@@ -94,6 +113,9 @@ class ModelSelectionPipeline:
             # Step 6: Update database
             await self._update_database(model_name, str(model_path), mode)
 
+            # Step 7: Notify subscribers
+            self._notify(mode, model_name, str(model_path))
+
             logger.info(f"Model selection completed: {model_name}")
             return {
                 "success": True,
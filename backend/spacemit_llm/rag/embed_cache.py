@@ -0,0 +1,245 @@
+"""
+Persistent content-addressed embedding cache
+
+(嵌入模型标识, normalize, 内容哈希) → 向量，嵌入前先查缓存：
+- 磁盘层：SQLite WITHOUT ROWID 表，向量以 float32 字节存储（768 维约 3KB）
+- 内存层：最近使用的向量（LRU），重复上传、重建索引时无需访问磁盘
+
+模型标识由模型文件的路径、大小和修改时间组成，同名文件被替换也会得到新标识。
+通过 ModelSelectionPipeline 切换嵌入模型时，其他模型的缓存条目被清除。
+
+Usage:
+    cache = EmbeddingCache(path, model_key=lambda: model_identity(server.current_model_path))
+    hits = cache.get_many(hashes, normalized=True)
+    cache.put_many({hash: vector}, normalized=True)
+    cache.put_many({query_hash: vector}, normalized=True, persist=False)   # 只放入内存层
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..comon.sqlite.sqlite_base import SQLiteBase
+
+logger = logging.getLogger(__name__)
+
+# 单条 SQL 的最大参数数（SQLite 默认上限 999 以内）
+_MAX_PARAMS = 500
+
+
+def model_identity(model_path: Any) -> Optional[str]:
+    """
+    计算模型文件标识
+
+    Args:
+        model_path: 模型文件路径（None 表示未加载模型）
+
+    Returns:
+        "路径:大小:修改时间"；文件不存在时返回 None
+    """
+    if not model_path:
+        return None
+    try:
+        stat = os.stat(model_path)
+    except OSError:
+        return None
+    return f"{Path(model_path).resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class EmbeddingCache(SQLiteBase):
+    """两级（内存 LRU + SQLite）嵌入向量缓存"""
+
+    def __init__(
+        self,
+        db_path: Path,
+        model_key: Callable[[], Optional[str]],
+        max_memory_entries: int = 8192,
+        pragmas: Optional[Dict[str, Any]] = None
+    ):
+        """
+        初始化缓存
+
+        Args:
+            db_path: 缓存数据库路径
+            model_key: 返回当前嵌入模型标识的函数（返回 None 时不读写缓存）
+            max_memory_entries: 内存层最多保存的向量数
+            pragmas: 可选的 PRAGMA 配置
+        """
+        self.model_key = model_key
+        self.max_memory_entries = max_memory_entries
+        self._memory: "OrderedDict[Tuple[str, int, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.reset_stats()
+        super().__init__(db_path, pragmas)
+
+    def _init_db(self):
+        """初始化缓存表"""
+        with self.transaction() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    normalized INTEGER NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (model, normalized, content_hash)
+                ) WITHOUT ROWID
+            """)
+
+    # ==================== Public API ====================
+
+    def current_model(self) -> Optional[str]:
+        """当前嵌入模型标识"""
+        return self.model_key()
+
+    def get_many(
+        self,
+        hashes: Iterable[str],
+        normalized: bool,
+        model: Optional[str] = None
+    ) -> Dict[str, List[float]]:
+        """
+        批量查询缓存
+
+        Args:
+            hashes: 内容哈希
+            normalized: 向量是否归一化
+            model: 模型标识（默认为当前模型）
+
+        Returns:
+            {内容哈希: 向量}，只包含命中的条目
+        """
+        model = model or self.current_model()
+        hashes = list(dict.fromkeys(hashes))
+        if model is None or not hashes:
+            return {}
+
+        flag = int(bool(normalized))
+        found: Dict[str, List[float]] = {}
+        missing = []
+        with self._lock:
+            for content_hash in hashes:
+                key = (model, flag, content_hash)
+                vector = self._memory.get(key)
+                if vector is None:
+                    missing.append(content_hash)
+                    continue
+                self._memory.move_to_end(key)
+                found[content_hash] = vector.tolist()
+            self.memory_hits += len(found)
+
+        loaded = {}
+        for start in range(0, len(missing), _MAX_PARAMS):
+            part = missing[start:start + _MAX_PARAMS]
+            rows = self.conn.execute(
+                f"""
+                SELECT content_hash, vector FROM embeddings
+                WHERE model = ? AND normalized = ? AND content_hash IN ({",".join("?" * len(part))})
+                """,
+                (model, flag, *part)
+            ).fetchall()
+            for content_hash, blob in rows:
+                loaded[content_hash] = np.frombuffer(blob, dtype=np.float32)
+
+        with self._lock:
+            self.disk_hits += len(loaded)
+            self.misses += len(missing) - len(loaded)
+            for content_hash, vector in loaded.items():
+                self._remember((model, flag, content_hash), vector)
+                found[content_hash] = vector.tolist()
+        return found
+
+    def put_many(
+        self,
+        vectors: Dict[str, Sequence[float]],
+        normalized: bool,
+        model: Optional[str] = None,
+        persist: bool = True
+    ) -> None:
+        """
+        写入缓存（已存在的条目被覆盖）
+
+        Args:
+            vectors: {内容哈希: 向量}
+            normalized: 向量是否归一化
+            model: 生成这些向量的模型标识（默认为当前模型；请求前取得，避免请求期间切换模型）
+            persist: 是否写入磁盘层；为 False 时只放入内存层（用于查询等一次性文本，
+                避免磁盘层随查询无限增长并把用户输入写入磁盘）
+        """
+        model = model or self.current_model()
+        if model is None or not vectors:
+            return
+
+        flag = int(bool(normalized))
+        arrays = {content_hash: np.asarray(vector, dtype=np.float32) for content_hash, vector in vectors.items()}
+        if persist:
+            with self.transaction() as cursor:
+                cursor.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, normalized, content_hash, vector) VALUES (?, ?, ?, ?)",
+                    [(model, flag, content_hash, array.tobytes()) for content_hash, array in arrays.items()]
+                )
+        with self._lock:
+            for content_hash, array in arrays.items():
+                self._remember((model, flag, content_hash), array)
+
+    def invalidate(self, keep_model: Optional[str] = None) -> int:
+        """
+        删除 keep_model 以外所有模型的缓存条目
+
+        Args:
+            keep_model: 保留的模型标识（None 表示全部删除）
+
+        Returns:
+            删除的磁盘条目数
+        """
+        with self._lock:
+            for key in [key for key in self._memory if key[0] != keep_model]:
+                del self._memory[key]
+        with self.transaction() as cursor:
+            if keep_model is None:
+                cursor.execute("DELETE FROM embeddings")
+            else:
+                cursor.execute("DELETE FROM embeddings WHERE model != ?", (keep_model,))
+            return cursor.rowcount
+
+    def on_model_change(self, mode: str, model_name: str, model_path: str) -> None:
+        """ModelSelectionPipeline 模型切换回调：切换嵌入模型后清除旧模型的向量"""
+        if mode != "embed":
+            return
+        removed = self.invalidate(model_identity(model_path))
+        if removed:
+            logger.info(f"🧹 Embed model switched to {model_name}, dropped {removed} cached embeddings")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        row = self.fetchone("SELECT COUNT(*) AS entries FROM embeddings")
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "entries": row["entries"],
+                "memory_entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+            }
+
+    def reset_stats(self) -> None:
+        """重置统计信息"""
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # ==================== Internal ====================
+
+    def _remember(self, key: Tuple[str, int, str], vector: np.ndarray) -> None:
+        """放入内存层（调用方持有锁）"""
+        if self.max_memory_entries <= 0:
+            return
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
@@ -0,0 +1,309 @@
+"""
+Adaptive batched embedding stage for knowledge-base ingestion
+
+把 Chunk 流打包成请求发送给 Embed server：
+- 按 token 预算（不超过 embed server 上下文）和自适应的条数上限组批
+- 同时保持可配置数量的请求在途
+- 根据请求延迟调整批大小（延迟低于目标时加性增大，超过目标或失败时乘性减小）
+- 失败的批次拆成两半重试，单条失败时按退避重试
+- 统计吞吐（chunks/s）等指标
+- 配置 EmbeddingCache 时，按内容哈希命中缓存的条目不再发送给 server
+
+Usage:
+    embedder = BatchEmbedder(server_manager.get_client("embed"))
+    async for batch, vectors in embedder.embed_stream(splitter.split(blocks)):
+        ...
+"""
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from ..utils.token_estimator import estimate_tokens
+
+from .embed_cache import EmbeddingCache
+from .splitter import content_hash
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingError(Exception):
+    """嵌入请求在重试后仍然失败"""
+
+
+def _item_text(item: Any) -> str:
+    """获取条目文本（支持 str 和带 text 属性的对象，如 Chunk）"""
+    return item if isinstance(item, str) else item.text
+
+
+def _item_hash(item: Any) -> str:
+    """获取条目内容哈希（Chunk 自带 content_hash）"""
+    return getattr(item, "content_hash", None) or content_hash(_item_text(item))
+
+
+class BatchEmbedder:
+    """自适应批量嵌入器"""
+
+    def __init__(
+        self,
+        client: Any,
+        max_batch_tokens: int = 8192,
+        max_batch_size: int = 64,
+        initial_batch_size: int = 16,
+        concurrency: int = 2,
+        target_latency: float = 2.0,
+        timeout: float = 60.0,
+        max_retries: int = 2,
+        retry_backoff: float = 0.5,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+        cache: Optional[EmbeddingCache] = None
+    ):
+        """
+        初始化嵌入器
+
+        Args:
+            client: 提供 async get_embeddings(texts, timeout=...) 的客户端（EmbedClient）
+            max_batch_tokens: 单个请求的 token 上限（embed server 上下文大小）
+            max_batch_size: 单个请求的条数上限
+            initial_batch_size: 初始条数上限
+            concurrency: 同时在途的请求数
+            target_latency: 目标请求延迟（秒），用于调整批大小
+            timeout: 单个请求的超时（秒）
+            max_retries: 单条请求失败后的重试次数
+            retry_backoff: 重试退避基数（秒）
+            count_tokens: token 计数函数（条目自带 token_count 时不调用）
+            cache: 可选的持久化嵌入缓存
+        """
+        self.client = client
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.min_batch_size = 1
+        self.batch_size = max(1, min(initial_batch_size, max_batch_size))
+        self.concurrency = max(1, concurrency)
+        self.target_latency = target_latency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.count_tokens = count_tokens
+        self.cache = cache
+        self.reset_stats()
+
+    # ==================== Public API ====================
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        嵌入一组文本，结果与输入顺序一致
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            嵌入向量列表
+        """
+        vectors: List[List[float]] = [None] * len(texts)
+        items = [_Indexed(i, text) for i, text in enumerate(texts)]
+
+        async for batch, batch_vectors in self.embed_stream(items):
+            for entry, vector in zip(batch, batch_vectors):
+                vectors[entry.index] = vector
+        return vectors
+
+    async def embed_stream(
+        self,
+        items: Union[Iterable[Any], AsyncIterable[Any]]
+    ) -> AsyncIterator[Tuple[List[Any], List[List[float]]]]:
+        """
+        流式嵌入条目，按请求完成顺序产出 (条目批次, 向量列表)
+
+        Args:
+            items: str 或带 text（可选 token_count）属性的条目，同步或异步可迭代
+
+        Yields:
+            (批次条目, 对应的嵌入向量)
+
+        Raises:
+            EmbeddingError: 某个条目在重试后仍然失败
+        """
+        pending: Set[asyncio.Task] = set()
+        started = time.monotonic()
+        try:
+            async for batch in self._batches(items):
+                if self.cache is not None:
+                    cached, batch = await self._lookup(batch)
+                    if cached[0]:
+                        yield cached
+                    if not batch:
+                        continue
+                while len(pending) >= self.concurrency:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield task.result()
+                pending.add(asyncio.create_task(self._embed_batch(batch)))
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            self._elapsed += time.monotonic() - started
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取吞吐和自适应状态统计"""
+        elapsed = self._elapsed
+        return {
+            "chunks": self._chunks,
+            "cached": self._cached,
+            "tokens": self._tokens,
+            "requests": self._requests,
+            "failures": self._failures,
+            "splits": self._splits,
+            "retries": self._retries,
+            "batch_size": self.batch_size,
+            "elapsed": elapsed,
+            "chunks_per_sec": self._chunks / elapsed if elapsed > 0 else 0.0,
+            "avg_latency": self._latency / self._requests if self._requests else 0.0
+        }
+
+    def reset_stats(self) -> None:
+        """重置统计信息（不影响当前批大小）"""
+        self._chunks = 0
+        self._cached = 0
+        self._tokens = 0
+        self._requests = 0
+        self._failures = 0
+        self._splits = 0
+        self._retries = 0
+        self._latency = 0.0
+        self._elapsed = 0.0
+
+    # ==================== Internal ====================
+
+    async def _batches(self, items: Union[Iterable[Any], AsyncIterable[Any]]) -> AsyncIterator[List[Tuple[Any, int]]]:
+        """按 token 预算和当前批大小打包 (条目, token 数)"""
+        batch: List[Tuple[Any, int]] = []
+        batch_tokens = 0
+
+        async def iterate():
+            if hasattr(items, "__aiter__"):
+                async for item in items:
+                    yield item
+            else:
+                for item in items:
+                    yield item
+
+        async for item in iterate():
+            tokens = getattr(item, "token_count", None) or self.count_tokens(_item_text(item))
+            if batch and (len(batch) >= self.batch_size or batch_tokens + tokens > self.max_batch_tokens):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append((item, tokens))
+            batch_tokens += tokens
+        if batch:
+            yield batch
+
+    async def _lookup(
+        self,
+        batch: List[Tuple[Any, int]]
+    ) -> Tuple[Tuple[List[Any], List[List[float]]], List[Tuple[Any, int]]]:
+        """查缓存，返回 ((命中条目, 向量), 未命中的批次)；缓存不可用时全部视为未命中"""
+        normalized = getattr(self.client, "normalize", True)
+        hashes = [_item_hash(item) for item, _ in batch]
+        try:
+            found = await asyncio.to_thread(self.cache.get_many, hashes, normalized)
+        except Exception as e:
+            logger.warning(f"⚠️ Embedding cache lookup failed: {e}")
+            found = {}
+
+        hit_items, hit_vectors, missing = [], [], []
+        for (item, tokens), item_hash in zip(batch, hashes):
+            vector = found.get(item_hash)
+            if vector is None:
+                missing.append((item, tokens))
+            else:
+                hit_items.append(item)
+                hit_vectors.append(vector)
+        self._cached += len(hit_items)
+        return (hit_items, hit_vectors), missing
+
+    async def _store(self, items: List[Any], vectors: List[List[float]], model: Optional[str]) -> None:
+        """写入缓存；失败只记录警告"""
+        normalized = getattr(self.client, "normalize", True)
+        try:
+            await asyncio.to_thread(
+                self.cache.put_many,
+                {_item_hash(item): vector for item, vector in zip(items, vectors)},
+                normalized,
+                model
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Embedding cache store failed: {e}")
+
+    async def _embed_batch(
+        self,
+        batch: List[Tuple[Any, int]],
+        attempt: int = 0
+    ) -> Tuple[List[Any], List[List[float]]]:
+        """发送一个批次；失败时拆分或重试"""
+        items = [item for item, _ in batch]
+        texts = [_item_text(item) for item in items]
+        # 请求前取得模型标识，请求期间切换模型时向量不会记到新模型名下
+        model = self.cache.current_model() if self.cache is not None else None
+        started = time.monotonic()
+        try:
+            vectors = await self.client.get_embeddings(texts, timeout=self.timeout)
+            if len(vectors) != len(texts):
+                raise EmbeddingError(f"Expected {len(texts)} embeddings, got {len(vectors)}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._requests += 1
+            self._failures += 1
+            self._decrease(0.5)
+
+            if len(batch) > 1:
+                # 拆成两半依次重试，避免放大服务器负载
+                self._splits += 1
+                logger.warning(f"⚠️ Embedding batch of {len(batch)} failed ({e}), splitting")
+                middle = len(batch) // 2
+                _, left = await self._embed_batch(batch[:middle])
+                _, right = await self._embed_batch(batch[middle:])
+                return items, left + right
+
+            if attempt < self.max_retries:
+                self._retries += 1
+                await asyncio.sleep(self.retry_backoff * (2 ** attempt))
+                return await self._embed_batch(batch, attempt + 1)
+            raise EmbeddingError(f"Failed to embed chunk after {attempt + 1} attempts: {e}") from e
+
+        latency = time.monotonic() - started
+        self._requests += 1
+        self._latency += latency
+        self._chunks += len(batch)
+        self._tokens += sum(tokens for _, tokens in batch)
+        self._adapt(len(batch), latency)
+        if model is not None:
+            await self._store(items, vectors, model)
+        return items, vectors
+
+    def _adapt(self, size: int, latency: float) -> None:
+        """根据延迟调整批大小：低于目标时加性增大，超过目标时乘性减小"""
+        if latency > self.target_latency:
+            self._decrease(0.7)
+        elif size >= self.batch_size:
+            # 只有满批才能说明当前上限还有余量
+            self.batch_size = min(self.max_batch_size, self.batch_size + max(1, self.batch_size // 8))
+
+    def _decrease(self, factor: float) -> None:
+        self.batch_size = max(self.min_batch_size, int(self.batch_size * factor))
+
+
+class _Indexed:
+    """embed() 使用的带位置信息的条目"""
+
+    __slots__ = ("index", "text")
+
+    def __init__(self, index: int, text: str):
+        self.index = index
+        self.text = text
@@ -0,0 +1,79 @@
+"""
+CJK-aware tokenization for the knowledge-base lexical (BM25) index
+
+chunk 在写入 SQLite FTS5 之前先在 Python 中切分为词项，再以空格连接交给
+unicode61 分词器（tokenchars 保留 '_' '.' '-'），因此索引中的词项完全由这里决定：
+- 拉丁字母 / 数字按词切分并转小写；标识符（get_scores、config.DATA_DIR、
+  nomic-embed-text）整体作为一个词项，同时加入按 '_' '.' '-' 拆开的各部分
+- 中日韩文字按相邻两字（bigram）切分，单独的一个字作为 unigram
+
+查询使用同样的切分，各词项以 OR 连接，由 bm25() 排序。
+
+分词规则变化时必须提升 TOKENIZER_VERSION：索引为 contentless 表，删除时需要用
+同样的规则重新切分原文。
+"""
+import re
+from typing import List, Optional
+
+TOKENIZER_VERSION = 1
+
+# 超过该长度的词项（哈希、base64 等）不建索引
+MAX_TOKEN_CHARS = 64
+# 查询最多使用的词项数
+MAX_QUERY_TERMS = 32
+
+# 平假名/片假名、CJK 扩展 A、CJK 统一汉字、谚文音节、CJK 兼容汉字
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_WORD = rf"[^\W{_CJK}]+"
+_TOKEN_RE = re.compile(rf"(?P<cjk>[{_CJK}]+)|(?P<word>{_WORD}(?:[.\-]{_WORD})*)")
+_PART_RE = re.compile(r"[_.\-]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    把文本切分为索引词项（保持原顺序，可重复）
+
+    Args:
+        text: 原文
+
+    Returns:
+        词项列表
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(text):
+        run = match.group("cjk")
+        if run:
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            continue
+
+        word = match.group("word").lower().strip("_.-")
+        if not word or len(word) > MAX_TOKEN_CHARS:
+            continue
+        tokens.append(word)
+        parts = [part for part in _PART_RE.split(word) if part]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def index_text(text: str) -> str:
+    """chunk 原文 → 写入 FTS5 的词项串"""
+    return " ".join(tokenize(text))
+
+
+def match_query(query: str) -> Optional[str]:
+    """
+    构造 FTS5 MATCH 表达式：去重后的词项以 OR 连接
+
+    每个词项加引号，用户输入不会被解析为 FTS5 语法。
+
+    Returns:
+        MATCH 表达式；查询中没有可检索的词项时返回 None
+    """
+    terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    return " OR ".join(f'"{term}"' for term in terms)
@@ -0,0 +1,337 @@
+"""
+Streaming document parser for knowledge-base files
+
+把上传的 .md / .txt / .pdf 文件转换为带页码和标题信息的文本块流：
+- md / txt：从 MinIO 响应流按块增量解码，不把整个文件读入内存
+- pdf：先把流落盘到临时文件，再在进程池中按页段提取文本，避免阻塞 API 事件循环
+
+Usage:
+    parser = DocumentParser(max_workers=2)
+    async for block in parser.iter_blocks(lambda: minio_client.open_object(name), filename):
+        ...
+    parser.close()
+"""
+import asyncio
+import codecs
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import AbstractContextManager
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Callable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = {".md", ".txt", ".pdf"}
+
+# 每次从流中读取的字节数
+READ_CHUNK_BYTES = 64 * 1024
+# 单个文本块的最大字符数，超长段落会被切开以限制内存
+MAX_BLOCK_CHARS = 16 * 1024
+# 每个进程池任务提取的 PDF 页数
+PDF_PAGES_PER_TASK = 8
+# 在线程中迭代文本文件时每次取出的块数
+_BLOCKS_PER_STEP = 64
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+
+# 打开源文件流的工厂函数，返回的上下文管理器产出二进制流
+StreamOpener = Callable[[], AbstractContextManager]
+
+
+class TextBlock:
+    """解析出的文本块"""
+
+    __slots__ = ("text", "page", "heading", "offset")
+
+    def __init__(self, text: str, page: Optional[int] = None, heading: Optional[str] = None, offset: int = 0):
+        """
+        Args:
+            text: 块文本
+            page: 所在页码（从 1 开始，仅 PDF）
+            heading: 所属标题路径（如 "安装 > 依赖"，仅 Markdown）
+            offset: 块在源文档解码后文本中的字符偏移
+        """
+        self.text = text
+        self.page = page
+        self.heading = heading
+        self.offset = offset
+
+    def __repr__(self) -> str:
+        return f"TextBlock(page={self.page}, heading={self.heading!r}, offset={self.offset}, chars={len(self.text)})"
+
+
+def get_file_type(filename: str) -> str:
+    """
+    根据文件名获取文件类型
+
+    Raises:
+        ValueError: 不支持的文件类型
+    """
+    ext = Path(filename).suffix.lower()
+    if ext not in SUPPORTED_EXTENSIONS:
+        raise ValueError(f"Unsupported file type: {ext}")
+    return ext[1:]
+
+
+# ==================== Text / Markdown ====================
+
+def _iter_lines(stream: BinaryIO, encoding: str = "utf-8") -> Iterator[Tuple[str, int]]:
+    """按块读取二进制流并增量解码，逐行产出 (行文本, 字符偏移)，行尾不含换行符"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    pending = ""
+    offset = 0
+    first = True
+    while True:
+        chunk = stream.read(READ_CHUNK_BYTES)
+        text = decoder.decode(chunk or b"", final=not chunk)
+        if first and text.startswith("\ufeff"):
+            text = text[1:]
+        if text:
+            first = False
+        pending += text
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r"), offset
+            offset += len(line) + 1
+        # 没有换行的超长行也按 MAX_BLOCK_CHARS 切开
+        while len(pending) > MAX_BLOCK_CHARS:
+            yield pending[:MAX_BLOCK_CHARS], offset
+            offset += MAX_BLOCK_CHARS
+            pending = pending[MAX_BLOCK_CHARS:]
+        if not chunk:
+            break
+    if pending:
+        yield pending.rstrip("\r"), offset
+
+
+def iter_text_blocks(stream: BinaryIO, markdown: bool = False, encoding: str = "utf-8") -> Iterator[TextBlock]:
+    """
+    把文本流切分为段落块（空行分隔）
+
+    Markdown 模式下标题行单独成块并更新标题路径，代码块内的 # 不视为标题。
+
+    Args:
+        stream: 二进制流（只需要支持 read）
+        markdown: 是否按 Markdown 解析标题
+        encoding: 文本编码
+
+    Yields:
+        TextBlock（page 为 None）
+    """
+    headings: List[Tuple[int, str]] = []
+    lines: List[str] = []
+    size = 0
+    start = 0
+    in_fence = False
+
+    def heading_path() -> Optional[str]:
+        return " > ".join(title for _, title in headings) if headings else None
+
+    def flush() -> Optional[TextBlock]:
+        nonlocal lines, size
+        text = "\n".join(lines).strip("\n")
+        lines, size = [], 0
+        if text.strip():
+            return TextBlock(text, heading=heading_path(), offset=start)
+        return None
+
+    for line, offset in _iter_lines(stream, encoding):
+        if markdown:
+            if _FENCE_RE.match(line):
+                in_fence = not in_fence
+            elif not in_fence:
+                match = _HEADING_RE.match(line)
+                if match:
+                    block = flush()
+                    if block:
+                        yield block
+                    level = len(match.group(1))
+                    while headings and headings[-1][0] >= level:
+                        headings.pop()
+                    headings.append((level, match.group(2)))
+                    yield TextBlock(line, heading=heading_path(), offset=offset)
+                    continue
+
+        if not line.strip() and not in_fence:
+            block = flush()
+            if block:
+                yield block
+            continue
+
+        if not lines:
+            start = offset
+        lines.append(line)
+        size += len(line) + 1
+        if size >= MAX_BLOCK_CHARS:
+            block = flush()
+            if block:
+                yield block
+
+    block = flush()
+    if block:
+        yield block
+
+
+# ==================== PDF (runs in worker processes) ====================
+
+def _pdf_page_count(path: str) -> int:
+    """获取 PDF 页数（在工作进程中执行）"""
+    from pypdf import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def _extract_pdf_pages(path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """提取 [start, end) 页的文本（在工作进程中执行），返回 (页码, 文本) 列表"""
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    pages = []
+    for index in range(start, min(end, len(reader.pages))):
+        try:
+            text = reader.pages[index].extract_text() or ""
+        except Exception as e:
+            # 单页解析失败不影响其余页面
+            text = ""
+            logging.getLogger(__name__).warning(f"Failed to extract page {index + 1} of {path}: {e}")
+        pages.append((index + 1, text))
+    return pages
+
+
+def _split_page(page: int, text: str, offset: int) -> Iterator[TextBlock]:
+    """把单页文本按空行切分为块"""
+    position = 0
+    for paragraph in re.split(r"\n\s*\n", text):
+        index = text.find(paragraph, position)
+        position = index + len(paragraph)
+        for i in range(0, len(paragraph), MAX_BLOCK_CHARS):
+            piece = paragraph[i:i + MAX_BLOCK_CHARS]
+            if piece.strip():
+                yield TextBlock(piece.strip(), page=page, offset=offset + index + i)
+
+
+# ==================== Parser ====================
+
+class DocumentParser:
+    """文档解析器，PDF 文本提取在独立的进程池中执行"""
+
+    def __init__(self, max_workers: int = 2, temp_dir: Optional[Path] = None):
+        """
+        初始化解析器
+
+        Args:
+            max_workers: PDF 解析进程数
+            temp_dir: PDF 临时文件目录，默认使用系统临时目录
+        """
+        self.max_workers = max_workers
+        self.temp_dir = temp_dir
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """按需创建进程池（spawn 方式，避免在多线程进程中 fork）"""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def close(self) -> None:
+        """关闭进程池"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def iter_blocks(self, open_stream: StreamOpener, filename: str) -> AsyncIterator[TextBlock]:
+        """
+        流式解析文档
+
+        Args:
+            open_stream: 无参工厂函数，返回产出二进制流的上下文管理器
+                         （如 lambda: minio_client.open_object(name)）
+            filename: 文件名，用于判断类型
+
+        Yields:
+            TextBlock
+
+        Raises:
+            ValueError: 不支持的文件类型
+        """
+        file_type = get_file_type(filename)
+        if file_type == "pdf":
+            async for block in self._iter_pdf_blocks(open_stream, filename):
+                yield block
+        else:
+            async for block in self._iter_text_blocks(open_stream, markdown=file_type == "md"):
+                yield block
+
+    async def _iter_text_blocks(self, open_stream: StreamOpener, markdown: bool) -> AsyncIterator[TextBlock]:
+        """在线程中读取文本流，每次取出一批块交给事件循环"""
+        context = await asyncio.to_thread(open_stream)
+        stream = await asyncio.to_thread(context.__enter__)
+        try:
+            blocks = iter_text_blocks(stream, markdown=markdown)
+
+            def next_batch() -> List[TextBlock]:
+                batch = []
+                for block in blocks:
+                    batch.append(block)
+                    if len(batch) >= _BLOCKS_PER_STEP:
+                        break
+                return batch
+
+            while True:
+                batch = await asyncio.to_thread(next_batch)
+                if not batch:
+                    break
+                for block in batch:
+                    yield block
+        finally:
+            await asyncio.to_thread(context.__exit__, None, None, None)
+
+    async def _iter_pdf_blocks(self, open_stream: StreamOpener, filename: str) -> AsyncIterator[TextBlock]:
+        """把 PDF 落盘到临时文件，按页段提交到进程池提取"""
+        fd, path = tempfile.mkstemp(suffix=".pdf", dir=self.temp_dir)
+        os.close(fd)
+        try:
+            await asyncio.to_thread(self._spool, open_stream, path)
+
+            loop = asyncio.get_running_loop()
+            pool = self._get_pool()
+            page_count = await loop.run_in_executor(pool, _pdf_page_count, path)
+            logger.info(f"📄 Parsing PDF {filename}: {page_count} pages")
+
+            offset = 0
+            # 预取下一段，使进程池提取与下游消费重叠
+            pending = None
+            for start in range(0, page_count, PDF_PAGES_PER_TASK):
+                future = loop.run_in_executor(pool, _extract_pdf_pages, path, start, start + PDF_PAGES_PER_TASK)
+                if pending is not None:
+                    for page, text in await pending:
+                        for block in _split_page(page, text, offset):
+                            yield block
+                        offset += len(text) + 1
+                pending = future
+            if pending is not None:
+                for page, text in await pending:
+                    for block in _split_page(page, text, offset):
+                        yield block
+                    offset += len(text) + 1
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _spool(open_stream: StreamOpener, path: str) -> None:
+        """把源文件流按块复制到临时文件"""
+        with open_stream() as stream, open(path, "wb") as f:
+            shutil.copyfileobj(stream, f, READ_CHUNK_BYTES)
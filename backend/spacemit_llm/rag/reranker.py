@@ -0,0 +1,238 @@
+"""
+Budgeted cross-encoder rerank stage for knowledge-base retrieval
+
+把检索候选交给 Rerank server（llama-server --reranking）重新打分：
+- 每个文档先截断到 token 预算内（query + 文档需放进 server 的一个 batch）
+- 候选按请求 token 上限（server 上下文）和条数上限拆成多个子请求并行发送，
+  子请求只返回 index + 分数（return_documents=False），再按偏移合并
+- (query, content_hash) → 分数缓存在 LRU 中，重复查询和翻页不再调用 cross-encoder；
+  缓存键包含当前 rerank 模型，切换模型后旧分数自然失效
+
+Usage:
+    reranker = Reranker(server_manager.get_client("rerank"))
+    ranked = await reranker.rerank(query, chunks, top_k=8)
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ..utils.token_estimator import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# 每个 (query, document) 对的模板开销（BOS/SEP/EOS 等特殊 token）
+_PAIR_OVERHEAD_TOKENS = 8
+
+
+class Reranker:
+    """带 token 预算、并行子请求和分数缓存的重排序器"""
+
+    def __init__(
+        self,
+        client: Any,
+        max_request_tokens: int = 8192,
+        max_pair_tokens: int = 512,
+        max_batch_size: int = 16,
+        concurrency: int = 2,
+        cache_size: int = 4096,
+        model_key: Optional[Callable[[], Any]] = None,
+        count_tokens: Callable[[str], int] = estimate_tokens
+    ):
+        """
+        初始化重排序器
+
+        Args:
+            client: 提供 async rerank(query, documents, top_n=, return_documents=) 的客户端（RerankClient）
+            max_request_tokens: 单个子请求的 token 上限（rerank server 上下文大小）
+            max_pair_tokens: 单个 (query, 文档) 对的 token 上限（rerank server batch 大小）
+            max_batch_size: 单个子请求的文档数上限
+            concurrency: 同时在途的子请求数
+            cache_size: 分数缓存的条目上限（0 表示不缓存）
+            model_key: 返回当前 rerank 模型标识的函数（加入缓存键）
+            count_tokens: token 计数函数
+        """
+        self.client = client
+        self.max_request_tokens = max_request_tokens
+        self.max_pair_tokens = max_pair_tokens
+        self.max_batch_size = max(1, max_batch_size)
+        self.concurrency = max(1, concurrency)
+        self.cache_size = cache_size
+        self.model_key = model_key
+        self.count_tokens = count_tokens
+
+        self._cache: "OrderedDict[Tuple[Any, str, str], float]" = OrderedDict()
+        self.reset_stats()
+
+    # ==================== Public API ====================
+
+    async def rerank(
+        self,
+        query: str,
+        chunks: List[Dict[str, Any]],
+        top_k: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        重排序 chunk
+
+        Args:
+            query: 查询文本
+            chunks: chunk 字典列表（需包含 content 和 content_hash）
+            top_k: 返回结果数（None 表示全部）
+
+        Returns:
+            按 rerank_score 降序的 chunk 列表（原字典上附加 rerank_score 字段）
+        """
+        scores = await self.score(query, [(chunk["content_hash"], chunk["content"]) for chunk in chunks])
+        for chunk, score in zip(chunks, scores):
+            chunk["rerank_score"] = score
+        ranked = sorted(chunks, key=lambda chunk: chunk["rerank_score"], reverse=True)
+        return ranked if top_k is None else ranked[:top_k]
+
+    async def score(self, query: str, documents: List[Tuple[str, str]]) -> List[float]:
+        """
+        计算文档与查询的相关性分数，结果与输入顺序一致
+
+        Args:
+            query: 查询文本
+            documents: [(缓存键（内容哈希）, 文档文本)]
+
+        Returns:
+            分数列表
+        """
+        model = self.model_key() if self.model_key else None
+        scores: List[Optional[float]] = [None] * len(documents)
+        pending: Dict[str, List[int]] = {}
+        texts: Dict[str, str] = {}
+        for i, (key, text) in enumerate(documents):
+            cached = self._cache_get((model, query, key))
+            if cached is not None:
+                scores[i] = cached
+                continue
+            # 同一批中内容相同的文档只打分一次
+            pending.setdefault(key, []).append(i)
+            texts[key] = text
+
+        if pending:
+            keys = list(pending)
+            fresh = await self._score_uncached(query, [texts[key] for key in keys])
+            for key, score in zip(keys, fresh):
+                self._cache_put((model, query, key), score)
+                for i in pending[key]:
+                    scores[i] = score
+        return scores
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取统计信息"""
+        return {
+            "cache_entries": len(self._cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "requests": self.requests,
+            "documents_scored": self.documents_scored,
+            "documents_truncated": self.documents_truncated,
+            "total_time": round(self.total_time, 3)
+        }
+
+    def reset_stats(self) -> None:
+        """重置统计信息"""
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.requests = 0
+        self.documents_scored = 0
+        self.documents_truncated = 0
+        self.total_time = 0.0
+
+    def clear_cache(self) -> None:
+        """清空分数缓存"""
+        self._cache.clear()
+
+    # ==================== Scoring ====================
+
+    async def _score_uncached(self, query: str, texts: List[str]) -> List[float]:
+        """截断、分批并行请求，按原顺序合并分数"""
+        query_tokens = self.count_tokens(query)
+        doc_budget = max(1, self.max_pair_tokens - query_tokens - _PAIR_OVERHEAD_TOKENS)
+        truncated = []
+        for text in texts:
+            text, tokens = self._truncate(text, doc_budget)
+            truncated.append((text, query_tokens + tokens + _PAIR_OVERHEAD_TOKENS))
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(offset: int, batch: List[str]) -> Tuple[int, List[float]]:
+            async with semaphore:
+                return offset, await self._request(query, batch)
+
+        results = await asyncio.gather(*[run(offset, batch) for offset, batch in self._batches(truncated)])
+
+        scores = [0.0] * len(texts)
+        for offset, batch_scores in results:
+            scores[offset:offset + len(batch_scores)] = batch_scores
+        return scores
+
+    def _batches(self, items: List[Tuple[str, int]]) -> List[Tuple[int, List[str]]]:
+        """按请求 token 上限和条数上限切分，返回 [(起始偏移, 文本列表)]"""
+        batches = []
+        start = 0
+        batch: List[str] = []
+        batch_tokens = 0
+        for i, (text, tokens) in enumerate(items):
+            if batch and (len(batch) >= self.max_batch_size or batch_tokens + tokens > self.max_request_tokens):
+                batches.append((start, batch))
+                start, batch, batch_tokens = i, [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append((start, batch))
+        return batches
+
+    async def _request(self, query: str, documents: List[str]) -> List[float]:
+        """发送一个子请求，只取回 index 和分数"""
+        started = time.perf_counter()
+        results = await self.client.rerank(query, documents, top_n=len(documents), return_documents=False)
+        self.total_time += time.perf_counter() - started
+        self.requests += 1
+        self.documents_scored += len(documents)
+
+        scores = [0.0] * len(documents)
+        for index, score, _ in results:
+            if index is not None and 0 <= index < len(documents) and score is not None:
+                scores[index] = float(score)
+        return scores
+
+    def _truncate(self, text: str, budget: int) -> Tuple[str, int]:
+        """把文本截断到 token 预算内，返回 (文本, 估算 token 数)"""
+        tokens = self.count_tokens(text)
+        if tokens <= budget:
+            return text, tokens
+
+        self.documents_truncated += 1
+        # 按比例截断后逐步收缩（估算器对中英文的系数不同，比例只是近似）
+        length = max(1, len(text) * budget // tokens)
+        while True:
+            head = text[:length]
+            tokens = self.count_tokens(head)
+            if tokens <= budget or length <= 1:
+                return head, tokens
+            length = max(1, length * 9 // 10)
+
+    # ==================== Cache ====================
+
+    def _cache_get(self, key: Tuple[Any, str, str]) -> Optional[float]:
+        score = self._cache.get(key)
+        if score is None:
+            self.cache_misses += 1
+            return None
+        self._cache.move_to_end(key)
+        self.cache_hits += 1
+        return score
+
+    def _cache_put(self, key: Tuple[Any, str, str], score: float) -> None:
+        if self.cache_size <= 0:
+            return
+        self._cache[key] = score
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
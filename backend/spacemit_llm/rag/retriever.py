@@ -0,0 +1,217 @@
+"""
+Hybrid knowledge-base retriever
+
+同时进行两路检索并用倒数排名融合（Reciprocal Rank Fusion）合并：
+- 向量检索：嵌入查询后在每个知识库的 VectorStore 中取 top-k
+- 词法检索：SQLite FTS5 上的 BM25（CJK 按 bigram 切分，能命中嵌入容易漏掉的
+  标识符、型号、错误码等精确词）
+
+RRF 分数为 sum(1 / (rrf_k + rank))，只依赖排名，两路分数不需要归一化。
+词法检索几乎没有开销，因此向量候选池可以取得较小。
+
+配置了 Reranker 时，融合后的前 rerank_candidates 个结果再交给 cross-encoder 重排序。
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Dict, List, Optional, Sequence, Tuple
+
+from ..comon.sqlite.sqlit_kb import SQLiteKnowledgeBase
+from .embed_cache import EmbeddingCache
+from .reranker import Reranker
+from .splitter import content_hash
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_MODES = ("hybrid", "vector", "lexical")
+
+
+def rrf_fuse(rankings: Sequence[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """
+    倒数排名融合
+
+    Args:
+        rankings: 多路检索结果，每路为按相关度降序的 ID 列表
+        k: 平滑常数（越大，排名靠后的结果权重下降越慢）
+
+    Returns:
+        [(ID, 融合分数)]，按分数降序（同分时先出现者优先）
+    """
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+async def _timed(awaitable: Awaitable[Any], timings: Dict[str, float], stage: str) -> Any:
+    """等待 awaitable 并把耗时（毫秒）记入 timings[stage]"""
+    started = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = round((time.perf_counter() - started) * 1000, 1)
+
+
+class Retriever:
+    """向量 + BM25 混合检索器"""
+
+    def __init__(
+        self,
+        db_kb: SQLiteKnowledgeBase,
+        embed_client: Any,
+        vector_candidates: int = 32,
+        lexical_candidates: int = 32,
+        rrf_k: int = 60,
+        reranker: Optional[Reranker] = None,
+        rerank_candidates: int = 24,
+        embed_cache: Optional[EmbeddingCache] = None
+    ):
+        """
+        初始化检索器
+
+        Args:
+            db_kb: 知识库数据库（需配置 vector_store）
+            embed_client: 提供 async get_embeddings(texts) 的客户端（EmbedClient）
+            vector_candidates: 向量检索每路候选数
+            lexical_candidates: 词法检索候选数
+            rrf_k: RRF 平滑常数
+            reranker: 可选的重排序阶段
+            rerank_candidates: 交给重排序的融合结果数
+            embed_cache: 可选的嵌入缓存（重复查询不再嵌入）
+        """
+        self.db_kb = db_kb
+        self.embed_client = embed_client
+        self.vector_candidates = vector_candidates
+        self.lexical_candidates = lexical_candidates
+        self.rrf_k = rrf_k
+        self.reranker = reranker
+        self.rerank_candidates = rerank_candidates
+        self.embed_cache = embed_cache
+
+    async def retrieve(
+        self,
+        query: str,
+        kb_ids: List[int],
+        top_k: int = 8,
+        mode: str = "hybrid",
+        rerank: bool = True,
+        timings: Optional[Dict[str, float]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        检索与查询相关的 chunk
+
+        混合模式下某一路失败（如 embed server 未启动）时只记录警告，使用另一路的结果；
+        重排序失败（如 rerank server 未启动）时保留融合顺序。
+
+        Args:
+            query: 查询文本
+            kb_ids: 要检索的知识库 ID
+            top_k: 返回结果数
+            mode: 'hybrid'、'vector' 或 'lexical'
+            rerank: 是否使用重排序阶段（未配置 reranker 时忽略）
+            timings: 可选，写入各阶段耗时（毫秒）：embed、vector_search、lexical_search、
+                fetch、rerank（未执行的阶段不写入）
+
+        Returns:
+            chunk 字典列表（含 filename），按相关度降序；附加字段：
+            score（融合分数）、vector_score / lexical_score（未命中该路时为 None）、
+            rerank_score（未重排序时为 None）
+
+        Raises:
+            ValueError: mode 无效
+        """
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Invalid retrieval mode: {mode}. Must be one of {', '.join(RETRIEVAL_MODES)}")
+        if not query.strip() or not kb_ids:
+            return []
+
+        if timings is None:
+            timings = {}
+        legs = {}
+        if mode in ("hybrid", "vector"):
+            legs["vector"] = self._vector_search(query, kb_ids, self.vector_candidates, timings)
+        if mode in ("hybrid", "lexical"):
+            legs["lexical"] = _timed(
+                self.db_kb.search_chunks_lexical(kb_ids, query, self.lexical_candidates),
+                timings, "lexical_search"
+            )
+        results = await asyncio.gather(*legs.values(), return_exceptions=True)
+
+        hits: Dict[str, List[Tuple[int, float]]] = {}
+        for leg_name, result in zip(legs, results):
+            if isinstance(result, BaseException):
+                if mode != "hybrid":
+                    raise result
+                logger.warning(f"⚠️ {leg_name.capitalize()} retrieval failed, using the other leg only: {result}")
+                result = []
+            hits[leg_name] = result
+
+        vector_hits = dict(hits.get("vector", []))
+        lexical_hits = dict(hits.get("lexical", []))
+        rankings = [[chunk_id for chunk_id, _ in leg_hits] for leg_hits in hits.values()]
+        use_reranker = rerank and self.reranker is not None
+        limit = max(top_k, self.rerank_candidates) if use_reranker else top_k
+        fused = rrf_fuse(rankings, self.rrf_k)[:limit]
+
+        chunks = await _timed(self.db_kb.get_chunks([chunk_id for chunk_id, _ in fused]), timings, "fetch")
+        by_id = {chunk["id"]: chunk for chunk in chunks}
+        output = []
+        for chunk_id, score in fused:
+            chunk = by_id.get(chunk_id)
+            if chunk is None:
+                # 检索期间被删除
+                continue
+            chunk["score"] = score
+            chunk["vector_score"] = vector_hits.get(chunk_id)
+            chunk["lexical_score"] = lexical_hits.get(chunk_id)
+            chunk["rerank_score"] = None
+            output.append(chunk)
+
+        if use_reranker and output:
+            try:
+                output = await _timed(self.reranker.rerank(query, output), timings, "rerank")
+            except Exception as e:
+                logger.warning(f"⚠️ Rerank failed, keeping fused order: {e}")
+        return output[:top_k]
+
+    async def _vector_search(
+        self,
+        query: str,
+        kb_ids: List[int],
+        limit: int,
+        timings: Dict[str, float]
+    ) -> List[Tuple[int, float]]:
+        """嵌入查询并在各知识库中检索，按内积合并（同一嵌入模型的分数可直接比较）"""
+        vector_store = self.db_kb.vector_store
+        if vector_store is None:
+            return []
+        query_vector = await _timed(self._embed_query(query), timings, "embed")
+        if query_vector is None:
+            return []
+
+        per_kb = await _timed(asyncio.gather(*[
+            asyncio.to_thread(vector_store.search, kb_id, query_vector, limit) for kb_id in kb_ids
+        ]), timings, "vector_search")
+        hits = [hit for kb_hits in per_kb for hit in kb_hits]
+        hits.sort(key=lambda hit: hit[1], reverse=True)
+        return hits[:limit]
+
+    async def _embed_query(self, query: str) -> Optional[List[float]]:
+        """嵌入查询，先查嵌入缓存（查询向量只放入内存层，不写入磁盘）"""
+        cache = self.embed_cache
+        if cache is None:
+            embeddings = await self.embed_client.get_embeddings([query])
+            return embeddings[0] if embeddings else None
+
+        query_hash = content_hash(query)
+        normalized = getattr(self.embed_client, "normalize", True)
+        model = cache.current_model()
+        found = await asyncio.to_thread(cache.get_many, [query_hash], normalized, model)
+        if query_hash in found:
+            return found[query_hash]
+        embeddings = await self.embed_client.get_embeddings([query])
+        if not embeddings:
+            return None
+        await asyncio.to_thread(cache.put_many, {query_hash: embeddings[0]}, normalized, model, persist=False)
+        return embeddings[0]
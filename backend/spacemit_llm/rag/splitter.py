@@ -0,0 +1,284 @@
+"""
+Token-aware recursive text splitter
+
+消费解析器产出的 TextBlock 流，按 token 预算切分为带重叠的 Chunk：
+- 标题路径变化时强制断开，块内依次按段落、换行、句子（含中文标点）、分句、字符递归切分
+- token 数由项目的 estimate_tokens 计算
+- 每个 Chunk 带有稳定的内容哈希和源文档字符偏移
+- 全程为生成器，只保留当前窗口中的片段，内存占用与输入大小无关
+"""
+import hashlib
+import re
+from collections import deque
+from typing import AsyncIterable, AsyncIterator, Callable, Deque, Iterable, Iterator, List, Optional, Tuple
+
+from ..utils.token_estimator import estimate_tokens
+from .parser import TextBlock
+
+# 递归切分使用的分隔规则（匹配结束位置即切分点，分隔符保留在前一段末尾）
+_SEPARATORS = [
+    re.compile(r"\n[ \t]*\n\s*"),                                        # 段落
+    re.compile(r"\n"),                                                   # 换行
+    re.compile(r"(?:[。！？；…]+|[!?;]+|\.(?=\s))[”’」』）)\"']*\s*"),    # 句子
+    re.compile(r"[，、：,:]\s*|\s+"),                                     # 分句 / 词
+]
+
+# 窗口中来自不同文本块的片段之间的连接符
+_BLOCK_SEPARATOR = "\n\n"
+
+
+class Chunk:
+    """切分出的文本片段"""
+
+    __slots__ = ("index", "text", "token_count", "content_hash", "start", "end", "page", "heading")
+
+    def __init__(
+        self,
+        index: int,
+        text: str,
+        token_count: int,
+        start: int,
+        end: int,
+        page: Optional[int] = None,
+        heading: Optional[str] = None
+    ):
+        """
+        Args:
+            index: 在文档中的序号（从 0 开始）
+            text: 片段文本
+            token_count: 估算的 token 数
+            start: 在源文档中的起始字符偏移
+            end: 在源文档中的结束字符偏移（不含）
+            page: 起始页码（仅 PDF）
+            heading: 所属标题路径
+        """
+        self.index = index
+        self.text = text
+        self.token_count = token_count
+        self.content_hash = content_hash(text)
+        self.start = start
+        self.end = end
+        self.page = page
+        self.heading = heading
+
+    def __repr__(self) -> str:
+        return (
+            f"Chunk(index={self.index}, tokens={self.token_count}, "
+            f"span=[{self.start}, {self.end}), hash={self.content_hash[:12]})"
+        )
+
+
+def content_hash(text: str) -> str:
+    """计算片段内容的 sha256 哈希（十六进制）"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class _Unit:
+    """不超过 token 预算的最小片段"""
+
+    __slots__ = ("text", "tokens", "start", "block", "page", "heading")
+
+    def __init__(self, text: str, tokens: int, start: int, block: int, page: Optional[int], heading: Optional[str]):
+        self.text = text
+        self.tokens = tokens
+        self.start = start
+        self.block = block
+        self.page = page
+        self.heading = heading
+
+
+class TextSplitter:
+    """按 token 预算递归切分文本块"""
+
+    def __init__(
+        self,
+        chunk_tokens: int = 512,
+        overlap_tokens: int = 64,
+        count_tokens: Callable[[str], int] = estimate_tokens
+    ):
+        """
+        初始化切分器
+
+        Args:
+            chunk_tokens: 每个 Chunk 的 token 上限
+            overlap_tokens: 相邻 Chunk 之间重叠的 token 数上限
+            count_tokens: token 计数函数
+        """
+        if chunk_tokens <= 0:
+            raise ValueError("chunk_tokens must be positive")
+        if not 0 <= overlap_tokens < chunk_tokens:
+            raise ValueError("overlap_tokens must be in [0, chunk_tokens)")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.count_tokens = count_tokens
+        # 跨块拼接时插入的空行同样占用预算
+        self.separator_tokens = count_tokens(_BLOCK_SEPARATOR)
+
+    def split_text(self, text: str) -> Iterator[Chunk]:
+        """切分一段纯文本（便捷方法）"""
+        return self.split([TextBlock(text)])
+
+    def split(self, blocks: Iterable[TextBlock]) -> Iterator[Chunk]:
+        """
+        把文本块流切分为 Chunk 流
+
+        Args:
+            blocks: 解析器产出的 TextBlock（按文档顺序）
+
+        Yields:
+            Chunk
+        """
+        packer = _ChunkPacker(self)
+        for block in blocks:
+            yield from packer.feed(block)
+        yield from packer.finish()
+
+    async def asplit(self, blocks: AsyncIterable[TextBlock]) -> AsyncIterator[Chunk]:
+        """
+        split 的异步版本，直接消费 DocumentParser.iter_blocks 的输出
+
+        Args:
+            blocks: 异步 TextBlock 流
+
+        Yields:
+            Chunk
+        """
+        packer = _ChunkPacker(self)
+        async for block in blocks:
+            for chunk in packer.feed(block):
+                yield chunk
+        for chunk in packer.finish():
+            yield chunk
+
+    # ==================== Internal ====================
+
+    def _make_chunk(self, index: int, window: Deque[_Unit]) -> Chunk:
+        """把窗口中的片段拼接为 Chunk（跨块处以空行连接）"""
+        parts: List[str] = []
+        previous = None
+        for unit in window:
+            if previous is not None and unit.block != previous.block:
+                parts.append(_BLOCK_SEPARATOR)
+            parts.append(unit.text)
+            previous = unit
+        text = "".join(parts).strip()
+        first, last = window[0], window[-1]
+        return Chunk(
+            index=index,
+            text=text,
+            token_count=self.count_tokens(text),
+            start=first.start,
+            end=last.start + len(last.text),
+            page=first.page,
+            heading=first.heading
+        )
+
+    def _units(self, block: TextBlock, block_no: int) -> Iterator[_Unit]:
+        """把文本块递归切分为不超过预算的片段（跳过纯空白片段）"""
+        for start, end, tokens in self._spans(block.text, 0, 0):
+            piece = block.text[start:end]
+            if piece.strip():
+                yield _Unit(piece, tokens, block.offset + start, block_no, block.page, block.heading)
+
+    def _spans(self, text: str, base: int, level: int) -> Iterator[Tuple[int, int, int]]:
+        """递归产出 (起始, 结束, token 数)，相邻片段首尾相接"""
+        tokens = self.count_tokens(text)
+        if tokens <= self.chunk_tokens:
+            yield base, base + len(text), tokens
+            return
+
+        while level < len(_SEPARATORS):
+            pieces = self._cut(text, _SEPARATORS[level])
+            level += 1
+            if len(pieces) > 1:
+                for start, end in pieces:
+                    yield from self._spans(text[start:end], base + start, level)
+                return
+
+        yield from self._hard_split(text, base, tokens)
+
+    @staticmethod
+    def _cut(text: str, separator: "re.Pattern") -> List[Tuple[int, int]]:
+        """在分隔符结束处切分，返回覆盖全文的区间列表"""
+        pieces = []
+        start = 0
+        for match in separator.finditer(text):
+            end = match.end()
+            if start < end < len(text):
+                pieces.append((start, end))
+                start = end
+        pieces.append((start, len(text)))
+        return pieces
+
+    def _hard_split(self, text: str, base: int, tokens: int) -> Iterator[Tuple[int, int, int]]:
+        """没有可用分隔符时按字符数切分"""
+        start = 0
+        while start < len(text):
+            remaining = len(text) - start
+            size = max(1, remaining * self.chunk_tokens // max(tokens, 1))
+            piece_tokens = self.count_tokens(text[start:start + size])
+            while size > 1 and piece_tokens > self.chunk_tokens:
+                size = max(1, size * 3 // 4)
+                piece_tokens = self.count_tokens(text[start:start + size])
+            yield base + start, base + start + size, piece_tokens
+            start += size
+
+
+class _ChunkPacker:
+    """把片段按 token 预算装入滑动窗口（split / asplit 共用的状态）"""
+
+    def __init__(self, splitter: TextSplitter):
+        self.splitter = splitter
+        self.window: Deque[_Unit] = deque()
+        self.window_tokens = 0
+        self.fresh = 0  # 窗口中尚未输出过的片段数
+        self.index = 0
+        self.block_no = 0
+        self.heading: Optional[str] = None
+
+    def feed(self, block: TextBlock) -> Iterator[Chunk]:
+        """加入一个文本块，产出因此填满的 Chunk"""
+        splitter = self.splitter
+        if block.heading != self.heading and self.window:
+            # 标题变化时断开，且不跨标题重叠
+            yield from self._flush()
+            self.window.clear()
+            self.window_tokens = 0
+        self.heading = block.heading
+
+        for unit in splitter._units(block, self.block_no):
+            if self.window_tokens + self._cost(unit) > splitter.chunk_tokens and self.window:
+                yield from self._flush()
+                self._trim_overlap(unit)
+            self.window_tokens += self._cost(unit)
+            self.window.append(unit)
+            self.fresh += 1
+        self.block_no += 1
+
+    def finish(self) -> Iterator[Chunk]:
+        """输出窗口中剩余的内容"""
+        yield from self._flush()
+
+    def _cost(self, unit: _Unit) -> int:
+        """把片段加入窗口末尾增加的 token 数（含跨块连接符）"""
+        if self.window and self.window[-1].block != unit.block:
+            return unit.tokens + self.splitter.separator_tokens
+        return unit.tokens
+
+    def _flush(self) -> Iterator[Chunk]:
+        if self.window and self.fresh:
+            yield self.splitter._make_chunk(self.index, self.window)
+            self.index += 1
+        self.fresh = 0
+
+    def _trim_overlap(self, incoming: _Unit) -> None:
+        """保留窗口尾部作为重叠，同时保证加入下一个片段后不超过预算"""
+        splitter = self.splitter
+        while self.window and (
+            self.window_tokens > splitter.overlap_tokens
+            or self.window_tokens + self._cost(incoming) > splitter.chunk_tokens
+        ):
+            removed = self.window.popleft()
+            self.window_tokens -= removed.tokens
+            if self.window and self.window[0].block != removed.block:
+                self.window_tokens -= splitter.separator_tokens
@@ -0,0 +1,923 @@
+"""
+Memory-mapped per-knowledge-base vector store
+
+每个知识库一个目录，保存一个连续的 float32 向量矩阵文件和对应的 chunk ID 文件：
+- 新向量追加写入文件末尾，查询时以内存映射方式读取，不把矩阵读入堆内存
+- 删除时把 ID 置为 -1（墓碑），死行比例超过阈值时压缩重写
+- 查询为一次向量化的矩阵乘法 + argpartition 取 top-k
+
+索引类型（知识库设置中选择）:
+- flat: 精确检索，扫描全部向量
+- ivf:  倒排文件索引。存活向量数达到 exact_threshold 时用球面 k-means 训练
+        nlist 个聚类中心，之后新追加的向量直接分配到最近的中心；查询只扫描
+        与查询最接近的 nprobe 个列表（nprobe 越大召回越高、延迟越高）。
+        向量数低于 exact_threshold 时仍走精确检索。
+
+量化方式（知识库设置中选择）:
+- none:   直接扫描 float32 向量
+- int8:   每维对称标量量化（每维一个缩放系数），码本为向量的 1/4
+- binary: 每维一个符号位，码本为向量的 1/32，用汉明距离打分
+量化时先扫描紧凑的码本得到 top_k * rescore 个候选，再从磁盘上的 float32 向量
+中只读取这些行重新精确打分。可与 ivf 组合：只扫描被探测列表中的码。
+
+目录结构:
+    {root}/kb_{id}/meta.json            {"dim": 768, "generation": 3, "index": "ivf", "nlist": 512, ...}
+    {root}/kb_{id}/vectors.3.f32        rows x dim float32（行优先）
+    {root}/kb_{id}/ids.3.i64            rows 个 int64 chunk ID（-1 表示已删除）
+    {root}/kb_{id}/assign.3.i32         rows 个 int32 聚类编号（仅 ivf 已训练时）
+    {root}/kb_{id}/centroids.3.npy      nlist x dim 聚类中心（仅 ivf 已训练时）
+    {root}/kb_{id}/codes.3.q            rows x code_size 量化码（仅量化时）
+    {root}/kb_{id}/scale.3.npy          dim 个 int8 缩放系数（仅 int8）
+
+压缩 / 训练写入新一代文件后通过替换 meta.json 原子切换。向量可以由 chunk 内容重新
+生成，因此追加时不做 fsync；ID 文件最后写入，行数以各文件中最短者为准，崩溃时
+截断半写入的尾部。
+
+并发：每个知识库一个写锁和一个状态锁。写操作（追加、删除、切换设置、压缩）按知识库
+串行执行；压缩和训练在只持有写锁时构建新一代文件，只在切换 meta.json 和内存状态时
+短暂持有状态锁，因此重建期间该知识库和其他知识库的查询都不会被阻塞。
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_VECTOR_DTYPE = np.float32
+_ID_DTYPE = np.int64
+_ASSIGN_DTYPE = np.int32
+_TOMBSTONE = -1
+# 压缩时每次复制的行数
+_COMPACT_BLOCK_ROWS = 65536
+
+INDEX_TYPES = ("flat", "ivf")
+# IVF 聚类数为 4 * sqrt(存活行数)，限制在该范围内
+_MIN_NLIST = 16
+_MAX_NLIST = 1024
+# 每个聚类中心使用的训练样本数
+_TRAIN_SAMPLES_PER_LIST = 40
+_KMEANS_ITERATIONS = 10
+# 存活行数增长到上次训练时的该倍数后重新训练
+_RETRAIN_GROWTH = 8
+
+QUANTIZATION_TYPES = ("none", "int8", "binary")
+# 量化扫描保留的候选数 = top_k * 该倍数（binary 误差更大，需要更多候选）
+_RESCORE_FACTORS = {"int8": 4, "binary": 16}
+# 8 位整数的置位数（旧版 NumPy 没有 bitwise_count）
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _code_size(quantization: str, dim: int) -> int:
+    """每行量化码的字节数"""
+    if quantization == "int8":
+        return dim
+    if quantization == "binary":
+        return (dim + 7) // 8
+    return 0
+
+
+def _train_scale(vectors: np.ndarray) -> np.ndarray:
+    """int8 每维缩放系数：该维绝对值最大值 / 127（超出范围的值在量化时截断）"""
+    scale = np.abs(vectors).max(axis=0) / 127.0
+    return np.maximum(scale, 1e-12).astype(_VECTOR_DTYPE)
+
+
+def _quantize(vectors: np.ndarray, quantization: str, scale: Optional[np.ndarray]) -> np.ndarray:
+    """把 float32 向量编码为 uint8 码（int8 按位存储为 uint8）"""
+    if quantization == "int8":
+        codes = np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+        return codes.view(np.uint8)
+    return np.packbits(vectors > 0, axis=1)
+
+
+def _approx_scores(codes: np.ndarray, query: np.ndarray, quantization: str, scale: Optional[np.ndarray]) -> np.ndarray:
+    """
+    用量化码估算内积分数（只用于排序候选）
+
+    int8 为反量化后的内积；binary 为负的汉明距离（与符号向量的内积同序）。
+    """
+    scores = np.empty(len(codes), dtype=_VECTOR_DTYPE)
+    if quantization == "int8":
+        scaled_query = query * scale
+    else:
+        query_bits = np.packbits(query > 0)
+    for start in range(0, len(codes), _COMPACT_BLOCK_ROWS):
+        block = np.asarray(codes[start:start + _COMPACT_BLOCK_ROWS])
+        if quantization == "int8":
+            scores[start:start + len(block)] = block.view(np.int8).astype(_VECTOR_DTYPE) @ scaled_query
+        else:
+            xor = np.bitwise_xor(block, query_bits)
+            if hasattr(np, "bitwise_count"):
+                distance = np.bitwise_count(xor).sum(axis=1, dtype=np.int32)
+            else:
+                distance = _POPCOUNT[xor].sum(axis=1, dtype=np.int32)
+            scores[start:start + len(block)] = -distance
+    return scores
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """分数最高的 k 个位置（按分数降序）"""
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+class _KBLocks:
+    """单个知识库的锁"""
+
+    __slots__ = ("writer", "state")
+
+    def __init__(self):
+        # 串行化写操作（可能持有整个压缩 / 训练过程）
+        self.writer = threading.RLock()
+        # 保护内存状态和内存映射，只在短时间内持有
+        self.state = threading.RLock()
+
+
+class _KBVectors:
+    """单个知识库的向量文件状态"""
+
+    __slots__ = (
+        "directory", "dim", "generation", "index_type", "quantization", "trained_rows",
+        "rows", "dead", "centroids", "scale", "matrix", "ids", "codes", "lists"
+    )
+
+    def __init__(
+        self,
+        directory: Path,
+        dim: int,
+        generation: int,
+        index_type: str = "flat",
+        quantization: str = "none"
+    ):
+        self.directory = directory
+        self.dim = dim
+        self.generation = generation
+        self.index_type = index_type
+        self.quantization = quantization
+        self.trained_rows = 0
+        self.rows = 0
+        self.dead = 0
+        # IVF 聚类中心（未训练时为 None）
+        self.centroids: Optional[np.ndarray] = None
+        # int8 每维缩放系数（首批向量写入时确定）
+        self.scale: Optional[np.ndarray] = None
+        # 按需打开的内存映射和倒排列表（追加或压缩后失效）
+        self.matrix: Optional[np.memmap] = None
+        self.ids: Optional[np.memmap] = None
+        self.codes: Optional[np.memmap] = None
+        self.lists: Optional[Tuple[np.ndarray, np.ndarray]] = None
+
+    @property
+    def code_size(self) -> int:
+        return _code_size(self.quantization, self.dim)
+
+    @property
+    def vectors_path(self) -> Path:
+        return self.directory / f"vectors.{self.generation}.f32"
+
+    @property
+    def ids_path(self) -> Path:
+        return self.directory / f"ids.{self.generation}.i64"
+
+    @property
+    def assign_path(self) -> Path:
+        return self.directory / f"assign.{self.generation}.i32"
+
+    @property
+    def centroids_path(self) -> Path:
+        return self.directory / f"centroids.{self.generation}.npy"
+
+    @property
+    def codes_path(self) -> Path:
+        return self.directory / f"codes.{self.generation}.q"
+
+    @property
+    def scale_path(self) -> Path:
+        return self.directory / f"scale.{self.generation}.npy"
+
+    def replace_with(self, other: "_KBVectors") -> None:
+        """切换到另一代文件的状态（调用方持有状态锁并随后使内存映射失效）"""
+        self.generation = other.generation
+        self.index_type = other.index_type
+        self.quantization = other.quantization
+        self.trained_rows = other.trained_rows
+        self.rows = other.rows
+        self.dead = other.dead
+        self.centroids = other.centroids
+        self.scale = other.scale
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """把向量分配到内积最大的聚类中心"""
+    out = np.empty(len(vectors), dtype=_ASSIGN_DTYPE)
+    for start in range(0, len(vectors), _COMPACT_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + _COMPACT_BLOCK_ROWS])
+        out[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def _train_centroids(sample: np.ndarray, nlist: int, seed: int = 0) -> np.ndarray:
+    """
+    球面 k-means（中心归一化，按内积分配）
+
+    Args:
+        sample: 训练样本，形状 (n, dim)，n >= nlist
+        nlist: 聚类数
+        seed: 随机种子
+
+    Returns:
+        形状 (nlist, dim) 的 float32 聚类中心
+    """
+    rng = np.random.default_rng(seed)
+    norms = np.linalg.norm(sample, axis=1, keepdims=True)
+    sample = sample / np.maximum(norms, 1e-12)
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+
+    for _ in range(_KMEANS_ITERATIONS):
+        assign = _assign(sample, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=nlist)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        nonempty = counts > 0
+        sums = np.empty_like(centroids)
+        sums[nonempty] = np.add.reduceat(sample[order], starts[nonempty], axis=0)
+        # 空聚类用随机样本重新初始化
+        empty = int(np.count_nonzero(~nonempty))
+        if empty:
+            sums[~nonempty] = sample[rng.choice(len(sample), empty, replace=False)]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return centroids.astype(_VECTOR_DTYPE)
+
+
+def _save_npy(path: Path, array: np.ndarray) -> None:
+    """写入 .npy 并 fsync（在切换 meta.json 之前落盘）"""
+    with open(path, "wb") as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _validate_settings(index_type: Optional[str], quantization: Optional[str]) -> None:
+    if index_type is not None and index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}'. Supported: {', '.join(INDEX_TYPES)}")
+    if quantization is not None and quantization not in QUANTIZATION_TYPES:
+        raise ValueError(f"Unknown quantization '{quantization}'. Supported: {', '.join(QUANTIZATION_TYPES)}")
+
+
+class VectorStore:
+    """按知识库划分的内存映射向量存储（线程安全）"""
+
+    def __init__(
+        self,
+        root_dir: Path,
+        compact_ratio: float = 0.3,
+        compact_min_rows: int = 1024,
+        exact_threshold: int = 20000,
+        nprobe: int = 16
+    ):
+        """
+        初始化向量存储
+
+        Args:
+            root_dir: 存储根目录（如 config.VECTOR_DIR）
+            compact_ratio: 死行比例超过该值时压缩
+            compact_min_rows: 死行数至少达到该值才压缩
+            exact_threshold: 存活向量少于该值时使用精确检索（ivf 也在此时训练）
+            nprobe: ivf 查询默认扫描的列表数
+        """
+        self.root_dir = Path(root_dir)
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        self.compact_ratio = compact_ratio
+        self.compact_min_rows = compact_min_rows
+        self.exact_threshold = exact_threshold
+        self.nprobe = nprobe
+        # 只保护 _locks 字典；各知识库的数据由其 _KBLocks 保护
+        self._lock = threading.Lock()
+        self._locks: Dict[int, _KBLocks] = {}
+        self._kbs: Dict[int, _KBVectors] = {}
+
+    # ==================== Write Path ====================
+
+    def add(
+        self,
+        kb_id: int,
+        chunk_ids: Sequence[int],
+        vectors: Any,
+        index_type: str = None,
+        quantization: str = None
+    ) -> int:
+        """
+        追加向量（ivf 已训练时同时写入聚类分配，量化时同时写入量化码）
+
+        Args:
+            kb_id: 知识库 ID
+            chunk_ids: 每个向量对应的 chunk ID
+            vectors: 形状为 (n, dim) 的向量（列表或数组）
+            index_type: 知识库的索引类型（与当前不同时先切换）
+            quantization: 知识库的量化方式（与当前不同时先切换）
+
+        Returns:
+            追加的行数
+
+        Raises:
+            ValueError: 数量不一致、维度与已有向量不同或设置无效
+        """
+        _validate_settings(index_type, quantization)
+        matrix = np.ascontiguousarray(vectors, dtype=_VECTOR_DTYPE)
+        ids = np.ascontiguousarray(chunk_ids, dtype=_ID_DTYPE)
+        if matrix.ndim != 2 or matrix.shape[0] != ids.shape[0]:
+            raise ValueError(f"Expected {ids.shape[0]} vectors, got array of shape {matrix.shape}")
+        if ids.shape[0] == 0:
+            return 0
+
+        locks = self._kb_locks(kb_id)
+        with locks.writer:
+            with locks.state:
+                state = self._load(
+                    kb_id, create_dim=matrix.shape[1], index_type=index_type, quantization=quantization
+                )
+            if matrix.shape[1] != state.dim:
+                raise ValueError(f"Vector dimension {matrix.shape[1]} does not match store dimension {state.dim}")
+            self._configure(kb_id, state, index_type, quantization)
+
+            if state.quantization == "int8" and state.scale is None:
+                scale = _train_scale(matrix)
+                _save_npy(state.scale_path, scale)
+                with locks.state:
+                    state.scale = scale
+
+            # ID 最后写入：崩溃时多出的向量 / 分配 / 码行会在加载时被截断。
+            # 查询只映射已提交的行数，追加期间不需要状态锁
+            with open(state.vectors_path, "ab") as f:
+                f.write(matrix.tobytes())
+            if state.centroids is not None:
+                with open(state.assign_path, "ab") as f:
+                    f.write(_assign(matrix, state.centroids).tobytes())
+            if state.quantization != "none":
+                with open(state.codes_path, "ab") as f:
+                    f.write(_quantize(matrix, state.quantization, state.scale).tobytes())
+            with open(state.ids_path, "ab") as f:
+                f.write(ids.tobytes())
+
+            with locks.state:
+                state.rows += ids.shape[0]
+                self._invalidate(state)
+            if self._needs_training(state):
+                self._compact(kb_id, state, train=True)
+        return int(ids.shape[0])
+
+    def delete(self, kb_id: int, chunk_ids: Sequence[int]) -> int:
+        """
+        删除 chunk 对应的向量（写入墓碑，必要时压缩）
+
+        Args:
+            kb_id: 知识库 ID
+            chunk_ids: 要删除的 chunk ID
+
+        Returns:
+            被删除的行数
+        """
+        if len(chunk_ids) == 0:
+            return 0
+
+        locks = self._kb_locks(kb_id)
+        with locks.writer:
+            with locks.state:
+                state = self._load(kb_id)
+                if state is None or state.rows == 0:
+                    return 0
+                _, ids, _ = self._views(state)
+            # 持有写锁时 ID 文件不会被切换，匹配可以在状态锁之外进行
+            mask = np.isin(ids, np.asarray(chunk_ids, dtype=_ID_DTYPE))
+            deleted = int(np.count_nonzero(mask))
+            if deleted:
+                with locks.state:
+                    ids[mask] = _TOMBSTONE
+                    ids.flush()
+                    state.dead += deleted
+                if state.dead >= self.compact_min_rows and state.dead > state.rows * self.compact_ratio:
+                    self._compact(kb_id, state)
+        return deleted
+
+    def contains(self, kb_id: int, chunk_ids: Sequence[int]) -> Set[int]:
+        """
+        查询哪些 chunk 已有（未删除的）向量
+
+        Args:
+            kb_id: 知识库 ID
+            chunk_ids: 要检查的 chunk ID
+
+        Returns:
+            chunk_ids 中有向量的 ID
+        """
+        if len(chunk_ids) == 0:
+            return set()
+
+        with self._kb_locks(kb_id).state:
+            state = self._load(kb_id)
+            if state is None or state.rows == 0:
+                return set()
+            _, ids, _ = self._views(state)
+            query = np.asarray(chunk_ids, dtype=_ID_DTYPE)
+            return set(query[np.isin(query, ids)].tolist())
+
+    def drop(self, kb_id: int) -> None:
+        """删除知识库的全部向量文件"""
+        locks = self._kb_locks(kb_id)
+        with locks.writer, locks.state:
+            state = self._kbs.pop(kb_id, None)
+            if state is not None:
+                self._invalidate(state)
+            shutil.rmtree(self._kb_dir(kb_id), ignore_errors=True)
+
+    def configure(self, kb_id: int, index_type: str = None, quantization: str = None) -> None:
+        """
+        切换知识库的索引类型 / 量化方式（知识库还没有向量时在首次追加时生效）
+
+        Raises:
+            ValueError: 未知的索引类型或量化方式
+        """
+        _validate_settings(index_type, quantization)
+        locks = self._kb_locks(kb_id)
+        with locks.writer:
+            with locks.state:
+                state = self._load(kb_id)
+            if state is None:
+                return
+            try:
+                self._configure(kb_id, state, index_type, quantization)
+            except BaseException:
+                # meta.json 可能已被替换：丢弃状态，下次访问时按 meta.json 重新加载
+                with locks.state:
+                    self._kbs.pop(kb_id, None)
+                    self._invalidate(state)
+                raise
+
+    def rebuild_index(self, kb_id: int) -> bool:
+        """
+        用当前数据重新训练 ivf 索引和 int8 缩放系数（同时移除墓碑行）
+
+        Returns:
+            是否训练了索引（flat 或向量数不足时为 False）
+        """
+        locks = self._kb_locks(kb_id)
+        with locks.writer:
+            with locks.state:
+                state = self._load(kb_id)
+            if state is None or state.index_type != "ivf" or state.rows - state.dead < self.exact_threshold:
+                return False
+            self._compact(kb_id, state, train=True)
+            return True
+
+    def compact(self, kb_id: int) -> int:
+        """
+        立即压缩知识库的向量文件（移除墓碑行）
+
+        Returns:
+            被移除的行数
+        """
+        locks = self._kb_locks(kb_id)
+        with locks.writer:
+            with locks.state:
+                state = self._load(kb_id)
+            if state is None or state.dead == 0:
+                return 0
+            removed = state.dead
+            self._compact(kb_id, state)
+            return removed
+
+    # ==================== Read Path ====================
+
+    def search(
+        self,
+        kb_id: int,
+        query: Any,
+        top_k: int = 10,
+        nprobe: int = None,
+        exact: bool = False,
+        rescore: int = None
+    ) -> List[Tuple[int, float]]:
+        """
+        top-k 内积检索（向量已归一化时即余弦相似度）
+
+        Args:
+            kb_id: 知识库 ID
+            query: 查询向量
+            top_k: 返回结果数
+            nprobe: ivf 扫描的列表数（默认使用 self.nprobe）
+            exact: 强制扫描全部 float32 向量（用于评估召回率）
+            rescore: 量化时重新打分的候选倍数（默认按量化方式选择）
+
+        Returns:
+            [(chunk ID, 分数)]，按分数降序；分数始终为 float32 向量的精确内积
+        """
+        with self._kb_locks(kb_id).state:
+            state = self._load(kb_id)
+            if state is None or state.rows == 0:
+                return []
+            matrix, ids, codes = self._views(state)
+            # 复制 ID 快照，避免计算期间被并发删除修改
+            ids = np.array(ids)
+            quantization, scale = state.quantization, state.scale
+            centroids = lists = None
+            if not exact and state.centroids is not None and state.rows - state.dead >= self.exact_threshold:
+                centroids, lists = state.centroids, self._lists(state)
+
+        q = np.asarray(query, dtype=_VECTOR_DTYPE).reshape(-1)
+        if q.shape[0] != matrix.shape[1]:
+            raise ValueError(f"Query dimension {q.shape[0]} does not match store dimension {matrix.shape[1]}")
+
+        rows = None
+        if centroids is not None:
+            # 只扫描与查询最接近的 nprobe 个列表，按行号排序以顺序读取内存映射
+            order, offsets = lists
+            nprobe = max(1, min(nprobe or self.nprobe, len(centroids)))
+            probe = np.argpartition(-(centroids @ q), nprobe - 1)[:nprobe]
+            rows = np.sort(np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probe]))
+            ids = ids[rows]
+
+        live = ids != _TOMBSTONE
+        k = min(top_k, int(np.count_nonzero(live)))
+        if k <= 0:
+            return []
+
+        if exact or quantization == "none":
+            scores = (matrix @ q) if rows is None else (matrix[rows] @ q)
+            scores = np.where(live, scores, -np.inf)
+            top = _top_k(scores, k)
+            return [(int(ids[i]), float(scores[i])) for i in top]
+
+        # 先用量化码选出候选，再读取候选行的 float32 向量精确打分
+        candidate_codes = codes if rows is None else codes[rows]
+        approx = np.where(live, _approx_scores(candidate_codes, q, quantization, scale), -np.inf)
+        shortlist = _top_k(approx, min(len(approx), k * (rescore or _RESCORE_FACTORS[quantization])))
+        # 候选位置排序后对应的矩阵行号也是有序的，便于顺序读取
+        shortlist = np.sort(shortlist[live[shortlist]])
+        exact_scores = matrix[shortlist if rows is None else rows[shortlist]] @ q
+        top = _top_k(exact_scores, min(k, len(exact_scores)))
+        return [(int(ids[shortlist[i]]), float(exact_scores[i])) for i in top]
+
+    def count(self, kb_id: int) -> int:
+        """知识库中未删除的向量数"""
+        with self._kb_locks(kb_id).state:
+            state = self._load(kb_id)
+            return 0 if state is None else state.rows - state.dead
+
+    def get_stats(self, kb_id: int) -> Dict[str, Any]:
+        """
+        获取知识库向量文件统计信息
+
+        scan_bytes 为每次查询需要扫描的数据量（量化时为码本，否则为 float32 矩阵），
+        即需要常驻内存才能保持查询速度的部分；其余数据只在重新打分时按行读取。
+        """
+        with self._kb_locks(kb_id).state:
+            state = self._load(kb_id)
+            if state is None:
+                return {
+                    "rows": 0, "live": 0, "dead": 0, "dim": None, "bytes": 0, "scan_bytes": 0,
+                    "index": None, "nlist": 0, "quantization": None
+                }
+            nlist = 0 if state.centroids is None else len(state.centroids)
+            vector_bytes = state.rows * state.dim * 4
+            code_bytes = state.rows * state.code_size
+            return {
+                "rows": state.rows,
+                "live": state.rows - state.dead,
+                "dead": state.dead,
+                "dim": state.dim,
+                "bytes": vector_bytes + code_bytes + state.rows * (8 + (4 if nlist else 0)) + nlist * state.dim * 4,
+                "scan_bytes": code_bytes if state.quantization != "none" else vector_bytes,
+                "index": state.index_type,
+                "nlist": nlist,
+                "quantization": state.quantization
+            }
+
+    def evaluate(self, kb_id: int, sample_size: int = 20, top_k: int = 10, seed: int = 0) -> Dict[str, Any]:
+        """
+        用知识库中随机抽取的向量作为查询，评估当前索引 / 量化设置的 recall@k
+
+        Args:
+            kb_id: 知识库 ID
+            sample_size: 查询数
+            top_k: 评估的 k
+            seed: 随机种子
+
+        Returns:
+            {"recall": recall@k, "latency_ms": 平均查询耗时, "exact_latency_ms": 精确检索平均耗时, ...}
+            以及 get_stats() 的内容
+        """
+        with self._kb_locks(kb_id).state:
+            state = self._load(kb_id)
+            if state is None or state.rows == state.dead:
+                return {**self.get_stats(kb_id), "recall": None, "latency_ms": None, "exact_latency_ms": None}
+            matrix, ids, _ = self._views(state)
+            live_rows = np.flatnonzero(np.asarray(ids) != _TOMBSTONE)
+            rng = np.random.default_rng(seed)
+            sample = np.sort(rng.choice(live_rows, min(sample_size, len(live_rows)), replace=False))
+            queries = np.array(matrix[sample])
+
+        hits = 0
+        elapsed = exact_elapsed = 0.0
+        for q in queries:
+            started = time.perf_counter()
+            expected = {chunk_id for chunk_id, _ in self.search(kb_id, q, top_k=top_k, exact=True)}
+            exact_elapsed += time.perf_counter() - started
+            started = time.perf_counter()
+            found = {chunk_id for chunk_id, _ in self.search(kb_id, q, top_k=top_k)}
+            elapsed += time.perf_counter() - started
+            hits += len(expected & found)
+        total = min(top_k, len(live_rows)) * len(queries)
+        return {
+            **self.get_stats(kb_id),
+            "recall": hits / total,
+            "latency_ms": elapsed / len(queries) * 1000,
+            "exact_latency_ms": exact_elapsed / len(queries) * 1000
+        }
+
+    # ==================== Internal ====================
+
+    def _kb_locks(self, kb_id: int) -> _KBLocks:
+        """获取（或创建）知识库的锁"""
+        with self._lock:
+            locks = self._locks.get(kb_id)
+            if locks is None:
+                locks = self._locks[kb_id] = _KBLocks()
+            return locks
+
+    def _kb_dir(self, kb_id: int) -> Path:
+        return self.root_dir / f"kb_{kb_id}"
+
+    def _load(
+        self,
+        kb_id: int,
+        create_dim: Optional[int] = None,
+        index_type: str = None,
+        quantization: str = None
+    ) -> Optional[_KBVectors]:
+        """加载（或在 create_dim 给定时按给定设置创建）知识库状态（调用方持有状态锁）"""
+        state = self._kbs.get(kb_id)
+        if state is not None:
+            return state
+
+        directory = self._kb_dir(kb_id)
+        meta_path = directory / "meta.json"
+        if meta_path.exists():
+            meta = json.loads(meta_path.read_text())
+            state = _KBVectors(
+                directory, int(meta["dim"]), int(meta["generation"]),
+                meta.get("index", "flat"), meta.get("quantization", "none")
+            )
+            state.trained_rows = int(meta.get("trained_rows", 0))
+            if meta.get("nlist"):
+                state.centroids = np.load(state.centroids_path)
+            if state.quantization == "int8" and state.scale_path.exists():
+                state.scale = np.load(state.scale_path)
+            self._recover(state)
+        elif create_dim is not None:
+            directory.mkdir(parents=True, exist_ok=True)
+            state = _KBVectors(directory, create_dim, 0, index_type or "flat", quantization or "none")
+            state.vectors_path.touch()
+            state.ids_path.touch()
+            if state.quantization != "none":
+                state.codes_path.touch()
+            self._write_meta(state)
+        else:
+            return None
+
+        self._kbs[kb_id] = state
+        return state
+
+    def _recover(self, state: _KBVectors) -> None:
+        """根据文件大小确定行数，截断半写入的尾部并清理旧一代文件"""
+        files = [(state.vectors_path, state.dim * 4), (state.ids_path, 8)]
+        if state.centroids is not None:
+            files.append((state.assign_path, 4))
+        if state.quantization != "none":
+            files.append((state.codes_path, state.code_size))
+        for path, _ in files:
+            path.touch(exist_ok=True)
+        state.rows = min(path.stat().st_size // row_bytes for path, row_bytes in files)
+        for path, row_bytes in files:
+            os.truncate(path, state.rows * row_bytes)
+
+        current = {path.name for path, _ in files}
+        current |= {state.centroids_path.name, state.scale_path.name, "meta.json"}
+        for path in state.directory.iterdir():
+            if path.name not in current and path.name.startswith(
+                ("vectors.", "ids.", "assign.", "centroids.", "codes.", "scale.")
+            ):
+                path.unlink(missing_ok=True)
+
+        if state.rows:
+            _, ids, _ = self._views(state)
+            state.dead = int(np.count_nonzero(ids == _TOMBSTONE))
+
+    @staticmethod
+    def _map(state: _KBVectors) -> Tuple[np.memmap, np.memmap, Optional[np.memmap]]:
+        """打开当前一代的向量矩阵、ID 和量化码的内存映射"""
+        matrix = np.memmap(state.vectors_path, dtype=_VECTOR_DTYPE, mode="r", shape=(state.rows, state.dim))
+        ids = np.memmap(state.ids_path, dtype=_ID_DTYPE, mode="r+", shape=(state.rows,))
+        codes = None
+        if state.quantization != "none":
+            codes = np.memmap(state.codes_path, dtype=np.uint8, mode="r", shape=(state.rows, state.code_size))
+        return matrix, ids, codes
+
+    def _views(self, state: _KBVectors) -> Tuple[np.memmap, np.memmap, Optional[np.memmap]]:
+        """打开（或复用）缓存的内存映射（调用方持有状态锁）"""
+        if state.matrix is None:
+            state.matrix, state.ids, state.codes = self._map(state)
+        return state.matrix, state.ids, state.codes
+
+    def _lists(self, state: _KBVectors) -> Tuple[np.ndarray, np.ndarray]:
+        """由聚类分配文件构建倒排列表：(按聚类排序的行号, 每个聚类的起始偏移)（调用方持有状态锁）"""
+        if state.lists is None:
+            assign = np.fromfile(state.assign_path, dtype=_ASSIGN_DTYPE, count=state.rows)
+            order = np.argsort(assign, kind="stable")
+            counts = np.bincount(assign, minlength=len(state.centroids))
+            state.lists = (order, np.concatenate(([0], np.cumsum(counts))))
+        return state.lists
+
+    @staticmethod
+    def _invalidate(state: _KBVectors) -> None:
+        """丢弃内存映射和倒排列表（正在使用旧映射的查询不受影响）"""
+        state.matrix = None
+        state.ids = None
+        state.codes = None
+        state.lists = None
+
+    def _write_meta(self, state: _KBVectors) -> None:
+        """原子替换 meta.json"""
+        meta = {
+            "dim": state.dim,
+            "generation": state.generation,
+            "index": state.index_type,
+            "nlist": 0 if state.centroids is None else len(state.centroids),
+            "trained_rows": state.trained_rows,
+            "quantization": state.quantization
+        }
+        tmp_path = state.directory / "meta.json.tmp"
+        tmp_path.write_text(json.dumps(meta))
+        os.replace(tmp_path, state.directory / "meta.json")
+
+    def _needs_training(self, state: _KBVectors, index_type: str = None) -> bool:
+        """ivf 首次达到 exact_threshold 或数据量大幅增长后需要（重新）训练"""
+        if (index_type or state.index_type) != "ivf":
+            return False
+        live = state.rows - state.dead
+        if state.centroids is None:
+            return live >= self.exact_threshold
+        return live >= state.trained_rows * _RETRAIN_GROWTH
+
+    def _configure(
+        self,
+        kb_id: int,
+        state: _KBVectors,
+        index_type: Optional[str],
+        quantization: Optional[str]
+    ) -> None:
+        """
+        切换索引类型 / 量化方式（调用方持有写锁）：
+
+        - flat 时丢弃聚类，ivf 且数据足够时立即训练
+        - 量化方式变化时重写（或丢弃）量化码
+        """
+        index_changed = index_type is not None and index_type != state.index_type
+        quantization_changed = quantization is not None and quantization != state.quantization
+        if not index_changed and not quantization_changed:
+            return
+
+        index_type = index_type if index_changed else state.index_type
+        quantization = quantization if quantization_changed else state.quantization
+        train = self._needs_training(state, index_type)
+        dropped_index = index_type == "flat" and state.centroids is not None
+        if train or dropped_index or (quantization_changed and state.rows):
+            self._compact(kb_id, state, train=train, index_type=index_type, quantization=quantization)
+            return
+
+        with self._kb_locks(kb_id).state:
+            state.index_type = index_type
+            if quantization_changed:
+                state.quantization = quantization
+                state.scale = None
+            if state.quantization != "none":
+                state.codes_path.touch()
+            else:
+                state.codes_path.unlink(missing_ok=True)
+            self._write_meta(state)
+
+    def _compact(
+        self,
+        kb_id: int,
+        state: _KBVectors,
+        train: bool = False,
+        index_type: str = None,
+        quantization: str = None
+    ) -> None:
+        """
+        把存活的行复制到新一代文件，再切换 meta.json（调用方持有写锁）
+
+        新一代文件在状态锁之外构建（查询继续使用当前一代），失败时当前一代保持不变。
+
+        Args:
+            kb_id: 知识库 ID
+            state: 知识库状态
+            train: 是否用存活的行重新训练 ivf 聚类中心和 int8 缩放系数
+            index_type: 新的索引类型（默认不变）
+            quantization: 新的量化方式（默认不变；变化时旧码不能复用）
+        """
+        new = _KBVectors(
+            state.directory, state.dim, state.generation + 1,
+            index_type or state.index_type, quantization or state.quantization
+        )
+        matrix, ids, codes = self._map(state)
+        old_codes = None
+        if new.quantization == state.quantization and new.quantization != "none" and not train:
+            old_codes = codes
+        old_files = [
+            state.vectors_path, state.ids_path, state.assign_path, state.centroids_path,
+            state.codes_path, state.scale_path
+        ]
+
+        live_rows = np.flatnonzero(np.asarray(ids) != _TOMBSTONE)
+        rng = np.random.default_rng(state.generation)
+        centroids = state.centroids if new.index_type == "ivf" else None
+        assign = None
+        new.trained_rows = state.trained_rows
+        if train:
+            nlist = int(np.clip(4 * np.sqrt(len(live_rows)), _MIN_NLIST, _MAX_NLIST))
+            sample_rows = live_rows
+            if len(live_rows) > nlist * _TRAIN_SAMPLES_PER_LIST:
+                sample_rows = np.sort(rng.choice(live_rows, nlist * _TRAIN_SAMPLES_PER_LIST, replace=False))
+            centroids = _train_centroids(np.asarray(matrix[sample_rows]), min(nlist, len(sample_rows)))
+            new.trained_rows = len(live_rows)
+        elif centroids is not None:
+            assign = np.fromfile(state.assign_path, dtype=_ASSIGN_DTYPE, count=state.rows)
+
+        scale = state.scale if new.quantization == state.quantization else None
+        if new.quantization == "int8" and (scale is None or old_codes is None) and len(live_rows):
+            sample_rows = live_rows
+            if len(live_rows) > _COMPACT_BLOCK_ROWS:
+                sample_rows = np.sort(rng.choice(live_rows, _COMPACT_BLOCK_ROWS, replace=False))
+            scale = _train_scale(np.asarray(matrix[sample_rows]))
+
+        rows = 0
+        with open(new.vectors_path, "wb") as fv, open(new.ids_path, "wb") as fi, \
+                open(new.assign_path, "wb") as fa, open(new.codes_path, "wb") as fc:
+            for start in range(0, state.rows, _COMPACT_BLOCK_ROWS):
+                end = start + _COMPACT_BLOCK_ROWS
+                block_ids = np.asarray(ids[start:end])
+                live = block_ids != _TOMBSTONE
+                block = np.ascontiguousarray(matrix[start:end][live])
+                fv.write(block.tobytes())
+                fi.write(block_ids[live].tobytes())
+                if assign is not None:
+                    fa.write(assign[start:end][live].tobytes())
+                elif centroids is not None:
+                    fa.write(_assign(block, centroids).tobytes())
+                if old_codes is not None:
+                    fc.write(np.ascontiguousarray(old_codes[start:end][live]).tobytes())
+                elif new.quantization != "none":
+                    fc.write(_quantize(block, new.quantization, scale).tobytes())
+                rows += int(np.count_nonzero(live))
+            for f in (fv, fi, fa, fc):
+                f.flush()
+                os.fsync(f.fileno())
+        del matrix, ids, codes, old_codes
+
+        removed = state.rows - rows
+        new.rows = rows
+        new.centroids = centroids
+        new.scale = scale if new.quantization == "int8" else None
+        if centroids is None:
+            new.assign_path.unlink()
+            new.trained_rows = 0
+        else:
+            _save_npy(new.centroids_path, centroids)
+        if new.quantization == "none":
+            new.codes_path.unlink()
+        if new.scale is not None:
+            _save_npy(new.scale_path, new.scale)
+
+        # 只在切换时持有状态锁；正在使用旧内存映射的查询不受旧文件删除的影响
+        with self._kb_locks(kb_id).state:
+            self._write_meta(new)
+            state.replace_with(new)
+            self._invalidate(state)
+        for path in old_files:
+            path.unlink(missing_ok=True)
+        if train:
+            logger.info(
+                f"🧭 Trained IVF index for {state.directory.name}: {len(centroids)} lists over {rows} vectors"
+            )
+        else:
+            logger.info(
+                f"🧹 Rewrote vectors in {state.directory.name} ({state.index_type}/{state.quantization}): "
+                f"removed {removed} rows, {rows} remain"
+            )
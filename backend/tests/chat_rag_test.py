@@ -0,0 +1,201 @@
+"""
+Test for retrieval-augmented chat in ChatPipeline
+Tests:
+1. Retrieved chunks are packed into the context budget in relevance order
+2. Citations are streamed before the first token, the model sees the context and history, the stored message is the original question
+3. Retrieval runs concurrently with history loading; a failing retriever degrades to plain chat
+"""
+
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from spacemit_llm.comon.sqlite.sqlite_session import SQLiteSession
+from spacemit_llm.pipeline.chat import ChatPipeline
+from spacemit_llm.utils.token_estimator import estimate_tokens
+
+
+def print_section(title: str):
+    """Print a section header"""
+    print("\n" + "=" * 60)
+    print(f"  {title}")
+    print("=" * 60)
+
+
+def _chunk(chunk_id: int, content: str, score: float, page=None):
+    return {
+        "id": chunk_id, "kb_id": 1, "file_id": 10 + chunk_id, "filename": f"doc{chunk_id}.md",
+        "content": content, "page": page, "heading": None,
+        "score": score, "vector_score": None, "lexical_score": None, "rerank_score": None,
+    }
+
+
+class FakeConfig:
+    def get_parameter(self, name):
+        return None
+
+    def subscribe(self, callback):
+        pass
+
+
+class FakeLLMClient:
+    def __init__(self):
+        self.messages = None
+
+    async def chat_stream(self, messages, **kwargs):
+        self.messages = messages
+        for token in ["答", "案"]:
+            yield {"data": token, "done_flag": False}
+        yield {"data": "", "done_flag": True}
+
+
+class FakeServerManager:
+    def __init__(self):
+        self.client = FakeLLMClient()
+
+    def get_server(self, mode):
+        return SimpleNamespace(get_status=lambda: {"is_running": True})
+
+    def get_client(self, mode):
+        return self.client
+
+
+class FakeRetriever:
+    def __init__(self, chunks, delay: float = 0.0, fail: bool = False):
+        self.chunks = chunks
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+
+    async def retrieve(self, query, kb_ids, top_k=8, timings=None):
+        self.calls.append((query, kb_ids, top_k))
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("embed server down")
+        timings["embed"] = 1.0
+        return [dict(chunk) for chunk in self.chunks[:top_k]]
+
+
+def _request(session_id, content, kb_ids=None):
+    return SimpleNamespace(
+        session_id=session_id, mode="llm", kb_ids=kb_ids,
+        message=SimpleNamespace(role="user", content=content),
+        temperature=None, repeat_penalty=None, max_tokens=None
+    )
+
+
+async def _collect(response):
+    events = []
+    async for line in response.body_iterator:
+        if line.startswith("data: "):
+            events.append(json.loads(line[6:]))
+    return events
+
+
+def test_pack_context():
+    """Chunks are numbered in order and skipped when they do not fit"""
+    print_section("Testing Context Packing")
+
+    chunks = [_chunk(1, "短" * 10, 0.9, page=3), _chunk(2, "长" * 400, 0.8), _chunk(3, "中" * 20, 0.7)]
+    budget = estimate_tokens("[1] doc1.md（第 3 页）\n" + "短" * 10) + estimate_tokens("[2] doc3.md\n" + "中" * 20)
+    context, citations = ChatPipeline._pack_context(chunks, budget)
+
+    assert [c["chunk_id"] for c in citations] == [1, 3]
+    assert [c["index"] for c in citations] == [1, 2]
+    assert context.startswith("[1] doc1.md（第 3 页）\n")
+    assert "[2] doc3.md\n" in context and "长" not in context
+    assert ChatPipeline._pack_context(chunks, 0) == ("", [])
+    print("✓ Context packing PASSED")
+
+
+def test_rag_chat_stream():
+    """Citations precede tokens; context goes to the model but not into history"""
+    print_section("Testing RAG Chat Stream")
+
+    async def run():
+        db = SQLiteSession(Path(tempfile.mkdtemp()) / "sessions.db")
+        session_id = db.create_session("earlier")
+        db.add_message(session_id, "user", "earlier question", 5)
+        db.add_message(session_id, "assistant", "earlier answer", 5)
+
+        manager = FakeServerManager()
+        retriever = FakeRetriever([_chunk(1, "端口为 8051。", 0.9), _chunk(2, "嵌入端口为 8052。", 0.5)])
+        pipeline = ChatPipeline(
+            manager, FakeConfig(), db, default_context_size=4096,
+            retriever=retriever, rag_top_k=4, rag_context_ratio=0.25
+        )
+
+        events = await _collect(await pipeline.process_chat(_request(session_id, "默认端口是多少？", [1])))
+        assert "citations" in events[0] and "data" not in events[0]
+        assert [c["chunk_id"] for c in events[0]["citations"]] == [1, 2]
+        assert events[0]["citations"][0]["filename"] == "doc1.md"
+        timings = events[0]["timings"]
+        assert {"history", "retrieval", "embed", "pack", "prompt_ready"} <= set(timings)
+        assert "".join(e.get("data", "") for e in events[1:]) == "答案"
+        assert retriever.calls == [("默认端口是多少？", [1], 4)]
+
+        sent = manager.client.messages
+        assert [m["content"] for m in sent[1:3]] == ["earlier question", "earlier answer"]
+        assert "[1] doc1.md\n端口为 8051。" in sent[-1]["content"]
+        assert sent[-1]["content"].endswith("问题：默认端口是多少？")
+
+        stored = db.get_messages(session_id)
+        assert [m["content"] for m in stored[-2:]] == ["默认端口是多少？", "答案"]
+
+        # 不指定 kb_ids：普通对话，不发送引用事件
+        retriever.calls.clear()
+        events = await _collect(await pipeline.process_chat(_request(session_id, "你好")))
+        assert "citations" not in events[0] and retriever.calls == []
+        assert manager.client.messages[-1]["content"] == "你好"
+
+    asyncio.run(run())
+    print("✓ RAG chat stream PASSED")
+
+
+def test_parallel_retrieval():
+    """History load overlaps retrieval; retrieval failure falls back to plain chat"""
+    print_section("Testing Parallel Retrieval")
+
+    async def run():
+        db = SQLiteSession(Path(tempfile.mkdtemp()) / "sessions.db")
+        session_id = db.create_session("parallel")
+        load = db.get_messages_within_token_limit
+
+        def slow_load(**kwargs):
+            time.sleep(0.2)
+            return load(**kwargs)
+
+        db.get_messages_within_token_limit = slow_load
+        manager = FakeServerManager()
+        pipeline = ChatPipeline(
+            manager, FakeConfig(), db, retriever=FakeRetriever([_chunk(1, "资料", 0.9)], delay=0.2)
+        )
+
+        started = time.perf_counter()
+        events = await _collect(await pipeline.process_chat(_request(session_id, "问题", [1])))
+        elapsed = time.perf_counter() - started
+        assert elapsed < 0.35, elapsed
+        assert events[0]["timings"]["history"] >= 200 and events[0]["timings"]["retrieval"] >= 200
+        print(f"  history + retrieval (200ms each) finished in {elapsed * 1000:.0f}ms")
+
+        pipeline.retriever = FakeRetriever([], fail=True)
+        events = await _collect(await pipeline.process_chat(_request(session_id, "问题", [1])))
+        assert events[0]["citations"] == []
+        assert manager.client.messages[-1]["content"] == "问题"
+        assert "".join(e.get("data", "") for e in events[1:]) == "答案"
+
+    asyncio.run(run())
+    print("✓ Parallel retrieval PASSED")
+
+
+if __name__ == "__main__":
+    test_pack_context()
+    test_rag_chat_stream()
+    test_parallel_retrieval()
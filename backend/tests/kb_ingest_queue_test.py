@@ -0,0 +1,268 @@
+"""
+Test for the persistent knowledge-base ingest queue
+Tests:
+1. Enqueue returns immediately; workers process every file and record stages and progress
+2. A restart requeues interrupted jobs, queues pending files without a job and fails jobs out of attempts
+3. A file interrupted halfway resumes from its committed chunks instead of starting over
+4. Uploading a file again while it is processed cancels the old run; only the new job completes
+"""
+
+import asyncio
+import io
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from spacemit_llm.comon.sqlite.sqlit_kb import SQLiteKnowledgeBase
+from spacemit_llm.pipeline.kb_ingest import KnowledgeBaseIngestPipeline
+from spacemit_llm.pipeline.kb_jobs import KnowledgeBaseIngestQueue
+from spacemit_llm.rag.embedder import BatchEmbedder
+from spacemit_llm.rag.parser import DocumentParser
+from spacemit_llm.rag.splitter import TextSplitter
+from spacemit_llm.rag.vector_store import VectorStore
+
+
+def print_section(title: str):
+    """Print a section header"""
+    print("\n" + "=" * 60)
+    print(f"  {title}")
+    print("=" * 60)
+
+
+def _doc(name: str, sections: int = 6) -> str:
+    return "\n\n".join(f"# {name} {i}\n\n" + f"{name} paragraph {i} about topic {i}. " * 12 for i in range(sections))
+
+
+class FakeEmbedClient:
+    """模拟 EmbedClient：记录发送的文本；gate 未打开时在第 stall_after 个请求处等待"""
+
+    def __init__(self, delay: float = 0.0, stall_after: int = None):
+        self.delay = delay
+        self.stall_after = stall_after
+        self.gate = asyncio.Event()
+        self.requests = 0
+        self.sent = []
+
+    async def get_embeddings(self, texts, timeout=None):
+        self.requests += 1
+        if self.stall_after is not None and self.requests > self.stall_after:
+            await self.gate.wait()
+        await asyncio.sleep(self.delay)
+        self.sent.extend(texts)
+        return [np.random.default_rng(abs(hash(text)) % (2 ** 32)).standard_normal(8).tolist() for text in texts]
+
+
+class Env:
+    """知识库数据库 + 向量存储 + 流水线 + 队列；源文件保存在内存中"""
+
+    def __init__(self, root: Path, client: FakeEmbedClient, concurrency: int = 2, max_attempts: int = 3):
+        self.root = root
+        self.objects = {}
+        self.client = client
+        self.db = SQLiteKnowledgeBase(root / "knowledge_base.db", pool_size=2, vector_store=VectorStore(root / "vectors"))
+        self.parser = DocumentParser(max_workers=1)
+        self.pipeline = KnowledgeBaseIngestPipeline(
+            self.db, self.parser, TextSplitter(chunk_tokens=48, overlap_tokens=0),
+            BatchEmbedder(client, max_batch_size=4, concurrency=1)
+        )
+        self.queue = KnowledgeBaseIngestQueue(
+            self.db, self.pipeline, concurrency=concurrency, max_attempts=max_attempts, checkpoint_interval=0.0
+        )
+
+    def open_object(self, name):
+        return io.BytesIO(self.objects[name])
+
+    async def add_files(self, kb_id, docs):
+        file_ids = []
+        for name, text in docs.items():
+            self.objects[f"kb/{name}"] = text.encode()
+            file_ids.append(await self.db.add_file(kb_id, name, f"kb/{name}", len(text), "md"))
+        return file_ids
+
+    async def wait_idle(self, timeout: float = 10.0):
+        async def idle():
+            while await self.queue.get_jobs(statuses=["queued", "running"]):
+                version = self.queue.version
+                await self.queue.wait_for_change(version, 0.1)
+        await asyncio.wait_for(idle(), timeout)
+
+    async def close(self):
+        await self.queue.close()
+        self.parser.close()
+        self.db.close()
+
+
+def test_queue_processes_files():
+    """Jobs are durable rows; workers run them in the background and record progress"""
+    print_section("Testing Queue Processing")
+
+    async def run():
+        env = Env(Path(tempfile.mkdtemp()), FakeEmbedClient(delay=0.01), concurrency=2)
+        await env.queue.start(env.open_object)
+        kb_id = await env.db.create_knowledge_base("kb")
+        file_ids = await env.add_files(kb_id, {f"doc{i}.md": _doc(f"doc{i}") for i in range(5)})
+
+        stages = set()
+        version = env.queue.version
+        job_ids = await env.queue.enqueue(file_ids)
+        assert len(job_ids) == 5
+        # enqueue 立即返回：任务已写入表中，尚未处理完成
+        assert {job["status"] for job in await env.db.get_ingest_jobs(kb_id)} <= {"queued", "running"}
+
+        while await env.queue.get_jobs(kb_id, ["queued", "running"]):
+            await env.queue.wait_for_change(version, 1.0)
+            version = env.queue.version
+            for job in await env.queue.get_jobs(kb_id, ["running"]):
+                stages.add(job["stage"])
+        assert "embed" in stages, stages
+
+        jobs = await env.db.get_ingest_jobs(kb_id)
+        assert [job["status"] for job in jobs] == ["done"] * 5
+        assert all(job["stage"] == "done" and job["attempts"] == 1 for job in jobs)
+        assert all(job["chunks_done"] == job["chunk_count"] > 0 for job in jobs)
+        assert all(job["file_status"] == "ready" and job["finished_at"] for job in jobs)
+        assert await env.db.get_ingest_job_counts(kb_id) == {"queued": 0, "running": 0, "done": 5, "failed": 0}
+        assert env.queue.get_stats()["completed_count"] == 5
+
+        # 解析失败的文件：任务失败并带有错误信息
+        env.objects["kb/bad.docx"] = b"x"
+        bad = await env.db.add_file(kb_id, "bad.docx", "kb/bad.docx", 1, "docx")
+        await env.queue.enqueue([bad])
+        await env.wait_idle()
+        failed = [job for job in await env.db.get_ingest_jobs(kb_id) if job["file_id"] == bad][0]
+        assert failed["status"] == "failed" and failed["error"]
+        await env.close()
+
+    asyncio.run(run())
+    print("✓ Queue processing PASSED")
+
+
+def test_restart_recovery():
+    """Interrupted jobs resume after a restart; a job that keeps crashing fails"""
+    print_section("Testing Restart Recovery")
+
+    async def run():
+        root = Path(tempfile.mkdtemp())
+        env = Env(root, FakeEmbedClient(), max_attempts=2)
+        kb_id = await env.db.create_knowledge_base("kb")
+        docs = {f"doc{i}.md": _doc(f"doc{i}", 2) for i in range(4)}
+        file_ids = await env.add_files(kb_id, docs)
+        await env.db.enqueue_ingest_jobs(file_ids[:3])
+
+        # 模拟崩溃：两个任务已被领取（running），其中一个已是第 2 次尝试；doc3 上传后未入队
+        first = await env.db.claim_ingest_job()
+        second = await env.db.claim_ingest_job()
+        await env.db.update_ingest_job(second["id"], second["generation"], status="queued")
+        second = await env.db.claim_ingest_job()
+        assert second["attempts"] == 2 and first["status"] == "running"
+        await env.close()
+
+        env = Env(root, FakeEmbedClient(), max_attempts=2)
+        env.objects = {f"kb/{name}": text.encode() for name, text in docs.items()}
+        recovered = await env.queue.start(env.open_object)
+        assert recovered == {"requeued": 1, "failed": 1, "enqueued": 1}, recovered
+        await env.wait_idle()
+
+        by_file = {job["file_id"]: job for job in await env.db.get_ingest_jobs(kb_id)}
+        assert by_file[second["file_id"]]["status"] == "failed"
+        assert "Interrupted" in by_file[second["file_id"]]["error"]
+        assert (await env.db.get_file(second["file_id"]))["status"] == "error"
+        done = [file_id for file_id in file_ids if file_id != second["file_id"]]
+        assert all(by_file[file_id]["status"] == "done" for file_id in done)
+        assert by_file[first["file_id"]]["attempts"] == 2
+
+        # 正常关闭中断的任务不计入尝试次数（内容有变化，需要嵌入）
+        env.client.stall_after = 0
+        env.objects["kb/doc0.md"] = _doc("edited", 2).encode()
+        await env.queue.enqueue([file_ids[0]])
+        while not env.queue.get_stats()["active_files"]:
+            await asyncio.sleep(0.01)
+        await env.close()
+        job = [job for job in await Env(root, FakeEmbedClient()).db.get_ingest_jobs(kb_id) if job["file_id"] == file_ids[0]][0]
+        assert job["status"] == "queued" and job["attempts"] == 0
+
+    asyncio.run(run())
+    print("✓ Restart recovery PASSED")
+
+
+def test_resume_within_file():
+    """Chunks committed before the interruption are not embedded again"""
+    print_section("Testing Resume Within a File")
+
+    async def run():
+        root = Path(tempfile.mkdtemp())
+        doc = _doc("large", 30)
+        env = Env(root, FakeEmbedClient(stall_after=5), concurrency=1)
+        kb_id = await env.db.create_knowledge_base("kb")
+        [file_id] = await env.add_files(kb_id, {"large.md": doc})
+        await env.queue.start(env.open_object)
+        await env.queue.enqueue([file_id])
+
+        # 处理到一半时"崩溃"
+        while env.client.requests <= 5:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        committed = len(await env.db.get_file_chunks(file_id))
+        job = (await env.db.get_ingest_jobs(kb_id))[0]
+        assert job["status"] == "running" and job["stage"] == "embed" and job["chunks_done"] == committed > 0
+        await env.close()
+
+        env = Env(root, FakeEmbedClient(), concurrency=1)
+        env.objects["kb/large.md"] = doc.encode()
+        await env.queue.start(env.open_object)
+        await env.wait_idle()
+
+        job = (await env.db.get_ingest_jobs(kb_id))[0]
+        assert job["status"] == "done" and job["chunks_reused"] == committed
+        assert len(env.client.sent) == job["chunks_done"] - committed
+        chunks = await env.db.get_file_chunks(file_id)
+        assert [c["chunk_index"] for c in chunks] == list(range(len(chunks)))
+        assert env.db.vector_store.count(kb_id) == len(chunks) == job["chunk_count"]
+        print(f"  resumed: {committed} chunks kept, {len(env.client.sent)} embedded after restart")
+        await env.close()
+
+    asyncio.run(run())
+    print("✓ Resume within a file PASSED")
+
+
+def test_superseded_upload():
+    """Re-enqueueing a running file cancels it; the new generation is the one that completes"""
+    print_section("Testing Superseded Upload")
+
+    async def run():
+        env = Env(Path(tempfile.mkdtemp()), FakeEmbedClient(stall_after=1), concurrency=2)
+        await env.queue.start(env.open_object)
+        kb_id = await env.db.create_knowledge_base("kb")
+        [file_id] = await env.add_files(kb_id, {"doc.md": _doc("old", 10)})
+        [job_id] = await env.queue.enqueue([file_id])
+        while not env.queue.get_stats()["active_files"]:
+            await asyncio.sleep(0.01)
+
+        # 覆盖上传：新内容重新入队，旧的处理被取消
+        env.objects["kb/doc.md"] = _doc("new", 3).encode()
+        await env.db.add_file(kb_id, "doc.md", "kb/doc.md", 1, "md")
+        assert await env.queue.enqueue([file_id]) == [job_id]
+        env.client.gate.set()
+        await env.wait_idle()
+
+        job = (await env.db.get_ingest_jobs(kb_id))[0]
+        assert job["status"] == "done" and job["generation"] == 2 and job["attempts"] == 1
+        contents = [c["content"] for c in await env.db.get_file_chunks(file_id)]
+        assert contents and all("new" in content and "old" not in content for content in contents)
+        assert env.db.vector_store.count(kb_id) == len(contents)
+        await env.close()
+
+    asyncio.run(run())
+    print("✓ Superseded upload PASSED")
+
+
+if __name__ == "__main__":
+    test_queue_processes_files()
+    test_restart_recovery()
+    test_resume_within_file()
+    test_superseded_upload()
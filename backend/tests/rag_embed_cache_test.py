@@ -0,0 +1,172 @@
+"""
+Test for the persistent embedding cache
+Tests:
+1. Vectors round-trip through the memory and disk tiers, isolated by model and normalize flag
+2. Re-embedding unchanged content sends nothing to the server; only changed chunks are embedded
+3. Switching the embed model through ModelSelectionPipeline drops the old model's vectors
+"""
+
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from spacemit_llm.pipeline.model_select import ModelSelectionPipeline
+from spacemit_llm.rag.embed_cache import EmbeddingCache, model_identity
+from spacemit_llm.rag.embedder import BatchEmbedder
+from spacemit_llm.rag.splitter import TextSplitter, content_hash
+
+
+def print_section(title: str):
+    """Print a section header"""
+    print("\n" + "=" * 60)
+    print(f"  {title}")
+    print("=" * 60)
+
+
+class FakeEmbedClient:
+    """模拟 EmbedClient：向量为 [文本长度, 字符码之和]，记录发送的文本"""
+
+    def __init__(self, normalize: bool = True):
+        self.normalize = normalize
+        self.sent = []
+
+    async def get_embeddings(self, texts, timeout=None):
+        self.sent.extend(texts)
+        return [[float(len(text)), float(sum(map(ord, text)) % 1000)] for text in texts]
+
+
+def _model_file(tmp: Path, name: str) -> Path:
+    path = tmp / name
+    path.write_bytes(name.encode())
+    return path
+
+
+def test_cache_tiers():
+    """Memory LRU, disk persistence, model and normalize isolation"""
+    print_section("Testing Cache Tiers")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        model = [model_identity(_model_file(tmp, "a.gguf"))]
+        db_path = tmp / "embed_cache.db"
+        cache = EmbeddingCache(db_path, model_key=lambda: model[0], max_memory_entries=2)
+
+        cache.put_many({"h1": [0.5, 0.25], "h2": [1.0, 2.0], "h3": [3.0, 4.0]}, normalized=True)
+        assert len(cache._memory) == 2
+        found = cache.get_many(["h1", "h2", "h3", "h4"], normalized=True)
+        assert found == {"h1": [0.5, 0.25], "h2": [1.0, 2.0], "h3": [3.0, 4.0]}
+        assert cache.memory_hits == 2 and cache.disk_hits == 1 and cache.misses == 1
+
+        # 向量以 float32 存储
+        blob = cache.fetchone("SELECT vector FROM embeddings WHERE content_hash = 'h2'")["vector"]
+        assert np.array_equal(np.frombuffer(blob, dtype=np.float32), [1.0, 2.0])
+
+        assert cache.get_many(["h1"], normalized=False) == {}
+        model[0] = model_identity(_model_file(tmp, "b.gguf"))
+        assert cache.get_many(["h1"], normalized=True) == {}
+
+        # 未加载模型时不读写缓存
+        model[0] = None
+        cache.put_many({"h9": [1.0]}, normalized=True)
+        assert cache.get_many(["h1", "h9"], normalized=True) == {}
+        cache.close()
+
+        # 重新打开：磁盘层保留
+        model[0] = model_identity(tmp / "a.gguf")
+        reopened = EmbeddingCache(db_path, model_key=lambda: model[0])
+        assert reopened.get_many(["h3"], normalized=True) == {"h3": [3.0, 4.0]}
+        assert reopened.get_stats()["entries"] == 3
+        reopened.close()
+
+        # 同名模型文件被替换 → 新标识
+        identity = model_identity(tmp / "a.gguf")
+        (tmp / "a.gguf").write_bytes(b"retrained weights")
+        assert model_identity(tmp / "a.gguf") != identity
+        assert model_identity(tmp / "missing.gguf") is None and model_identity(None) is None
+
+    print("✓ Cache tiers PASSED")
+
+
+def test_embedder_reuses_vectors():
+    """A second pass over unchanged chunks hits the cache; edited chunks are embedded"""
+    print_section("Testing Embedder Cache Reuse")
+
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            identity = model_identity(_model_file(tmp, "embed.gguf"))
+            cache = EmbeddingCache(tmp / "embed_cache.db", model_key=lambda: identity)
+            client = FakeEmbedClient()
+            embedder = BatchEmbedder(client, max_batch_size=8, count_tokens=len, cache=cache)
+            splitter = TextSplitter(chunk_tokens=40, overlap_tokens=0, count_tokens=len)
+
+            text = "\n\n".join(f"段落 {i}：" + "内容" * 12 for i in range(30))
+            chunks = list(splitter.split_text(text))
+            first = await embedder.embed([c.text for c in chunks])
+            assert len(client.sent) == len(chunks)
+
+            # 重新上传同样的内容：不访问 server，向量一致
+            client.sent.clear()
+            embedder.reset_stats()
+            again = [vectors async for _, batch in embedder.embed_stream(chunks) for vectors in batch]
+            assert client.sent == [] and embedder.get_stats()["cached"] == len(chunks)
+            by_hash = {content_hash(c.text): v for c, v in zip(chunks, first)}
+            assert sorted(map(tuple, again)) == sorted(map(tuple, by_hash.values()))
+
+            # 修改一个段落：只嵌入变化的 chunk
+            edited = text.replace("段落 7：", "段落 7（修订）：")
+            new_chunks = list(splitter.split_text(edited))
+            changed = [c.text for c in new_chunks if content_hash(c.text) not in by_hash]
+            vectors = await embedder.embed([c.text for c in new_chunks])
+            assert client.sent == changed and 0 < len(changed) < len(new_chunks)
+            assert vectors[0] == first[0]
+            print(f"  re-embed after edit: {len(changed)}/{len(new_chunks)} chunks sent to the server")
+
+            # normalize 不同的客户端不复用
+            other = BatchEmbedder(FakeEmbedClient(normalize=False), count_tokens=len, cache=cache)
+            await other.embed([chunks[0].text])
+            assert other.get_stats()["cached"] == 0
+            cache.close()
+
+    asyncio.run(run())
+    print("✓ Embedder cache reuse PASSED")
+
+
+def test_model_switch_invalidation():
+    """ModelSelectionPipeline notifies the cache; vectors of other models are removed"""
+    print_section("Testing Model Switch Invalidation")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        old_model = _model_file(tmp, "old.gguf")
+        new_model = _model_file(tmp, "new.gguf")
+        current = [model_identity(old_model)]
+        cache = EmbeddingCache(tmp / "embed_cache.db", model_key=lambda: current[0])
+        cache.put_many({"h1": [1.0], "h2": [2.0]}, normalized=True)
+
+        pipeline = ModelSelectionPipeline(tmp / "models", None, None, None)
+        pipeline.subscribe(cache.on_model_change)
+        pipeline.subscribe(lambda mode, name, path: 1 / 0)  # 失败的订阅者不影响其他订阅者
+
+        pipeline._notify("rerank", "bge", str(new_model))
+        assert cache.get_stats()["entries"] == 2
+
+        pipeline._notify("embed", "new", str(new_model))
+        assert cache.get_stats()["entries"] == 0 and len(cache._memory) == 0
+        current[0] = model_identity(new_model)
+        assert cache.get_many(["h1"], normalized=True) == {}
+        cache.close()
+
+    print("✓ Model switch invalidation PASSED")
+
+
+if __name__ == "__main__":
+    test_cache_tiers()
+    test_embedder_reuses_vectors()
+    test_model_switch_invalidation()
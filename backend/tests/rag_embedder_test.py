@@ -0,0 +1,127 @@
+"""
+Test for the adaptive batched embedder
+Tests:
+1. Batches respect the token budget, keep several requests in flight and preserve order
+2. Oversized batches that the server rejects are split and retried
+3. Batch size shrinks under high latency and grows when the server is fast
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from spacemit_llm.rag.embedder import BatchEmbedder, EmbeddingError
+from spacemit_llm.rag.splitter import TextSplitter
+
+
+def print_section(title: str):
+    """Print a section header"""
+    print("\n" + "=" * 60)
+    print(f"  {title}")
+    print("=" * 60)
+
+
+class FakeEmbedServer:
+    """模拟 EmbedClient：向量为文本长度，可配置拒绝大批次和延迟"""
+
+    def __init__(self, max_items: int = 1000, delay: float = 0.0, fail_text: str = None):
+        self.max_items = max_items
+        self.delay = delay
+        self.fail_text = fail_text
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.batch_sizes = []
+
+    async def get_embeddings(self, texts, timeout=None):
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if len(texts) > self.max_items or self.fail_text in texts:
+                raise RuntimeError("batch rejected")
+            self.batch_sizes.append(len(texts))
+            return [[float(len(text))] for text in texts]
+        finally:
+            self.in_flight -= 1
+
+
+def test_batching_and_order():
+    """Token budget caps each request; embed() returns vectors in input order"""
+    print_section("Testing Batching and Order")
+
+    server = FakeEmbedServer(delay=0.01)
+    embedder = BatchEmbedder(server, max_batch_tokens=100, max_batch_size=8, concurrency=3,
+                             count_tokens=len)
+    texts = ["x" * (i % 30 + 1) for i in range(200)]
+    vectors = asyncio.run(embedder.embed(texts))
+
+    assert vectors == [[float(len(t))] for t in texts]
+    assert server.peak_in_flight == 3
+    stats = embedder.get_stats()
+    assert stats["chunks"] == 200 and stats["tokens"] == sum(len(t) for t in texts)
+    assert stats["chunks_per_sec"] > 0
+
+    # 直接消费切分器输出的 Chunk（使用 Chunk 自带的 token 数）
+    splitter = TextSplitter(chunk_tokens=32, overlap_tokens=0)
+    chunks = list(splitter.split_text("这是一个句子。" * 200))
+    seen = []
+
+    async def consume():
+        async for batch, batch_vectors in embedder.embed_stream(chunks):
+            assert sum(c.token_count for c in batch) <= 100
+            seen.extend(batch)
+
+    asyncio.run(consume())
+    assert sorted(c.index for c in seen) == list(range(len(chunks)))
+    print("✓ Batching and order PASSED")
+
+
+def test_split_retry():
+    """Rejected batches are halved until the server accepts them"""
+    print_section("Testing Split Retry")
+
+    server = FakeEmbedServer(max_items=3)
+    embedder = BatchEmbedder(server, max_batch_size=16, initial_batch_size=16, retry_backoff=0)
+    texts = [f"text {i}" for i in range(40)]
+    vectors = asyncio.run(embedder.embed(texts))
+
+    assert vectors == [[float(len(t))] for t in texts]
+    assert max(server.batch_sizes) <= 3
+    assert embedder.get_stats()["splits"] > 0
+    assert embedder.batch_size < 16
+
+    # 单条持续失败时在重试后报错
+    server = FakeEmbedServer(fail_text="poison")
+    embedder = BatchEmbedder(server, max_retries=1, retry_backoff=0)
+    try:
+        asyncio.run(embedder.embed(["ok", "poison", "fine"]))
+        assert False, "expected EmbeddingError"
+    except EmbeddingError:
+        pass
+    assert embedder.get_stats()["retries"] == 1
+    print("✓ Split retry PASSED")
+
+
+def test_adaptive_batch_size():
+    """Slow responses shrink the batch size; fast ones grow it"""
+    print_section("Testing Adaptive Batch Size")
+
+    slow = BatchEmbedder(FakeEmbedServer(delay=0.02), initial_batch_size=16, concurrency=1,
+                         target_latency=0.001)
+    asyncio.run(slow.embed([f"t{i}" for i in range(64)]))
+    assert slow.batch_size < 16
+
+    fast = BatchEmbedder(FakeEmbedServer(), initial_batch_size=4, max_batch_size=32, concurrency=1,
+                         target_latency=10)
+    asyncio.run(fast.embed([f"t{i}" for i in range(2000)]))
+    assert fast.batch_size == 32
+    print("✓ Adaptive batch size PASSED")
+
+
+if __name__ == "__main__":
+    test_batching_and_order()
+    test_split_retry()
+    test_adaptive_batch_size()
@@ -0,0 +1,160 @@
+"""
+Test for the streaming document parser
+Tests:
+1. Markdown headings, paragraphs and code fences become blocks with heading paths
+2. Incremental decoding keeps multi-byte characters and offsets intact across read chunks
+3. The async parser streams text files through a stream opener
+4. PDF pages are extracted in a process pool in page order across task boundaries
+"""
+
+import asyncio
+import io
+import sys
+import tempfile
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from spacemit_llm.rag import parser
+from spacemit_llm.rag.parser import DocumentParser, iter_text_blocks, get_file_type, PDF_PAGES_PER_TASK
+
+
+def print_section(title: str):
+    """Print a section header"""
+    print("\n" + "=" * 60)
+    print(f"  {title}")
+    print("=" * 60)
+
+
+def test_markdown_blocks():
+    """Headings update the heading path; '#' inside code fences is ignored"""
+    print_section("Testing Markdown Blocks")
+
+    doc = "# 安装\n\n第一段。\n第一段续行。\n\n## 依赖\n\n```\n# not a heading\n\nstill code\n```\n\n# 使用\n正文\n"
+    blocks = list(iter_text_blocks(io.BytesIO(doc.encode("utf-8")), markdown=True))
+    texts = [b.text for b in blocks]
+    assert texts == [
+        "# 安装", "第一段。\n第一段续行。", "## 依赖",
+        "```\n# not a heading\n\nstill code\n```", "# 使用", "正文"
+    ]
+    assert blocks[1].heading == "安装"
+    assert blocks[3].heading == "安装 > 依赖"
+    assert blocks[5].heading == "使用"
+    for block in blocks:
+        assert doc[block.offset:block.offset + len(block.text)] == block.text
+
+    assert get_file_type("A.PDF") == "pdf"
+    try:
+        get_file_type("a.docx")
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    print("✓ Markdown blocks PASSED")
+
+
+def test_chunked_decoding():
+    """Multi-byte characters split across read chunks decode correctly"""
+    print_section("Testing Chunked Decoding")
+
+    original = parser.READ_CHUNK_BYTES
+    parser.READ_CHUNK_BYTES = 7
+    try:
+        doc = "\ufeff中文段落一。\r\n\r\nparagraph two\n\n" + "长" * 50
+        blocks = list(iter_text_blocks(io.BytesIO(doc.encode("utf-8"))))
+    finally:
+        parser.READ_CHUNK_BYTES = original
+
+    text = doc[1:]
+    assert [b.text for b in blocks] == ["中文段落一。", "paragraph two", "长" * 50]
+    assert all(b.page is None and b.heading is None for b in blocks)
+    assert blocks[2].offset == text.index("长")
+    print("✓ Chunked decoding PASSED")
+
+
+def test_async_text_stream():
+    """DocumentParser streams text files without a process pool"""
+    print_section("Testing Async Text Stream")
+
+    path = Path(tempfile.mkdtemp()) / "notes.txt"
+    path.write_text("\n\n".join(f"段落 {i}" for i in range(200)), encoding="utf-8")
+
+    async def collect():
+        doc_parser = DocumentParser()
+        try:
+            return [b async for b in doc_parser.iter_blocks(lambda: open(path, "rb"), "notes.txt")]
+        finally:
+            doc_parser.close()
+
+    blocks = asyncio.run(collect())
+    assert [b.text for b in blocks] == [f"段落 {i}" for i in range(200)]
+    print("✓ Async text stream PASSED")
+
+
+def _write_pdf(path: Path, pages):
+    """用 pypdf 生成每页一行文本的 PDF（None 表示空白页）"""
+    from pypdf import PdfWriter
+    from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+    for text in pages:
+        page = writer.add_blank_page(width=612, height=792)
+        if text is None:
+            continue
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode("latin-1"))
+        page[NameObject("/Contents")] = writer._add_object(content)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font})
+        })
+    with open(path, "wb") as f:
+        writer.write(f)
+
+
+def test_pdf_pages():
+    """Blocks carry their page numbers and stay in order across extraction tasks"""
+    print_section("Testing PDF Pages")
+
+    root = Path(tempfile.mkdtemp())
+    spool_dir = root / "spool"
+    spool_dir.mkdir()
+    page_count = PDF_PAGES_PER_TASK * 2 + 4
+    blank = PDF_PAGES_PER_TASK + 2
+    texts = [None if page == blank else f"Page {page} marker text" for page in range(1, page_count + 1)]
+    path = root / "manual.pdf"
+    _write_pdf(path, texts)
+    opened = []
+
+    def open_stream():
+        opened.append(path)
+        return open(path, "rb")
+
+    async def collect():
+        doc_parser = DocumentParser(max_workers=2, temp_dir=spool_dir)
+        try:
+            return [b async for b in doc_parser.iter_blocks(open_stream, "Manual.PDF")]
+        finally:
+            doc_parser.close()
+
+    blocks = asyncio.run(collect())
+    expected = [page for page in range(1, page_count + 1) if page != blank]
+    assert [b.page for b in blocks] == expected, [b.page for b in blocks]
+    assert [b.text for b in blocks] == [f"Page {page} marker text" for page in expected]
+    offsets = [b.offset for b in blocks]
+    assert offsets == sorted(offsets) and len(set(offsets)) == len(offsets)
+    # 源流只读取一次，临时文件在解析后删除
+    assert len(opened) == 1 and list(spool_dir.iterdir()) == []
+    print(f"  {page_count} pages in {-(-page_count // PDF_PAGES_PER_TASK)} tasks")
+    print("✓ PDF pages PASSED")
+
+
+if __name__ == "__main__":
+    test_markdown_blocks()
+    test_chunked_decoding()
+    test_async_text_stream()
+    test_pdf_pages()
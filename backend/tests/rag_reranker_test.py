@@ -0,0 +1,172 @@
+"""
+Test for the budgeted rerank stage
+Tests:
+1. Candidates are truncated to the pair budget, split into parallel index-only sub-requests and merged in order
+2. (query, content hash) scores are cached in an LRU keyed by the rerank model
+3. Retriever reranks fused candidates and keeps the fused order when the rerank server is down
+"""
+
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from spacemit_llm.comon.sqlite.sqlit_kb import SQLiteKnowledgeBase
+from spacemit_llm.rag.reranker import Reranker
+from spacemit_llm.rag.retriever import Retriever
+from spacemit_llm.rag.splitter import Chunk
+
+
+def print_section(title: str):
+    """Print a section header"""
+    print("\n" + "=" * 60)
+    print(f"  {title}")
+    print("=" * 60)
+
+
+DOCS = [
+    "知识库支持 PDF、Markdown 和纯文本文件的上传与检索。",
+    "调用 RerankClient.get_scores 时需要传入 query 和 documents。",
+    "模型服务器默认监听 8051 端口，embed 服务使用 8052 端口。",
+    "会话消息按 token 偏移分页加载，历史记录可以导出为 NDJSON。",
+]
+
+
+def _count_tokens(text: str) -> int:
+    return len(text)
+
+
+class FakeRerankClient:
+    """模拟 RerankClient：分数为文档与查询共有的字符数，结果按分数降序返回"""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def rerank(self, query, documents, top_n=None, return_documents=None):
+        if self.fail:
+            raise RuntimeError("rerank server down")
+        self.requests.append((list(documents), top_n, return_documents))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        scores = [float(len(set(query) & set(doc))) for doc in documents]
+        order = sorted(range(len(documents)), key=lambda i: scores[i], reverse=True)[:top_n]
+        return [(i, scores[i], None) for i in order]
+
+
+def test_budgeted_batches():
+    """Truncation, token/size-bounded sub-requests, index-only results merged in input order"""
+    print_section("Testing Budgeted Batches")
+
+    async def run():
+        client = FakeRerankClient()
+        reranker = Reranker(
+            client, max_request_tokens=100, max_pair_tokens=40, max_batch_size=3,
+            concurrency=2, count_tokens=_count_tokens
+        )
+        query = "abc"
+        documents = [(f"h{i}", "abcdefghij"[:i % 4 + 1] + "x" * (60 if i == 5 else 5)) for i in range(8)]
+        scores = await reranker.score(query, documents)
+
+        # 分数与输入顺序一致
+        expected = [float(len(set(query) & set(text))) for _, text in documents]
+        assert scores == expected, (scores, expected)
+
+        # 每个子请求：只要 index，top_n 等于文档数，token 和条数都在预算内
+        assert len(client.requests) >= 3
+        for sent, top_n, return_documents in client.requests:
+            assert return_documents is False and top_n == len(sent)
+            assert len(sent) <= 3
+            assert sum(len(query) + len(doc) + 8 for doc in sent) <= 100
+            assert all(len(query) + len(doc) + 8 <= 40 for doc in sent)
+        assert sum(len(sent) for sent, _, _ in client.requests) == 8
+        assert client.max_in_flight == 2
+
+        stats = reranker.get_stats()
+        assert stats["documents_truncated"] == 1 and stats["documents_scored"] == 8
+        print(f"  {stats['requests']} sub-requests for 8 documents")
+
+    asyncio.run(run())
+    print("✓ Budgeted batches PASSED")
+
+
+def test_score_cache():
+    """Repeated queries hit the cache; duplicate content is scored once; model switch misses"""
+    print_section("Testing Score Cache")
+
+    async def run():
+        client = FakeRerankClient()
+        model = ["bge-reranker-a"]
+        reranker = Reranker(client, cache_size=3, model_key=lambda: model[0], count_tokens=_count_tokens)
+        documents = [("h1", "alpha"), ("h2", "beta"), ("h1", "alpha")]
+
+        first = await reranker.score("ab", documents)
+        assert first[0] == first[2]
+        assert client.requests[-1][0] == ["alpha", "beta"]
+
+        second = await reranker.score("ab", documents)
+        assert second == first and len(client.requests) == 1
+        assert reranker.cache_hits == 3
+
+        # 不同查询、不同模型都不复用分数
+        await reranker.score("cd", documents[:1])
+        model[0] = "bge-reranker-b"
+        await reranker.score("ab", documents[:1])
+        assert len(client.requests) == 3
+
+        # LRU 上限
+        assert len(reranker._cache) == 3
+        assert ("bge-reranker-a", "ab", "h2") not in reranker._cache
+        assert ("bge-reranker-a", "ab", "h1") in reranker._cache
+
+    asyncio.run(run())
+    print("✓ Score cache PASSED")
+
+
+def test_retriever_rerank():
+    """Retriever reorders fused candidates by rerank score and degrades to fused order"""
+    print_section("Testing Retriever Rerank")
+
+    async def run():
+        with tempfile.TemporaryDirectory() as tmp:
+            # 不配置向量存储：只走词法检索，重排序阶段与检索路数无关
+            db = SQLiteKnowledgeBase(Path(tmp) / "knowledge_base.db", pool_size=2)
+            kb_id = await db.create_knowledge_base("kb")
+            file_id = await db.add_file(kb_id, "doc.md", "kb/doc.md", 1, "md")
+            chunks = [Chunk(i, text, len(text), 0, len(text)) for i, text in enumerate(DOCS)]
+            chunk_ids = await db.add_chunks(kb_id, file_id, chunks)
+            client = FakeRerankClient()
+            retriever = Retriever(db, None, reranker=Reranker(client), rerank_candidates=len(DOCS))
+
+            query = "端口 检索 token 分页"
+            results = await retriever.retrieve(query, [kb_id], top_k=2)
+            # 候选池大于 top_k，结果按 cross-encoder 分数排序
+            assert len(client.requests[0][0]) > 2
+            assert len(results) == 2
+            assert results[0]["id"] == chunk_ids[3]
+            assert results[0]["rerank_score"] > results[1]["rerank_score"]
+
+            plain = await retriever.retrieve(query, [kb_id], top_k=2, rerank=False)
+            assert all(r["rerank_score"] is None for r in plain)
+
+            retriever.reranker = Reranker(FakeRerankClient(fail=True))
+            fallback = await retriever.retrieve(query, [kb_id], top_k=2)
+            assert [r["id"] for r in fallback] == [r["id"] for r in plain]
+            assert all(r["rerank_score"] is None for r in fallback)
+            db.close()
+
+    asyncio.run(run())
+    print("✓ Retriever rerank PASSED")
+
+
+if __name__ == "__main__":
+    test_budgeted_batches()
+    test_score_cache()
+    test_retriever_rerank()
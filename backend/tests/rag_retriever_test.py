@@ -0,0 +1,220 @@
+"""
+Test for lexical (BM25) search and hybrid retrieval
+Tests:
+1. CJK text is indexed as bigrams; identifiers are kept whole and split into parts
+2. BM25 index follows chunk adds/deletes and is rebuilt when the tokenizer version changes
+3. Reciprocal-rank fusion merges vector and lexical results; one failing leg degrades gracefully
+4. Query embeddings are cached in memory only, never in the persistent embedding cache
+"""
+
+import asyncio
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from spacemit_llm.comon.sqlite.sqlit_kb import SQLiteKnowledgeBase
+from spacemit_llm.rag.embed_cache import EmbeddingCache
+from spacemit_llm.rag.lexical import match_query, tokenize
+from spacemit_llm.rag.retriever import Retriever, rrf_fuse
+from spacemit_llm.rag.splitter import Chunk
+from spacemit_llm.rag.vector_store import VectorStore
+
+
+def print_section(title: str):
+    """Print a section header"""
+    print("\n" + "=" * 60)
+    print(f"  {title}")
+    print("=" * 60)
+
+
+DOCS = [
+    "知识库支持 PDF、Markdown 和纯文本文件的上传与检索。",
+    "调用 RerankClient.get_scores 时需要传入 query 和 documents。",
+    "模型服务器默认监听 8051 端口，embed 服务使用 8052 端口。",
+    "会话消息按 token 偏移分页加载，历史记录可以导出为 NDJSON。",
+    "错误码 E_KB_0042 表示向量维度与知识库不一致。",
+]
+
+
+def _chunks(texts):
+    return [Chunk(i, text, len(text), 0, len(text)) for i, text in enumerate(texts)]
+
+
+class FakeEmbedClient:
+    """模拟 EmbedClient：每个文本对应一个确定的随机单位向量"""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+
+    async def get_embeddings(self, texts, timeout=None):
+        if self.fail:
+            raise RuntimeError("embed server down")
+        vectors = []
+        for text in texts:
+            rng = np.random.default_rng(sum(map(ord, text)))
+            v = rng.standard_normal(16)
+            vectors.append((v / np.linalg.norm(v)).tolist())
+        return vectors
+
+
+async def _setup(tmp: Path):
+    store = VectorStore(tmp / "vectors")
+    db = SQLiteKnowledgeBase(tmp / "knowledge_base.db", pool_size=2, vector_store=store)
+    kb_id = await db.create_knowledge_base("kb")
+    file_id = await db.add_file(kb_id, "doc.md", "kb/doc.md", 1, "md")
+    vectors = await FakeEmbedClient().get_embeddings(DOCS)
+    chunk_ids = await db.add_chunks(kb_id, file_id, _chunks(DOCS), vectors)
+    return db, kb_id, file_id, chunk_ids
+
+
+def test_tokenize():
+    """CJK bigrams, lower-cased identifiers plus their parts, quoted OR query"""
+    print_section("Testing Tokenizer")
+
+    assert tokenize("知识库") == ["知识", "识库"]
+    assert tokenize("库") == ["库"]
+    assert tokenize("调用 RerankClient.get_scores") == [
+        "调用", "rerankclient.get_scores", "rerankclient", "get", "scores"
+    ]
+    assert tokenize("nomic-embed-text v2.") == ["nomic-embed-text", "nomic", "embed", "text", "v2"]
+    assert tokenize("x" * 100) == []
+    # 用户输入中的 FTS5 语法被转义为普通词项
+    assert match_query('知识 OR "NEAR(') == '"知识" OR "or" OR "near"'
+    assert match_query("，。！") is None
+    print("✓ Tokenizer PASSED")
+
+
+def test_lexical_index():
+    """BM25 ranks exact identifiers first; deletes and tokenizer upgrades keep the index consistent"""
+    print_section("Testing Lexical Index")
+
+    tmp = Path(tempfile.mkdtemp())
+
+    async def run():
+        db, kb_id, file_id, chunk_ids = await _setup(tmp)
+        hits = await db.search_chunks_lexical([kb_id], "get_scores 怎么用")
+        assert hits[0][0] == chunk_ids[1]
+        assert all(a[1] >= b[1] for a, b in zip(hits, hits[1:]))
+        assert (await db.search_chunks_lexical([kb_id], "E_KB_0042"))[0][0] == chunk_ids[4]
+        assert (await db.search_chunks_lexical([kb_id], "导出历史记录"))[0][0] == chunk_ids[3]
+        assert await db.search_chunks_lexical([kb_id + 1], "get_scores") == []
+
+        # 重新切分文件：旧 chunk 从索引中移除
+        await db.delete_file_chunks(file_id)
+        assert await db.search_chunks_lexical([kb_id], "get_scores") == []
+        new_ids = await db.add_chunks(kb_id, file_id, _chunks(DOCS[:2]))
+        assert (await db.search_chunks_lexical([kb_id], "get_scores"))[0][0] == new_ids[1]
+        db.close()
+
+        # 分词器版本变化时重建索引
+        conn = sqlite3.connect(tmp / "knowledge_base.db")
+        conn.execute("UPDATE kb_meta SET value = '0' WHERE key = 'lexical_tokenizer'")
+        conn.execute("INSERT INTO kb_chunks_fts (kb_chunks_fts) VALUES ('delete-all')")
+        conn.commit()
+        conn.close()
+        db = SQLiteKnowledgeBase(tmp / "knowledge_base.db", pool_size=2)
+        assert (await db.search_chunks_lexical([kb_id], "get_scores"))[0][0] == new_ids[1]
+
+        await db.delete_file(file_id)
+        assert await db.search_chunks_lexical([kb_id], "知识库") == []
+        db.close()
+
+    asyncio.run(run())
+    print("✓ Lexical index PASSED")
+
+
+def test_hybrid_retrieval():
+    """RRF fuses both legs; lexical-only results survive an embed failure"""
+    print_section("Testing Hybrid Retrieval")
+
+    fused = rrf_fuse([[1, 2, 3], [3, 1, 4]], k=60)
+    assert [item_id for item_id, _ in fused] == [1, 3, 2, 4]
+    assert abs(fused[0][1] - (1 / 61 + 1 / 62)) < 1e-12
+
+    tmp = Path(tempfile.mkdtemp())
+
+    async def run():
+        db, kb_id, _, chunk_ids = await _setup(tmp)
+        retriever = Retriever(db, FakeEmbedClient(), vector_candidates=3, lexical_candidates=3)
+
+        # 查询文本与某个 chunk 完全相同 → 两路都排第一
+        results = await retriever.retrieve(DOCS[2], [kb_id], top_k=3)
+        assert results[0]["id"] == chunk_ids[2]
+        assert results[0]["vector_score"] is not None and results[0]["lexical_score"] is not None
+        assert results[0]["filename"] == "doc.md"
+
+        # 嵌入无法命中的错误码由词法检索补上
+        results = await retriever.retrieve("E_KB_0042", [kb_id], top_k=5)
+        assert chunk_ids[4] in [r["id"] for r in results]
+        vector_only = await retriever.retrieve("E_KB_0042", [kb_id], top_k=5, mode="vector")
+        assert all(r["lexical_score"] is None for r in vector_only)
+
+        # embed server 不可用：混合检索退化为词法检索，纯向量检索报错
+        retriever.embed_client = FakeEmbedClient(fail=True)
+        results = await retriever.retrieve("get_scores", [kb_id], top_k=3)
+        assert results[0]["id"] == chunk_ids[1] and results[0]["vector_score"] is None
+        try:
+            await retriever.retrieve("get_scores", [kb_id], mode="vector")
+            assert False, "expected RuntimeError"
+        except RuntimeError:
+            pass
+        db.close()
+
+    asyncio.run(run())
+    print("✓ Hybrid retrieval PASSED")
+
+
+class CountingEmbedClient(FakeEmbedClient):
+    """记录嵌入请求的文本"""
+
+    def __init__(self):
+        super().__init__()
+        self.sent = []
+
+    async def get_embeddings(self, texts, timeout=None):
+        self.sent.extend(texts)
+        return await super().get_embeddings(texts, timeout)
+
+
+def test_query_embedding_cache():
+    """Repeated queries hit the memory tier; the disk tier never stores queries"""
+    print_section("Testing Query Embedding Cache")
+
+    tmp = Path(tempfile.mkdtemp())
+
+    async def run():
+        db, kb_id, _, chunk_ids = await _setup(tmp)
+        cache = EmbeddingCache(tmp / "embed_cache.db", model_key=lambda: "model")
+        client = CountingEmbedClient()
+        retriever = Retriever(db, client, embed_cache=cache)
+
+        for _ in range(3):
+            results = await retriever.retrieve("端口配置", [kb_id], top_k=3, mode="vector")
+        assert client.sent == ["端口配置"] and len(results) == 3
+        assert cache.get_stats()["entries"] == 0
+        assert cache.get_stats()["memory_entries"] == 1
+
+        # 重新打开后内存层为空，查询重新嵌入
+        cache.close()
+        cache = EmbeddingCache(tmp / "embed_cache.db", model_key=lambda: "model")
+        retriever.embed_cache = cache
+        await retriever.retrieve("端口配置", [kb_id], top_k=3, mode="vector")
+        assert client.sent == ["端口配置"] * 2
+        cache.close()
+        db.close()
+
+    asyncio.run(run())
+    print("✓ Query embedding cache PASSED")
+
+
+if __name__ == "__main__":
+    test_tokenize()
+    test_lexical_index()
+    test_hybrid_retrieval()
+    test_query_embedding_cache()
@@ -0,0 +1,117 @@
+"""
+Test for the token-aware text splitter
+Tests:
+1. Chunks respect the token budget, end on sentence boundaries and map back to source offsets
+2. Consecutive chunks overlap; heading changes force a boundary without overlap
+3. Content hashes are stable and splitting is lazy over unbounded input
+"""
+
+import itertools
+import sys
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from spacemit_llm.rag.parser import TextBlock
+from spacemit_llm.rag.splitter import TextSplitter, content_hash
+
+
+def print_section(title: str):
+    """Print a section header"""
+    print("\n" + "=" * 60)
+    print(f"  {title}")
+    print("=" * 60)
+
+
+def _sample_text(count: int = 300) -> str:
+    sentences = []
+    for i in range(count):
+        if i % 3:
+            sentences.append(f"这是第{i}句话，包含一些中文内容。")
+        else:
+            sentences.append(f"This is sentence number {i}, written in English! ")
+    return "".join(sentences)
+
+
+def test_budget_and_offsets():
+    """Every chunk fits the budget and is a slice of the source text"""
+    print_section("Testing Budget and Offsets")
+
+    text = _sample_text()
+    splitter = TextSplitter(chunk_tokens=64, overlap_tokens=0)
+    chunks = list(splitter.split_text(text))
+
+    assert len(chunks) > 10
+    assert [c.index for c in chunks] == list(range(len(chunks)))
+    for chunk in chunks:
+        assert chunk.token_count <= 64, chunk
+        assert text[chunk.start:chunk.end].strip() == chunk.text
+        assert chunk.text[-1] in "。!", chunk.text
+    # 没有重叠时各片段首尾相接
+    assert all(a.end == b.start for a, b in zip(chunks, chunks[1:]))
+
+    # 没有分隔符的超长文本按字符硬切
+    long_word = "长" * 500
+    pieces = list(splitter.split_text(long_word))
+    assert "".join(c.text for c in pieces) == long_word
+    assert all(c.token_count <= 64 for c in pieces)
+    print("✓ Budget and offsets PASSED")
+
+
+def test_overlap_and_headings():
+    """Neighbouring chunks share a tail; sections never bleed into each other"""
+    print_section("Testing Overlap and Headings")
+
+    splitter = TextSplitter(chunk_tokens=64, overlap_tokens=32)
+    text = _sample_text(60)
+    chunks = list(splitter.split_text(text))
+    for a, b in zip(chunks, chunks[1:]):
+        assert b.start < a.end, (a, b)
+        shared = text[b.start:a.end].strip()
+        assert a.text.endswith(shared) and b.text.startswith(shared)
+
+    blocks = [
+        TextBlock("# 安装", heading="安装", offset=0),
+        TextBlock("安装步骤。" * 30, heading="安装", offset=10),
+        TextBlock("## 依赖", heading="安装 > 依赖", offset=200),
+        TextBlock("依赖说明。" * 5, heading="安装 > 依赖", offset=210),
+    ]
+    chunks = list(splitter.split(blocks))
+    assert chunks[0].text.startswith("# 安装")
+    last = chunks[-1]
+    assert last.heading == "安装 > 依赖"
+    assert last.text == "## 依赖\n\n" + "依赖说明。" * 5
+    assert all("依赖" not in c.text for c in chunks[:-1])
+
+    # 许多小块：跨块连接的空行也计入预算
+    small = [TextBlock(f"item {i} ok", offset=i * 20) for i in range(200)]
+    chunks = list(splitter.split(small))
+    assert all(c.token_count <= 64 for c in chunks), max(c.token_count for c in chunks)
+    assert chunks[-1].text.endswith("item 199 ok")
+    print("✓ Overlap and headings PASSED")
+
+
+def test_hash_and_streaming():
+    """Hashes depend only on content; chunks are produced lazily"""
+    print_section("Testing Hashes and Streaming")
+
+    splitter = TextSplitter(chunk_tokens=128, overlap_tokens=16)
+    first = [c.content_hash for c in splitter.split_text(_sample_text())]
+    second = [c.content_hash for c in splitter.split_text(_sample_text())]
+    assert first == second
+    assert first[0] == content_hash(next(iter(splitter.split_text(_sample_text()))).text)
+
+    def endless_blocks():
+        for i in itertools.count():
+            yield TextBlock(f"第{i}段。" * 40, offset=i * 1000)
+
+    chunks = list(itertools.islice(splitter.split(endless_blocks()), 50))
+    assert len(chunks) == 50
+    print("✓ Hashes and streaming PASSED")
+
+
+if __name__ == "__main__":
+    test_budget_and_offsets()
+    test_overlap_and_headings()
+    test_hash_and_streaming()
@@ -0,0 +1,446 @@
+"""
+Test for the memory-mapped vector store
+Tests:
+1. Top-k search matches brute force and deleted rows are never returned
+2. Compaction removes tombstones and a reopened store recovers from a torn append
+3. Ingest pipeline streams chunks into SQLite and the vector store; deletes remove vectors
+4. IVF index trains incrementally, persists, and its recall@10 is benchmarked against exact search
+5. int8 / binary quantization: memory use and recall@10 per mode, exact rescoring, switching modes
+6. Overwriting a file re-embeds only changed chunks; removed chunks lose their vectors; chunks without vectors are re-embedded
+7. Training / rewriting one KB does not block searches of that KB or of other KBs
+"""
+
+import asyncio
+import io
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from spacemit_llm.comon.sqlite.sqlit_kb import SQLiteKnowledgeBase
+from spacemit_llm.pipeline.kb_ingest import KnowledgeBaseIngestPipeline
+from spacemit_llm.rag.embedder import BatchEmbedder
+from spacemit_llm.rag.parser import DocumentParser
+from spacemit_llm.rag.splitter import TextSplitter
+from spacemit_llm.rag import vector_store
+from spacemit_llm.rag.vector_store import VectorStore
+
+
+def print_section(title: str):
+    """Print a section header"""
+    print("\n" + "=" * 60)
+    print(f"  {title}")
+    print("=" * 60)
+
+
+def _random_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_search_and_delete():
+    """argpartition top-k equals a full sort; tombstoned rows are skipped"""
+    print_section("Testing Search and Delete")
+
+    store = VectorStore(Path(tempfile.mkdtemp()))
+    vectors = _random_vectors(1000, 32)
+    ids = list(range(100, 1100))
+    # 分两次追加
+    store.add(1, ids[:600], vectors[:600])
+    store.add(1, ids[600:], vectors[600:])
+    assert store.count(1) == 1000
+
+    query = _random_vectors(1, 32, seed=1)[0]
+    expected = np.argsort(-(vectors @ query), kind="stable")[:10]
+    results = store.search(1, query, top_k=10)
+    assert [chunk_id for chunk_id, _ in results] == [ids[i] for i in expected]
+    assert all(a[1] >= b[1] for a, b in zip(results, results[1:]))
+
+    deleted = [chunk_id for chunk_id, _ in results[:5]]
+    assert store.delete(1, deleted + [99999]) == 5
+    assert store.count(1) == 995
+    remaining = [chunk_id for chunk_id, _ in store.search(1, query, top_k=10)]
+    assert not set(remaining) & set(deleted)
+    assert remaining[:5] == [chunk_id for chunk_id, _ in results[5:]]
+
+    # 维度不一致、未知知识库
+    try:
+        store.add(1, [1], _random_vectors(1, 16))
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    assert store.search(2, query) == []
+    assert store.search(1, query, top_k=5000)[-1][0] not in deleted
+    print("✓ Search and delete PASSED")
+
+
+def test_compact_and_recover():
+    """Compaction rewrites live rows; reload truncates a half-written tail"""
+    print_section("Testing Compaction and Recovery")
+
+    root = Path(tempfile.mkdtemp())
+    store = VectorStore(root, compact_ratio=0.3, compact_min_rows=10)
+    vectors = _random_vectors(100, 8)
+    store.add(7, list(range(100)), vectors)
+
+    # 40% 死行触发自动压缩
+    store.delete(7, list(range(0, 100, 5)))
+    stats = store.get_stats(7)
+    assert stats["dead"] == 20 and stats["rows"] == 100
+    store.delete(7, list(range(1, 100, 5)))
+    stats = store.get_stats(7)
+    print(f"after compaction: {stats}")
+    assert stats["dead"] == 0 and stats["rows"] == 60
+    assert sorted(p.name for p in (root / "kb_7").iterdir()) == ["ids.1.i64", "meta.json", "vectors.1.f32"]
+
+    query = vectors[2]
+    assert store.search(7, query, top_k=1)[0][0] == 2
+
+    # 模拟追加向量后、写入 ID 前崩溃
+    with open(root / "kb_7" / "vectors.1.f32", "ab") as f:
+        f.write(vectors[:3].tobytes())
+    reopened = VectorStore(root)
+    assert reopened.count(7) == 60
+    assert reopened.search(7, query, top_k=1)[0][0] == 2
+    reopened.add(7, [1000], vectors[:1])
+    assert reopened.search(7, vectors[0], top_k=1)[0][0] == 1000
+
+    reopened.drop(7)
+    assert not (root / "kb_7").exists()
+    assert reopened.count(7) == 0
+    print("✓ Compaction and recovery PASSED")
+
+
+class FakeEmbedClient:
+    """模拟 EmbedClient：返回由文本哈希生成的单位向量"""
+
+    async def get_embeddings(self, texts, timeout=None):
+        return [_random_vectors(1, 16, seed=abs(hash(text)) % (2 ** 32))[0].tolist() for text in texts]
+
+
+def test_ingest_pipeline():
+    """Uploaded text is chunked, embedded and searchable; file/KB deletes drop vectors"""
+    print_section("Testing Ingest Pipeline")
+
+    tmp = Path(tempfile.mkdtemp())
+    store = VectorStore(tmp / "vectors")
+    db = SQLiteKnowledgeBase(tmp / "knowledge_base.db", pool_size=2, vector_store=store)
+    parser = DocumentParser(max_workers=1)
+    embed_client = FakeEmbedClient()
+    pipeline = KnowledgeBaseIngestPipeline(
+        db, parser, TextSplitter(chunk_tokens=64, overlap_tokens=0), BatchEmbedder(embed_client)
+    )
+    doc = "\n\n".join(f"# Section {i}\n\n" + f"Paragraph {i} talks about topic {i}. " * 20 for i in range(10))
+
+    async def run():
+        kb_id = await db.create_knowledge_base("kb")
+        file_ids = [await db.add_file(kb_id, f"doc{i}.md", f"kb/doc{i}.md", len(doc), "md") for i in range(2)]
+        for file_id in file_ids:
+            stats = await pipeline.submit(kb_id, file_id, lambda: io.BytesIO(doc.encode()), "doc.md")
+            assert stats["chunks"] > 10
+
+        file_info = await db.get_file(file_ids[0])
+        assert file_info["status"] == "ready" and file_info["chunk_count"] == stats["chunks"]
+        chunks = await db.get_file_chunks(file_ids[0])
+        assert [c["chunk_index"] for c in chunks] == list(range(stats["chunks"]))
+        assert store.count(kb_id) == 2 * stats["chunks"]
+
+        # 以某个 chunk 的向量查询能命中它本身
+        target = chunks[3]
+        query = (await embed_client.get_embeddings([target["content"]]))[0]
+        top_id = store.search(kb_id, query, top_k=1)[0][0]
+        assert (await db.get_chunks([top_id]))[0]["content"] == target["content"]
+
+        # 解析失败的文件标记为 error
+        failed = await db.add_file(kb_id, "bad.docx", "kb/bad.docx", 1, "docx")
+        assert await pipeline.ingest_file(kb_id, failed, lambda: io.BytesIO(b"x"), "bad.docx") is None
+        assert (await db.get_file(failed))["status"] == "error"
+
+        # 删除文件和知识库时同步删除向量
+        await db.delete_file(file_ids[0])
+        assert store.count(kb_id) == stats["chunks"]
+        assert await db.get_file_chunks(file_ids[0]) == []
+        await db.delete_knowledge_base(kb_id)
+        assert store.count(kb_id) == 0
+
+        await pipeline.close()
+
+    try:
+        asyncio.run(run())
+    finally:
+        parser.close()
+        db.close()
+    print("✓ Ingest pipeline PASSED")
+
+
+def _clustered_vectors(n: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    """围绕随机中心生成的归一化向量（接近真实嵌入的分布）"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim))
+    vectors = centers[rng.integers(0, clusters, n)] + 1.2 * rng.standard_normal((n, dim))
+    vectors = vectors.astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_ivf_recall():
+    """IVF: exact fallback below threshold, incremental build, persistence, recall benchmark"""
+    print_section("Testing IVF Index Recall")
+
+    root = Path(tempfile.mkdtemp())
+    store = VectorStore(root, exact_threshold=5000, nprobe=16)
+    data = _clustered_vectors(30000, 48, clusters=200, seed=0)
+    queries = data[np.random.default_rng(1).choice(len(data), 100, replace=False)] + 0.05
+
+    # 未达到阈值时只写向量不训练
+    store.add(3, list(range(4000)), data[:4000], index_type="ivf")
+    assert store.get_stats(3)["nlist"] == 0
+    # 跨过阈值时训练，之后的批次增量分配
+    for start in range(4000, 30000, 2000):
+        store.add(3, list(range(start, start + 2000)), data[start:start + 2000], index_type="ivf")
+    stats = store.get_stats(3)
+    print(f"stats: {stats}")
+    assert stats["index"] == "ivf" and stats["nlist"] > 0 and stats["live"] == 30000
+
+    def benchmark(nprobe):
+        exact_time = ivf_time = 0.0
+        hits = 0
+        for q in queries:
+            t0 = time.perf_counter()
+            exact = {i for i, _ in store.search(3, q, top_k=10, exact=True)}
+            t1 = time.perf_counter()
+            approx = {i for i, _ in store.search(3, q, top_k=10, nprobe=nprobe)}
+            t2 = time.perf_counter()
+            exact_time += t1 - t0
+            ivf_time += t2 - t1
+            hits += len(exact & approx)
+        recall = hits / (10 * len(queries))
+        print(f"nprobe={nprobe:4d}  recall@10={recall:.3f}  "
+              f"exact={exact_time / len(queries) * 1000:.2f}ms  ivf={ivf_time / len(queries) * 1000:.2f}ms")
+        return recall
+
+    low, default, full = benchmark(1), benchmark(16), benchmark(stats["nlist"])
+    assert low <= default <= full
+    assert default >= 0.9
+    assert full == 1.0
+
+    # 重新打开后索引仍在；删除的行不会返回
+    reopened = VectorStore(root, exact_threshold=5000, nprobe=16)
+    q = queries[0]
+    assert reopened.search(3, q, top_k=10) == store.search(3, q, top_k=10)
+    first = reopened.search(3, q, top_k=1)[0][0]
+    reopened.delete(3, [first])
+    assert first not in {i for i, _ in reopened.search(3, q, top_k=10)}
+
+    # 切回 flat 时丢弃索引文件
+    reopened.configure(3, index_type="flat")
+    assert reopened.get_stats(3)["nlist"] == 0
+    assert not list((root / "kb_3").glob("assign.*")) and not list((root / "kb_3").glob("centroids.*"))
+    assert [i for i, _ in reopened.search(3, q, top_k=10)] == [i for i, _ in reopened.search(3, q, top_k=10, exact=True)]
+    print("✓ IVF index recall PASSED")
+
+
+def test_quantization():
+    """Quantized codes shrink the scanned data; rescoring keeps recall near exact"""
+    print_section("Testing Quantization")
+
+    root = Path(tempfile.mkdtemp())
+    store = VectorStore(root, exact_threshold=5000)
+    data = _clustered_vectors(20000, 128, clusters=100, seed=2)
+    ids = list(range(20000))
+    reports = {}
+    for kb_id, (index_type, quantization) in enumerate(
+        [("flat", "none"), ("flat", "int8"), ("flat", "binary"), ("ivf", "int8"), ("ivf", "binary")], start=1
+    ):
+        for start in range(0, 20000, 5000):
+            store.add(kb_id, ids[start:start + 5000], data[start:start + 5000],
+                      index_type=index_type, quantization=quantization)
+        report = store.evaluate(kb_id, sample_size=50, top_k=10)
+        reports[(index_type, quantization)] = report
+        print(f"{index_type:4s}/{quantization:6s}  scan={report['scan_bytes'] / 1024:8.0f}KB  "
+              f"total={report['bytes'] / 1024:8.0f}KB  recall@10={report['recall']:.3f}  "
+              f"latency={report['latency_ms']:.2f}ms (exact {report['exact_latency_ms']:.2f}ms)")
+
+    full = reports[("flat", "none")]
+    assert full["recall"] == 1.0
+    assert reports[("flat", "int8")]["scan_bytes"] * 4 == full["scan_bytes"]
+    assert reports[("flat", "binary")]["scan_bytes"] * 32 == full["scan_bytes"]
+    assert reports[("flat", "int8")]["recall"] >= 0.98
+    assert reports[("flat", "binary")]["recall"] >= 0.9
+    assert reports[("ivf", "int8")]["recall"] >= 0.9
+
+    # 返回的分数是 float32 向量的精确内积
+    q = data[123]
+    for chunk_id, score in store.search(3, q, top_k=5):
+        assert abs(score - float(data[chunk_id] @ q)) < 1e-4
+    assert store.search(3, q, top_k=1)[0][0] == 123
+
+    # 删除后不返回；切换量化方式重写码本；重新打开后一致
+    store.delete(2, [123])
+    assert 123 not in {i for i, _ in store.search(2, q, top_k=10)}
+    before = store.search(2, q, top_k=10)
+    store.configure(2, quantization="binary")
+    assert store.get_stats(2)["quantization"] == "binary"
+    store.configure(2, quantization="int8")
+    assert store.search(2, q, top_k=10) == before
+    reopened = VectorStore(root, exact_threshold=5000)
+    assert reopened.search(2, q, top_k=10) == before
+    store.configure(2, quantization="none")
+    assert not list((root / "kb_2").glob("codes.*")) and not list((root / "kb_2").glob("scale.*"))
+
+    # 码文件半写入时按最短文件截断
+    with open(root / "kb_3" / "vectors.0.f32", "ab") as f:
+        f.write(data[:2].tobytes())
+    reopened = VectorStore(root, exact_threshold=5000)
+    assert reopened.count(3) == 20000
+    print("✓ Quantization PASSED")
+
+
+class CountingEmbedClient(FakeEmbedClient):
+    """记录发送给 server 的文本"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def get_embeddings(self, texts, timeout=None):
+        self.sent.extend(texts)
+        return await super().get_embeddings(texts, timeout)
+
+
+def test_incremental_reindex():
+    """Unchanged chunks keep their rows and vectors; only added chunks are embedded"""
+    print_section("Testing Incremental Re-index")
+
+    tmp = Path(tempfile.mkdtemp())
+    store = VectorStore(tmp / "vectors")
+    db = SQLiteKnowledgeBase(tmp / "knowledge_base.db", pool_size=2, vector_store=store)
+    parser = DocumentParser(max_workers=1)
+    embed_client = CountingEmbedClient()
+    pipeline = KnowledgeBaseIngestPipeline(
+        db, parser, TextSplitter(chunk_tokens=64, overlap_tokens=0), BatchEmbedder(embed_client)
+    )
+    sections = [f"# Section {i}\n\n" + f"Paragraph {i} talks about topic {i}. " * 20 for i in range(40)]
+
+    async def ingest(kb_id, file_id, doc):
+        embed_client.sent.clear()
+        return await pipeline.ingest_file(kb_id, file_id, lambda: io.BytesIO(doc.encode()), "doc.md")
+
+    async def run():
+        kb_id = await db.create_knowledge_base("kb")
+        file_id = await db.add_file(kb_id, "doc.md", "kb/doc.md", 1, "md")
+        first = await ingest(kb_id, file_id, "\n\n".join(sections))
+        old_chunks = await db.get_file_chunks(file_id)
+        assert first["reused"] == 0 and len(embed_client.sent) == first["chunks"]
+
+        # 覆盖：修改一节、删除一节、在开头插入一节
+        edited = list(sections)
+        edited[10] = edited[10].replace("talks about", "now covers")
+        del edited[30]
+        edited.insert(0, "# Preface\n\n" + "A new introduction. " * 20)
+        await db.add_file(kb_id, "doc.md", "kb/doc.md", 2, "md")
+        second = await ingest(kb_id, file_id, "\n\n".join(edited))
+        print(f"  re-index after edit: {len(embed_client.sent)}/{second['chunks']} chunks embedded, "
+              f"{second['reused']} reused in {second['elapsed'] * 1000:.0f}ms")
+
+        new_chunks = await db.get_file_chunks(file_id)
+        assert second["reused"] + len(embed_client.sent) == second["chunks"] == len(new_chunks)
+        assert 0 < len(embed_client.sent) < second["chunks"] // 4
+        assert (await db.get_file(file_id))["chunk_count"] == second["chunks"]
+
+        # 与全量处理的结果一致：顺序、位置、内容
+        fresh_id = await db.add_file(kb_id, "fresh.md", "kb/fresh.md", 2, "md")
+        await ingest(kb_id, fresh_id, "\n\n".join(edited))
+        keys = ("chunk_index", "content", "start_offset", "end_offset", "heading")
+        expected = [[c[k] for k in keys] for c in await db.get_file_chunks(fresh_id)]
+        assert [[c[k] for k in keys] for c in new_chunks] == expected
+
+        # 未变化的 chunk 保留原 ID；被删除的 chunk 不再有向量
+        old_ids = {c["id"] for c in old_chunks}
+        assert sum(c["id"] in old_ids for c in new_chunks) == second["reused"]
+        assert store.count(kb_id) == 2 * len(new_chunks)
+        removed = old_ids - {c["id"] for c in new_chunks}
+        indexed = {chunk_id for chunk_id, _ in store.search(kb_id, _random_vectors(1, 16)[0], top_k=1000)}
+        assert removed and not removed & indexed
+
+        # 上次处理在写入向量前崩溃：只有行没有向量的 chunk 被重新嵌入
+        lost = [c["id"] for c in new_chunks[-5:]]
+        store.delete(kb_id, lost)
+        await db.update_file_status(file_id, "processing", chunk_count=0)
+        third = await ingest(kb_id, file_id, "\n\n".join(edited))
+        assert len(embed_client.sent) == 5 and third["reused"] == third["chunks"] - 5
+        assert [c["content"] for c in await db.get_file_chunks(file_id)] == [c["content"] for c in new_chunks]
+        assert store.count(kb_id) == 2 * len(new_chunks)
+
+    try:
+        asyncio.run(run())
+    finally:
+        parser.close()
+        db.close()
+    print("✓ Incremental re-index PASSED")
+
+
+def test_rebuild_concurrency():
+    """Searches run while another thread trains a new generation"""
+    print_section("Testing Searches During Rebuild")
+
+    store = VectorStore(Path(tempfile.mkdtemp()), exact_threshold=500)
+    vectors = _random_vectors(1000, 16)
+    store.add(1, range(1000), vectors, index_type="ivf")
+    store.add(2, range(100), vectors[:100])
+    before = store.search(1, vectors[0], top_k=5, exact=True)
+
+    # 训练在另一个线程中进行，并停在 k-means 中
+    train = vector_store._train_centroids
+    training, release = threading.Event(), threading.Event()
+
+    def blocking_train(*args, **kwargs):
+        training.set()
+        release.wait(10)
+        return train(*args, **kwargs)
+
+    vector_store._train_centroids = blocking_train
+    try:
+        rebuild = threading.Thread(target=store.rebuild_index, args=(1,))
+        rebuild.start()
+        assert training.wait(10)
+
+        done = []
+
+        def search_all():
+            done.append(store.search(2, vectors[0], top_k=1))
+            done.append(store.search(1, vectors[0], top_k=5, exact=True))
+            done.append(store.get_stats(1))
+
+        reader = threading.Thread(target=search_all)
+        reader.start()
+        reader.join(5)
+        assert len(done) == 3, "searches blocked by the rebuild"
+        assert done[0][0][0] == 0 and done[1] == before
+        generation = done[2]
+
+        release.set()
+        rebuild.join(10)
+        assert not rebuild.is_alive()
+    finally:
+        vector_store._train_centroids = train
+        release.set()
+
+    # 切换后读到新一代：训练前后精确检索结果一致
+    assert store.search(1, vectors[0], top_k=5, exact=True) == before
+    assert store.get_stats(1)["nlist"] > 0 and generation["rows"] == store.get_stats(1)["rows"]
+    print("✓ Searches during rebuild PASSED")
+
+
+if __name__ == "__main__":
+    test_search_and_delete()
+    test_compact_and_recover()
+    test_ingest_pipeline()
+    test_ivf_recall()
+    test_quantization()
+    test_incremental_reindex()
+    test_rebuild_concurrency()
@@ -0,0 +1,203 @@
+"""
+Test for SessionHistoryCache
+Tests:
+1. A fill that raced a write is rejected; the next read goes to the database
+2. Partial windows (covered_from) only answer budgets they fully cover
+3. Eviction follows LRU order under the session, byte and per-session message limits
+4. delete_message, archive_session and import invalidate cached sessions
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from spacemit_llm.comon.sqlite.sqlite_cache import SessionHistoryCache
+from spacemit_llm.comon.sqlite.sqlite_session import SQLiteSession, SessionImport
+
+
+def print_section(title: str):
+    """Print a section header"""
+    print("\n" + "=" * 60)
+    print(f"  {title}")
+    print("=" * 60)
+
+
+def _messages(session_id: int, token_counts, first_id: int = 1, content: str = "m"):
+    """按顺序构造带 token_offset 的消息"""
+    messages, offset = [], 0
+    for i, token_count in enumerate(token_counts):
+        messages.append({
+            "id": first_id + i,
+            "session_id": session_id,
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": f"{content}{i}",
+            "token_count": token_count,
+            "token_offset": offset
+        })
+        offset += token_count
+    return messages
+
+
+def _new_db(cache: SessionHistoryCache) -> SQLiteSession:
+    return SQLiteSession(Path(tempfile.mkdtemp()) / "sessions.db", cache=cache)
+
+
+def test_fill_race():
+    """Fill tokens taken before a write are rejected"""
+    print_section("Testing Fill / Write Race")
+
+    cache = SessionHistoryCache()
+    token = cache.fill_token()
+    cache.mark_write()
+    cache.put_window(1, _messages(1, [5, 5]), 0, token)
+    cache.put_session(1, {"id": 1, "message_count": 2}, token)
+    assert not cache.contains(1)
+
+    # 没有并发写入时填充生效
+    token = cache.fill_token()
+    cache.put_window(1, _messages(1, [5, 5]), 0, token)
+    assert [m["content"] for m in cache.get_window(1, 100)] == ["m0", "m1"]
+    assert "token_offset" not in cache.get_window(1, 100)[0]
+
+    # 数据库层：读取窗口期间另一个写入提交，过期的结果不会进入缓存
+    db = _new_db(SessionHistoryCache())
+    session_id = db.create_session("race")
+    db.add_message(session_id, "user", "first", 3)
+    token = db.cache.fill_token()
+    stale = db.fetchall(
+        "SELECT id, session_id, role, content, token_count, token_offset FROM messages WHERE session_id = ?",
+        (session_id,)
+    )
+    db.add_message(session_id, "assistant", "second", 4)
+    db.cache.put_window(session_id, stale, 0, token)
+    assert db.cache.get_window(session_id, 100) is None
+    window = db.get_messages_within_token_limit(session_id, 100)
+    assert [m["content"] for m in window] == ["first", "second"]
+
+    # 已缓存的会话由写操作直写更新
+    db.add_message(session_id, "user", "third", 5)
+    hits = db.cache.hits
+    assert [m["content"] for m in db.get_messages_within_token_limit(session_id, 100)] == \
+        ["first", "second", "third"]
+    assert db.cache.hits == hits + 1
+    print("✓ Fill / write race PASSED")
+
+
+def test_partial_window():
+    """A window loaded for a small budget does not answer a larger one"""
+    print_section("Testing Partial Windows")
+
+    cache = SessionHistoryCache()
+    messages = _messages(1, [10] * 10)
+    # 只缓存了 token_offset >= 60 的消息（最后 4 条）
+    cache.put_window(1, messages[6:], 60)
+    assert [m["id"] for m in cache.get_window(1, 40)] == [7, 8, 9, 10]
+    assert [m["id"] for m in cache.get_window(1, 25)] == [9, 10]
+    misses = cache.misses
+    assert cache.get_window(1, 50) is None
+    assert cache.misses == misses + 1
+
+    # covered_from <= 0 表示整个会话都在缓存中
+    cache.put_window(2, messages, 0)
+    assert len(cache.get_window(2, 10 ** 6)) == 10
+
+    # 超过单会话消息上限时丢弃最旧的消息，covered_from 随之前移
+    small = SessionHistoryCache(max_messages_per_session=3)
+    small.put_window(1, messages, 0)
+    assert [m["id"] for m in small.get_window(1, 30)] == [8, 9, 10]
+    assert small.get_window(1, 40) is None
+    small.append_messages(1, _messages(1, [10] * 11)[10:], {"id": 1})
+    assert [m["id"] for m in small.get_window(1, 30)] == [9, 10, 11]
+    print("✓ Partial windows PASSED")
+
+
+def test_eviction():
+    """Least recently used sessions are evicted first under each limit"""
+    print_section("Testing Eviction")
+
+    # 会话数上限
+    cache = SessionHistoryCache(max_sessions=2)
+    cache.put_window(1, _messages(1, [1]), 0)
+    cache.put_window(2, _messages(2, [1]), 0)
+    cache.get_window(1, 10)
+    cache.put_window(3, _messages(3, [1]), 0)
+    assert cache.contains(1) and not cache.contains(2) and cache.contains(3)
+    assert cache.evictions == 1
+
+    # 内存上限：每条消息 = 内容长度 + 200 字节
+    cache = SessionHistoryCache(max_bytes=1000)
+    for session_id in (1, 2):
+        cache.put_window(session_id, _messages(session_id, [1], content="x" * 299), 0)
+    assert cache.get_stats()["bytes"] == 1000
+    cache.get_session(1)
+    cache.get_window(1, 10)
+    cache.put_window(3, _messages(3, [1], content="x" * 299), 0)
+    assert cache.contains(1) and not cache.contains(2) and cache.contains(3)
+    # 直写追加使会话超过上限时淘汰其他会话，最近使用的会话总是保留
+    cache.append_messages(3, _messages(3, [1, 1], content="y" * 598)[1:])
+    assert not cache.contains(1) and cache.contains(3)
+    assert cache.get_stats()["sessions"] == 1 and cache.get_stats()["bytes"] > 1000
+
+    # 单会话消息上限只丢弃该会话最旧的消息
+    cache = SessionHistoryCache(max_messages_per_session=2)
+    cache.put_window(1, _messages(1, [1, 1, 1]), 0)
+    cache.put_window(2, _messages(2, [1]), 0)
+    assert [m["id"] for m in cache.get_window(1, 2)] == [2, 3]
+    assert cache.contains(2) and cache.evictions == 0
+    print("✓ Eviction PASSED")
+
+
+def test_invalidation():
+    """Writes that bypass the write-through path drop the cached session"""
+    print_section("Testing Invalidation")
+
+    db = _new_db(SessionHistoryCache())
+    session_id = db.create_session("cached")
+    ids = [db.add_message(session_id, "user" if i % 2 == 0 else "assistant", f"m{i}", 2) for i in range(4)]
+    db.get_session(session_id)
+    db.get_messages_within_token_limit(session_id, 100)
+    assert db.cache.contains(session_id)
+
+    # 删除消息：后续消息的 token_offset 改变
+    assert db.delete_message(ids[1])
+    assert not db.cache.contains(session_id)
+    window = db.get_messages_within_token_limit(session_id, 4)
+    assert [m["id"] for m in window] == ids[2:]
+    assert db.get_session(session_id)["message_count"] == 3
+
+    # 归档：缓存条目移除，读取时恢复
+    assert db.archive_session(session_id)
+    assert not db.cache.contains(session_id)
+    assert db.get_session(session_id)["archived_at"] is not None
+    window = db.get_messages_within_token_limit(session_id, 100)
+    assert [m["id"] for m in window] == [ids[0]] + ids[2:]
+    assert db.get_session(session_id)["archived_at"] is None
+
+    # 导入：导入前读取尚不存在的会话会缓存空窗口；导入过程中读取的统计信息会过期
+    next_id = db.fetchone("SELECT seq FROM sqlite_sequence WHERE name = 'sessions'")["seq"] + 1
+    assert db.get_messages_within_token_limit(next_id, 100) == []
+    records = [
+        {"type": "session", "id": 7, "session_name": "imported"},
+        {"type": "message", "session_id": 7, "role": "user", "content": "q", "token_count": 3},
+    ]
+    state = SessionImport()
+    db.import_records(records[:1], state)
+    assert state.session_ids[7] == next_id
+    assert db.get_messages_within_token_limit(next_id, 100) == []
+    db.import_records(records[1:], state)
+    assert [m["content"] for m in db.get_messages_within_token_limit(next_id, 100)] == ["q"]
+    assert db.get_session(next_id)["message_count"] == 0
+    db.finish_import(state)
+    session = db.get_session(next_id)
+    assert session["message_count"] == 1 and session["total_tokens"] == 3
+    print("✓ Invalidation PASSED")
+
+
+if __name__ == "__main__":
+    test_fill_race()
+    test_partial_window()
+    test_eviction()
+    test_invalidation()
@@ -0,0 +1,132 @@
+"""
+Test for SQLiteConfig
+Tests:
+1. Parameter snapshot is typed and updated by set_parameter
+2. Subscribers are notified of parameter and current model changes
+3. reload() picks up external changes and notifies only the changed keys
+"""
+
+import sys
+import tempfile
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from spacemit_llm.comon.sqlite.sqlite_config import SQLiteConfig
+
+
+def print_section(title: str):
+    """Print a section header"""
+    print("\n" + "=" * 60)
+    print(f"  {title}")
+    print("=" * 60)
+
+
+def test_parameter_snapshot():
+    """Snapshot values keep their types and old snapshots stay unchanged"""
+    print_section("Testing Parameter Snapshot")
+
+    db_path = Path(tempfile.mkdtemp()) / "config.db"
+    db = SQLiteConfig(db_path)
+    db.set_parameter("context_size", 4096, "int")
+    db.set_parameter("temperature", 0.7, "float")
+    db.set_parameter("stop", ["</s>"], "list")
+
+    before = db.get_snapshot()
+    db.set_parameter("context_size", 8192, "int")
+
+    assert before["context_size"] == 4096
+    assert db.get_parameter("context_size") == 8192
+    assert db.get_parameter("stop") == ["</s>"]
+    assert db.get_parameter("missing", "default") == "default"
+
+    # 新实例从数据库加载的值与快照一致
+    assert SQLiteConfig(db_path).get_all_parameters() == db.get_all_parameters()
+    print("✓ Parameter snapshot PASSED")
+
+
+def test_change_notification():
+    """Subscribers receive parameter and current model changes"""
+    print_section("Testing Change Notification")
+
+    tmp_dir = Path(tempfile.mkdtemp())
+    db = SQLiteConfig(tmp_dir / "config.db")
+    events = []
+    unsubscribe = db.subscribe(lambda name, value: events.append((name, value)))
+
+    db.set_parameter("max_tokens", 512, "int")
+    assert events[-1] == ("max_tokens", 512)
+
+    model_file = tmp_dir / "model.gguf"
+    model_file.touch()
+    model_id = db.add_model("model", str(model_file), "llm")
+    assert db.get_current_model("llm") is None
+
+    db.set_current_model(model_id, "llm")
+    name, model = events[-1]
+    assert name == "current_model.llm" and model["id"] == model_id
+    assert db.get_current_model("llm")["id"] == model_id
+
+    db.update_model_download_status(model_id, False)
+    assert db.get_current_model("llm")["is_downloaded"] == 0
+
+    db.delete_model(model_id)
+    assert db.get_current_model("llm") is None
+
+    unsubscribe()
+    count = len(events)
+    db.set_parameter("max_tokens", 1024, "int")
+    assert len(events) == count
+    print("✓ Change notification PASSED")
+
+
+def test_reload():
+    """reload() diffs the new snapshot against the old one"""
+    print_section("Testing Reload")
+
+    tmp_dir = Path(tempfile.mkdtemp())
+    db = SQLiteConfig(tmp_dir / "config.db")
+    db.set_parameter("max_tokens", 512, "int")
+    db.set_parameter("temperature", 0.7, "float")
+    db.set_parameter("system_prompt", "old", "string")
+    model_file = tmp_dir / "model.gguf"
+    model_file.touch()
+    first = db.add_model("first", str(model_file), "llm")
+    second = db.add_model("second", str(model_file), "llm")
+    db.set_current_model(first, "llm")
+    assert db.get_current_model("llm")["id"] == first
+    snapshot = db.get_snapshot()
+
+    events = []
+    db.subscribe(lambda name, value: events.append((name, value)))
+
+    # 另一个进程直接修改数据库
+    other = SQLiteConfig(tmp_dir / "config.db")
+    other.execute("UPDATE llm_parameters SET parameter_value = '1024' WHERE parameter_name = 'max_tokens'")
+    other.execute("UPDATE llm_parameters SET parameter_value = '0.7' WHERE parameter_name = 'temperature'")
+    other.execute("DELETE FROM llm_parameters WHERE parameter_name = 'system_prompt'")
+    other.set_parameter("context_size", 4096, "int")
+    other.set_current_model(second, "llm")
+    assert db.get_parameter("max_tokens") == 512 and events == []
+
+    db.reload()
+    assert sorted(events[:3]) == [("context_size", 4096), ("max_tokens", 1024), ("system_prompt", None)]
+    name, model = events[3]
+    assert name == "current_model.llm" and model["id"] == second
+    assert len(events) == 4
+    assert db.get_parameter("max_tokens") == 1024 and db.get_parameter("system_prompt") is None
+    assert db.get_current_model("llm")["id"] == second
+    # 旧快照视图保持不变
+    assert snapshot["max_tokens"] == 512
+
+    # 没有变化时不通知
+    db.reload()
+    assert len(events) == 4
+    print("✓ Reload PASSED")
+
+
+if __name__ == "__main__":
+    test_parameter_snapshot()
+    test_change_notification()
+    test_reload()
@@ -0,0 +1,327 @@
+"""
+Test for SQLiteKnowledgeBase
+Tests:
+1. Batched add/delete keep KB stats consistent
+2. Concurrent queries share the connection pool
+3. The vector index type is a KB setting and is applied to the vector store
+4. Content-addressed blobs are reference counted across KBs; duplicate uploads reuse ingested chunks
+5. Freeing an orphaned blob and re-uploading the same content never lose the object
+"""
+
+import asyncio
+import io
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from spacemit_llm.comon.sqlite.sqlit_kb import SQLiteKnowledgeBase, blob_object_name
+from spacemit_llm.pipeline.kb_ingest import KnowledgeBaseIngestPipeline
+from spacemit_llm.rag.embedder import BatchEmbedder
+from spacemit_llm.rag.parser import DocumentParser
+from spacemit_llm.rag.splitter import TextSplitter
+from spacemit_llm.rag.vector_store import VectorStore
+
+
+def print_section(title: str):
+    """Print a section header"""
+    print("\n" + "=" * 60)
+    print(f"  {title}")
+    print("=" * 60)
+
+
+def _new_db() -> SQLiteKnowledgeBase:
+    return SQLiteKnowledgeBase(Path(tempfile.mkdtemp()) / "knowledge_base.db", pool_size=2)
+
+
+def test_batched_files():
+    """add_files / delete_files run in one transaction and update stats"""
+    print_section("Testing Batched File Operations")
+
+    async def run():
+        db = _new_db()
+        kb_id = await db.create_knowledge_base("kb", "desc")
+        files = [
+            {"filename": f"doc{i}.md", "file_path": f"kb/doc{i}.md", "file_size": 10 * (i + 1), "file_type": "md"}
+            for i in range(5)
+        ]
+        file_ids = await db.add_files(kb_id, files)
+        assert len(file_ids) == 5
+
+        # 重复上传同名文件只更新
+        assert await db.add_file(kb_id, "doc0.md", "kb/doc0.md", 100, "md") == file_ids[0]
+
+        kb = await db.get_knowledge_base(kb_id)
+        print(f"doc_count={kb['doc_count']}, total_size={kb['total_size']}")
+        assert kb["doc_count"] == 5 and kb["total_size"] == 100 + 20 + 30 + 40 + 50
+
+        assert await db.delete_files(file_ids[:3] + [9999]) == 3
+        kb = await db.get_knowledge_base(kb_id)
+        assert kb["doc_count"] == 2 and kb["total_size"] == 90
+
+        assert await db.delete_file(file_ids[0]) is False
+        assert await db.delete_kb_files(kb_id) == 2
+        db.close()
+
+    asyncio.run(run())
+    print("✓ Batched file operations PASSED")
+
+
+def test_concurrent_queries():
+    """Many concurrent calls complete with a small pool"""
+    print_section("Testing Concurrent Queries")
+
+    async def run():
+        db = _new_db()
+        kb_ids = await asyncio.gather(*[db.create_knowledge_base(f"kb{i}") for i in range(20)])
+        results = await asyncio.gather(*[db.get_knowledge_base(kb_id) for kb_id in kb_ids])
+        assert [kb["id"] for kb in results] == list(kb_ids)
+        assert len(await db.list_knowledge_bases()) == 20
+        db.close()
+
+    asyncio.run(run())
+    print("✓ Concurrent queries PASSED")
+
+
+def test_index_type_setting():
+    """index_type is stored per KB, validated, and switches the vector index"""
+    print_section("Testing Index Type Setting")
+
+    async def run():
+        tmp = Path(tempfile.mkdtemp())
+        store = VectorStore(tmp / "vectors", exact_threshold=50)
+        db = SQLiteKnowledgeBase(tmp / "knowledge_base.db", pool_size=2, vector_store=store)
+        kb_id = await db.create_knowledge_base("kb", index_type="ivf")
+        assert (await db.get_knowledge_base(kb_id))["index_type"] == "ivf"
+        try:
+            await db.create_knowledge_base("bad", index_type="hnsw")
+            assert False, "expected ValueError"
+        except ValueError:
+            pass
+
+        file_id = await db.add_file(kb_id, "doc.md", "kb/doc.md", 1, "md")
+        chunks = list(TextSplitter(chunk_tokens=8, overlap_tokens=0).split_text("第一句。" * 200))
+        vectors = np.random.default_rng(0).standard_normal((len(chunks), 8))
+        await db.add_chunks(kb_id, file_id, chunks, vectors)
+        assert store.get_stats(kb_id)["nlist"] > 0
+
+        assert await db.update_knowledge_base(kb_id, index_type="flat")
+        assert (await db.get_knowledge_base(kb_id))["index_type"] == "flat"
+        assert store.get_stats(kb_id)["nlist"] == 0
+
+        # 重写向量文件失败：设置不提交，向量存储保持原状态
+        compact = store._compact
+
+        def failing_compact(*args, **kwargs):
+            raise OSError("disk full")
+
+        store._compact = failing_compact
+        assert not await db.update_knowledge_base(kb_id, name="renamed", index_type="ivf")
+        store._compact = compact
+        kb = await db.get_knowledge_base(kb_id)
+        assert kb["index_type"] == "flat" and kb["name"] == "kb"
+        assert store.get_stats(kb_id)["index"] == "flat" and store.get_stats(kb_id)["nlist"] == 0
+        assert store.count(kb_id) == len(chunks)
+
+        # 文件或知识库已被删除：不写入 chunk 和向量
+        for missing_kb, missing_file in ((kb_id, 9999), (9999, file_id)):
+            try:
+                await db.add_chunks(missing_kb, missing_file, chunks[:1], vectors[:1])
+                assert False, "expected ValueError"
+            except ValueError:
+                pass
+        assert store.count(kb_id) == len(chunks)
+        db.close()
+
+    asyncio.run(run())
+    print("✓ Index type setting PASSED")
+
+
+class FakeEmbedClient:
+    """模拟 EmbedClient：向量为 [文本长度, 1]，记录发送的文本数"""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def get_embeddings(self, texts, timeout=None):
+        self.sent += len(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+class FakeParser:
+    """记录解析次数的 DocumentParser"""
+
+    def __init__(self):
+        self.parser = DocumentParser(max_workers=1)
+        self.calls = 0
+
+    def iter_blocks(self, open_stream, filename):
+        self.calls += 1
+        return self.parser.iter_blocks(open_stream, filename)
+
+
+def test_content_addressed_blobs():
+    """Blob references follow kb_files rows; duplicate content is ingested without parsing"""
+    print_section("Testing Content-Addressed Blobs")
+
+    async def run():
+        db = _new_db()
+        kb_a = await db.create_knowledge_base("a")
+        kb_b = await db.create_knowledge_base("b")
+        sha_1, sha_2 = "1" * 64, "2" * 64
+
+        # 同一内容上传到两个知识库：一个 blob，两个引用
+        object_name, created = await db.acquire_blob(sha_1, 100)
+        assert created and object_name == blob_object_name(sha_1) == f"blobs/11/{sha_1}"
+        await db.add_file(kb_a, "doc.md", object_name, 100, "md", content_hash=sha_1)
+        assert await db.acquire_blob(sha_1, 100) == (object_name, False)
+        file_b = await db.add_file(kb_b, "copy.md", object_name, 100, "md", content_hash=sha_1)
+        assert (await db.get_blob(sha_1))["ref_count"] == 2
+
+        # 覆盖同名文件：旧 blob 失去引用，但另一个知识库仍在使用
+        await db.acquire_blob(sha_2, 50)
+        await db.add_file(kb_a, "doc.md", blob_object_name(sha_2), 50, "md", content_hash=sha_2)
+        assert (await db.get_blob(sha_1))["ref_count"] == 1
+        assert await db.claim_orphan_blobs() == []
+
+        # 上传失败时归还引用
+        await db.acquire_blob(sha_1, 100)
+        await db.release_blobs([sha_1])
+        assert (await db.get_blob(sha_1))["ref_count"] == 1
+
+        # 最后一个引用被删除后 blob 才可回收，且只被回收一次
+        await db.delete_file(file_b)
+        assert await db.claim_orphan_blobs() == [blob_object_name(sha_1)]
+        assert await db.claim_orphan_blobs() == [] and await db.get_blob(sha_1) is None
+        await db.delete_knowledge_base(kb_a)
+        assert await db.claim_orphan_blobs() == [blob_object_name(sha_2)]
+
+        # 不带 content_hash 的旧文件不参与计数
+        legacy = await db.add_file(kb_b, "legacy.md", "b/legacy.md", 10, "md")
+        assert await db.find_duplicate_file(legacy) is None
+        await db.delete_file(legacy)
+        assert await db.claim_orphan_blobs() == []
+        db.close()
+
+    asyncio.run(run())
+    print("✓ Content-addressed blobs PASSED")
+
+    async def ingest():
+        db = _new_db()
+        parser = FakeParser()
+        client = FakeEmbedClient()
+        pipeline = KnowledgeBaseIngestPipeline(
+            db, parser, TextSplitter(chunk_tokens=32, overlap_tokens=0), BatchEmbedder(client)
+        )
+        doc = "\n\n".join(f"# Section {i}\n\n" + f"Paragraph {i} is about topic {i}. " * 8 for i in range(6))
+        sha = "3" * 64
+        file_ids = []
+        for name in ("a", "b"):
+            kb_id = await db.create_knowledge_base(name)
+            object_name, _ = await db.acquire_blob(sha, len(doc))
+            file_id = await db.add_file(kb_id, "doc.md", object_name, len(doc), "md", content_hash=sha)
+            stats = await pipeline.ingest_file(kb_id, file_id, lambda: io.BytesIO(doc.encode()), "doc.md")
+            file_ids.append(file_id)
+
+        # 第二个文件复用第一个的 chunk：不再解析，chunk 完全一致
+        assert parser.calls == 1
+        original, reused = [await db.get_file_chunks(file_id) for file_id in file_ids]
+        assert stats["chunks"] == len(original) > 1
+        keys = ("chunk_index", "content", "content_hash", "token_count", "start_offset", "end_offset", "heading")
+        assert [[c[k] for k in keys] for c in reused] == [[c[k] for k in keys] for c in original]
+        assert (await db.get_file(file_ids[1]))["status"] == "ready"
+
+        # 原文件被删除后，重新处理会回到解析
+        await db.delete_file(file_ids[0])
+        await pipeline.ingest_file(kb_id, file_ids[1], lambda: io.BytesIO(doc.encode()), "doc.md")
+        assert parser.calls == 2 and len(await db.get_file_chunks(file_ids[1])) == len(original)
+        db.close()
+
+    asyncio.run(ingest())
+    print("✓ Duplicate ingest reuse PASSED")
+
+
+class FakeMinio:
+    """内存中的 MinIO：对象名 → 内容"""
+
+    def __init__(self):
+        self.objects = {}
+        self.deleting = None
+
+    async def file_exists(self, object_name):
+        return object_name in self.objects
+
+    async def upload_file(self, object_name, content):
+        self.objects[object_name] = content
+
+    async def delete_file(self, object_name):
+        if self.deleting is not None:
+            await self.deleting.wait()
+        self.objects.pop(object_name, None)
+
+
+def test_orphan_blob_race():
+    """An upload interleaved with the orphan GC keeps its object"""
+    print_section("Testing Orphan Blob / Upload Race")
+
+    from routers import knowledge_base as kb_router
+
+    async def run():
+        db = _new_db()
+        minio = FakeMinio()
+        kb_router.db_kb, kb_router.minio_client = db, minio
+        content = b"same content"
+
+        async def orphan():
+            """上传后释放引用：记录留在 0，对象仍在 MinIO 中"""
+            content_hash, object_name, uploaded = await kb_router._store_blob(content)
+            assert uploaded and object_name in minio.objects
+            await db.release_blobs([content_hash])
+            return content_hash, object_name
+
+        # 1. GC 删除记录之后、删除对象之前，同一内容被再次上传
+        content_hash, object_name = await orphan()
+        claim = db.claim_orphan_blobs
+        stored = []
+
+        async def claim_then_upload():
+            object_names = await claim()
+            stored.append(await kb_router._store_blob(content))
+            return object_names
+
+        db.claim_orphan_blobs = claim_then_upload
+        await kb_router._free_orphan_blobs()
+        db.claim_orphan_blobs = claim
+        # 新记录的上传不会被当作去重跳过，GC 也不会删除它
+        assert stored[0][2] is True
+        assert object_name in minio.objects
+        assert (await db.get_blob(content_hash))["ref_count"] == 1
+
+        # 2. GC 正在删除对象时上传：上传等待删除完成后重新写入对象
+        await db.release_blobs([content_hash])
+        minio.deleting = asyncio.Event()
+        gc = asyncio.create_task(kb_router._free_orphan_blobs())
+        await asyncio.sleep(0.05)
+        upload = asyncio.create_task(kb_router._store_blob(content))
+        await asyncio.sleep(0.05)
+        assert not upload.done()
+        minio.deleting.set()
+        await gc
+        assert (await upload)[2] is True
+        assert object_name in minio.objects
+        db.close()
+
+    asyncio.run(run())
+    print("✓ Orphan blob / upload race PASSED")
+
+
+if __name__ == "__main__":
+    test_batched_files()
+    test_concurrent_queries()
+    test_index_type_setting()
+    test_content_addressed_blobs()
+    test_orphan_blob_race()
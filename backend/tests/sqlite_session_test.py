@@ -0,0 +1,574 @@
+"""
+Test for SQLiteSession
+Tests:
+1. Incremental session stats apply deltas, deletes shift later offsets, and rebuild repairs drifted stats
+2. Token-limited history window matches the newest-first walk
+3. Batched inserts from several sessions commit together
+4. Transactions commit once and roll back as a whole
+5. Full-text search follows inserts/deletes and pages by keyset
+6. Keyset pagination of sessions and messages in both directions
+7. Large messages are compressed transparently
+8. Idle sessions are archived to files and restored on access
+9. Export/import round-trips sessions, including archived ones
+10. Write-behind batches concurrent submits, isolates failing sessions, flushes on demand and on close
+11. Archiving concurrently with inserts never strands messages in an archived session
+"""
+
+import asyncio
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from spacemit_llm.comon.sqlite.sqlite_session import SQLiteSession, SessionImport
+from spacemit_llm.comon.sqlite.sqlite_writer import SessionWriteBehind
+
+
+def print_section(title: str):
+    """Print a section header"""
+    print("\n" + "=" * 60)
+    print(f"  {title}")
+    print("=" * 60)
+
+
+def _new_db() -> SQLiteSession:
+    return SQLiteSession(Path(tempfile.mkdtemp()) / "sessions.db")
+
+
+def _reference_window(db: SQLiteSession, session_id: int, available: int):
+    """旧实现：从最新消息往前累计，直到超过限制"""
+    rows = db.fetchall(
+        "SELECT id, token_count FROM messages WHERE session_id = ? ORDER BY id DESC",
+        (session_id,)
+    )
+    selected, current = [], 0
+    for row in rows:
+        if current + row["token_count"] > available:
+            break
+        selected.append(row["id"])
+        current += row["token_count"]
+    return selected[::-1]
+
+
+def test_incremental_stats():
+    """Stats maintained by deltas equal a full recount"""
+    print_section("Testing Incremental Session Stats")
+
+    db = _new_db()
+    session_id = db.create_session("hello")
+    message_ids = [db.add_message(session_id, "user", f"m{i}", i) for i in range(10)]
+    db.delete_message(message_ids[3])
+
+    session = db.get_session(session_id)
+    print(f"message_count={session['message_count']}, total_tokens={session['total_tokens']}")
+    assert session["message_count"] == db.get_session_message_count(session_id) == 9
+    assert session["total_tokens"] == db.get_session_token_count(session_id) == 42
+
+    # 删除消息后，之后消息的 token_offset 减去被删除消息的 token 数，之前的不变
+    offsets = [row["token_offset"] for row in db.fetchall(
+        "SELECT token_offset FROM messages WHERE session_id = ? ORDER BY id", (session_id,)
+    )]
+    counts = [i for i in range(10) if i != 3]
+    assert offsets == [sum(counts[:k]) for k in range(len(counts))]
+
+    # 写入路径只应用增量：从人为设置的基数继续累加，而不是重新计数
+    other_id = db.create_session("other")
+    db.execute("UPDATE sessions SET message_count = 100, total_tokens = 1000 WHERE id = ?", (session_id,))
+    db.add_messages([
+        {"session_id": session_id, "role": "assistant", "content": "a", "token_count": 5},
+        {"session_id": other_id, "role": "user", "content": "b", "token_count": 7},
+        {"session_id": session_id, "role": "user", "content": "c", "token_count": 1},
+    ])
+    session = db.get_session(session_id)
+    assert session["message_count"] == 102 and session["total_tokens"] == 1006
+    other = db.get_session(other_id)
+    assert other["message_count"] == 1 and other["total_tokens"] == 7
+
+    # 修复：只修正指定会话；统计信息和 token_offset 都按消息表重建
+    assert db.rebuild_session_stats(other_id) == 0
+    db.execute("UPDATE messages SET token_offset = 0 WHERE session_id = ?", (session_id,))
+    assert db.rebuild_session_stats(session_id) == 1
+    session = db.get_session(session_id)
+    assert session["message_count"] == 11 and session["total_tokens"] == 48
+    window = db.get_messages_within_token_limit(session_id, 6)
+    assert [m["content"] for m in window] == ["a", "c"]
+
+    # 人为破坏全部统计信息后修复
+    db.execute("UPDATE sessions SET message_count = 0, total_tokens = 0")
+    assert db.rebuild_session_stats() == 2
+    assert db.get_session(session_id)["total_tokens"] == 48
+    assert db.rebuild_session_stats() == 0
+
+    # 单会话全量重算
+    db.execute("UPDATE sessions SET total_tokens = 1 WHERE id = ?", (other_id,))
+    assert db.update_session_stats(other_id)
+    assert db.get_session(other_id)["total_tokens"] == 7
+
+    db.clear_session_messages(session_id)
+    session = db.get_session(session_id)
+    assert session["message_count"] == 0 and session["total_tokens"] == 0
+    print("✓ Incremental stats PASSED")
+
+
+def test_token_limited_window():
+    """History window selected in SQL matches the reference walk"""
+    print_section("Testing Token-Limited History Window")
+
+    rng = random.Random(0)
+    db = _new_db()
+    session_id = db.create_session("window")
+
+    for _ in range(300):
+        if rng.random() < 0.8:
+            db.add_message(session_id, rng.choice(["user", "assistant"]), "x", rng.randint(0, 40))
+        else:
+            row = db.fetchone(
+                "SELECT id FROM messages WHERE session_id = ? ORDER BY random() LIMIT 1",
+                (session_id,)
+            )
+            if row:
+                db.delete_message(row["id"])
+
+        max_tokens = rng.randint(0, 500)
+        window = db.get_messages_within_token_limit(session_id, max_tokens, system_prompt_tokens=10)
+        assert [m["id"] for m in window] == _reference_window(db, session_id, max_tokens - 10)
+
+    print("✓ Token-limited window PASSED")
+
+
+def test_batched_insert():
+    """add_messages writes several sessions in one transaction"""
+    print_section("Testing Batched Insert")
+
+    db = _new_db()
+    first = db.create_session("a")
+    second = db.create_session("b")
+    ids = db.add_messages([
+        {"session_id": first, "role": "user", "content": "q", "token_count": 5},
+        {"session_id": second, "role": "user", "content": "q", "token_count": 7},
+        {"session_id": first, "role": "assistant", "content": "a", "token_count": 11},
+    ])
+    assert len(ids) == 3
+    assert db.get_session(first)["total_tokens"] == 16
+    assert db.get_session(second)["message_count"] == 1
+
+    try:
+        db.add_messages([{"session_id": first, "role": "system", "content": "s", "token_count": 1}])
+        assert False, "system role must be rejected"
+    except ValueError:
+        pass
+    print("✓ Batched insert PASSED")
+
+
+def test_transaction():
+    """Nested transaction helpers commit once and roll back together"""
+    print_section("Testing Transactions")
+
+    db = _new_db()
+    assert db.fetchone("PRAGMA journal_mode")["journal_mode"] == "wal"
+
+    session_id = db.create_session("tx")
+    try:
+        with db.transaction():
+            db.add_message(session_id, "user", "kept?", 3)
+            db.execute("UPDATE sessions SET session_name = 'renamed' WHERE id = ?", (session_id,))
+            raise RuntimeError("abort")
+    except RuntimeError:
+        pass
+
+    row = db.fetchone("SELECT * FROM sessions WHERE id = ?", (session_id,))
+    assert row["session_name"] == "tx" and row["message_count"] == 0
+    assert db.get_session_message_count(session_id) == 0
+
+    with db.transaction():
+        db.add_message(session_id, "user", "q", 3)
+        db.add_message(session_id, "assistant", "a", 4)
+    assert db.get_session_token_count(session_id) == 7
+    print("✓ Transactions PASSED")
+
+
+def test_search():
+    """FTS index is maintained incrementally and pages without gaps"""
+    print_section("Testing Message Search")
+
+    db = _new_db()
+    first = db.create_session("first")
+    second = db.create_session("second")
+    for i in range(25):
+        db.add_message(first if i % 2 else second, "user", f"第{i}次讨论向量数据库 vector index", 5)
+    noise = db.add_message(first, "assistant", "完全无关的内容", 5)
+
+    results = db.search_messages("数据库", limit=100)
+    assert len(results) == 25
+    assert "<mark>数据库</mark>" in results[0]["snippet"]
+
+    # 翻页结果与一次性查询一致
+    paged, after = [], None
+    while True:
+        page = db.search_messages("数据库 vector", limit=7, after=after)
+        if not page:
+            break
+        paged.extend(page)
+        after = (page[-1]["score"], page[-1]["message_id"])
+    assert [r["message_id"] for r in paged] == [r["message_id"] for r in db.search_messages("数据库 vector", limit=100)]
+
+    # 少于 3 个字符的关键词退回 LIKE 扫描
+    assert len(db.search_messages("无关")) == 1
+    assert len(db.search_messages("数据", session_id=second)) == 13
+
+    db.delete_message(noise)
+    assert db.search_messages("无关") == []
+    db.clear_session_messages(second)
+    assert len(db.search_messages("数据库", limit=100)) == 12
+    db.delete_session(first)
+    assert db.search_messages("数据库") == []
+    print("✓ Message search PASSED")
+
+
+def test_keyset_pagination():
+    """Walking pages forward and backward visits every row exactly once"""
+    print_section("Testing Keyset Pagination")
+
+    db = _new_db()
+    session_ids = [db.create_session(f"s{i}") for i in range(23)]
+    # 制造相同的 updated_at，验证以 id 打破平局
+    db.execute("UPDATE sessions SET updated_at = '2024-01-01 00:00:00' WHERE id % 3 = 0")
+
+    expected = [s["id"] for s in db.get_all_sessions(limit=100)]
+    assert sorted(expected) == sorted(session_ids)
+
+    pages, after = [], None
+    while True:
+        page = db.get_all_sessions(limit=5, after=after)
+        if not page:
+            break
+        pages.append(page)
+        after = (page[-1]["updated_at"], page[-1]["id"])
+    assert [s["id"] for page in pages for s in page] == expected
+
+    # 从最后一页往回翻
+    first = pages[-1][0]
+    back = db.get_all_sessions(limit=5, before=(first["updated_at"], first["id"]))
+    assert [s["id"] for s in back] == [s["id"] for s in pages[-2]]
+
+    session_id = session_ids[0]
+    message_ids = [db.add_message(session_id, "user", f"m{i}", 1) for i in range(12)]
+    latest = db.get_messages(session_id, limit=5)
+    assert [m["id"] for m in latest] == message_ids[-5:]
+    earlier = db.get_messages(session_id, limit=5, before_id=latest[0]["id"])
+    assert [m["id"] for m in earlier] == message_ids[2:7]
+    later = db.get_messages(session_id, limit=5, after_id=earlier[-1]["id"])
+    assert [m["id"] for m in later] == message_ids[7:12]
+    print("✓ Keyset pagination PASSED")
+
+
+def test_compression():
+    """Compressed rows read back unchanged through every reader"""
+    print_section("Testing Message Compression")
+
+    db = _new_db()
+    session_id = db.create_session("zip")
+    long_text = "def handler(request):\n    return 向量数据库\n" * 200
+    short_id = db.add_message(session_id, "user", "short question", 3)
+    long_id = db.add_message(session_id, "assistant", long_text, 50)
+
+    codecs = {r["id"]: r["codec"] for r in db.fetchall("SELECT id, codec FROM messages")}
+    assert codecs == {short_id: "plain", long_id: "zlib"}
+    assert [m["content"] for m in db.get_messages(session_id)] == ["short question", long_text]
+    assert db.get_messages_within_token_limit(session_id, 100)[-1]["content"] == long_text
+    assert db.search_messages("向量数据库")[0]["message_id"] == long_id
+
+    # 旧版本写入的原文大消息由后台迁移压缩
+    db.execute("UPDATE messages SET content = ?, codec = 'plain' WHERE id = ?", (long_text, long_id))
+    assert db.compress_existing_messages() == 1
+    assert db.compress_existing_messages() == 0
+    assert db.get_messages(session_id)[-1]["content"] == long_text
+    print("✓ Message compression PASSED")
+
+
+def test_archive():
+    """Archived sessions keep their stub row and restore transparently"""
+    print_section("Testing Session Archiving")
+
+    db = _new_db()
+    idle = db.create_session("idle")
+    active = db.create_session("active")
+    ids = [db.add_message(idle, "user", f"归档消息 number {i}", i + 1) for i in range(5)]
+    db.add_message(active, "user", "still here", 1)
+    db.execute("UPDATE sessions SET updated_at = datetime('now', '-40 days') WHERE id = ?", (idle,))
+    before = db.get_messages(idle)
+
+    assert db.archive_idle_sessions(idle_days=30) == 1
+    stub = db.get_session(idle)
+    assert stub["archived_at"] and stub["message_count"] == 5 and stub["total_tokens"] == 15
+    assert db.fetchone("SELECT COUNT(*) AS n FROM messages WHERE session_id = ?", (idle,))["n"] == 0
+    assert db.search_messages("number") == []
+    assert db.rebuild_session_stats() == 0
+    archive_path = Path(stub["archive_path"])
+    assert archive_path.exists()
+
+    # 读取时自动恢复，消息 ID 和内容不变
+    assert db.get_messages(idle) == before
+    assert not archive_path.exists() and db.get_session(idle)["archived_at"] is None
+    assert len(db.search_messages("number")) == 5
+
+    # 向归档会话追加消息时 token 偏移保持连续
+    db.archive_session(idle)
+    new_id = db.add_message(idle, "assistant", "reply", 7)
+    assert new_id > ids[-1]
+    window = db.get_messages_within_token_limit(idle, 7 + 5)
+    assert [m["id"] for m in window] == [ids[-1], new_id]
+
+    # 删除归档会话中的消息：先恢复再删除，之后的 token 偏移随之调整
+    db.archive_session(idle)
+    assert not db.delete_message(ids[0], session_id=active)
+    assert db.delete_message(ids[0])
+    assert db.get_session(idle)["archived_at"] is None
+    db.archive_session(idle)
+    assert db.delete_message(ids[1], session_id=idle)
+    assert not db.delete_message(ids[1])
+    assert [m["id"] for m in db.get_messages_within_token_limit(idle, 7 + 5)] == [ids[-1], new_id]
+    assert db.get_session(idle)["message_count"] == 4 and db.rebuild_session_stats() == 0
+
+    db.archive_session(idle)
+    path = Path(db.get_session(idle)["archive_path"])
+    db.delete_session(idle)
+    assert not path.exists()
+    print("✓ Session archiving PASSED")
+
+
+def test_archive_race():
+    """Messages added while the session is being archived are never stranded"""
+    print_section("Testing Archive / Insert Race")
+
+    db = _new_db()
+    session_id = db.create_session("racing")
+    db.add_message(session_id, "user", "seed", 1)
+
+    # 在任何写入前的会话检查之后立即由另一个线程归档
+    get_session = db.get_session
+
+    def get_session_then_archive(sid):
+        session = get_session(sid)
+        thread = threading.Thread(target=db.archive_session, args=(sid,))
+        thread.start()
+        thread.join()
+        return session
+
+    db.get_session = get_session_then_archive
+    try:
+        db.add_message(session_id, "assistant", "checked", 1)
+    finally:
+        db.get_session = get_session
+    assert db.archive_session(session_id)
+    assert [m["content"] for m in db.get_messages(session_id)] == ["seed", "checked"]
+    db.delete_message(db.get_messages(session_id)[-1]["id"])
+
+    done = threading.Event()
+    archived = [0]
+
+    def archiver():
+        while not done.is_set():
+            if db.archive_session(session_id):
+                archived[0] += 1
+
+    thread = threading.Thread(target=archiver)
+    thread.start()
+    try:
+        for i in range(200):
+            if i % 2:
+                db.add_message(session_id, "assistant", f"m{i}", 1)
+            else:
+                db.add_messages([{"session_id": session_id, "role": "user", "content": f"m{i}", "token_count": 1}])
+    finally:
+        done.set()
+        thread.join()
+
+    # 归档会话不应残留消息行
+    session = db.get_session(session_id)
+    live = db.fetchone("SELECT COUNT(*) AS n FROM messages WHERE session_id = ?", (session_id,))["n"]
+    assert not (session["archived_at"] and live), (session["archived_at"], live)
+    messages = db.get_messages(session_id)
+    assert [m["content"] for m in messages] == ["seed"] + [f"m{i}" for i in range(200)]
+    assert db.get_session(session_id)["message_count"] == 201
+    assert db.rebuild_session_stats() == 0
+    print(f"  archived {archived[0]} times during 200 inserts")
+    print("✓ Archive / insert race PASSED")
+
+
+def test_export_import():
+    """Exported records re-import into identical sessions with stats written once"""
+    print_section("Testing Export / Import")
+
+    src = SQLiteSession(Path(tempfile.mkdtemp()) / "sessions.db", compress_threshold=64)
+    first = src.create_session("first")
+    second = src.create_session("second")
+    for i in range(4):
+        src.add_message(first, "user" if i % 2 == 0 else "assistant", f"导出消息 {i} " * (i * 10 + 1), i + 2)
+    src.add_message(second, "user", "archived body", 3)
+    src.execute("UPDATE sessions SET updated_at = datetime('now', '-40 days') WHERE id = ?", (second,))
+    src.archive_session(second)
+
+    records = list(src.iter_export())
+    assert [r["type"] for r in records] == ["session"] + ["message"] * 4 + ["session", "message"]
+    assert records[-1]["content"] == "archived body"
+    # 导出不会恢复归档会话
+    assert src.get_session(second)["archived_at"] is not None
+
+    dst = _new_db()
+    state = SessionImport()
+    dst.import_records(records[:3], state)
+    dst.import_records(records[3:], state)
+    dst.finish_import(state)
+    assert state.session_count == 2 and state.message_count == 5
+    assert dst.rebuild_session_stats() == 0
+
+    new_first = state.session_ids[first]
+    assert [m["content"] for m in dst.get_messages(new_first)] == \
+        [m["content"] for m in src.get_messages(first)]
+    assert dst.get_session(new_first)["total_tokens"] == 2 + 3 + 4 + 5
+    window = dst.get_messages_within_token_limit(new_first, 9)
+    assert [m["token_count"] for m in window] == [4, 5]
+    assert len(dst.search_messages("archived")) == 1
+
+    # 无效批次整体拒绝，状态不变
+    try:
+        dst.import_records([{"type": "message", "session_id": 999, "role": "user", "content": "x"}], state)
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    assert state.message_count == 5
+    print("✓ Export / import PASSED")
+
+
+def test_write_behind():
+    """Messages submitted from several threads land in order with correct offsets"""
+    print_section("Testing Write-Behind")
+
+    db = _new_db()
+    session_ids = [db.create_session(f"s{i}") for i in range(4)]
+    per_session = 50
+
+    # group：多个线程并发提交，每个线程写自己的会话
+    writer = SessionWriteBehind(db, flush_interval=0.2, durability="group")
+    writer.start()
+    futures = {session_id: [] for session_id in session_ids}
+
+    def produce(session_id):
+        for i in range(per_session):
+            role = "user" if i % 2 == 0 else "assistant"
+            futures[session_id].append(writer.submit(session_id, role, f"{session_id}-{i}", i + 1))
+
+    threads = [threading.Thread(target=produce, args=(session_id,)) for session_id in session_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ids = {session_id: [f.result(5) for f in futures[session_id]] for session_id in session_ids}
+
+    total = len(session_ids) * per_session
+    assert writer.message_count == total
+    # 同一刷新周期内的写入合并为一个事务
+    assert 1 <= writer.flush_count <= total // 10, writer.flush_count
+    for session_id in session_ids:
+        messages = db.get_messages(session_id)
+        assert [m["id"] for m in messages] == ids[session_id]
+        assert [m["content"] for m in messages] == [f"{session_id}-{i}" for i in range(per_session)]
+        offsets = [m["token_offset"] for m in db.fetchall(
+            "SELECT token_offset FROM messages WHERE session_id = ? ORDER BY id", (session_id,)
+        )]
+        assert offsets == [i * (i + 1) // 2 for i in range(per_session)]
+        session = db.get_session(session_id)
+        assert session["message_count"] == per_session
+        assert session["total_tokens"] == per_session * (per_session + 1) // 2
+    assert db.rebuild_session_stats() == 0
+    flushes = writer.flush_count
+    writer.close()
+
+    # async：立即返回；has_pending/flush 保证读到自己的写入
+    session_id = db.create_session("async")
+    writer = SessionWriteBehind(db, flush_interval=0.5, durability="async")
+    writer.start()
+
+    async def run():
+        assert await writer.add_message(session_id, "user", "q", 3) is None
+        assert writer.has_pending(session_id)
+        await writer.flush()
+        assert not writer.has_pending(session_id)
+        assert [m["content"] for m in db.get_messages(session_id)] == ["q"]
+
+    asyncio.run(run())
+
+    # close 提交队列中剩余的消息
+    for i in range(20):
+        writer.submit(session_id, "assistant" if i % 2 == 0 else "user", f"a{i}", 2)
+    writer.close()
+    assert not writer.is_running
+    messages = db.get_messages(session_id)
+    assert [m["content"] for m in messages] == ["q"] + [f"a{i}" for i in range(20)]
+    assert db.get_session(session_id)["total_tokens"] == 3 + 40
+
+    # 同一批次中一个会话写入失败时，其他会话的消息照常提交
+    ok_id, gone_id = db.create_session("ok"), db.create_session("gone")
+    db.delete_session(gone_id)
+    writer = SessionWriteBehind(db, flush_interval=0.2, durability="group")
+    writer.start()
+    ok_future = writer.submit(ok_id, "user", "kept", 1)
+    gone_future = writer.submit(gone_id, "user", "lost", 1)
+    assert ok_future.result(5) == db.get_messages(ok_id)[0]["id"]
+    try:
+        gone_future.result(5)
+        assert False, "message for a deleted session must fail"
+    except sqlite3.IntegrityError:
+        pass
+    assert not writer.has_pending(ok_id) and not writer.has_pending(gone_id)
+
+    # 关闭开始后提交的消息直接写入，flush 不会等待永远不被处理的屏障
+    with writer._lock:
+        writer._stopping.set()
+    late = writer.submit(ok_id, "assistant", "late", 1)
+    assert late.done() and late.result() == db.get_messages(ok_id)[-1]["id"]
+    writer.flush_sync(timeout=1)
+    asyncio.run(asyncio.wait_for(writer.flush(), 1))
+    writer.close()
+    after = writer.submit(ok_id, "user", "after", 1)
+    assert after.done() and [m["content"] for m in db.get_messages(ok_id)] == ["kept", "late", "after"]
+    writer.flush_sync(timeout=1)
+
+    # sync：不启动线程，直接写入并返回 ID
+    writer = SessionWriteBehind(db, durability="sync")
+    writer.start()
+    assert not writer.is_running
+    future = writer.submit(session_id, "user", "sync", 1)
+    assert future.done() and future.result() == db.get_messages(session_id)[-1]["id"]
+    try:
+        writer.submit(session_id, "system", "x", 1)
+        assert False, "system role must be rejected"
+    except ValueError:
+        pass
+    try:
+        SessionWriteBehind(db, durability="never")
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+    print(f"  {total} messages from {len(threads)} threads in {flushes} flushes")
+    print("✓ Write-behind PASSED")
+
+
+if __name__ == "__main__":
+    test_incremental_stats()
+    test_token_limited_window()
+    test_batched_insert()
+    test_transaction()
+    test_search()
+    test_keyset_pagination()
+    test_compression()
+    test_archive()
+    test_export_import()
+    test_write_behind()
+    test_archive_race()